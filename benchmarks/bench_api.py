@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import socket
+import statistics
+import time
+from datetime import datetime, UTC
+from unittest.mock import patch
+
+import uvicorn
+import zmq
+from fastapi import APIRouter, FastAPI, status
+
+"""
+Compare the POST /alert request path served on a worker thread (the former `def` endpoint calling
+the publisher synchronously with eager f-string logging) with the async endpoint, on the asyncio/h11
+and uvloop/httptools uvicorn runtimes.
+The API runs in a separate process publishing on an inproc PUB socket, the load is generated with
+keep-alive connections written on raw asyncio streams.
+Run it as :
+python -m benchmarks.bench_api --requests 20000 --connections 32
+"""
+
+ALERT = {"jail": "sshd", "action": "banip", "reason": "benchmark"}
+
+
+def legacy_routes(publisher_service) -> APIRouter:
+    """The POST /alert endpoint as it was before it moved to the event loop."""
+    from src.models.alert_model import AlertModel
+    from src.shared.custom_cache import is_duplicate
+
+    logger = logging.getLogger("src.api.routes")
+    router = APIRouter()
+
+    @router.post("/alert", status_code=status.HTTP_202_ACCEPTED)
+    def send_alert(alert: AlertModel):
+        try:
+            alert.processing_timestamp = datetime.now(UTC)
+            if is_duplicate(ip=alert.ip, action=alert.action, jail=alert.jail):
+                logger.info(f"HTTP STATUS 208 - Duplicate alert detected: {alert}")
+                return {"status": "duplicate"}, status.HTTP_208_ALREADY_REPORTED
+            logger.info(f"HTTP STATUS 202 - POST /alert called with alert: {alert}")
+            publisher_service.publish_alert(alert)
+            return {"status": "alert published"}
+        except Exception as e:
+            logger.error(f"POST /alert failed: {e}")
+            return {"status": "error", "HTTP ERROR 500": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    return router
+
+
+def serve(path: str, loop: str, http: str, port: int, log_level: str):
+    """Run the API in this process until terminated."""
+    from src.api.routes import get_routes
+    from src.ids2zmq.publisher import ZMQPublisher
+    from src.services.publish_msg_service import PublishMsgService
+
+    logging.basicConfig(level=log_level.upper(), handlers=[logging.NullHandler()])
+    with patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"}):
+        publisher = ZMQPublisher(context=zmq.Context())
+        publisher._bind_address = "inproc://bench-api"
+        publisher.bind()
+        service = PublishMsgService(publisher)
+        app = FastAPI()
+        app.include_router(legacy_routes(service) if path == "thread" else get_routes(service))
+        uvicorn.run(app, host="127.0.0.1", port=port, loop=loop, http=http, log_level="warning", access_log=False)
+
+
+async def run_connection(port: int, count: int, first_ip: int, latencies: list[float]):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for i in range(count):
+            ip = first_ip + i
+            body = json.dumps({**ALERT, "ip": f"10.{ip >> 16 & 255}.{ip >> 8 & 255}.{ip & 255}"}).encode()
+            request = (b"POST /alert HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                       b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            started = time.perf_counter()
+            writer.write(request)
+            headers = await reader.readuntil(b"\r\n\r\n")
+            length = int(headers.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if not headers.startswith(b"HTTP/1.1 202"):
+                raise RuntimeError(f"Unexpected response: {headers[:32]!r}")
+    finally:
+        writer.close()
+
+
+async def generate_load(port: int, requests: int, connections: int) -> tuple[float, list[float]]:
+    latencies: list[float] = []
+    per_connection = requests // connections
+    started = time.perf_counter()
+    await asyncio.gather(*(run_connection(port, per_connection, i * per_connection, latencies) for i in range(connections)))
+    return time.perf_counter() - started, latencies
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"API did not start on port {port}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench(path: str, loop: str, http: str, args) -> dict:
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(path, loop, http, port, args.log_level), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        asyncio.run(generate_load(port, min(args.requests, 2000), args.connections))  # Warm-up
+        elapsed, latencies = asyncio.run(generate_load(port, args.requests, args.connections))
+    finally:
+        server.terminate()
+        server.join()
+    latencies.sort()
+    return {
+        "path": path,
+        "runtime": f"{loop}/{http}",
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1e3,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST /alert benchmark")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the API process")
+    args = parser.parse_args()
+
+    runtimes = [("asyncio", "h11")]
+    try:
+        import uvloop, httptools  # noqa: F401
+        runtimes.append(("uvloop", "httptools"))
+    except ImportError:
+        print("uvloop/httptools not installed, skipping that runtime")
+    for loop, http in runtimes:
+        for path in ("thread", "async"):
+            result = bench(path, loop, http, args)
+            print(f"{result['path']:<7} {result['runtime']:<18} {result['requests_per_second']:9.0f} req/s "
+                  f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import timeit
+from unittest.mock import patch
+
+from cryptography.fernet import Fernet
+
+from src.ids2zmq.codec import BinaryCodec, JsonCodec
+from src.models.alert_model import AlertModel
+
+"""
+Compare the payload size and the per-message CPU time of the wire codecs, in clear and wrapped in a
+Fernet token as done when ZMQ security is enabled.
+Run it as :
+python -m benchmarks.bench_codec --count 20000
+"""
+
+def sample_alert() -> AlertModel:
+    return AlertModel(
+        hostname="node-1", source_ip="203.0.113.7", target_ip="10.0.0.2", port=22, protocol="ssh",
+        alert_type="ssh_brute_force", severity="high", jail="sshd", action="banip", ip="203.0.113.7",
+        reason="5 failed logins in 60s", message_id="0123456789abcdef", origin="00000000000000aa",
+    )
+
+
+def per_message(func, count: int) -> float:
+    return min(timeit.repeat(func, number=count, repeat=5)) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wire codec benchmark")
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    fernet = Fernet(Fernet.generate_key())
+    with patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"}):
+        alert = sample_alert()
+        for codec in (JsonCodec, BinaryCodec):
+            payload = codec.encode(alert)
+            token = fernet.encrypt(payload)
+            encode = per_message(lambda: codec.encode(alert), args.count)
+            decode = per_message(lambda: codec.decode(memoryview(payload)), args.count)
+            encode_encrypted = per_message(lambda: fernet.encrypt(codec.encode(alert)), args.count)
+            decode_encrypted = per_message(lambda: codec.decode(fernet.decrypt(token)), args.count)
+            print(f"{codec.name:<7} clear {len(payload):4d} B  encode {encode * 1e6:6.2f} us  decode {decode * 1e6:6.2f} us | "
+                  f"fernet {len(token):4d} B  encode {encode_encrypted * 1e6:6.2f} us  decode {decode_encrypted * 1e6:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from src.fail2ban.socket_client import Fail2banSocketClient
+from src.fail2ban.stub_server import Fail2banStubServer
+
+"""
+Compare the cost of a ban issued over fail2ban-server's socket with the cost of spawning a process.
+The socket side runs against the local stub server, the process side spawns `sudo`-less `true`,
+which is a lower bound of what `sudo fail2ban-client set <jail> banip <ip>` costs.
+Run it as :
+python -m benchmarks.bench_fail2ban_client --count 2000
+"""
+
+def bench_subprocess(count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        subprocess.run(["true"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return time.perf_counter() - started
+
+
+def bench_socket(client: Fail2banSocketClient, count: int, pipeline: int) -> float:
+    commands = [["set", "sshd", "banip", f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"] for i in range(count)]
+    started = time.perf_counter()
+    for i in range(0, count, pipeline):
+        client.send_commands(commands[i:i + pipeline])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fail2ban client benchmark")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server latency per command in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = Fail2banStubServer(socket_path=os.path.join(tmp_dir, "fail2ban.sock"), latency=args.latency)
+        server.start()
+        client = Fail2banSocketClient(socket_path=server.socket_path)
+        try:
+            results = {
+                "subprocess (true)": bench_subprocess(min(args.count, 500)) / min(args.count, 500),
+                "socket, one command per request": bench_socket(client, args.count, pipeline=1) / args.count,
+                "socket, 64 pipelined commands": bench_socket(client, args.count, pipeline=64) / args.count,
+            }
+        finally:
+            client.close()
+            server.stop()
+    for name, per_command in results.items():
+        print(f"{name:<36} {per_command * 1e6:10.1f} us/command {1 / per_command:12.0f} commands/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import threading
+import time
+
+from src.shared.metrics import MetricsRegistry
+
+"""
+Measure the cost of recording a metric event, on one thread and on several threads at once, and
+the time to render the registry.
+Run it as :
+python -m benchmarks.bench_metrics --count 1000000 --threads 4
+"""
+
+def per_event(function, count: int, threads: int) -> float:
+    def record():
+        for _ in range(count):
+            function()
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - started) / (count * threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics overhead benchmark")
+    parser.add_argument("--count", type=int, default=1000000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    for enabled in (True, False):
+        registry = MetricsRegistry(enabled=enabled)
+        counter = registry.counter("bench_events_total", "Events.", labels=("stage",)).labels("decode")
+        histogram = registry.histogram("bench_seconds", "Latency.")
+        baseline = per_event(lambda: None, args.count, 1)
+        label = "enabled " if enabled else "disabled"
+        for threads in (1, args.threads):
+            inc = per_event(counter.inc, args.count, threads) - baseline
+            observe = per_event(lambda: histogram.observe(0.00042), args.count, threads) - baseline
+            print(f"{label} {threads} thread(s): counter.inc {inc * 1e9:6.0f} ns | histogram.observe {observe * 1e9:6.0f} ns")
+        if enabled:
+            started = time.perf_counter()
+            text = registry.render()
+            print(f"render {len(text)} bytes in {(time.perf_counter() - started) * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import ipaddress
+import shutil
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+from src.fail2ban.action import Fail2banAction
+from src.ids2zmq.codec import get_codec, pack_envelope
+from src.ids2zmq.payload_crypto import PayloadCrypto
+from src.models.alert_model import AlertModel
+
+"""
+Measure the size and the CPU time of the payload encryption, Fernet against the AEAD ciphers,
+for a single alert and for an envelope of alerts encoded with the binary codec.
+Run it as :
+python -m benchmarks.bench_payload_crypto --count 20000 --batch-size 128
+"""
+
+HEADER = bytes(18)
+
+
+def measure(encrypt, decrypt, payload: bytes, count: int) -> tuple[float, float, int]:
+    token = encrypt(payload)
+    started = time.process_time()
+    for _ in range(count):
+        token = encrypt(payload)
+    encrypt_time = (time.process_time() - started) / count
+    started = time.process_time()
+    for _ in range(count):
+        decrypt(token)
+    decrypt_time = (time.process_time() - started) / count
+    return encrypt_time, decrypt_time, len(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload encryption benchmark")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=128)
+    args = parser.parse_args()
+
+    codec = get_codec("binary")
+    alerts = [codec.encode(AlertModel.model_construct(ip=ipaddress.ip_address(f"10.0.{i >> 8 & 255}.{i & 255}"),
+                                                      action=Fail2banAction.BAN, message_id=f"{i:016x}",
+                                                      origin="00000000000000aa"))
+              for i in range(args.batch_size)]
+    payloads = {"1 alert": alerts[0], f"{args.batch_size} alerts": pack_envelope(alerts)}
+
+    fernet = Fernet(Fernet.generate_key())
+    keys_dir = tempfile.mkdtemp()
+    try:
+        PayloadCrypto(keys_path=keys_dir, cipher="aes-gcm").generate_key("bench")
+        ciphers = {"fernet": (fernet.encrypt, fernet.decrypt)}
+        for cipher in ("aes-gcm", "chacha20-poly1305"):
+            crypto = PayloadCrypto(keys_path=keys_dir, cipher=cipher)
+            crypto.reload()
+            ciphers[cipher] = (lambda data, crypto=crypto: crypto.encrypt(data, associated_data=HEADER),
+                               lambda token, crypto=crypto: crypto.decrypt(token, associated_data=HEADER))
+        for label, payload in payloads.items():
+            count = max(1, args.count // (len(payload) // 64 + 1))
+            for cipher, (encrypt, decrypt) in ciphers.items():
+                encrypt_time, decrypt_time, size = measure(encrypt, decrypt, payload, count)
+                print(f"{label:<11} {cipher:<18} {len(payload):6d} -> {size:6d} bytes (+{(size - len(payload)) / len(payload):5.0%}) | "
+                      f"encrypt {encrypt_time * 1e6:7.1f} us | decrypt {decrypt_time * 1e6:7.1f} us")
+    finally:
+        shutil.rmtree(keys_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import time
+from unittest.mock import patch
+
+import zmq
+
+from src.fail2ban.action import Fail2banAction
+from src.ids2zmq.codec import get_codec
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.dedup_engine import dedup_engine
+
+"""
+Measure the per-alert CPU time of the receive pipeline, from the clear payload to the fail2ban call,
+when the subscriber hands over the JSON string of the alert (parsed and validated again by the
+service) and when it hands over the validated AlertModel itself. fail2ban is replaced by a stub.
+Run it as :
+python -m benchmarks.bench_pipeline --count 20000
+"""
+
+class StubClient:
+    @staticmethod
+    def execute_action(action, jail=None, ip=None):
+        return True
+
+
+def run(subscriber: ZMQSubscriber, service: SubscribeMsgService, payloads: list[bytes], codec, typed: bool) -> float:
+    dedup_engine.clear()
+    started = time.perf_counter()
+    for payload in payloads:
+        alert = subscriber._decode_payload(data=payload, codec=codec)
+        if typed:
+            service.process_alert(alert)
+        else:
+            service.process_received_message(alert.to_json())
+    return (time.perf_counter() - started) / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive pipeline benchmark")
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    context = zmq.Context()
+    with patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"}):
+        subscriber = ZMQSubscriber(on_message_callback=print, context=context)
+        service = SubscribeMsgService()
+        service._fail2ban_client = StubClient()
+        for codec_name in ("json", "binary"):
+            codec = get_codec(codec_name)
+            payloads = [codec.encode(AlertModel(ip=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", action=Fail2banAction.BAN,
+                                                message_id=f"{i:016x}", origin="00000000000000aa"))
+                        for i in range(args.count)]
+            legacy = run(subscriber, service, payloads, codec, typed=False)
+            typed = run(subscriber, service, payloads, codec, typed=True)
+            print(f"{codec_name:<7} JSON string callback {legacy * 1e6:6.1f} us/alert | "
+                  f"AlertModel callback {typed * 1e6:6.1f} us/alert | saved {(legacy - typed) * 1e6:5.1f} us")
+        subscriber.stop()
+    context.term()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import threading
+import time
+from unittest.mock import patch
+
+import zmq
+from cryptography.fernet import Fernet
+
+from src.fail2ban.action import Fail2banAction
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+
+"""
+Measure the sustained throughput of the publish path, alert by alert and batched in envelopes,
+with Fernet encryption, from publish_alert() on one end to the subscriber callback on the other
+over inproc sockets.
+Run it as :
+python -m benchmarks.bench_publish_batch --count 20000 --batch-size 128
+"""
+
+def run(count: int, batching: bool, batch_size: int, window: float) -> tuple[float, int]:
+    context = zmq.Context()
+    key = Fernet.generate_key()
+    received = []
+    done = threading.Event()
+
+    def callback(message):
+        received.append(message)
+        if len(received) >= count:
+            done.set()
+
+    with patch("src.ids2zmq.publisher.ZMQManager.zmq_security_enabled", True), \
+            patch("src.ids2zmq.subscriber.ZMQManager.zmq_security_enabled", True), \
+            patch("src.ids2zmq.publisher.settings.ZMQ_PUBLISH_BATCH_ENABLED", batching), \
+            patch("src.ids2zmq.publisher.settings.ZMQ_PUBLISH_BATCH_MAX_SIZE", batch_size), \
+            patch("src.ids2zmq.publisher.settings.ZMQ_PUBLISH_BATCH_WINDOW", window):
+        publisher = ZMQPublisher(context=context)
+        publisher._fernet = Fernet(key)
+        publisher._bind_address = "inproc://bench-publish-batch"
+        publisher.publisher_socket.setsockopt(zmq.SNDHWM, 0)
+        publisher.bind()
+        subscriber = ZMQSubscriber(on_message_callback=callback, context=context)
+        subscriber._fernet = Fernet(key)
+        subscriber.subscriber_socket.setsockopt(zmq.RCVHWM, 0)
+        subscriber.subscriber_socket.connect(publisher._bind_address)
+        subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, publisher._topic)
+        subscriber.start()
+        time.sleep(0.2)
+        alerts = [AlertModel(ip=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", severity="low",
+                             action=Fail2banAction.BAN, message_id=f"{i:016x}", origin="00000000000000aa")
+                  for i in range(count)]
+        started = time.perf_counter()
+        for alert in alerts:
+            publisher.publish_alert(alert)
+        publisher.flush()
+        done.wait(timeout=120)
+        elapsed = time.perf_counter() - started
+        subscriber.stop()
+        publisher.close()
+    context.term()
+    return elapsed, len(received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched publishing benchmark")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--window", type=float, default=0.005)
+    args = parser.parse_args()
+
+    with patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"}):
+        for batching in (False, True):
+            elapsed, received = run(args.count, batching, args.batch_size, args.window)
+            label = f"batched ({args.batch_size})" if batching else "one by one"
+            print(f"{label:<16} {received}/{args.count} alerts in {elapsed:.2f}s, {received / elapsed:,.0f} alerts/s")
+
+
+if __name__ == "__main__":
+    main()
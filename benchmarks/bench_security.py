@@ -0,0 +1,106 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import zmq
+from cryptography.fernet import Fernet
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.ids2zmq.manager import ZMQManager
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+
+"""
+Compare the throughput and the CPU time of the two security modes, PLAIN authentication with
+Fernet encrypted payloads against CURVE, from publish_alert() on one end to the subscriber callback
+on the other over tcp loopback. The CPU time is the process time of both ends, libzmq I/O threads included.
+Run it as :
+python -m benchmarks.bench_security --count 20000
+"""
+
+def run(count: int, mechanism: str, certs_dir: str, port: int) -> tuple[float, float, int]:
+    context = zmq.Context()
+    received = []
+    done = threading.Event()
+
+    def callback(alert):
+        received.append(alert)
+        if len(received) >= count:
+            done.set()
+
+    address = f"tcp://127.0.0.1:{port}"
+    with patch.object(ZMQManager, "zmq_security_enabled", True), \
+            patch.object(ZMQManager, "security_mechanism", mechanism), \
+            patch.object(ZMQManager, "_context", context), \
+            patch.object(ZMQManager, "_authenticator", None), \
+            patch.object(settings, "ZMQ_CERTS_PATH", certs_dir + "/"), \
+            patch.object(settings, "ZMQ_TRUSTED_PEERS_CERTS_PATH", os.path.join(certs_dir, "authorized_clients") + "/"), \
+            patch.object(settings, "ZMQ_SECURITY_USERNAME", "bench"), \
+            patch.object(settings, "ZMQ_SECURITY_PASSWORD", "bench"), \
+            patch.object(ZMQManager, "get_trusted_hosts", return_value=["127.0.0.1"]):
+        publisher = ZMQPublisher(context=context)
+        publisher._bind_address = address
+        publisher.publisher_socket.setsockopt(zmq.SNDHWM, 0)
+        subscriber = ZMQSubscriber(on_alert_callback=callback, context=context)
+        subscriber.subscriber_socket.setsockopt(zmq.RCVHWM, 0)
+        if mechanism == "curve":
+            publisher.configure_security()
+            subscriber.configure_security()
+        else:
+            key = Fernet.generate_key()
+            with patch.object(ZMQManager, "load_symmetrical_key", return_value=key):
+                publisher.configure_security()
+                subscriber.configure_security()
+        publisher.bind()
+        subscriber.connect_to_publisher(address)
+        subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, publisher._topic)
+        subscriber.start()
+        time.sleep(0.5)
+        alerts = [AlertModel(ip=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", action=Fail2banAction.BAN,
+                             message_id=f"{i:016x}", origin="00000000000000aa")
+                  for i in range(count)]
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for alert in alerts:
+            publisher.publish_alert(alert)
+        done.wait(timeout=120)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        subscriber.stop()
+        publisher.close()
+        ZMQManager.stop_authenticator()
+    context.term()
+    return elapsed, cpu, len(received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PLAIN + Fernet against CURVE benchmark")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--port", type=int, default=5599)
+    args = parser.parse_args()
+
+    certs_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(certs_dir, "authorized_clients"))
+        with patch.object(settings, "ZMQ_CERTS_PATH", certs_dir + "/"):
+            ZMQManager.generate_key(filename=settings.ZMQ_CERTS_NAME)
+        shutil.copy(os.path.join(certs_dir, f"{settings.ZMQ_CERTS_NAME}.key"),
+                    os.path.join(certs_dir, "authorized_clients", "127.0.0.1.key"))
+        with patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"}):
+            for mechanism in ("plain", "curve"):
+                elapsed, cpu, received = run(args.count, mechanism, certs_dir, args.port)
+                label = "PLAIN + Fernet" if mechanism == "plain" else "CURVE"
+                print(f"{label:<15} {received}/{args.count} alerts in {elapsed:.2f}s, {received / elapsed:,.0f} alerts/s, "
+                      f"{cpu / max(received, 1) * 1e6:.1f} us CPU/alert")
+    finally:
+        shutil.rmtree(certs_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
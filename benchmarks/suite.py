@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, UTC
+from unittest.mock import patch
+
+import zmq
+
+from benchmarks.bench_api import free_port, serve, wait_for_port
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.stub_server import Fail2banStubServer
+from src.ids2zmq.manager import ZMQManager
+from src.ids2zmq.payload_crypto import PayloadCrypto
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+from src.services.ban_executor import BanExecutor
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.dedup_engine import dedup_engine
+
+"""
+Benchmark suite of the whole alert path, runnable without network access nor root:
+- api: POST /alert, served by uvicorn in a separate process, driven by keep-alive connections.
+- batch: POST /alerts/batch with NDJSON bodies, same server.
+- tcp, inproc: a real publisher and subscriber pair over tcp://127.0.0.1 and inproc://.
+- pipeline: publisher to subscriber to ban executor to SubscribeMsgService to Fail2banClient, fail2ban
+  being the socket stub server, or with --fail2ban-transport subprocess a fake `fail2ban-client`
+  (and pass-through `sudo`) put first on the PATH, both answering after --fail2ban-latency seconds.
+Each scenario reports the messages per second, the p50/p99 latency (HTTP round trip, publish to
+subscriber callback, or publish to ban completed), the CPU time and the resident memory of the
+process under test. The results are saved as JSON along with the commit and the machine, and can be
+compared with an earlier run, the exit code being 1 when a scenario regressed beyond the threshold.
+Run it as :
+python -m benchmarks.suite --output results.json
+python -m benchmarks.suite --scenarios tcp,pipeline --fail2ban-latency 0.002 --compare results.json
+"""
+
+SCENARIOS = ("api", "batch", "tcp", "inproc", "pipeline")
+ALERT = {"jail": "sshd", "action": "banip", "reason": "benchmark"}
+
+
+def ip_of(index: int) -> str:
+    return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+
+def percentile(ordered: list[float], rank: float) -> float | None:
+    """Nearest rank percentile of already sorted values."""
+    if not ordered:
+        return None
+    return ordered[max(0, -(-int(rank * len(ordered)) // 100) - 1)]
+
+
+def process_usage(pid: int = None) -> tuple[float, float]:
+    """
+    Return the CPU seconds and the resident memory in MB of a process, this one by default.
+    Another process is read from /proc, so on Linux only; without /proc the memory of this one is its peak.
+    """
+    if pid is None:
+        cpu = time.process_time()
+    else:
+        with open(f"/proc/{pid}/stat") as stat:
+            # The fields after the command name, utime and stime being the 14th and 15th of the line
+            fields = stat.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as status:
+            rss = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:")) / 1024
+    except (OSError, StopIteration):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return cpu, rss
+
+
+def summarize(name: str, messages: int, elapsed: float, latencies: list[float], cpu: float, rss: float, **extra) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "scenario": name,
+        "messages": messages,
+        "seconds": elapsed,
+        "msgs_per_sec": messages / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1e3 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1e3 if latencies else None,
+        "cpu_seconds": cpu,
+        "cpu_us_per_msg": cpu / messages * 1e6 if messages else None,
+        "rss_mb": rss,
+        **extra,
+    }
+
+
+async def _read_response(reader: asyncio.StreamReader) -> bytes:
+    headers = await reader.readuntil(b"\r\n\r\n")
+    length = int(headers.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+    await reader.readexactly(length)
+    if not headers.startswith(b"HTTP/1.1 202"):
+        raise RuntimeError(f"Unexpected response: {headers[:32]!r}")
+    return headers
+
+
+async def _post_loop(port: int, bodies: list[tuple[bytes, bytes, bytes]], latencies: list[float]):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for path, content_type, body in bodies:
+            request = (b"POST " + path + b" HTTP/1.1\r\nHost: bench\r\nContent-Type: " + content_type
+                       + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            started = time.perf_counter()
+            writer.write(request)
+            await _read_response(reader)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+async def _generate_http_load(port: int, requests: list[tuple[bytes, bytes, bytes]], connections: int) -> tuple[float, list[float]]:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(_post_loop(port, requests[i::connections], latencies) for i in range(connections)))
+    return time.perf_counter() - started, latencies
+
+
+def _alert_requests(first_ip: int, count: int) -> list[tuple[bytes, bytes, bytes]]:
+    return [(b"/alert", b"application/json", json.dumps({**ALERT, "ip": ip_of(first_ip + i)}).encode())
+            for i in range(count)]
+
+
+def _batch_requests(first_ip: int, count: int, batch_size: int) -> list[tuple[bytes, bytes, bytes]]:
+    return [(b"/alerts/batch", b"application/x-ndjson",
+             "\n".join(json.dumps({**ALERT, "ip": ip_of(first_ip + i + j)}) for j in range(min(batch_size, count - i))).encode())
+            for i in range(0, count, batch_size)]
+
+
+def bench_api(args, batch: bool) -> dict:
+    """POST /alert or /alerts/batch against the API process, whose CPU time and memory are reported."""
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=("async", "auto", "auto", port, args.log_level), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        # Every alert has its own IP, so that none is answered as a duplicate
+        if batch:
+            warmup = _batch_requests(0, min(args.count, 2000), args.batch_size)
+            requests = _batch_requests(1 << 20, args.count, args.batch_size)
+        else:
+            warmup = _alert_requests(0, min(args.count, 2000))
+            requests = _alert_requests(1 << 20, args.count)
+        asyncio.run(_generate_http_load(port, warmup, args.connections))
+        cpu_started, _ = process_usage(server.pid)
+        client_started = time.process_time()
+        elapsed, latencies = asyncio.run(_generate_http_load(port, requests, args.connections))
+        cpu, rss = process_usage(server.pid)
+        client_cpu = time.process_time() - client_started
+    finally:
+        server.terminate()
+        server.join()
+    return summarize("batch" if batch else "api", args.count, elapsed, latencies, cpu - cpu_started, rss,
+                     requests=len(requests), client_cpu_seconds=client_cpu)
+
+
+class _PubSub:
+    """A publisher and a subscriber connected over an address, with the send time of each alert."""
+
+    def __init__(self, address: str, callback: callable, encrypt_keys: str = None):
+        self.context = zmq.Context()
+        self.publisher = ZMQPublisher(context=self.context)
+        self.publisher._bind_address = address
+        self.publisher.publisher_socket.setsockopt(zmq.SNDHWM, 0)
+        self.subscriber = ZMQSubscriber(on_alert_callback=callback, context=self.context)
+        self.subscriber.subscriber_socket.setsockopt(zmq.RCVHWM, 0)
+        if encrypt_keys:
+            crypto = PayloadCrypto(keys_path=encrypt_keys, cipher="aes-gcm")
+            crypto.reload()
+            self.publisher._aead = self.subscriber._aead = crypto
+        self.publisher.bind()
+        self.subscriber.subscriber_socket.connect(address)
+        self.subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, self.publisher._topic)
+        self.subscriber.start()
+        # Let the subscription reach the publisher before the first alert
+        time.sleep(0.3)
+
+    def publish(self, alerts: list[AlertModel], sent: list[float], rate: float):
+        started = time.perf_counter()
+        for index, alert in enumerate(alerts):
+            if rate:
+                delay = started + index / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent[index] = time.perf_counter()
+            self.publisher.publish_alert(alert)
+        self.publisher.flush()
+
+    def close(self):
+        self.subscriber.stop()
+        self.publisher.close()
+        self.context.term()
+
+
+def _alerts(count: int) -> list[AlertModel]:
+    return [AlertModel(ip=ip_of(i), action=Fail2banAction.BAN, reason="benchmark", message_id=f"{i:016x}",
+                       origin="00000000000000aa")
+            for i in range(count)]
+
+
+def _run_pubsub(name: str, address: str, args, handler: callable = None, **extra) -> dict:
+    """
+    Publish args.count alerts and wait for all of them to be handed over, or handled by the handler
+    when given; the latency of an alert ends when its handling returns.
+    """
+    count = args.count if handler is None else args.pipeline_count
+    alerts = _alerts(count)
+    sent = [0.0] * count
+    latencies: list[float] = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def finished(alert: AlertModel):
+        latency = time.perf_counter() - sent[int(alert.message_id, 16)]
+        with lock:
+            latencies.append(latency)
+            if len(latencies) >= count:
+                done.set()
+
+    def handle(alert: AlertModel):
+        result = handler(alert)
+        finished(alert)
+        return result
+
+    executor = None
+    if handler is not None:
+        executor = BanExecutor(handler=handle, key_func=SubscribeMsgService.extract_jail)
+        executor.start()
+    pubsub = _PubSub(address, executor.submit if executor else finished, encrypt_keys=args.keys_dir)
+    try:
+        cpu_started, _ = process_usage()
+        started = time.perf_counter()
+        pubsub.publish(alerts, sent, args.rate)
+        done.wait(timeout=args.timeout)
+        elapsed = time.perf_counter() - started
+        cpu, rss = process_usage()
+    finally:
+        pubsub.close()
+        if executor is not None:
+            executor.stop(drain=False)
+    return summarize(name, len(latencies), elapsed, latencies, cpu - cpu_started, rss, sent=count,
+                     lost=count - len(latencies), **extra)
+
+
+def bench_pubsub(args, transport: str) -> dict:
+    address = f"tcp://127.0.0.1:{free_port()}" if transport == "tcp" else f"inproc://bench-suite-{os.getpid()}"
+    return _run_pubsub(transport, address, args)
+
+
+def _fake_fail2ban_client(bin_dir: str, latency: float):
+    """Write a `fail2ban-client` answering after the latency, and a `sudo` running its command as is."""
+    scripts = {"sudo": 'exec "$@"\n', "fail2ban-client": f"sleep {latency}\nexit 0\n" if latency else "exit 0\n"}
+    for name, body in scripts.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as script:
+            script.write("#!/bin/sh\n" + body)
+        os.chmod(path, 0o755)
+
+
+def bench_pipeline(args) -> dict:
+    """From publish_alert() to the completion of the fail2ban command of each alert on a subscriber node."""
+    tmp_dir = tempfile.mkdtemp()
+    service = SubscribeMsgService()
+    server = None
+    try:
+        with ExitStack() as stack:
+            if args.fail2ban_transport == "socket":
+                server = Fail2banStubServer(socket_path=os.path.join(tmp_dir, "fail2ban.sock"), latency=args.fail2ban_latency)
+                server.start()
+                stack.enter_context(patch.object(settings, "FAIL2BAN_USE_SOCKET", True))
+                stack.enter_context(patch.object(settings, "FAIL2BAN_SOCKET_PATH", server.socket_path))
+            else:
+                _fake_fail2ban_client(tmp_dir, args.fail2ban_latency)
+                stack.enter_context(patch.dict(os.environ, {"PATH": tmp_dir + os.pathsep + os.environ.get("PATH", "")}))
+                stack.enter_context(patch.object(settings, "FAIL2BAN_USE_SOCKET", False))
+            Fail2banClient.close()
+            dedup_engine.clear()
+            address = f"tcp://127.0.0.1:{free_port()}"
+            result = _run_pubsub("pipeline", address, args, handler=service.process_alert,
+                                 fail2ban_transport=args.fail2ban_transport, fail2ban_latency=args.fail2ban_latency)
+            if server is not None:
+                result["fail2ban_commands"] = len(server.commands)
+            return result
+    finally:
+        Fail2banClient.close()
+        if server is not None:
+            server.stop()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now(UTC).isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "zmq": zmq.zmq_version(),
+        "wire_codec": settings.ZMQ_WIRE_CODEC,
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keys_dir")},
+    }
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> list[str]:
+    """
+    Print the change of each scenario against an earlier run.
+    Returns:
+        list[str]: The scenarios whose throughput dropped or whose p99 latency grew beyond the threshold.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {result["scenario"]: result for result in json.load(baseline_file)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if before is None:
+            continue
+        changes = {}
+        for key in ("msgs_per_sec", "p50_ms", "p99_ms", "cpu_us_per_msg", "rss_mb"):
+            if result.get(key) and before.get(key):
+                changes[key] = result[key] / before[key] - 1
+        print(f"{result['scenario']:<9} " + " | ".join(f"{key} {change:+6.1%}" for key, change in changes.items()))
+        if changes.get("msgs_per_sec", 0) < -threshold or changes.get("p99_ms", 0) > threshold:
+            regressions.append(result["scenario"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert path benchmark suite")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated among {', '.join(SCENARIOS)}")
+    parser.add_argument("--count", type=int, default=20000, help="Alerts per scenario")
+    parser.add_argument("--pipeline-count", type=int, default=5000, help="Alerts of the pipeline scenario")
+    parser.add_argument("--connections", type=int, default=32, help="HTTP keep-alive connections of the load generator")
+    parser.add_argument("--batch-size", type=int, default=100, help="Alerts per POST /alerts/batch request")
+    parser.add_argument("--rate", type=float, default=0.0, help="Alerts per second published, 0 for as fast as possible")
+    parser.add_argument("--encrypt", action="store_true", help="Encrypt the ZMQ payloads with AES-GCM")
+    parser.add_argument("--fail2ban-transport", choices=("socket", "subprocess"), default="socket")
+    parser.add_argument("--fail2ban-latency", type=float, default=0.001, help="Seconds fail2ban takes per command")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Maximum seconds to wait for the alerts of a scenario")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default=f"bench_results_{datetime.now(UTC):%Y%m%dT%H%M%S}.json")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    args.keys_dir = None
+    results = []
+    with ExitStack() as stack:
+        stack.enter_context(patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"}))
+        stack.enter_context(patch.object(ZMQManager, "zmq_security_enabled", args.encrypt))
+        if args.encrypt:
+            args.keys_dir = tempfile.mkdtemp()
+            stack.callback(shutil.rmtree, args.keys_dir, True)
+            PayloadCrypto(keys_path=args.keys_dir, cipher="aes-gcm").generate_key("bench")
+        runners = {
+            "api": lambda: bench_api(args, batch=False),
+            "batch": lambda: bench_api(args, batch=True),
+            "tcp": lambda: bench_pubsub(args, "tcp"),
+            "inproc": lambda: bench_pubsub(args, "inproc"),
+            "pipeline": lambda: bench_pipeline(args),
+        }
+        for name in scenarios:
+            result = runners[name]()
+            results.append(result)
+            print(f"{name:<9} {result['messages']:7d} msgs {result['msgs_per_sec']:10,.0f} msgs/s | "
+                  f"p50 {result['p50_ms'] or 0:8.3f} ms p99 {result['p99_ms'] or 0:8.3f} ms | "
+                  f"CPU {result['cpu_us_per_msg'] or 0:7.1f} us/msg | RSS {result['rss_mb']:6.1f} MB")
+
+    with open(args.output, "w") as output:
+        json.dump({"meta": metadata(args), "results": results}, output, indent=2)
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,209 @@
-from fastapi import APIRouter, status
+import time
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
+from src.config.settings import settings
+from src.fail2ban.ban_state import ban_state
+from src.fail2ban.action import Fail2banAction
 from src.models.alert_model import AlertModel
+from src.shared import alert_trace
+from src.shared.alert_trace import latency_tracker
+from src.shared.allowlist import allowlist
 from src.services.publish_msg_service import PublishMsgService
-from src.shared.custom_cache import is_duplicate
+from src.shared.custom_cache import check_and_register, discard_alert
+from src.shared.metrics import CONTENT_TYPE, metrics
+from src.utils.json_stream import iter_json_array, iter_ndjson
 import logging
 from datetime import datetime, UTC
 
 logger = logging.getLogger(__name__)
 
+_api_alerts = metrics.counter("ids2zmq_api_alerts_total", "Alerts received by the API, by endpoint and outcome.",
+                              labels=("endpoint", "status"))
+_api_seconds = metrics.histogram("ids2zmq_api_request_seconds", "Time to handle an alert request, by endpoint.",
+                                 labels=("endpoint",))
+_alert_accepted = _api_alerts.labels("alert", "accepted")
+_alert_duplicate = _api_alerts.labels("alert", "duplicate")
+_alert_error = _api_alerts.labels("alert", "error")
+_alert_allowlisted = _api_alerts.labels("alert", "allowlisted")
+_alert_seconds = _api_seconds.labels("alert")
+_batch_seconds = _api_seconds.labels("batch")
+
 def get_routes(publisher_service: PublishMsgService):
     """
-    Create and return the API router with the alert route.
+    Create and return the API router with the alert routes.
     Args:
         publisher_service (PublishMsgService): The service used to publish alerts.
     Returns:
-        APIRouter: The FastAPI router with the alert route.
+        APIRouter: The FastAPI router with the alert routes.
     """
     router = APIRouter()
 
+    @router.post("/alerts/batch", status_code=status.HTTP_202_ACCEPTED)
+    async def send_alerts_batch(request: Request):
+        """
+        Endpoint to publish a batch of alerts, sent either as a JSON array or as newline delimited
+        JSON (Content-Type: application/x-ndjson). The body is parsed and validated item by item
+        while it is received, duplicates are removed over the whole batch and the accepted alerts
+        are published together at the end.
+        Args:
+            request (Request): The request streaming the batch.
+        Returns:
+            dict: The number of accepted, duplicate, invalid, rejected and allowlisted alerts and the status of each item.
+        """
+        started = time.perf_counter()
+        content_type = request.headers.get("content-type", "")
+        is_ndjson = "ndjson" in content_type or "jsonlines" in content_type
+        items = iter_ndjson(request.stream()) if is_ndjson else iter_json_array(request.stream())
+        results: list[dict] = []
+        accepted: list[AlertModel] = []
+        counts = {"accepted": 0, "duplicate": 0, "invalid": 0, "rejected": 0, "allowlisted": 0}
+
+        async for index, item in items:
+            if index >= settings.API_BATCH_MAX_ITEMS:
+                results.append({"index": index, "status": "rejected", "error": f"Batch limited to {settings.API_BATCH_MAX_ITEMS} alerts"})
+                counts["rejected"] += 1
+                break
+            if isinstance(item, ValueError):
+                results.append({"index": index, "status": "invalid", "error": str(item)})
+                counts["invalid"] += 1
+                continue
+            try:
+                alert = AlertModel.model_validate(item)
+                alert_trace.stamp(alert, alert_trace.API)
+            except ValidationError as e:
+                results.append({"index": index, "status": "invalid", "error": e.errors(include_url=False, include_context=False, include_input=False)})
+                counts["invalid"] += 1
+                continue
+            if alert.action == Fail2banAction.BAN and allowlist.is_allowed(alert.ip, path="api"):
+                results.append({"index": index, "status": "allowlisted"})
+                counts["allowlisted"] += 1
+                continue
+            if check_and_register(ip=alert.ip, action=alert.action, jail=alert.jail):
+                results.append({"index": index, "status": "duplicate"})
+                counts["duplicate"] += 1
+                continue
+            alert_trace.stamp(alert, alert_trace.DEDUP)
+            alert.processing_timestamp = datetime.now(UTC)
+            accepted.append(alert)
+            results.append({"index": index, "status": "accepted"})
+
+        try:
+            await publisher_service.publish_alerts_async(accepted)
+            counts["accepted"] = len(accepted)
+        except Exception as e:
+            logger.error("POST /alerts/batch failed to publish %d alerts: %s", len(accepted), e)
+            for alert in accepted:
+                discard_alert(ip=alert.ip, action=alert.action, jail=alert.jail)
+            for result in results:
+                if result["status"] == "accepted":
+                    result.update(status="error", error=str(e))
+            counts["rejected"] += len(accepted)
+        logger.info("POST /alerts/batch processed %d items: %s", len(results), counts)
+        for outcome, count in counts.items():
+            if count:
+                _api_alerts.labels("batch", outcome).inc(count)
+        _batch_seconds.observe(time.perf_counter() - started)
+        return {**counts, "results": results}
+
     @router.post("/alert", status_code=status.HTTP_202_ACCEPTED)
-    def send_alert(alert: AlertModel):
+    async def send_alert(alert: AlertModel):
         """
         Endpoint to publish an alert.
+        The endpoint runs on the event loop rather than on a worker thread: the jail check and the
+        dedup lookup are in-memory and the publish hand-off never waits (a PUB socket drops instead
+        of blocking), so every alert is served without a thread switch.
         Args:
             alert (AlertModel): The alert to be published.
         Returns:
             dict: A response indicating the status of the alert publication.
         """
+        started = time.perf_counter()
+        # Peers, this node and the protected networks are never banned, checked before any other work
+        if alert.action == Fail2banAction.BAN and allowlist.is_allowed(alert.ip, path="api"):
+            logger.warning("HTTP STATUS 403 - Refusing to ban allowlisted address: %s, %s", alert.ip, alert.jail)
+            _alert_allowlisted.inc()
+            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN,
+                                content={"status": "allowlisted", "message": f"{alert.ip} is allowlisted and never banned"})
+        alert_trace.stamp(alert, alert_trace.API)
         try:
             alert.processing_timestamp = datetime.now(UTC)
-            if is_duplicate(ip=alert.ip, action=alert.action, jail=alert.jail):
+            if check_and_register(ip=alert.ip, action=alert.action, jail=alert.jail):
                 # If the alert is a duplicate, log it and return a response
-                logger.info(f"HTTP STATUS 208 - Duplicate alert detected: {alert}")
+                logger.debug("HTTP STATUS 208 - Duplicate alert detected: %s, %s, %s", alert.ip, alert.action, alert.jail)
+                _alert_duplicate.inc()
+                _alert_seconds.observe(time.perf_counter() - started)
                 return {"status": "duplicate", "message": f"Alert ({alert.ip}, {alert.action}, {alert.jail}) already processed"}, status.HTTP_208_ALREADY_REPORTED
-            else:
-                logger.info(f"HTTP STATUS 202 - POST /alert called with alert: {alert}")
-                publisher_service.publish_alert(alert)
-                return {"status": "alert published"}
+            alert_trace.stamp(alert, alert_trace.DEDUP)
+            logger.info("HTTP STATUS 202 - POST /alert accepted: %s, %s, %s", alert.ip, alert.action, alert.jail)
+            try:
+                await publisher_service.publish_alert_async(alert)
+            except Exception:
+                # Let the alert through again once the publisher recovers
+                discard_alert(ip=alert.ip, action=alert.action, jail=alert.jail)
+                raise
+            _alert_accepted.inc()
+            _alert_seconds.observe(time.perf_counter() - started)
+            return {"status": "alert published"}
         except Exception as e:
-            logger.error(f"POST /alert failed: {e}")
+            logger.error("POST /alert failed: %s", e)
+            _alert_error.inc()
+            _alert_seconds.observe(time.perf_counter() - started)
             # return the error response
             return {"status": "error", "HTTP ERROR 500": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
 
+    @router.get("/metrics")
+    async def get_metrics():
+        """
+        Endpoint exposing the counters and latency histograms of the pipeline.
+        Returns:
+            PlainTextResponse: The metrics in the Prometheus text format.
+        """
+        return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+    @router.get("/latency")
+    async def get_latency():
+        """
+        Endpoint exposing the detection to ban latency of the alerts banned by this node, per origin
+        node, and the time spent in each stage, recorded when ALERT_TRACE_ENABLED.
+        Returns:
+            dict: The count, p50, p90, p99 and max in seconds, per origin node and per stage.
+        """
+        return latency_tracker.summary()
+
+    @router.get("/bans")
+    async def get_bans():
+        """
+        Endpoint exposing the number of IPs banned in each jail according to the ban state index.
+        Returns:
+            dict: The count per loaded jail.
+        """
+        return {"jails": ban_state.stats()}
+
+    @router.get("/bans/{jail}")
+    async def get_jail_bans(jail: str, ip: str = None):
+        """
+        Endpoint exposing the IPs banned in a jail according to the ban state index.
+        Args:
+            jail (str): The jail.
+            ip (str): An IP address to look up instead of listing them all.
+        Returns:
+            dict: The banned IPs of the jail, or whether the given IP is banned.
+        Raises:
+            HTTPException: 404 if the jail is not loaded, 422 if ip is not an IP address.
+        """
+        if ip is not None:
+            try:
+                banned = ban_state.is_banned(jail, ip)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+            if banned is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Jail {jail} is not loaded")
+            return {"jail": jail, "ip": ip, "banned": banned}
+        ips = ban_state.banned(jail)
+        if ips is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Jail {jail} is not loaded")
+        return {"jail": jail, "count": len(ips), "ips": ips}
+
     return router
@@ -11,15 +11,109 @@ class Settings(BaseSettings):
         ZMQ_TOPIC_FAIL2BAN_ALERT (str): Topic for Fail2Ban alerts.
         ZMQ_ROUTER_BIND_ADDRESS (str): Address for the ZMQ router.
         API_KEY (str): Secret API key for authentication.
+        API_BATCH_MAX_ITEMS (int): Maximum number of alerts accepted by one POST /alerts/batch request.
+        API_LOOP (str): uvicorn event loop: "auto" (uvloop when installed), "uvloop" or "asyncio".
+        API_HTTP (str): uvicorn HTTP parser: "auto" (httptools when installed), "httptools" or "h11".
+        METRICS_ENABLED (bool): Record the counters and latency histograms of the pipeline, exposed by GET /metrics.
+        ALERT_TRACE_ENABLED (bool): Stamp the time of each stage on the alerts and carry it to the peers, which aggregate the
+            detection to ban latency per origin node, exposed by GET /latency. Needs the clocks of the nodes kept in sync
+            (NTP), and every node upgraded first: older nodes reject the binary alerts carrying a trace.
+        ALERT_LATENCY_WINDOW (int): Number of most recent bans per origin node the latency percentiles are computed on.
+        ENABLE_ASYNC_RUNTIME (bool): Run the API and the ZMQ sockets as asyncio tasks on a single event loop.
+        ENABLE_ZMQ_ROUTER (bool): Start the ZMQ router alongside the publisher and subscriber.
         LOG_LEVEL (str): Logging level.
         LOG_FILE (str): Log file path.
+        LOG_FORMAT (str): "text" lines, or "json" objects with the extra fields of each record.
+        LOG_ASYNC (bool): Hand the records over to a queue written by a listener thread, so that logging never blocks on I/O.
+        LOG_QUEUE_SIZE (int): Maximum records waiting to be written with LOG_ASYNC, the next ones being dropped.
+        LOG_SAMPLE_RATE (float): Fraction of the INFO and DEBUG records kept per logger, 1 to keep them all.
+        LOG_RATE_LIMIT (float): Records per second kept per logger and level, 0 for no limit; CRITICAL is never limited.
         ENABLE_ZMQ_SECURITY (bool): Enable ZMQ security features.
+        ZMQ_SECURITY_MECHANISM (str): "plain" for PLAIN authentication with Fernet encrypted payloads, or "curve" for
+            CURVE authentication and encryption by libzmq, each peer's public certificate being <ip>.key in
+            ZMQ_TRUSTED_PEERS_CERTS_PATH.
         ZMQ_SECURITY_USERNAME (str): Username for ZMQ security.
         ZMQ_SECURITY_PASSWORD (str): Password for ZMQ security.
         ZMQ_CERTS_PATH (str): Path to ZMQ certificates.
         ZMQ_CERTS_NAME (str): Name of the ZMQ certificates.
         ZMQ_TRUSTED_PEERS_CERTS_PATH (str): Path to trusted peers' certificates.
         ZMQ_SYMMETRICAL_KEY_FILE (str): File containing the symmetric key for encryption.
+        ZMQ_PAYLOAD_CIPHER (str): Cipher of the payloads with PLAIN security: "fernet" with ZMQ_SYMMETRICAL_KEY_FILE, or the
+            AEAD "aes-gcm" or "chacha20-poly1305" with the keys of ZMQ_PAYLOAD_KEYS_PATH, both decrypted whichever is set.
+        ZMQ_PAYLOAD_KEYS_PATH (str): Directory of the AEAD payload keys, one base64 encoded 32 bytes key per *.key file.
+        ZMQ_PAYLOAD_KEY_ACTIVATION_DELAY (float): Seconds a new key file waits before being used to encrypt, so that every
+            node loaded it first; it decrypts right away.
+        ZMQ_PAYLOAD_KEYS_REFRESH_INTERVAL (float): Seconds between two checks of ZMQ_PAYLOAD_KEYS_PATH for added or removed keys.
+        ZMQ_WIRE_CODEC (str): Codec of the published alert payloads, "binary" or "json"; both are decoded on receipt.
+        NODE_ID (str): Name of this node, hashed into the origin id of the published alerts; random per process when empty.
+        NODE_IDENTITY_REFRESH_INTERVAL (float): Seconds between two enumerations of the local addresses of this node.
+        ZMQ_SEEN_FILTER_CAPACITY (int): Number of message ids per window the subscriber's seen filter is sized for.
+        ZMQ_SEEN_FILTER_ERROR_RATE (float): Target false positive rate of the seen filter.
+        ZMQ_SEEN_FILTER_WINDOW (float): Seconds a message id is remembered by the seen filter, at least.
+        ZMQ_SUBSCRIBER_MAX_IN_FLIGHT (int): Maximum plain callback calls the asyncio subscriber runs in the executor at once.
+        ZMQ_PUBLISH_BATCH_ENABLED (bool): Gather the published alerts into envelope messages encrypted at once.
+        ZMQ_PUBLISH_BATCH_WINDOW (float): Maximum seconds an alert waits for its envelope to fill up.
+        ZMQ_PUBLISH_BATCH_MAX_SIZE (int): Number of alerts after which an envelope is sent immediately.
+        ZMQ_PUBLISH_BATCH_URGENT_SEVERITIES (list[str]): Severities of the alerts sent immediately, with the pending ones.
+        FAIL2BAN_JAIL_REFRESH_INTERVAL (float): Seconds between two background refreshes of the active jails.
+        FAIL2BAN_JAIL_MISS_REFRESH_COOLDOWN (float): Minimum seconds between two jail refreshes forced by unknown jails.
+        FAIL2BAN_USE_SOCKET (bool): Send commands over fail2ban-server's socket instead of spawning fail2ban-client.
+        FAIL2BAN_SOCKET_PATH (str): Path of fail2ban-server's Unix socket.
+        FAIL2BAN_SOCKET_TIMEOUT (float): Timeout in seconds of the requests sent on fail2ban-server's socket.
+        FAIL2BAN_SOCKET_RETRY_INTERVAL (float): Seconds to fall back to fail2ban-client after a socket failure.
+        FAIL2BAN_BATCH_ENABLED (bool): Gather ban/unban actions into multi-IP fail2ban commands.
+        FAIL2BAN_BATCH_WINDOW (float): Maximum seconds an action waits for its batch to fill up.
+        FAIL2BAN_BATCH_MAX_SIZE (int): Number of IPs after which a batch is executed immediately.
+        FAIL2BAN_BAN_STATE_ENABLED (bool): Index the IPs banned in each jail and skip the actions fail2ban already reflects.
+        FAIL2BAN_BAN_STATE_SOURCE (str): Where the index is loaded from, "status" for `status <jail>` or "database" for
+            fail2ban's SQLite database, falling back to "status" when it cannot be read.
+        FAIL2BAN_DATABASE_PATH (str): fail2ban's SQLite database, dbfile in fail2ban.conf.
+        FAIL2BAN_BAN_STATE_RECONCILE_INTERVAL (float): Seconds between two reloads of the index from fail2ban.
+        PREFIX_AGGREGATION_ENABLED (bool): Escalate the bans of many hosts of a prefix into a ban of the prefix, and ban
+            the IPv6 addresses as their PREFIX_AGGREGATION_IPV6_HOST_PREFIX network.
+        PREFIX_AGGREGATION_IPV4_PREFIX (int): Length of the IPv4 prefixes the bans are escalated to.
+        PREFIX_AGGREGATION_IPV6_PREFIX (int): Length of the IPv6 prefixes the bans are escalated to.
+        PREFIX_AGGREGATION_IPV6_HOST_PREFIX (int): Length of the network an IPv6 address is banned as, 128 for the address only.
+        PREFIX_AGGREGATION_THRESHOLDS (dict[str, int]): Number of bans within a prefix triggering its escalation, per jail.
+        PREFIX_AGGREGATION_DEFAULT_THRESHOLD (int): Threshold of the jails missing from PREFIX_AGGREGATION_THRESHOLDS, 0 to
+            never escalate.
+        PREFIX_AGGREGATION_TTL (float): Seconds a ban is counted for the aggregation, at most the bantime of the jails.
+        BAN_EXECUTOR_ENABLED (bool): Hand the received alerts to a bounded pool of workers instead of the subscriber thread.
+        BAN_EXECUTOR_WORKERS (int): Number of ban executor worker threads.
+        BAN_EXECUTOR_QUEUE_SIZE (int): Maximum number of alerts waiting in the ban executor queue.
+        BAN_EXECUTOR_PER_JAIL_LIMIT (int): Maximum number of alerts of the same jail handled concurrently.
+        BAN_EXECUTOR_OVERFLOW_POLICY (str): "block", "drop_newest" or "drop_oldest" when the queue is full.
+        BAN_EXECUTOR_BLOCK_TIMEOUT (float): Maximum seconds the subscriber waits for room with the "block" policy.
+        DEDUP_ACTION_TTLS (dict[str, float]): Seconds an alert is remembered by the dedup engine, per action.
+        DEDUP_ACTION_CAPACITIES (dict[str, int]): Maximum number of alerts remembered by the dedup engine, per action.
+        DEDUP_DEFAULT_TTL (float): Dedup TTL of the actions missing from DEDUP_ACTION_TTLS.
+        DEDUP_DEFAULT_CAPACITY (int): Dedup capacity of the actions missing from DEDUP_ACTION_CAPACITIES.
+        DEDUP_SHARDS (int): Number of independently locked shards of each dedup table.
+        BAN_JOURNAL_ENABLED (bool): Journal the applied actions, restoring the ban and dedup state on restart.
+        BAN_JOURNAL_PATH (str): Directory of the ban journal and of its snapshot.
+        BAN_JOURNAL_FSYNC_INTERVAL (float): Maximum seconds between the write of a journal record and its fsync, what a
+            power loss can lose; a crash of the process loses nothing.
+        BAN_JOURNAL_FSYNC_BATCH (int): Number of pending journal records fsynced without waiting for the interval.
+        BAN_JOURNAL_COMPACT_SIZE (int): Size in bytes of the journal triggering its compaction into the snapshot.
+        BAN_EXPIRY_ENABLED (bool): Unban the received bans once their duration, set by the policy below, has elapsed,
+            instead of leaving it to the bantime of the local jails, which must then be longer (or -1, never).
+        BAN_EXPIRY_PATH (str): Directory of the saved ban expiry timers.
+        BAN_EXPIRY_DURATIONS (dict[str, float]): Seconds a ban lasts, per jail, 0 to leave the bans of a jail to fail2ban.
+        BAN_EXPIRY_DEFAULT_DURATION (float): Ban duration of the jails missing from BAN_EXPIRY_DURATIONS.
+        BAN_EXPIRY_SEVERITY_FACTORS (dict[str, float]): Factor of the ban duration per alert severity, 1 for the others.
+        BAN_EXPIRY_REPEAT_FACTOR (float): Factor of the ban duration per earlier ban of the same IP in the same jail.
+        BAN_EXPIRY_REPEAT_WINDOW (float): Seconds the bans of an IP are counted as repeat offences after their expiry.
+        BAN_EXPIRY_MAX_DURATION (float): Longest ban duration, whatever the severity and the repeat offences.
+        BAN_EXPIRY_RESOLUTION (float): Seconds per tick of the timer wheel, how late a ban may be lifted.
+        BAN_EXPIRY_BATCH_SIZE (int): Maximum number of IPs unbanned by one fail2ban command.
+        BAN_EXPIRY_SAVE_INTERVAL (float): Seconds between two saves of the timers, what a crash can lose.
+        ALLOWLIST_ENABLED (bool): Refuse to ban the allowlisted addresses, in the API and on receipt.
+        ALLOWLIST (str): Comma-separated addresses and networks never banned, such as the management networks.
+        ALLOWLIST_FILE (str): File of addresses and networks never banned, one per line with # comments, reloaded when
+            modified; none if empty.
+        ALLOWLIST_TRUSTED_HOSTS (bool): Never ban the trusted hosts of the cluster, TRUSTED_HOSTS or TRUSTED_HOSTS_FILE.
+        ALLOWLIST_LOCAL_ADDRESSES (bool): Never ban the addresses of this node.
+        ALLOWLIST_REFRESH_INTERVAL (float): Seconds between two checks of ALLOWLIST_FILE for changes.
         TRUSTED_HOSTS_FILE (str): File containing trusted hosts.
         TRUSTED_HOSTS (str): Comma-separated list of trusted hosts.
     Uses:
@@ -39,19 +133,117 @@ class Settings(BaseSettings):
     ZMQ_ROUTER_BIND_ADDRESS: str = "tcp://0.0.0.0:5555"
 
     API_KEY: str = "YOUR_SECRET_API_KEY"
+    API_BATCH_MAX_ITEMS: int = 10000
+    API_LOOP: str = "auto"
+    API_HTTP: str = "auto"
+    METRICS_ENABLED: bool = True
+    ALERT_TRACE_ENABLED: bool = False
+    ALERT_LATENCY_WINDOW: int = 4096
+
+    # Runtime configuration
+    ENABLE_ASYNC_RUNTIME: bool = False
+    ENABLE_ZMQ_ROUTER: bool = False
 
     # Logging configuration
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "app.log"
+    LOG_FORMAT: str = "text"
+    LOG_ASYNC: bool = True
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_RATE: float = 1.0
+    LOG_RATE_LIMIT: float = 100.0
 
     # ZMQ configuration
     ENABLE_ZMQ_SECURITY: bool = True
+    ZMQ_SECURITY_MECHANISM: str = "plain"
     ZMQ_SECURITY_USERNAME: str = "zmq_user"
     ZMQ_SECURITY_PASSWORD: str = "zmq_password"
     ZMQ_CERTS_PATH: str = "certs/"
     ZMQ_CERTS_NAME: str = "local"
     ZMQ_TRUSTED_PEERS_CERTS_PATH: str = "certs/authorized_clients/"
     ZMQ_SYMMETRICAL_KEY_FILE: str = "symmetric_key.key"
+    ZMQ_PAYLOAD_CIPHER: str = "fernet"
+    ZMQ_PAYLOAD_KEYS_PATH: str = "certs/payload_keys/"
+    ZMQ_PAYLOAD_KEY_ACTIVATION_DELAY: float = 60.0
+    ZMQ_PAYLOAD_KEYS_REFRESH_INTERVAL: float = 10.0
+    ZMQ_WIRE_CODEC: str = "binary"
+    NODE_ID: str = ""
+    NODE_IDENTITY_REFRESH_INTERVAL: float = 300.0
+    ZMQ_SEEN_FILTER_CAPACITY: int = 1000000
+    ZMQ_SEEN_FILTER_ERROR_RATE: float = 0.0001
+    ZMQ_SEEN_FILTER_WINDOW: float = 300.0
+    ZMQ_SUBSCRIBER_MAX_IN_FLIGHT: int = 64
+    ZMQ_PUBLISH_BATCH_ENABLED: bool = False
+    ZMQ_PUBLISH_BATCH_WINDOW: float = 0.005
+    ZMQ_PUBLISH_BATCH_MAX_SIZE: int = 128
+    ZMQ_PUBLISH_BATCH_URGENT_SEVERITIES: list[str] = ["high", "critical"]
+
+    # Fail2ban configuration
+    FAIL2BAN_JAIL_REFRESH_INTERVAL: float = 60.0
+    FAIL2BAN_JAIL_MISS_REFRESH_COOLDOWN: float = 5.0
+    FAIL2BAN_USE_SOCKET: bool = True
+    FAIL2BAN_SOCKET_PATH: str = "/var/run/fail2ban/fail2ban.sock"
+    FAIL2BAN_SOCKET_TIMEOUT: float = 5.0
+    FAIL2BAN_SOCKET_RETRY_INTERVAL: float = 30.0
+    FAIL2BAN_BATCH_ENABLED: bool = False
+    FAIL2BAN_BATCH_WINDOW: float = 0.05
+    FAIL2BAN_BATCH_MAX_SIZE: int = 200
+    FAIL2BAN_BAN_STATE_ENABLED: bool = True
+    FAIL2BAN_BAN_STATE_SOURCE: str = "status"
+    FAIL2BAN_DATABASE_PATH: str = "/var/lib/fail2ban/fail2ban.sqlite3"
+    FAIL2BAN_BAN_STATE_RECONCILE_INTERVAL: float = 60.0
+
+    # Prefix aggregation configuration
+    PREFIX_AGGREGATION_ENABLED: bool = False
+    PREFIX_AGGREGATION_IPV4_PREFIX: int = 24
+    PREFIX_AGGREGATION_IPV6_PREFIX: int = 48
+    PREFIX_AGGREGATION_IPV6_HOST_PREFIX: int = 64
+    PREFIX_AGGREGATION_THRESHOLDS: dict[str, int] = {}
+    PREFIX_AGGREGATION_DEFAULT_THRESHOLD: int = 16
+    PREFIX_AGGREGATION_TTL: float = 600.0
+
+    # Ban executor configuration
+    BAN_EXECUTOR_ENABLED: bool = True
+    BAN_EXECUTOR_WORKERS: int = 4
+    BAN_EXECUTOR_QUEUE_SIZE: int = 10000
+    BAN_EXECUTOR_PER_JAIL_LIMIT: int = 2
+    BAN_EXECUTOR_OVERFLOW_POLICY: str = "block"
+    BAN_EXECUTOR_BLOCK_TIMEOUT: float = 1.0
+
+    # Dedup engine configuration
+    DEDUP_ACTION_TTLS: dict[str, float] = {"banip": 60.0, "unbanip": 60.0}
+    DEDUP_ACTION_CAPACITIES: dict[str, int] = {"banip": 1000000, "unbanip": 100000}
+    DEDUP_DEFAULT_TTL: float = 60.0
+    DEDUP_DEFAULT_CAPACITY: int = 10000
+    DEDUP_SHARDS: int = 16
+
+    # Ban journal configuration
+    BAN_JOURNAL_ENABLED: bool = True
+    BAN_JOURNAL_PATH: str = "state/"
+    BAN_JOURNAL_FSYNC_INTERVAL: float = 0.05
+    BAN_JOURNAL_FSYNC_BATCH: int = 256
+    BAN_JOURNAL_COMPACT_SIZE: int = 16777216
+
+    # Ban expiry configuration
+    BAN_EXPIRY_ENABLED: bool = False
+    BAN_EXPIRY_PATH: str = "state/"
+    BAN_EXPIRY_DURATIONS: dict[str, float] = {}
+    BAN_EXPIRY_DEFAULT_DURATION: float = 3600.0
+    BAN_EXPIRY_SEVERITY_FACTORS: dict[str, float] = {"low": 0.5, "medium": 1.0, "high": 2.0, "critical": 4.0}
+    BAN_EXPIRY_REPEAT_FACTOR: float = 2.0
+    BAN_EXPIRY_REPEAT_WINDOW: float = 86400.0
+    BAN_EXPIRY_MAX_DURATION: float = 604800.0
+    BAN_EXPIRY_RESOLUTION: float = 1.0
+    BAN_EXPIRY_BATCH_SIZE: int = 500
+    BAN_EXPIRY_SAVE_INTERVAL: float = 5.0
+
+    # Allowlist configuration
+    ALLOWLIST_ENABLED: bool = True
+    ALLOWLIST: str = "127.0.0.0/8,::1"
+    ALLOWLIST_FILE: str = ""
+    ALLOWLIST_TRUSTED_HOSTS: bool = True
+    ALLOWLIST_LOCAL_ADDRESSES: bool = True
+    ALLOWLIST_REFRESH_INTERVAL: float = 10.0
 
     TRUSTED_HOSTS_FILE: str = "trustedHost.json"
     TRUSTED_HOSTS: str = ""
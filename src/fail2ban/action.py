@@ -4,3 +4,7 @@ class Fail2banAction(str, Enum):
     BAN = "banip"
     UNBAN = "unbanip"
     STATUS = "status"
+
+    def __str__(self) -> str:
+        # The command word, as sent to fail2ban, rather than "Fail2banAction.BAN"
+        return self.value
@@ -0,0 +1,447 @@
+import ipaddress
+import os
+import struct
+import threading
+import time
+import logging
+import zlib
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.ban_state import ban_state
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.prefix_aggregator import prefix_aggregator
+from src.shared.ban_journal import ban_journal, fsync_directory
+from src.shared.custom_cache import discard_alert
+from src.shared.metrics import metrics
+from src.shared.timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+ban_expiry.start()
+ban_expiry.schedule(jail="sshd", target="1.2.3.4", severity="high")
+ban_expiry.cancel(jail="sshd", target="1.2.3.4")
+ban_expiry.stop()
+"""
+
+STATE_FILE = "ban.expiry"
+
+# Attempts to unban an IP before leaving it to fail2ban, and seconds between two of them
+_MAX_ATTEMPTS = 3
+_RETRY_DELAY = 60.0
+# Cap of the repeat offences counted in the duration, the policy maximum being reached long before
+_MAX_REPEATS = 64
+
+# State: magic, version, timer count, offence count | per timer: expiry wall time, attempts, jail length,
+# target length, jail, target | per offence: expiry of the last ban, ban count, lengths, jail, target | crc32
+_STATE_MAGIC = b"IBES"
+_STATE_VERSION = 1
+_STATE_HEADER = struct.Struct("<4sHII")
+_STATE_TIMER = struct.Struct("<dBHH")
+_STATE_OFFENCE = struct.Struct("<dIHH")
+_STATE_CRC = struct.Struct("<I")
+
+_scheduled = metrics.counter("ids2zmq_ban_expiry_scheduled_total", "Bans given an expiry, by jail.", labels=("jail",))
+_expired = metrics.counter("ids2zmq_ban_expiry_unbanned_total", "Expired bans lifted, by result.", labels=("result",))
+_expired_ok, _expired_retried, _expired_dropped = (_expired.labels(result) for result in ("unbanned", "retried", "dropped"))
+_unban_seconds = metrics.histogram("ids2zmq_ban_expiry_unban_seconds", "Time to lift a batch of expired bans, fail2ban included.")
+
+
+def record_unban(jail: str, target: str):
+    """
+    Reflect a ban lifted in fail2ban in the ban state, the journal and the dedup engine. The bans are
+    recorded by host address, an IPv6 host being banned as its network: lifting a network lifts the
+    hosts recorded within it.
+    Args:
+        jail (str): The jail.
+        target (str): The IP address or the network unbanned.
+    """
+    if "/" in target:
+        network = ipaddress.ip_network(target, strict=False)
+        recorded = set(ban_state.banned(jail) or ()) | set(ban_journal.banned(jail) if ban_journal.is_open else ())
+        hosts = [host for host in recorded if ipaddress.ip_address(host) in network]
+    else:
+        hosts = [target]
+    for host in hosts:
+        ban_state.apply(action=Fail2banAction.UNBAN, jail=jail, ip=host)
+        ban_journal.record(action=Fail2banAction.UNBAN, jail=jail, ip=host)
+        # A new alert for the address must ban it again, not be skipped as a copy of the lifted one
+        discard_alert(ip=host, action=Fail2banAction.BAN, jail=jail)
+
+
+def encode_state(timers: list[tuple[str, str, float, int]], offences: list[tuple[str, str, float, int]]) -> bytes:
+    """
+    Encode the state of the scheduler.
+    Args:
+        timers (list[tuple[str, str, float, int]]): The jail, target, expiry wall time and unban attempts of each ban.
+        offences (list[tuple[str, str, float, int]]): The jail, target, expiry of the last ban and ban count of each offender.
+    Returns:
+        bytes: The state, checksummed so that a torn or corrupted file is detected on load.
+    """
+    parts = [_STATE_HEADER.pack(_STATE_MAGIC, _STATE_VERSION, len(timers), len(offences))]
+    for jail, target, expires_at, attempts in timers:
+        jail_bytes, target_bytes = jail.encode(), target.encode()
+        parts.append(_STATE_TIMER.pack(expires_at, attempts, len(jail_bytes), len(target_bytes)) + jail_bytes + target_bytes)
+    for jail, target, last_expiry, count in offences:
+        jail_bytes, target_bytes = jail.encode(), target.encode()
+        parts.append(_STATE_OFFENCE.pack(last_expiry, count, len(jail_bytes), len(target_bytes)) + jail_bytes + target_bytes)
+    body = b"".join(parts)
+    return body + _STATE_CRC.pack(zlib.crc32(body))
+
+
+def decode_state(data: bytes) -> tuple[list[tuple[str, str, float, int]], list[tuple[str, str, float, int]]]:
+    """
+    Decode the state of the scheduler.
+    Args:
+        data (bytes): The content of the state file.
+    Returns:
+        tuple[list, list]: The timers and the offences, as given to encode_state().
+    Raises:
+        ValueError: If the state is truncated, corrupted or of another version.
+    """
+    if len(data) < _STATE_HEADER.size + _STATE_CRC.size:
+        raise ValueError("Ban expiry state truncated")
+    body, (crc,) = data[:-_STATE_CRC.size], _STATE_CRC.unpack_from(data, len(data) - _STATE_CRC.size)
+    if zlib.crc32(body) != crc:
+        raise ValueError("Ban expiry state corrupted: checksum mismatch")
+    magic, version, timer_count, offence_count = _STATE_HEADER.unpack_from(body, 0)
+    if magic != _STATE_MAGIC or version != _STATE_VERSION:
+        raise ValueError(f"Unsupported ban expiry state: {magic!r} version {version}")
+    position = _STATE_HEADER.size
+    decoded = []
+    for layout, count in ((_STATE_TIMER, timer_count), (_STATE_OFFENCE, offence_count)):
+        entries = []
+        for _ in range(count):
+            at, number, jail_length, target_length = layout.unpack_from(body, position)
+            position += layout.size
+            jail = body[position:position + jail_length].decode()
+            target = body[position + jail_length:position + jail_length + target_length].decode()
+            position += jail_length + target_length
+            entries.append((jail, target, at, number))
+        decoded.append(entries)
+    if position != len(body):
+        raise ValueError("Ban expiry state corrupted: trailing bytes")
+    return decoded[0], decoded[1]
+
+
+class BanExpiryScheduler:
+    """
+    Owner of the lifetime of the received bans: each ban applied is given an expiry, and lifted by an
+    unbanip sent to fail2ban once it has passed.
+    The duration of a ban is set by the policy: the duration of its jail, times the factor of the
+    severity of the alert, times repeat_factor for each earlier ban of the same target in the same jail
+    within repeat_window seconds, at most max_duration. The expiries are held in a hierarchical timer
+    wheel, scheduling and cancelling a ban in constant time whatever the number of bans, and a
+    background thread advances it every resolution seconds, lifting the expired bans of each jail with
+    batched commands of at most batch_size IPs. A batch that fails is retried after a minute, each ban
+    given up after a few attempts, fail2ban's own bantime lifting it then. The bans and the offences
+    are saved every save_interval seconds when changed, and on stop; on start, the bans expired while
+    stopped are lifted at once.
+    Args:
+        enabled (bool): Schedule the bans, BAN_EXPIRY_ENABLED by default; schedule() does nothing otherwise.
+        path (str): Directory of the state file.
+        durations (dict[str, float]): Seconds a ban lasts, per jail, 0 to leave the bans of a jail to fail2ban.
+        default_duration (float): Duration of the jails missing from durations.
+        severity_factors (dict[str, float]): Factor of the duration per severity, 1 for the others.
+        repeat_factor (float): Factor of the duration per earlier ban of the target.
+        repeat_window (float): Seconds the bans of a target are remembered after their expiry.
+        max_duration (float): Longest duration.
+        resolution (float): Seconds per tick of the timer wheel.
+        batch_size (int): Maximum number of targets per unbanip command.
+        save_interval (float): Seconds between two saves of the state.
+        executor (Callable[[str, str, list[str]], bool]): Executes a batched action, Fail2banClient.execute_batch by default.
+    Attributes:
+        _wheel (TimerWheel): The expiry of each ban, keyed by jail and target, holding the unban attempts.
+        _offences (dict[tuple[str, str], tuple[float, int]]): The expiry of the last ban and the ban count of each target.
+        _dirty (bool): Whether the state changed since it was last saved.
+        _stop_event (threading.Event): Event used to stop the background thread.
+        _thread (threading.Thread): The background thread once started.
+    Methods:
+        duration(jail, severity, repeats): Return the duration of a ban according to the policy.
+        schedule(jail, target, severity): Give an applied ban its expiry.
+        cancel(jail, target): Forget the expiry of a ban lifted otherwise.
+        expires_at(jail, target): Return when a ban expires.
+        expire(now): Lift the bans expired.
+        load(): Restore the state saved.
+        save(): Save the state.
+        stats(): Return the number of bans and offenders.
+        start(): Restore the state and start the background thread.
+        stop(): Stop the background thread and save the state.
+    """
+
+    def __init__(self, enabled: bool = None, path: str = None, durations: dict[str, float] = None,
+                 default_duration: float = None, severity_factors: dict[str, float] = None, repeat_factor: float = None,
+                 repeat_window: float = None, max_duration: float = None, resolution: float = None,
+                 batch_size: int = None, save_interval: float = None, executor=None):
+        self.enabled = settings.BAN_EXPIRY_ENABLED if enabled is None else enabled
+        self._path = settings.BAN_EXPIRY_PATH if path is None else path
+        self._durations = dict(settings.BAN_EXPIRY_DURATIONS if durations is None else durations)
+        self._default_duration = settings.BAN_EXPIRY_DEFAULT_DURATION if default_duration is None else default_duration
+        factors = settings.BAN_EXPIRY_SEVERITY_FACTORS if severity_factors is None else severity_factors
+        self._severity_factors = {severity.lower(): factor for severity, factor in factors.items()}
+        self._repeat_factor = settings.BAN_EXPIRY_REPEAT_FACTOR if repeat_factor is None else repeat_factor
+        self._repeat_window = settings.BAN_EXPIRY_REPEAT_WINDOW if repeat_window is None else repeat_window
+        self._max_duration = settings.BAN_EXPIRY_MAX_DURATION if max_duration is None else max_duration
+        self._resolution = settings.BAN_EXPIRY_RESOLUTION if resolution is None else resolution
+        self._batch_size = settings.BAN_EXPIRY_BATCH_SIZE if batch_size is None else batch_size
+        self._save_interval = settings.BAN_EXPIRY_SAVE_INTERVAL if save_interval is None else save_interval
+        self._executor = Fail2banClient.execute_batch if executor is None else executor
+        self._wheel = TimerWheel(resolution=self._resolution, now=time.time())
+        self._offences: dict[tuple[str, str], tuple[float, int]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def duration(self, jail: str, severity: str = None, repeats: int = 0) -> float:
+        """
+        Return the duration of a ban according to the policy.
+        Args:
+            jail (str): The jail.
+            severity (str): The severity of the alert.
+            repeats (int): The number of earlier bans of the target in the jail, within the repeat window.
+        Returns:
+            float: The duration in seconds, 0 if the bans of the jail are left to fail2ban.
+        """
+        base = self._durations.get(jail, self._default_duration)
+        if base <= 0:
+            return 0.0
+        factor = self._severity_factors.get(str(severity).lower(), 1.0)
+        return min(base * factor * self._repeat_factor ** min(repeats, _MAX_REPEATS), self._max_duration)
+
+    def schedule(self, jail: str, target: str, severity: str = None, now: float = None) -> float | None:
+        """
+        Give an applied ban its expiry, counting it as a repeat offence of the target. A ban already
+        scheduled is given a new expiry.
+        Args:
+            jail (str): The jail.
+            target (str): The IP address or the network banned.
+            severity (str): The severity of the alert.
+            now (float): The wall time of the ban.
+        Returns:
+            float | None: The wall time the ban expires at, None if not scheduled.
+        """
+        if not self.enabled or target is None:
+            return None
+        now = time.time() if now is None else now
+        key = (jail, str(target))
+        with self._lock:
+            last_expiry, count = self._offences.get(key, (0.0, 0))
+            # The window starts once the previous ban is lifted, a ban still running always counts
+            if key not in self._wheel and now - last_expiry > self._repeat_window:
+                count = 0
+            duration = self.duration(jail, severity, count)
+            if duration <= 0:
+                return None
+            expires_at = now + duration
+            self._wheel.schedule(key, expires_at, 0)
+            self._offences[key] = (expires_at, count + 1)
+            self._dirty = True
+        _scheduled.labels(jail).inc()
+        logger.debug("Ban of %s in jail %s expires in %.0fs, offence %d", target, jail, duration, count + 1)
+        return expires_at
+
+    def cancel(self, jail: str, target: str) -> bool:
+        """
+        Forget the expiry of a ban lifted otherwise, by an unban alert or a prefix ban covering it.
+        Args:
+            jail (str): The jail.
+            target (str): The IP address or the network unbanned.
+        Returns:
+            bool: True if the ban was scheduled.
+        """
+        if target is None:
+            return False
+        with self._lock:
+            cancelled = self._wheel.cancel((jail, str(target))) is not None
+            if cancelled:
+                self._dirty = True
+        return cancelled
+
+    def expires_at(self, jail: str, target: str) -> float | None:
+        """
+        Return when a ban expires.
+        Args:
+            jail (str): The jail.
+            target (str): The IP address or the network.
+        Returns:
+            float | None: The wall time, None if the ban is not scheduled.
+        """
+        with self._lock:
+            timer = self._wheel.get((jail, str(target)))
+        return None if timer is None else timer[0]
+
+    def expire(self, now: float = None) -> int:
+        """
+        Lift the bans expired, with an unbanip command per jail and batch_size targets.
+        Args:
+            now (float): The current wall time.
+        Returns:
+            int: The number of bans lifted.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = self._wheel.advance(now)
+            if expired:
+                self._dirty = True
+        if not expired:
+            return 0
+        by_jail: dict[str, list[tuple[str, int]]] = {}
+        for (jail, target), _, attempts in expired:
+            by_jail.setdefault(jail, []).append((target, attempts))
+        lifted = 0
+        for jail, entries in sorted(by_jail.items()):
+            for start in range(0, len(entries), self._batch_size):
+                batch = entries[start:start + self._batch_size]
+                started = time.perf_counter()
+                try:
+                    success = self._executor(Fail2banAction.UNBAN.value, jail, [target for target, _ in batch])
+                except Exception as e:
+                    logger.error("Error lifting %d expired bans of jail %s: %s", len(batch), jail, e)
+                    success = False
+                _unban_seconds.observe(time.perf_counter() - started)
+                if success:
+                    for target, _ in batch:
+                        self._lifted(jail, target)
+                    lifted += len(batch)
+                    _expired_ok.inc(len(batch))
+                else:
+                    self._retry(jail, batch, now)
+        if lifted:
+            logger.info("Lifted %d expired bans.", lifted)
+        return lifted
+
+    def _lifted(self, jail: str, target: str):
+        """Reflect a ban lifted in the ban state, the journal, the prefix aggregator and the dedup engine."""
+        prefix_aggregator.forget(jail, target)
+        record_unban(jail, target)
+
+    def _retry(self, jail: str, batch: list[tuple[str, int]], now: float):
+        """Schedule the targets of a failed batch again, unless banned again meanwhile or out of attempts."""
+        dropped = 0
+        with self._lock:
+            for target, attempts in batch:
+                key = (jail, target)
+                if key in self._wheel:
+                    continue
+                if attempts + 1 >= _MAX_ATTEMPTS:
+                    dropped += 1
+                    continue
+                self._wheel.schedule(key, now + _RETRY_DELAY, attempts + 1)
+        _expired_retried.inc(len(batch) - dropped)
+        _expired_dropped.inc(dropped)
+        logger.warning("Failed to lift %d expired bans of jail %s, %d left to fail2ban", len(batch), jail, dropped)
+
+    def load(self) -> int:
+        """
+        Restore the state saved, the bans expired meanwhile being lifted on the next tick.
+        A corrupted state is renamed with a .corrupt suffix and the scheduler starts empty.
+        Returns:
+            int: The number of bans restored.
+        """
+        state_path = os.path.join(self._path, STATE_FILE)
+        try:
+            with open(state_path, "rb") as state_file:
+                timers, offences = decode_state(state_file.read())
+        except FileNotFoundError:
+            return 0
+        except ValueError as e:
+            logger.error("%s, starting without the saved ban expiries", e)
+            os.replace(state_path, f"{state_path}.corrupt")
+            return 0
+        with self._lock:
+            self._wheel = TimerWheel(resolution=self._resolution, now=time.time())
+            for jail, target, expires_at, attempts in timers:
+                self._wheel.schedule((jail, target), expires_at, attempts)
+            self._offences = {(jail, target): (last_expiry, count) for jail, target, last_expiry, count in offences}
+            self._dirty = False
+        logger.info("Ban expiries restored: %d bans, %d offenders.", len(timers), len(offences))
+        return len(timers)
+
+    def save(self):
+        """
+        Save the state atomically: written to a temporary file, fsynced and renamed over the previous one.
+        The offenders whose repeat window has passed are forgotten first.
+        """
+        now = time.time()
+        with self._lock:
+            timers = [(jail, target, expires_at, attempts) for (jail, target), expires_at, attempts in self._wheel.items()]
+            for key in [key for key, (last_expiry, _) in self._offences.items()
+                        if now - last_expiry > self._repeat_window and key not in self._wheel]:
+                del self._offences[key]
+            offences = [(jail, target, last_expiry, count) for (jail, target), (last_expiry, count) in self._offences.items()]
+            self._dirty = False
+        data = encode_state(timers, offences)
+        os.makedirs(self._path, exist_ok=True)
+        state_path = os.path.join(self._path, STATE_FILE)
+        temporary = f"{state_path}.tmp"
+        try:
+            with open(temporary, "wb") as state_file:
+                state_file.write(data)
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace(temporary, state_path)
+            fsync_directory(self._path)
+        except OSError:
+            with self._lock:
+                self._dirty = True
+            raise
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of bans and offenders.
+        Returns:
+            dict[str, int]: The scheduled bans and the offenders remembered.
+        """
+        with self._lock:
+            return {"scheduled": len(self._wheel), "offenders": len(self._offences)}
+
+    def start(self):
+        """Restore the state and start the background thread."""
+        if not self.enabled:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Ban expiry scheduler already running.")
+            return
+        self.load()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ban-expiry", daemon=True)
+        self._thread.start()
+        logger.info("Ban expiry scheduler started, %d bans scheduled.", len(self._wheel))
+
+    def stop(self):
+        """Stop the background thread and save the state."""
+        self._stop_event.set()
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+        self._thread = None
+        self._safe_save()
+        logger.info("Ban expiry scheduler stopped.")
+
+    def _run(self):
+        """Lift the expired bans every resolution seconds and save the state when changed, until stopped."""
+        saved_at = time.monotonic()
+        while not self._stop_event.wait(self._resolution):
+            try:
+                self.expire()
+            except Exception as e:
+                logger.error("Error lifting the expired bans: %s", e)
+            if self._dirty and time.monotonic() - saved_at >= self._save_interval:
+                self._safe_save()
+                saved_at = time.monotonic()
+
+    def _safe_save(self):
+        try:
+            self.save()
+        except Exception as e:
+            logger.error("Error saving the ban expiries: %s", e)
+
+
+ban_expiry = BanExpiryScheduler()
+
+metrics.callback("ids2zmq_ban_expiry_scheduled", "Bans waiting for their expiry.",
+                 function=lambda: ban_expiry.stats()["scheduled"])
@@ -0,0 +1,337 @@
+import ipaddress
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import closing
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.jail_registry import jail_registry
+from src.shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+ban_state.start()
+if not ban_state.matches(action="banip", jail="sshd", ip="1.2.3.4"):
+    Fail2banClient.execute_action(action="banip", jail="sshd", ip="1.2.3.4")
+    ban_state.apply(action="banip", jail="sshd", ip="1.2.3.4")
+"""
+
+SOURCES = ("status", "database")
+
+_skipped = metrics.counter("ids2zmq_ban_state_skipped_total", "Actions skipped as the ban state already matched, by action.",
+                           labels=("action",))
+_drift = metrics.counter("ids2zmq_ban_state_drift_total",
+                         "Banned IPs added or removed by a reconciliation with fail2ban, by change.", labels=("change",))
+_drift_added, _drift_removed = _drift.labels("added"), _drift.labels("removed")
+_reconcile_seconds = metrics.histogram("ids2zmq_ban_state_reconcile_seconds", "Time to reload the banned IPs of a jail.")
+
+
+def read_database_bans(path: str, jail: str, now: float = None) -> list[str]:
+    """
+    Read the IP addresses banned in a jail from fail2ban's SQLite database, without going through fail2ban.
+    Args:
+        path (str): The database file, dbfile of fail2ban.conf.
+        jail (str): The jail.
+        now (float): The current time, to leave out the expired bans.
+    Returns:
+        list[str]: The addresses whose last ban has not expired, a negative bantime never expiring.
+    Raises:
+        sqlite3.Error: If the database cannot be read.
+    """
+    now = time.time() if now is None else now
+    # Read-only, so that fail2ban's writes are never blocked by the reconciliation
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=1.0)) as connection:
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # bips holds the last ban of each IP since fail2ban 0.11, bans every ban
+        table = "bips" if "bips" in tables else "bans"
+        rows = connection.execute(
+            f"SELECT DISTINCT ip FROM {table} WHERE jail = ? AND (bantime < 0 OR timeofban + bantime > ?)", (jail, now))
+        return [row[0] for row in rows]
+
+
+class _JailBans:
+    """
+    Banned IPs of one jail, as the int value of each address, IPv4 and IPv6 apart. A jail seeded from
+    another source than fail2ban is partial: fail2ban may hold bans it does not know.
+    """
+    __slots__ = ("v4", "v6", "partial")
+
+    def __init__(self, partial: bool = False):
+        self.v4: set[int] = set()
+        self.v6: set[int] = set()
+        self.partial = partial
+
+    def add(self, version: int, value: int):
+        (self.v4 if version == 4 else self.v6).add(value)
+
+    def discard(self, version: int, value: int):
+        (self.v4 if version == 4 else self.v6).discard(value)
+
+    def contains(self, version: int, value: int) -> bool:
+        return value in (self.v4 if version == 4 else self.v6)
+
+    def __len__(self) -> int:
+        return len(self.v4) + len(self.v6)
+
+
+def _address(ip) -> tuple[int, int]:
+    """Return the version and the int value of an IP address."""
+    if not isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        ip = ipaddress.ip_address(str(ip))
+    return ip.version, int(ip)
+
+
+class BanStateIndex:
+    """
+    Index of the IPs currently banned in each jail, so that an action fail2ban already reflects is skipped.
+    Each jail is seeded from fail2ban, either from the "Banned IP list" of `status <jail>` or from
+    fail2ban's SQLite database, then updated as the actions succeed and reconciled in a background
+    thread every reconcile_interval seconds, which picks up the bans fail2ban applied or expired on
+    its own. Until then, a jail can be seeded from the ban journal restored on start. An action on
+    a jail not loaded yet is never skipped. The actions applied while a jail is reloaded are applied
+    again on top of the reloaded IPs, so that they are not lost. A ban that
+    fail2ban expired on its own is seen as still banned until the next reconciliation, which bounds
+    how long a new ban of that IP may be skipped.
+    Args:
+        source (str): "status" or "database", where the banned IPs are loaded from.
+        database_path (str): fail2ban's SQLite database, with the "database" source.
+        reconcile_interval (float): Seconds between two reloads of every jail.
+    Attributes:
+        _jails (dict[str, _JailBans]): The banned IPs of each loaded jail.
+        _reloading (dict[str, list[tuple[str, int, int]]]): The actions applied to each jail being reloaded.
+        _stop_event (threading.Event): Event used to stop the background reconciliation thread.
+        _thread (threading.Thread): The background reconciliation thread once started.
+    Methods:
+        reload(jail): Load the banned IPs of a jail from fail2ban again.
+        seed(jail, ips): Load the banned IPs of a jail not loaded yet from another source.
+        reconcile(): Reload every active jail.
+        matches(action, jail, ip): Check whether fail2ban already reflects an action.
+        apply(action, jail, ip): Record an action applied to fail2ban.
+        is_banned(jail, ip): Check whether an IP address is banned in a jail.
+        banned(jail): Return the IP addresses banned in a jail.
+        stats(): Return the number of banned IPs per loaded jail.
+        start(): Start the background reconciliation thread.
+        stop(): Stop the background reconciliation thread.
+    """
+
+    def __init__(self, source: str = None, database_path: str = None, reconcile_interval: float = None):
+        self._source = settings.FAIL2BAN_BAN_STATE_SOURCE if source is None else source
+        if self._source not in SOURCES:
+            raise ValueError(f"Invalid ban state source: {self._source}, expected one of {SOURCES}")
+        self._database_path = settings.FAIL2BAN_DATABASE_PATH if database_path is None else database_path
+        self._reconcile_interval = settings.FAIL2BAN_BAN_STATE_RECONCILE_INTERVAL if reconcile_interval is None else reconcile_interval
+        self._jails: dict[str, _JailBans] = {}
+        self._reloading: dict[str, list[tuple[str, int, int]]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def _load(self, jail: str) -> list[str] | None:
+        """Return the IP addresses banned in a jail according to fail2ban, None if it could not be queried."""
+        if self._source == "database":
+            try:
+                return read_database_bans(self._database_path, jail)
+            except sqlite3.Error as e:
+                logger.warning("Cannot read fail2ban database %s, falling back to status: %s", self._database_path, e)
+        return Fail2banClient.get_banned_ips(jail)
+
+    def reload(self, jail: str) -> bool:
+        """
+        Load the banned IPs of a jail from fail2ban again.
+        Args:
+            jail (str): The jail.
+        Returns:
+            bool: True if the jail was loaded, False if fail2ban could not be queried.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if jail in self._reloading:
+                return False
+            self._reloading[jail] = []
+        try:
+            ips = self._load(jail)
+            if ips is None:
+                return False
+            bans = _JailBans()
+            for ip in ips:
+                try:
+                    bans.add(*_address(ip))
+                except ValueError:
+                    logger.debug("Ignoring banned entry of jail %s that is not an IP address: %s", jail, ip)
+            with self._lock:
+                for action, version, value in self._reloading[jail]:
+                    self._update(bans, action, version, value)
+                previous = self._jails.get(jail)
+                self._jails[jail] = bans
+        finally:
+            with self._lock:
+                del self._reloading[jail]
+        if previous is not None:
+            added = len(bans.v4 - previous.v4) + len(bans.v6 - previous.v6)
+            removed = len(previous.v4 - bans.v4) + len(previous.v6 - bans.v6)
+            if added or removed:
+                logger.info("Ban state of jail %s reconciled: %d IPs added, %d removed.", jail, added, removed)
+                _drift_added.inc(added)
+                _drift_removed.inc(removed)
+        _reconcile_seconds.observe(time.perf_counter() - started)
+        return True
+
+    def seed(self, jail: str, ips: list[str]) -> bool:
+        """
+        Load the banned IPs of a jail not loaded yet from another source, such as the ban journal restored
+        on start, until the jail is loaded from fail2ban. Only the bans of a seeded jail are skipped, the
+        bans fail2ban applied on its own being unknown to the other source.
+        Args:
+            jail (str): The jail.
+            ips (list[str]): The IP addresses banned in the jail.
+        Returns:
+            bool: True if the jail was seeded, False if it is already loaded or being loaded.
+        """
+        bans = _JailBans(partial=True)
+        for ip in ips:
+            bans.add(*_address(ip))
+        with self._lock:
+            if jail in self._jails or jail in self._reloading:
+                return False
+            self._jails[jail] = bans
+        return True
+
+    def reconcile(self):
+        """Reload every active jail, and forget the jails no longer active."""
+        jails = jail_registry.get_jails()
+        for jail in sorted(jails):
+            if self._stop_event.is_set():
+                return
+            self.reload(jail)
+        with self._lock:
+            for jail in set(self._jails) - set(jails):
+                del self._jails[jail]
+
+    @staticmethod
+    def _update(bans: _JailBans, action: str, version: int, value: int):
+        if action == Fail2banAction.BAN.value:
+            bans.add(version, value)
+        else:
+            bans.discard(version, value)
+
+    def matches(self, action: str | Fail2banAction, jail: str, ip) -> bool:
+        """
+        Check whether fail2ban already reflects an action: a ban of a banned IP, an unban of an IP not banned.
+        Args:
+            action (str | Fail2banAction): The action.
+            jail (str): The jail.
+            ip (str | IPvAnyAddress): The IP address.
+        Returns:
+            bool: True if the action can be skipped, False if it must be executed or the jail is not loaded.
+        """
+        action = action.value if isinstance(action, Fail2banAction) else str(action)
+        if action not in (Fail2banAction.BAN.value, Fail2banAction.UNBAN.value) or ip is None:
+            return False
+        bans = self._jails.get(jail)
+        # The bans fail2ban applied on its own are missing from a seeded jail, an unban is always sent
+        if bans is None or (bans.partial and action == Fail2banAction.UNBAN.value):
+            return False
+        banned = bans.contains(*_address(ip))
+        if banned != (action == Fail2banAction.BAN.value):
+            return False
+        _skipped.labels(action).inc()
+        return True
+
+    def apply(self, action: str | Fail2banAction, jail: str, ip):
+        """
+        Record an action applied to fail2ban.
+        Args:
+            action (str | Fail2banAction): The action, only ban and unban change the state.
+            jail (str): The jail.
+            ip (str | IPvAnyAddress): The IP address.
+        """
+        action = action.value if isinstance(action, Fail2banAction) else str(action)
+        if action not in (Fail2banAction.BAN.value, Fail2banAction.UNBAN.value) or ip is None:
+            return
+        version, value = _address(ip)
+        with self._lock:
+            reloading = self._reloading.get(jail)
+            if reloading is not None:
+                reloading.append((action, version, value))
+            bans = self._jails.get(jail)
+            if bans is not None:
+                self._update(bans, action, version, value)
+
+    def is_banned(self, jail: str, ip) -> bool | None:
+        """
+        Check whether an IP address is banned in a jail.
+        Args:
+            jail (str): The jail.
+            ip (str | IPvAnyAddress): The IP address.
+        Returns:
+            bool | None: Whether the address is banned, None if the jail is not loaded.
+        """
+        bans = self._jails.get(jail)
+        if bans is None:
+            return None
+        return bans.contains(*_address(ip))
+
+    def banned(self, jail: str) -> list[str] | None:
+        """
+        Return the IP addresses banned in a jail.
+        Args:
+            jail (str): The jail.
+        Returns:
+            list[str] | None: The addresses, IPv4 first, each sorted; None if the jail is not loaded.
+        """
+        with self._lock:
+            bans = self._jails.get(jail)
+            if bans is None:
+                return None
+            v4, v6 = sorted(bans.v4), sorted(bans.v6)
+        return [str(ipaddress.IPv4Address(value)) for value in v4] + [str(ipaddress.IPv6Address(value)) for value in v6]
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of banned IPs per loaded jail.
+        Returns:
+            dict[str, int]: The count per jail.
+        """
+        with self._lock:
+            return {jail: len(bans) for jail, bans in sorted(self._jails.items())}
+
+    def start(self):
+        """Start the background reconciliation thread, which loads every active jail first."""
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Ban state reconciliation already running.")
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._reconcile_loop, name="ban-state", daemon=True)
+        self._thread.start()
+        logger.info("Ban state loaded from %s and reconciled every %ss.", self._source, self._reconcile_interval)
+
+    def stop(self):
+        """Stop the background reconciliation thread."""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        logger.info("Ban state reconciliation stopped.")
+
+    def _reconcile_loop(self):
+        """Reconcile every reconcile_interval seconds until stopped."""
+        self._safe_reconcile()
+        while not self._stop_event.wait(self._reconcile_interval):
+            self._safe_reconcile()
+
+    def _safe_reconcile(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            logger.error("Error reconciling the ban state: %s", e)
+
+
+ban_state = BanStateIndex()
+
+metrics.callback("ids2zmq_ban_state_entries", "IPs banned according to the ban state index, by jail.", labels=("jail",),
+                 function=lambda: {(jail,): count for jail, count in ban_state.stats().items()})
@@ -0,0 +1,213 @@
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.fail2ban_client import Fail2banClient
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+batcher = Fail2banBatcher()
+batcher.start()
+future = batcher.submit(action="banip", jail="sshd", ip="1.2.3.4")
+future.add_done_callback(lambda done: print("Applied" if done.result() else "Failed"))
+batcher.stop()
+"""
+
+_OPPOSITE_ACTIONS = {
+    Fail2banAction.BAN.value: Fail2banAction.UNBAN.value,
+    Fail2banAction.UNBAN.value: Fail2banAction.BAN.value,
+}
+
+
+class _Batch:
+    """Pending IPs of one (jail, action) pair, with the futures waiting for each of them."""
+    __slots__ = ("created_at", "ips")
+
+    def __init__(self):
+        self.created_at = time.monotonic()
+        self.ips: dict[str, list[Future]] = {}
+
+
+class Fail2banBatcher:
+    """
+    Batching stage in front of the Fail2banClient.
+    Ban and unban actions are gathered per (jail, action) for up to `window` seconds or `max_size`
+    IPs, then executed with a single `set <jail> <action> <ip1> <ip2> ...` command. A ban followed by
+    an unban of the same IP in the same window cancel each other without reaching fail2ban. An unban
+    followed by a ban is not cancelled, the IP may have been banned before: the last action wins and
+    the unban is resolved with the result of the ban.
+    Each submitted action gets a Future resolved with its own result. The callers add a callback to
+    it rather than block on it, as a batch only holds the actions submitted within its window. When
+    a batch command fails, its IPs are retried one by one so that the failure is reported on the
+    right IPs only.
+    Args:
+        client (type[Fail2banClient]): The client executing the commands.
+        window (float): Maximum seconds an action waits for its batch to fill up.
+        max_size (int): Number of IPs after which a batch is flushed immediately.
+    Attributes:
+        _batches (dict[tuple[str, str], _Batch]): The pending batches per (jail, action).
+        _condition (threading.Condition): Condition protecting the batches and waking up the flusher.
+        _thread (threading.Thread): The flusher thread once started.
+        stats (dict[str, int]): Counters of submitted, coalesced and executed actions and of issued commands.
+    Methods:
+        submit(action, jail, ip): Queue an action and return the Future of its result.
+        pending(jail, ip): Return the action pending for an IP.
+        flush(): Execute every pending batch right away.
+        start(): Start the flusher thread.
+        stop(): Stop the flusher thread after flushing the pending batches.
+    """
+
+    def __init__(self, client: type[Fail2banClient] = Fail2banClient, window: float = None, max_size: int = None):
+        self._client = client
+        self._window = settings.FAIL2BAN_BATCH_WINDOW if window is None else window
+        self._max_size = settings.FAIL2BAN_BATCH_MAX_SIZE if max_size is None else max_size
+        self._batches: dict[tuple[str, str], _Batch] = {}
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: threading.Thread = None
+        self.stats = {"submitted": 0, "coalesced": 0, "executed": 0, "commands": 0}
+
+    def submit(self, action: str | Fail2banAction, jail: str, ip: str) -> Future:
+        """
+        Queue an action and return the Future of its result.
+        Actions other than ban and unban are executed immediately.
+        Args:
+            action (str | Fail2banAction): The action to perform.
+            jail (str): The jail to target.
+            ip (str): The IP address to ban or unban.
+        Returns:
+            Future: Resolved with True if the action was applied (or cancelled out), False otherwise.
+        """
+        action = Fail2banAction(action).value
+        ip = str(ip) if ip is not None else None
+        future = Future()
+        if action not in _OPPOSITE_ACTIONS:
+            future.set_result(self._client.execute_action(action=action, jail=jail, ip=ip))
+            return future
+
+        coalesced = None
+        with self._condition:
+            self.stats["submitted"] += 1
+            opposite_key = (jail, _OPPOSITE_ACTIONS[action])
+            opposite = self._batches.get(opposite_key)
+            superseded = opposite.ips.pop(ip) if opposite is not None and ip in opposite.ips else []
+            if superseded and not opposite.ips:
+                del self._batches[opposite_key]
+            if superseded and action == Fail2banAction.UNBAN.value:
+                # Ban then unban within the window: nothing to do on fail2ban
+                coalesced = superseded + [future]
+                self.stats["coalesced"] += len(coalesced)
+            else:
+                batch = self._batches.get((jail, action))
+                if batch is None:
+                    batch = self._batches[(jail, action)] = _Batch()
+                    self._condition.notify()
+                # Unban then ban: only the ban is sent, the unban resolved first with its result
+                batch.ips.setdefault(ip, [])[:0] = superseded
+                batch.ips[ip].append(future)
+                if len(batch.ips) >= self._max_size:
+                    self._condition.notify()
+        if coalesced is not None:
+            # Resolved outside of the lock, the callbacks of the futures being free to submit again
+            logger.debug("Coalesced %s with pending %s for %s on jail %s", action, _OPPOSITE_ACTIONS[action], ip, jail)
+            for waiting in coalesced:
+                waiting.set_result(True)
+        return future
+
+    def pending(self, jail: str, ip: str) -> str | None:
+        """
+        Return the action pending for an IP, so that the callers do not skip an action undoing it.
+        Args:
+            jail (str): The jail.
+            ip (str): The IP address or network, as submitted.
+        Returns:
+            str | None: The pending ban or unban action, None if there is none.
+        """
+        ip = str(ip)
+        with self._condition:
+            for action in _OPPOSITE_ACTIONS:
+                batch = self._batches.get((jail, action))
+                if batch is not None and ip in batch.ips:
+                    return action
+        return None
+
+    def flush(self):
+        """Execute every pending batch right away."""
+        with self._condition:
+            ready, self._batches = list(self._batches.items()), {}
+        self._execute(ready)
+
+    def start(self):
+        """Start the flusher thread."""
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Fail2ban batcher already running.")
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._flush_loop, name="fail2ban-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Fail2ban batcher started (window {self._window}s, max {self._max_size} IPs).")
+
+    def stop(self):
+        """Stop the flusher thread after flushing the pending batches."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+        self._thread = None
+        self.flush()
+        logger.info(f"Fail2ban batcher stopped: {self.stats}")
+
+    def _flush_loop(self):
+        """Wait for batches to be due and execute them until stopped."""
+        while True:
+            with self._condition:
+                ready = self._take_due_batches()
+                while not ready and self._running:
+                    self._condition.wait(timeout=self._next_deadline())
+                    ready = self._take_due_batches()
+                if not ready and not self._running:
+                    return
+            self._execute(ready)
+
+    def _next_deadline(self) -> float | None:
+        """Seconds until the oldest batch is due, None when there is no pending batch."""
+        if not self._batches:
+            return None
+        oldest = min(batch.created_at for batch in self._batches.values())
+        return max(0.0, oldest + self._window - time.monotonic())
+
+    def _take_due_batches(self) -> list[tuple[tuple[str, str], _Batch]]:
+        """Remove and return the batches whose window elapsed or which reached max_size."""
+        now = time.monotonic()
+        due = [key for key, batch in self._batches.items()
+               if now - batch.created_at >= self._window or len(batch.ips) >= self._max_size]
+        return [(key, self._batches.pop(key)) for key in due]
+
+    def _execute(self, ready: list[tuple[tuple[str, str], _Batch]]):
+        """Execute the batches and resolve the futures of their IPs."""
+        for (jail, action), batch in ready:
+            ips = list(batch.ips)
+            try:
+                if self._client.execute_batch(action=action, jail=jail, ips=ips):
+                    results = [True] * len(ips)
+                    self.stats["commands"] += 1
+                elif len(ips) > 1:
+                    logger.warning("Batched %s of %d IPs on jail %s failed, retrying IP by IP.", action, len(ips), jail)
+                    results = self._client.execute_actions([(action, jail, ip) for ip in ips])
+                    self.stats["commands"] += 1 + len(ips)
+                else:
+                    results = [False]
+                    self.stats["commands"] += 1
+            except Exception as e:
+                logger.error("Error executing batched %s on jail %s: %s", action, jail, e)
+                results = [False] * len(ips)
+            self.stats["executed"] += len(ips)
+            for ip, success in zip(ips, results):
+                for future in batch.ips[ip]:
+                    future.set_result(success)
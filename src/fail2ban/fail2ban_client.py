@@ -1,15 +1,67 @@
 import subprocess
+import threading
+import time
 import logging
 
+from src.config.settings import settings
+from src.fail2ban.socket_client import Fail2banSocketClient
+from src.shared.metrics import metrics
+
 logger = logging.getLogger(__name__)
 
+_commands = metrics.counter("ids2zmq_fail2ban_commands_total", "Commands sent to fail2ban, by transport and result.",
+                            labels=("transport", "result"))
+_command_seconds = metrics.histogram("ids2zmq_fail2ban_command_seconds",
+                                     "Time to execute a call of fail2ban commands, by transport.", labels=("transport",))
+_socket_ok, _socket_error, _subprocess_ok, _subprocess_error = (
+    _commands.labels(transport, result) for transport in ("socket", "subprocess") for result in ("ok", "error"))
+_socket_seconds, _subprocess_seconds = _command_seconds.labels("socket"), _command_seconds.labels("subprocess")
+
+
+class _IpsText:
+    """The IPs of a command joined for a log line, only when the line is written."""
+    __slots__ = ("ips",)
+
+    def __init__(self, ips: list):
+        self.ips = ips
+
+    def __str__(self) -> str:
+        return " ".join(map(str, self.ips)) or "N/A"
+
+
+def _find_status_entry(status, name: str):
+    """Return the value of an entry of a `status <jail>` answer, nested (name, value) pairs."""
+    for entry in status or ():
+        if isinstance(entry, (list, tuple)) and len(entry) == 2:
+            key, value = entry
+            if key == name:
+                return value
+            if isinstance(value, (list, tuple)):
+                found = _find_status_entry(value, name)
+                if found is not None:
+                    return found
+    return None
+
 
 class Fail2banClient:
     """
     Fail2banClient interacts with the local fail2ban-server to manage IP bans.
+    Commands are sent over fail2ban-server's Unix socket on a persistent connection when
+    FAIL2BAN_USE_SOCKET is enabled, and through the fail2ban-client command line otherwise
+    or whenever the socket is unavailable.
+    Attributes:
+        _socket_client (Fail2banSocketClient): The shared socket client, created on first use.
+        _socket_retry_at (float): Monotonic time before which the socket is not retried after a failure.
     Methods:
         execute_action(action, jail, ip): Executes a Fail2ban action (ban/unban) on a specified jail for a given IP address.
+        execute_actions(actions): Executes several Fail2ban actions, pipelined on the socket when available.
+        execute_batch(action, jail, ips): Executes one Fail2ban action on several IP addresses with a single command.
+        get_banned_ips(jail): Returns the IP addresses currently banned in a jail, from `status <jail>`.
+        close(): Closes the socket connection to fail2ban-server.
     """
+    _socket_client: Fail2banSocketClient = None
+    _socket_retry_at: float = 0.0
+    _socket_lock = threading.Lock()
 
     @classmethod
     def execute_action(cls, action: str, jail: str = None, ip: str = None) -> bool:
@@ -23,19 +75,163 @@ class Fail2banClient:
         Returns:
             bool: True if the action was successfully executed, False otherwise.
         """
+        return cls.execute_actions([(action, jail, ip)])[0]
+
+    @classmethod
+    def execute_actions(cls, actions: list[tuple[str, str, str | None]]) -> list[bool]:
+        """
+        Execute several Fail2ban actions.
+        On the socket the commands are pipelined on the persistent connection, with the
+        subprocess path as a fallback when the socket cannot be used.
+
+        Args:
+            actions (list[tuple[str, str, str | None]]): The (action, jail, ip) triples to execute.
+        Returns:
+            list[bool]: For each action, True if it was successfully executed, False otherwise.
+        """
+        return cls._execute_commands([(action, jail, [ip] if ip else []) for action, jail, ip in actions])
+
+    @classmethod
+    def execute_batch(cls, action: str, jail: str, ips: list[str]) -> bool:
+        """
+        Execute a Fail2ban action on several IP addresses with a single
+        `set <jail> <action> <ip1> <ip2> ...` command.
+
+        Args:
+            action (str): The action to perform (e.g., "banip", "unbanip").
+            jail (str): The jail to target (e.g., "sshd").
+            ips (list[str]): The IP addresses to ban or unban.
+        Returns:
+            bool: True if the command was successfully executed for all the IPs, False otherwise.
+        """
+        return cls._execute_commands([(action, jail, [str(ip) for ip in ips])])[0]
+
+    @classmethod
+    def get_banned_ips(cls, jail: str) -> list[str] | None:
+        """
+        Return the IP addresses currently banned in a jail, from the "Banned IP list" of `status <jail>`.
+
+        Args:
+            jail (str): The jail to query (e.g., "sshd").
+        Returns:
+            list[str] | None: The banned IP addresses, None if fail2ban could not be queried.
+        """
+        client = cls._get_socket_client()
+        if client is not None:
+            try:
+                code, answer = client.send_command(["status", jail])
+            except OSError as e:
+                cls._socket_retry_at = time.monotonic() + settings.FAIL2BAN_SOCKET_RETRY_INTERVAL
+                logger.warning("fail2ban-server socket unavailable, falling back to fail2ban-client: %s", e)
+            else:
+                if code != 0:
+                    logger.error("Error getting the status of jail '%s': %s", jail, answer)
+                    return None
+                return _find_status_entry(answer, "Banned IP list") or []
+        try:
+            result = subprocess.run(["sudo", "fail2ban-client", "status", jail], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True)
+        except Exception as e:
+            logger.error("Error executing Fail2ban command: %s", e)
+            return None
+        if result.returncode != 0:
+            logger.error("Error getting the status of jail '%s': %s", jail, result.stderr.strip())
+            return None
+        for line in result.stdout.splitlines():
+            if "Banned IP list:" in line:
+                return line.split(":", 1)[1].split()
+        return []
+
+    @classmethod
+    def _execute_commands(cls, commands: list[tuple[str, str, list[str]]]) -> list[bool]:
+        """
+        Execute (action, jail, ips) commands on the socket, falling back to fail2ban-client.
+        Returns:
+            list[bool]: For each command, True if it was successfully executed, False otherwise.
+        """
+        started = time.perf_counter()
+        results = cls._execute_with_socket(commands)
+        if results is not None:
+            _socket_seconds.observe(time.perf_counter() - started)
+            succeeded = sum(results)
+            _socket_ok.inc(succeeded)
+            _socket_error.inc(len(results) - succeeded)
+            return results
+        started = time.perf_counter()
+        results = [cls._execute_with_subprocess(action=action, jail=jail, ips=ips) for action, jail, ips in commands]
+        _subprocess_seconds.observe(time.perf_counter() - started)
+        succeeded = sum(results)
+        _subprocess_ok.inc(succeeded)
+        _subprocess_error.inc(len(results) - succeeded)
+        return results
+
+    @classmethod
+    def close(cls):
+        """Close the socket connection to fail2ban-server."""
+        with cls._socket_lock:
+            if cls._socket_client is not None:
+                cls._socket_client.close()
+                cls._socket_client = None
+
+    @classmethod
+    def _get_socket_client(cls) -> Fail2banSocketClient | None:
+        """
+        Return the shared socket client, or None while the socket is disabled or backing off after a failure.
+        """
+        if not settings.FAIL2BAN_USE_SOCKET or time.monotonic() < cls._socket_retry_at:
+            return None
+        with cls._socket_lock:
+            if cls._socket_client is None:
+                cls._socket_client = Fail2banSocketClient()
+            return cls._socket_client
+
+    @classmethod
+    def _execute_with_socket(cls, commands: list[tuple[str, str, list[str]]]) -> list[bool] | None:
+        """
+        Execute the (action, jail, ips) commands over fail2ban-server's socket.
+        Returns:
+            list[bool] | None: The results, or None if the socket could not be used.
+        """
+        client = cls._get_socket_client()
+        if client is None:
+            return None
+        try:
+            answers = client.send_commands([["set", jail, action, *map(str, ips)] for action, jail, ips in commands])
+        except OSError as e:
+            cls._socket_retry_at = time.monotonic() + settings.FAIL2BAN_SOCKET_RETRY_INTERVAL
+            logger.warning(f"fail2ban-server socket unavailable, falling back to fail2ban-client: {e}")
+            return None
+        results = []
+        for (action, jail, ips), (code, result) in zip(commands, answers):
+            if code == 0:
+                logger.debug("Successfully executed action '%s' on jail '%s' for IP: %s", action, jail, _IpsText(ips))
+                results.append(True)
+            else:
+                logger.error("Error executing action '%s' on jail '%s' for IP: %s because: %s", action, jail, _IpsText(ips), result)
+                results.append(False)
+        return results
+
+    @classmethod
+    def _execute_with_subprocess(cls, action: str, jail: str = None, ips: list[str] = None) -> bool:
+        """
+        Execute a Fail2ban action by spawning fail2ban-client.
+        Returns:
+            bool: True if the action was successfully executed, False otherwise.
+        """
         cmd = ["sudo", "fail2ban-client", "set", jail, action]
-        if ip:
-            cmd.append(ip)
+        if ips:
+            cmd.extend(ips)
 
         try:
             result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
             if result.returncode == 0:
-                logger.info(f"Successfully executed action '{action}' on jail '{jail}' for IP: {ip or 'N/A'}")
+                logger.debug("Successfully executed action '%s' on jail '%s' for IP: %s", action, jail, _IpsText(ips))
                 logger.debug(result.stdout)
                 return True
             else:
-                logger.error(f"Error executing action '{action}' on jail '{jail}' for IP: {ip or 'N/A'} because: {result.stderr.strip()}")
+                logger.error("Error executing action '%s' on jail '%s' for IP: %s because: %s", action, jail, _IpsText(ips),
+                             result.stderr.strip())
                 return False
 
         except Exception as e:
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+import logging
+
+from src.config.settings import settings
+from src.fail2ban import jail
+
+logger = logging.getLogger(__name__)
+
+class JailRegistry:
+    """
+    In-memory registry of the active fail2ban jails.
+    The jails are loaded once from fail2ban-client, refreshed in a background thread and refreshed
+    on demand when an unknown jail is looked up, so that checking a jail is a set lookup that never
+    spawns a process on the hot path. On the event loop the refresh forced by an unknown jail is
+    handed over to the background thread instead of blocking the loop.
+    Args:
+        refresh_interval (float): Seconds between two background refreshes.
+        miss_refresh_cooldown (float): Minimum seconds between two refreshes forced by unknown jails.
+    Attributes:
+        _jails (frozenset[str]): The currently known active jails.
+        _last_refresh (float): Monotonic time of the last refresh.
+        _refresh_lock (threading.Lock): Lock preventing concurrent refreshes.
+        _stop_event (threading.Event): Event used to stop the background refresh thread.
+        _refresh_requested (threading.Event): Event waking up the background thread for an immediate refresh.
+        _thread (threading.Thread): The background refresh thread once started.
+    Methods:
+        refresh(): Reload the active jails from fail2ban.
+        is_active(name): Check whether a jail is active, forcing a refresh on a miss.
+        get_jails(): Return the currently known active jails.
+        start(): Start the background refresh thread.
+        stop(): Stop the background refresh thread.
+    """
+
+    def __init__(self, refresh_interval: float = None, miss_refresh_cooldown: float = None):
+        self._refresh_interval = settings.FAIL2BAN_JAIL_REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        self._miss_refresh_cooldown = settings.FAIL2BAN_JAIL_MISS_REFRESH_COOLDOWN if miss_refresh_cooldown is None else miss_refresh_cooldown
+        self._jails: frozenset[str] = frozenset()
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresh_requested = threading.Event()
+        self._thread: threading.Thread = None
+
+    def refresh(self) -> frozenset[str]:
+        """
+        Reload the active jails from fail2ban.
+        Returns:
+            frozenset[str]: The active jails.
+        """
+        with self._refresh_lock:
+            self._jails = frozenset(jail.get_active_jails())
+            self._last_refresh = time.monotonic()
+            self._loaded = True
+            logger.debug(f"Active jails refreshed: {sorted(self._jails)}")
+            return self._jails
+
+    def is_active(self, name: str) -> bool:
+        """
+        Check whether a jail is active.
+        An unknown jail forces a refresh, at most once per miss_refresh_cooldown seconds, so that a
+        jail added to fail2ban is picked up without waiting for the next background refresh.
+        Args:
+            name (str): The jail name.
+        Returns:
+            bool: True if the jail is active, False otherwise.
+        """
+        if not self._loaded:
+            self.refresh()
+        if name in self._jails:
+            return True
+        if time.monotonic() - self._last_refresh >= self._miss_refresh_cooldown:
+            if self._thread is not None and self._thread.is_alive() and self._on_event_loop():
+                self._refresh_requested.set()
+                return False
+            return name in self.refresh()
+        return False
+
+    def get_jails(self) -> frozenset[str]:
+        """
+        Return the currently known active jails, loading them on first use.
+        Returns:
+            frozenset[str]: The active jails.
+        """
+        if not self._loaded:
+            self.refresh()
+        return self._jails
+
+    def start(self):
+        """Start the background refresh thread."""
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Jail registry refresh already running.")
+            return
+        self._stop_event.clear()
+        self._refresh_requested.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="jail-registry", daemon=True)
+        self._thread.start()
+        logger.info(f"Jail registry refreshing every {self._refresh_interval}s.")
+
+    def stop(self):
+        """Stop the background refresh thread."""
+        self._stop_event.set()
+        self._refresh_requested.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        logger.info("Jail registry refresh stopped.")
+
+    def _refresh_loop(self):
+        """Refresh the jails every refresh_interval seconds until stopped."""
+        self._safe_refresh()
+        while True:
+            self._refresh_requested.wait(self._refresh_interval)
+            if self._stop_event.is_set():
+                return
+            self._refresh_requested.clear()
+            self._safe_refresh()
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        """True when called from a thread running an asyncio event loop."""
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing active jails: {e}")
+
+jail_registry = JailRegistry()
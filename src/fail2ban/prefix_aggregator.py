@@ -0,0 +1,226 @@
+import ipaddress
+import threading
+import time
+import logging
+from collections import deque
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.shared.metrics import metrics
+from src.shared.prefix_trie import PrefixTrie, mask
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+aggregation = prefix_aggregator.aggregate(action="banip", jail="sshd", ip="203.0.113.7")
+if not aggregation.covered:
+    if Fail2banClient.execute_action(action="banip", jail="sshd", ip=aggregation.target):
+        Fail2banClient.execute_batch(action="unbanip", jail="sshd", ips=aggregation.retired)
+    else:
+        prefix_aggregator.rollback(aggregation)
+"""
+
+_escalations = metrics.counter("ids2zmq_prefix_escalations_total", "Host bans escalated into a prefix ban, by IP version.",
+                               labels=("version",))
+_covered = metrics.counter("ids2zmq_prefix_covered_total", "Host bans skipped as covered by a prefix ban.")
+_retired = metrics.counter("ids2zmq_prefix_retired_total", "Host bans retired by the prefix ban covering them.")
+
+
+class Aggregation:
+    """
+    What to send to fail2ban for an action, once aggregated, and how to undo it if it fails.
+    Attributes:
+        target (str): The IP address or the network to apply the action to.
+        covered (bool): True if a prefix ban already covers the address, nothing to send.
+        escalated (bool): True if the ban was escalated into a ban of the prefix of the address.
+        retired (list[str]): The bans within the escalated prefix, to unban once the prefix is banned.
+    """
+    __slots__ = ("action", "jail", "target", "covered", "escalated", "retired", "_added", "_removed", "_retired")
+
+    def __init__(self, action: str, jail: str, target: str | None, covered: bool = False, escalated: bool = False,
+                 added: tuple = None, removed: tuple = None, retired: list[tuple] = ()):
+        self.action = action
+        self.jail = jail
+        self.target = target
+        self.covered = covered
+        self.escalated = escalated
+        self._added = added
+        self._removed = removed
+        self._retired = list(retired)
+        self.retired = [_format(*entry) for entry in self._retired]
+
+
+def _format(version: int, value: int, length: int) -> str:
+    """Format an entry as fail2ban expects it: an IP address for a host, a network in CIDR notation otherwise."""
+    if version == 4:
+        return str(ipaddress.IPv4Address(value)) if length == 32 else str(ipaddress.IPv4Network((value, length)))
+    return str(ipaddress.IPv6Address(value)) if length == 128 else str(ipaddress.IPv6Network((value, length)))
+
+
+class PrefixAggregator:
+    """
+    Aggregation of the host bans of each jail into prefix bans, in front of fail2ban.
+    The bans applied recently are kept in a radix trie per jail and IP version. Once the hosts banned
+    within the prefix of an address (ipv4_prefix or ipv6_prefix bits) reach the threshold of the jail,
+    the next ban is escalated into a single ban of that prefix and the host bans within it are retired,
+    so that fail2ban holds one rule instead of many. The bans within a prefix ban are then skipped.
+    IPv6 addresses are banned as their ipv6_host_prefix network, a /64 being what a single host is
+    usually given. The entries expire after ttl seconds, which should not exceed the bantime of the
+    jails, as fail2ban forgets its bans without telling.
+    Args:
+        enabled (bool): Aggregate the bans, PREFIX_AGGREGATION_ENABLED by default; the actions are passed through otherwise.
+        ipv4_prefix (int): Length of the IPv4 prefixes the bans are escalated to.
+        ipv6_prefix (int): Length of the IPv6 prefixes the bans are escalated to.
+        ipv6_host_prefix (int): Length of the network an IPv6 address is banned as, 128 to ban the address only.
+        thresholds (dict[str, int]): Number of bans within a prefix triggering its escalation, per jail.
+        default_threshold (int): Threshold of the jails missing from thresholds, 0 to never escalate.
+        ttl (float): Seconds a ban is remembered.
+    Attributes:
+        _tries (dict[tuple[str, int], PrefixTrie]): The bans per jail and IP version.
+        _expiries (deque): The (expires_at, jail, version, value, length) of the entries, oldest first.
+    Methods:
+        aggregate(action, jail, ip): Record an action and return what to send to fail2ban.
+        rollback(aggregation): Undo an aggregation whose action failed.
+        forget(jail, target): Forget a ban lifted before its TTL.
+        stats(): Return the number of entries per jail.
+        clear(): Forget every entry.
+    """
+
+    def __init__(self, enabled: bool = None, ipv4_prefix: int = None, ipv6_prefix: int = None,
+                 ipv6_host_prefix: int = None, thresholds: dict[str, int] = None, default_threshold: int = None,
+                 ttl: float = None):
+        self.enabled = settings.PREFIX_AGGREGATION_ENABLED if enabled is None else enabled
+        ipv4_prefix = settings.PREFIX_AGGREGATION_IPV4_PREFIX if ipv4_prefix is None else ipv4_prefix
+        ipv6_prefix = settings.PREFIX_AGGREGATION_IPV6_PREFIX if ipv6_prefix is None else ipv6_prefix
+        ipv6_host_prefix = settings.PREFIX_AGGREGATION_IPV6_HOST_PREFIX if ipv6_host_prefix is None else ipv6_host_prefix
+        if not 0 < ipv4_prefix <= 32 or not 0 < ipv6_prefix <= ipv6_host_prefix <= 128:
+            raise ValueError(f"Invalid aggregation prefixes: /{ipv4_prefix}, /{ipv6_prefix} and /{ipv6_host_prefix}")
+        # Per IP version: the address width, the length a host is banned as and the length of the escalated prefixes
+        self._lengths = {4: (32, 32, ipv4_prefix), 6: (128, ipv6_host_prefix, ipv6_prefix)}
+        self._thresholds = dict(settings.PREFIX_AGGREGATION_THRESHOLDS if thresholds is None else thresholds)
+        self._default_threshold = settings.PREFIX_AGGREGATION_DEFAULT_THRESHOLD if default_threshold is None else default_threshold
+        self._ttl = settings.PREFIX_AGGREGATION_TTL if ttl is None else ttl
+        self._tries: dict[tuple[str, int], PrefixTrie] = {}
+        self._expiries: deque = deque()
+        self._lock = threading.Lock()
+
+    def aggregate(self, action: str | Fail2banAction, jail: str, ip) -> Aggregation:
+        """
+        Record an action and return what to send to fail2ban for it.
+        Args:
+            action (str | Fail2banAction): The action.
+            jail (str): The jail.
+            ip (str | IPvAnyAddress): The IP address.
+        Returns:
+            Aggregation: The target of the action, the address itself unless aggregated.
+        """
+        action = action.value if isinstance(action, Fail2banAction) else str(action)
+        if not self.enabled or ip is None or action not in (Fail2banAction.BAN.value, Fail2banAction.UNBAN.value):
+            return Aggregation(action, jail, None if ip is None else str(ip))
+        if not isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            ip = ipaddress.ip_address(str(ip))
+        version = ip.version
+        width, host_length, prefix_length = self._lengths[version]
+        host = mask(int(ip), host_length, width)
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            trie = self._trie(jail, version)
+            if action == Fail2banAction.UNBAN.value:
+                removed = (version, host, host_length) if trie.remove(host, host_length) else None
+                return Aggregation(action, jail, _format(version, host, host_length), removed=removed)
+
+            covering = trie.covering(host, host_length)
+            if covering is not None:
+                _covered.inc()
+                return Aggregation(action, jail, _format(version, *covering), covered=True)
+            threshold = self._thresholds.get(jail, self._default_threshold)
+            if threshold > 0 and prefix_length < host_length:
+                prefix = mask(host, prefix_length, width)
+                banned = trie.count_under(prefix, prefix_length) + (trie.find(host, host_length) is None)
+                if banned >= threshold:
+                    retired = [(version, value, length) for value, length in trie.pop_under(prefix, prefix_length)]
+                    self._add(trie, jail, version, prefix, prefix_length, now)
+                    _escalations.labels(str(version)).inc()
+                    _retired.inc(len(retired))
+                    logger.info("Escalating %d bans of jail %s into a ban of %s", banned, jail,
+                                _format(version, prefix, prefix_length))
+                    return Aggregation(action, jail, _format(version, prefix, prefix_length), escalated=True,
+                                       added=(version, prefix, prefix_length), retired=retired)
+            added = self._add(trie, jail, version, host, host_length, now)
+            return Aggregation(action, jail, _format(version, host, host_length),
+                               added=(version, host, host_length) if added else None)
+
+    def rollback(self, aggregation: Aggregation):
+        """
+        Undo an aggregation whose action failed, so that the next copy of the alert is aggregated again.
+        Args:
+            aggregation (Aggregation): The aggregation returned by aggregate().
+        """
+        if aggregation._added is None and aggregation._removed is None and not aggregation._retired:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if aggregation._added is not None:
+                version, value, length = aggregation._added
+                self._trie(aggregation.jail, version).remove(value, length)
+            for version, value, length in aggregation._retired + ([aggregation._removed] if aggregation._removed else []):
+                self._add(self._trie(aggregation.jail, version), aggregation.jail, version, value, length, now)
+
+    def forget(self, jail: str, target: str) -> bool:
+        """
+        Forget a ban lifted before its TTL, so that the bans within it are no longer skipped as covered.
+        Args:
+            jail (str): The jail.
+            target (str): The IP address or the network unbanned, as returned in Aggregation.target.
+        Returns:
+            bool: True if the ban was remembered.
+        """
+        network = ipaddress.ip_network(target, strict=False)
+        with self._lock:
+            trie = self._tries.get((jail, network.version))
+            return trie is not None and trie.remove(int(network.network_address), network.prefixlen)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of entries per jail, hosts and prefixes.
+        Returns:
+            dict[str, int]: The count per jail.
+        """
+        with self._lock:
+            self._purge(time.monotonic())
+            counts: dict[str, int] = {}
+            for (jail, _), trie in self._tries.items():
+                counts[jail] = counts.get(jail, 0) + len(trie)
+            return counts
+
+    def clear(self):
+        """Forget every entry."""
+        with self._lock:
+            self._tries = {}
+            self._expiries.clear()
+
+    def _trie(self, jail: str, version: int) -> PrefixTrie:
+        trie = self._tries.get((jail, version))
+        if trie is None:
+            trie = self._tries[(jail, version)] = PrefixTrie(self._lengths[version][0])
+        return trie
+
+    def _add(self, trie: PrefixTrie, jail: str, version: int, value: int, length: int, now: float) -> bool:
+        expires_at = now + self._ttl
+        self._expiries.append((expires_at, jail, version, value, length))
+        return trie.insert(value, length, expires_at)
+
+    def _purge(self, now: float):
+        """Drop the expired entries, all at the front since every entry has the same TTL."""
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            expires_at, jail, version, value, length = expiries.popleft()
+            trie = self._tries.get((jail, version))
+            # Skip the entries refreshed, removed or retired since
+            if trie is not None and trie.find(value, length) == expires_at:
+                trie.remove(value, length)
+
+
+prefix_aggregator = PrefixAggregator()
@@ -0,0 +1,182 @@
+import io
+import pickle
+import socket
+import threading
+import builtins
+import logging
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Framing of fail2ban's command socket (fail2ban.protocol.CSPROTO)
+CSPROTO_END = b"<F2B_END_COMMAND>"
+CSPROTO_CLOSE = b"<F2B_CLOSE_COMMAND>"
+PICKLE_PROTOCOL = 4
+# The builtins fail2ban-server replies are made of: basic types, containers and exception classes
+_ALLOWED_BUILTINS = frozenset(
+    ["list", "dict", "tuple", "set", "frozenset", "str", "bytes", "bytearray", "int", "float", "complex", "bool"]
+    + [name for name, value in vars(builtins).items() if isinstance(value, type) and issubclass(value, BaseException)]
+)
+
+
+class RemoteError(Exception):
+    """Stand-in for an exception raised by fail2ban-server whose class is not importable locally."""
+
+
+class _ResponseUnpickler(pickle.Unpickler):
+    """
+    Unpickler restricted to the builtin types and exception classes of _ALLOWED_BUILTINS, any other
+    global (fail2ban's own exception classes, but also eval or __import__) is replaced by RemoteError
+    instead of being imported, so that a reply never calls more than a constructor.
+    """
+    def find_class(self, module, name):
+        if module == "builtins" and name in _ALLOWED_BUILTINS:
+            return getattr(builtins, name)
+        return RemoteError
+
+
+def encode_command(command: list) -> bytes:
+    """
+    Encode a fail2ban command the way fail2ban-client does.
+    Args:
+        command (list): The command words, e.g. ["set", "sshd", "banip", "1.2.3.4"].
+    Returns:
+        bytes: The framed message.
+    """
+    return pickle.dumps([str(word) for word in command], PICKLE_PROTOCOL) + CSPROTO_END
+
+
+def decode_response(data: bytes):
+    """
+    Decode a framed fail2ban-server response.
+    Args:
+        data (bytes): The response without its terminator.
+    Returns:
+        Any: The unpickled response.
+    """
+    return _ResponseUnpickler(io.BytesIO(data)).load()
+
+
+class Fail2banSocketClient:
+    """
+    Client speaking fail2ban-server's Unix socket command protocol over a long-lived connection.
+    Every command is a pickled list of words terminated by CSPROTO_END and answered by a pickled
+    (return_code, result) tuple terminated the same way. Several commands can be written before
+    reading their answers (pipelining), which the server processes in order.
+    Args:
+        socket_path (str): Path of fail2ban-server's socket.
+        timeout (float): Socket timeout in seconds.
+    Attributes:
+        _socket (socket.socket): The connected Unix socket, None while disconnected.
+        _buffer (bytes): Bytes received but not yet consumed.
+        _lock (threading.Lock): Lock serializing the requests on the connection.
+    Methods:
+        connect(): Open the connection to fail2ban-server.
+        close(): Close the connection to fail2ban-server.
+        send_command(command): Send one command and return its (return_code, result) answer.
+        send_commands(commands): Pipeline several commands and return their answers in order.
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self.socket_path = settings.FAIL2BAN_SOCKET_PATH if socket_path is None else socket_path
+        self.timeout = settings.FAIL2BAN_SOCKET_TIMEOUT if timeout is None else timeout
+        self._socket: socket.socket = None
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    @property
+    def is_connected(self) -> bool:
+        return self._socket is not None
+
+    def connect(self):
+        """
+        Open the connection to fail2ban-server.
+        Raises:
+            OSError: If the socket does not exist or cannot be connected.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        self._buffer = b""
+        logger.info(f"Connected to fail2ban-server socket {self.socket_path}")
+
+    def close(self):
+        """Close the connection to fail2ban-server."""
+        with self._lock:
+            self._disconnect(graceful=True)
+
+    def send_command(self, command: list) -> tuple[int, object]:
+        """
+        Send one command and return its answer.
+        Args:
+            command (list): The command words, e.g. ["set", "sshd", "banip", "1.2.3.4"].
+        Returns:
+            tuple[int, object]: The return code (0 on success) and the result or the remote error.
+        Raises:
+            OSError: If the command cannot be sent even after reconnecting.
+        """
+        return self.send_commands([command])[0]
+
+    def send_commands(self, commands: list[list]) -> list[tuple[int, object]]:
+        """
+        Pipeline several commands on the connection and return their answers in order.
+        The connection is re-established and the commands are replayed once if it was lost.
+        Args:
+            commands (list[list]): The commands to send.
+        Returns:
+            list[tuple[int, object]]: The answers, in the order of the commands.
+        Raises:
+            OSError: If the commands cannot be sent even after reconnecting.
+        """
+        if not commands:
+            return []
+        payload = b"".join(encode_command(command) for command in commands)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self.connect()
+                    self._socket.sendall(payload)
+                    return [self._read_response() for _ in commands]
+                except (OSError, EOFError, pickle.UnpicklingError) as e:
+                    self._disconnect(graceful=False)
+                    if attempt:
+                        raise OSError(f"fail2ban-server socket request failed: {e}") from e
+                    logger.warning(f"fail2ban-server connection lost, reconnecting: {e}")
+
+    def _read_response(self) -> tuple[int, object]:
+        """
+        Read one framed response from the connection.
+        Returns:
+            tuple[int, object]: The unpickled response.
+        Raises:
+            EOFError: If the server closed the connection.
+        """
+        while True:
+            end = self._buffer.find(CSPROTO_END)
+            if end != -1:
+                data, self._buffer = self._buffer[:end], self._buffer[end + len(CSPROTO_END):]
+                return decode_response(data)
+            chunk = self._socket.recv(65536)
+            if not chunk:
+                raise EOFError("Connection closed by fail2ban-server")
+            self._buffer += chunk
+
+    def _disconnect(self, graceful: bool):
+        if self._socket is None:
+            return
+        try:
+            if graceful:
+                self._socket.sendall(CSPROTO_CLOSE + CSPROTO_END)
+        except OSError:
+            pass
+        finally:
+            self._socket.close()
+            self._socket = None
+            self._buffer = b""
@@ -0,0 +1,164 @@
+import argparse
+import os
+import pickle
+import socket
+import socketserver
+import threading
+import time
+import logging
+
+from src.fail2ban.socket_client import CSPROTO_END, CSPROTO_CLOSE, PICKLE_PROTOCOL
+
+logger = logging.getLogger(__name__)
+
+"""
+Local stand-in for fail2ban-server speaking the same Unix socket protocol, to test and benchmark
+the clients without a real fail2ban. Run it as :
+python -m src.fail2ban.stub_server --socket /tmp/fail2ban.sock --jails sshd,nginx --latency 0.005
+"""
+
+class Fail2banStubServer:
+    """
+    In-memory fail2ban-server stand-in.
+    Supported commands: ping, status, status <jail>, set <jail> banip|unbanip <ip>..., get <jail> banned.
+    Args:
+        socket_path (str): Path of the Unix socket to listen on.
+        jails (tuple[str, ...]): The active jails.
+        latency (float): Seconds to sleep before answering each command, to emulate a busy server.
+    Attributes:
+        banned (dict[str, set[str]]): The banned IPs per jail.
+        commands (list[list[str]]): Every command received, in order.
+    Methods:
+        start(): Serve in a background thread.
+        stop(): Stop serving and remove the socket.
+        handle_command(command): Execute one command and return its (return_code, result) answer.
+    """
+
+    def __init__(self, socket_path: str, jails: tuple[str, ...] = ("sshd",), latency: float = 0.0):
+        self.socket_path = socket_path
+        self.latency = latency
+        self.banned: dict[str, set[str]] = {jail: set() for jail in jails}
+        self.commands: list[list[str]] = []
+        self._lock = threading.Lock()
+        self._server: socketserver.ThreadingUnixStreamServer = None
+        self._connections: set[socket.socket] = set()
+        self._thread: threading.Thread = None
+
+    def start(self):
+        """Serve in a background thread."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        stub = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                stub._serve_connection(self.request)
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), name="fail2ban-stub", daemon=True)
+        self._thread.start()
+        logger.info(f"fail2ban stub server listening on {self.socket_path}")
+
+    def stop(self):
+        """Stop serving, drop the open connections and remove the socket."""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _serve_connection(self, conn: socket.socket):
+        with self._lock:
+            self._connections.add(conn)
+        try:
+            self._serve_requests(conn)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+
+    def _serve_requests(self, conn: socket.socket):
+        buffer = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return
+            buffer += chunk
+            while (end := buffer.find(CSPROTO_END)) != -1:
+                message, buffer = buffer[:end], buffer[end + len(CSPROTO_END):]
+                if message == CSPROTO_CLOSE:
+                    return
+                try:
+                    command = pickle.loads(message)
+                    answer = self.handle_command(command)
+                except Exception as e:
+                    answer = (1, e)
+                conn.sendall(pickle.dumps(answer, PICKLE_PROTOCOL) + CSPROTO_END)
+
+    def handle_command(self, command: list[str]) -> tuple[int, object]:
+        """
+        Execute one command.
+        Args:
+            command (list[str]): The command words.
+        Returns:
+            tuple[int, object]: The return code and the result, or the raised error.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.commands.append(list(command))
+            if command == ["ping"]:
+                return 0, "pong"
+            if command == ["status"]:
+                return 0, [("Number of jail", len(self.banned)), ("Jail list", ", ".join(sorted(self.banned)))]
+            if len(command) == 2 and command[0] == "status":
+                ips = self._jail(command[1])
+                return 0, [
+                    ("Filter", [("Currently failed", 0), ("Total failed", 0), ("File list", [])]),
+                    ("Actions", [("Currently banned", len(ips)), ("Total banned", len(ips)), ("Banned IP list", sorted(ips))]),
+                ]
+            if len(command) == 3 and command[0] == "get" and command[2] == "banned":
+                return 0, sorted(self._jail(command[1]))
+            if len(command) >= 4 and command[0] == "set" and command[2] in ("banip", "unbanip"):
+                ips = self._jail(command[1])
+                if command[2] == "banip":
+                    new = [ip for ip in command[3:] if ip not in ips]
+                    ips.update(new)
+                    return 0, len(new)
+                missing = [ip for ip in command[3:] if ip not in ips]
+                if missing:
+                    return 1, ValueError(f"IP {missing[0]} is not banned")
+                ips.difference_update(command[3:])
+                return 0, len(command) - 3
+            return 1, Exception(f"Invalid command: {command}")
+
+    def _jail(self, name: str) -> set[str]:
+        if name not in self.banned:
+            raise Exception(f"Sorry but the jail '{name}' does not exist")
+        return self.banned[name]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fail2ban-server stand-in")
+    parser.add_argument("--socket", default="/tmp/fail2ban-stub.sock")
+    parser.add_argument("--jails", default="sshd")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = Fail2banStubServer(socket_path=args.socket, jails=tuple(args.jails.split(",")), latency=args.latency)
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,142 @@
+import asyncio
+
+import zmq
+import zmq.asyncio
+import logging
+
+from src.ids2zmq.manager import ZMQManager
+from src.ids2zmq.publisher import ZMQPublisher, _send_failures
+from src.models.alert_model import AlertModel
+
+logger = logging.getLogger(__name__)
+
+class AsyncZMQPublisher(ZMQPublisher):
+    """
+    zmq.asyncio flavour of the ZMQPublisher, meant to be used from the uvicorn event loop.
+    Security configuration, binding and closing are inherited from ZMQPublisher, only the
+    publication is awaited on the asyncio socket. With batching, the envelopes are flushed by a
+    timer of the event loop instead of a flusher thread.
+    Attributes:
+        _flush_handle (asyncio.TimerHandle): The timer flushing the pending alerts once their window elapsed.
+        _flush_tasks (set[asyncio.Task]): The flushes started by the timer and still running.
+    Methods:
+        publish_alert(alert: AlertModel | str, message_id: str, origin: str): Publish a Fail2Ban alert to the ZMQ topic without blocking the event loop.
+        publish_alerts(alerts: list[AlertModel | str]): Publish several Fail2Ban alerts at once, in envelopes.
+        aflush(): Send the pending alerts right away.
+        aclose(): Flush the pending alerts and close the ZMQ Publisher socket.
+    """
+    def __init__(self):
+        super().__init__(context=ZMQManager.get_async_context())
+        self.publisher_socket: zmq.asyncio.Socket
+        self._flush_handle: asyncio.TimerHandle = None
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def publish_alert(self, alert: AlertModel | str, message_id: str = None, origin: str = None):
+        """
+        Publish a Fail2Ban alert to the ZMQ topic.
+        Args:
+            alert (AlertModel | str): The alert to publish, encoded with the configured codec, or an already serialized JSON alert.
+            message_id (str): The message id of the alert, the alert's own or a new one if None.
+            origin (str): The origin node id of the alert, the alert's own or this node if None.
+        Raises:
+            RuntimeError: If the publisher is not bound or if there is an error during publishing.
+        """
+        if not self._is_bound:
+            logger.error("Attempted to publish without binding the ZMQ Publisher.")
+            raise RuntimeError("ZMQ Publisher not bound.")
+
+        item = self._encode_item(alert=alert, message_id=message_id, origin=origin)
+        if self._batching:
+            if self._enqueue(item=item, urgent=self._is_urgent(alert)):
+                await self.aflush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self._batch_window, self._on_window_elapsed)
+            return
+        try:
+            await self.publisher_socket.send_multipart(self._build_frames(items=[item]))
+            logger.debug("Published alert on topic '%s'", self._topic)
+        except zmq.ZMQError as e:
+            _send_failures.inc()
+            logger.error("Error publishing ZMQ message: %s", e)
+            raise
+
+    async def publish_alerts(self, alerts: list[AlertModel | str]):
+        """
+        Publish several Fail2Ban alerts at once, in envelopes of up to ZMQ_PUBLISH_BATCH_MAX_SIZE alerts,
+        whether batching is enabled or not. The pending alerts are sent first, so that the alerts leave in order.
+        Args:
+            alerts (list[AlertModel | str]): The alerts to publish, with their own message ids and origins.
+        Raises:
+            RuntimeError: If the publisher is not bound.
+            zmq.ZMQError: If sending an envelope fails.
+        """
+        if not self._is_bound:
+            logger.error("Attempted to publish without binding the ZMQ Publisher.")
+            raise RuntimeError("ZMQ Publisher not bound.")
+        if not alerts:
+            return
+
+        items = [self._encode_item(alert=alert) for alert in alerts]
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for envelope in self._split(self._take_pending() + items):
+            await self._asend_envelope(items=envelope)
+
+    async def aflush(self):
+        """
+        Send the pending alerts right away, in one envelope.
+        Raises:
+            zmq.ZMQError: If sending the envelope fails.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        items = self._take_pending()
+        if items:
+            await self._asend_envelope(items=items)
+
+    async def _asend_envelope(self, items: list[tuple[bytes, bytes]]):
+        """Send the given alerts as one message."""
+        try:
+            await self.publisher_socket.send_multipart(self._build_frames(items=items))
+            self.batch_stats["envelopes"] += 1
+            logger.debug("Published %d alerts on topic '%s'", len(items), self._topic)
+        except zmq.ZMQError as e:
+            _send_failures.inc()
+            logger.error(f"Error publishing ZMQ envelope of {len(items)} alerts: {e}")
+            raise
+
+    def _on_window_elapsed(self):
+        """Timer callback flushing the pending alerts on the event loop."""
+        self._flush_handle = None
+        task = asyncio.get_running_loop().create_task(self._flush_in_background())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_in_background(self):
+        try:
+            await self.aflush()
+        except zmq.ZMQError:
+            pass  # Already logged, nobody is awaiting this flush
+
+    def _start_flusher(self):
+        """The envelopes are flushed by event loop timers, no thread is needed."""
+
+    def _stop_flusher(self):
+        """Cancel the flush timer, the pending alerts must have been flushed by aclose()."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending:
+            logger.warning(f"Dropping {len(self._pending)} pending alerts, the publisher was closed without aclose().")
+            self._take_pending()
+
+    async def aclose(self):
+        """Flush the pending alerts and close the ZMQ Publisher socket."""
+        if self._is_bound:
+            try:
+                await self.aflush()
+            except zmq.ZMQError:
+                pass
+        self.close()
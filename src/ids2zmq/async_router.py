@@ -0,0 +1,64 @@
+import asyncio
+import logging
+
+import zmq
+import zmq.asyncio
+
+from src.ids2zmq.manager import ZMQManager
+from src.ids2zmq.router import ZMQRouter
+
+logger = logging.getLogger(__name__)
+
+class AsyncZMQRouter(ZMQRouter):
+    """
+    zmq.asyncio flavour of the ZMQRouter, running as a task on the current event loop instead of a thread.
+    Attributes:
+        _task (asyncio.Task): The task running the ROUTER loop once started.
+    Methods:
+        start_async(): Binds the ROUTER socket and answers incoming messages until stopped.
+        run_as_task(): Schedules the ROUTER loop as a task on the running event loop.
+        aclose(): Stops the ROUTER loop, waits for the task to finish and closes the socket.
+    """
+
+    def __init__(self):
+        super().__init__(context=ZMQManager.get_async_context())
+        self.socket: zmq.asyncio.Socket
+        self._task: asyncio.Task = None
+
+    async def start_async(self):
+        """
+        Binds the ROUTER socket to the specified address and answers incoming messages until stopped.
+        Raises:
+            zmq.ZMQError: If there is an error in binding the socket.
+        """
+        self.socket.bind(self.bind_address)
+        self.running = True
+        logger.info(f"ROUTER socket bound to {self.bind_address}")
+        while self.running:
+            try:
+                identity, empty, message = await self.socket.recv_multipart()
+                logger.info(f"Received message from {identity.decode(errors='replace')}: {message.decode(errors='replace')}")
+                await self.socket.send_multipart([identity, b"", b"ACK"])
+            except asyncio.CancelledError:
+                break
+            except zmq.ZMQError as e:
+                logger.error(f"ROUTER error: {e}")
+                break
+
+    def run_as_task(self) -> asyncio.Task:
+        """
+        Schedules the ROUTER loop as a task on the running event loop.
+        Returns:
+            asyncio.Task: The task running the ROUTER loop.
+        """
+        self._task = asyncio.get_running_loop().create_task(self.start_async(), name="zmq-router")
+        return self._task
+
+    async def aclose(self):
+        """Stops the ROUTER loop, waits for the task to finish and closes the socket."""
+        self.running = False
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.socket.close()
+        logger.info("ROUTER socket closed")
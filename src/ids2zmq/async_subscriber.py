@@ -0,0 +1,141 @@
+import asyncio
+import inspect
+import logging
+
+import zmq
+import zmq.asyncio
+
+from src.config.settings import settings
+from src.ids2zmq.manager import ZMQManager
+from src.ids2zmq.subscriber import ZMQSubscriber, _callback_failures
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class from a running event loop (e.g. a FastAPI lifespan) as :
+subscriber = AsyncZMQSubscriber(on_alert_callback=handle_alert)
+subscriber.connect_to_publishers()
+subscriber.start()
+...
+await subscriber.aclose()
+
+Coroutine callbacks are awaited on the event loop, plain callables are run in the default executor
+without being awaited, so that a blocking fail2ban call never stalls the loop nor the next messages.
+At most ZMQ_SUBSCRIBER_MAX_IN_FLIGHT calls run at once, the receive loop waiting beyond.
+"""
+
+class AsyncZMQSubscriber(ZMQSubscriber):
+    """
+    zmq.asyncio flavour of the ZMQSubscriber, running as a task on the current event loop instead of a thread.
+    Connection, security configuration and message decoding are inherited from ZMQSubscriber.
+    Args:
+        on_message_callback (callable): Function or coroutine function called with the JSON string of each received alert.
+        on_alert_callback (callable): Function or coroutine function called with each received AlertModel, preferred.
+    Attributes:
+        _task (asyncio.Task): The task running the receive loop once started.
+        _in_flight (asyncio.Semaphore): Slots of the plain callback calls running in the executor.
+        _calls (set[asyncio.Future]): The plain callback calls running in the executor.
+    Methods:
+        start(): Schedule the receive loop as a task on the running event loop.
+        run_async(): Receive loop awaiting messages on the asyncio socket.
+        aclose(): Stop the receive loop, wait for the task and the running callbacks to finish and close the sockets.
+        stop(): Cancel the receive loop and close the sockets without waiting.
+    """
+
+    def __init__(self, on_message_callback: callable = None, on_alert_callback: callable = None):
+        super().__init__(on_message_callback=on_message_callback, context=ZMQManager.get_async_context(),
+                         on_alert_callback=on_alert_callback)
+        self.subscriber_socket: zmq.asyncio.Socket
+        self._task: asyncio.Task = None
+        self._is_coroutine_callback = inspect.iscoroutinefunction(self._on_message_callback)
+        self._in_flight = asyncio.Semaphore(max(1, settings.ZMQ_SUBSCRIBER_MAX_IN_FLIGHT))
+        self._calls: set[asyncio.Future] = set()
+
+    def start(self) -> asyncio.Task:
+        """
+        Schedule the receive loop as a task on the running event loop.
+        Returns:
+            asyncio.Task: The task running the receive loop.
+        """
+        self._task = asyncio.get_running_loop().create_task(self.run_async(), name="zmq-subscriber")
+        return self._task
+
+    async def run_async(self):
+        """
+        Receive loop awaiting messages on the asyncio socket.
+        """
+        logger.info("AsyncZMQSubscriber started.")
+        while self._running.is_set():
+            try:
+                frames = await self.subscriber_socket.recv_multipart(copy=False)
+            except asyncio.CancelledError:
+                break
+            except zmq.ZMQError as e:
+                if e.errno in (zmq.ETERM, zmq.ENOTSOCK):
+                    break
+                logger.error("Error in AsyncZMQSubscriber: %s", e)
+                continue
+            except Exception as e:
+                logger.error("Error in AsyncZMQSubscriber: %s", e)
+                continue
+            await self._dispatch(frames=frames)
+        logger.info("AsyncZMQSubscriber receive loop exited.")
+
+    async def _dispatch(self, frames: list[bytes]):
+        """
+        Decode a received message and forward each of its alerts to the callback. A plain callback
+        is scheduled in the executor without waiting for it, unless the calls in flight are at the limit.
+        Args:
+            frames (list[zmq.Frame]): The frames of the message.
+        """
+        for alert in self._decode_frames(frames=frames):
+            argument = self._callback_argument(alert)
+            if not self._is_coroutine_callback:
+                await self._in_flight.acquire()
+                call = asyncio.get_running_loop().run_in_executor(None, self._on_message_callback, argument)
+                self._calls.add(call)
+                call.add_done_callback(self._on_call_done)
+                continue
+            try:
+                await self._on_message_callback(argument)
+            except Exception as e:
+                _callback_failures.inc()
+                logger.error("Error in AsyncZMQSubscriber: %s", e)
+
+    def _on_call_done(self, call: asyncio.Future):
+        """Free the slot of a plain callback call and log its failure."""
+        self._calls.discard(call)
+        self._in_flight.release()
+        if not call.cancelled() and call.exception() is not None:
+            _callback_failures.inc()
+            logger.error("Error in AsyncZMQSubscriber: %s", call.exception())
+
+    async def aclose(self):
+        """
+        Stop the receive loop, wait for the task and the running callbacks to finish and close the sockets.
+        """
+        self._running.clear()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._calls:
+            await asyncio.gather(*self._calls, return_exceptions=True)
+        self._close_sockets()
+
+    def stop(self, timeout: float = 2.0):
+        """
+        Cancel the receive loop and close the sockets without waiting for the task.
+        Args:
+            timeout (float): Unused, kept for compatibility with ZMQSubscriber.stop().
+        """
+        self._running.clear()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._close_sockets()
+
+    def _close_sockets(self):
+        """Close the subscriber and wake-up sockets."""
+        self.subscriber_socket.close()
+        self._wakeup_sender.close()
+        self._wakeup_receiver.close()
+        logger.info("AsyncZMQSubscriber stopped.")
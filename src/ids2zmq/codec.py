@@ -0,0 +1,441 @@
+import ipaddress
+import struct
+from datetime import datetime, timedelta, UTC
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.models.alert_model import AlertModel
+from src.shared.alert_trace import STAGES as TRACE_STAGES
+from src.shared.message_id import HEADER_SIZE as IDS_SIZE, decode_header as decode_ids, encode_header as encode_ids
+
+"""
+Wire codecs of the alerts exchanged between the nodes.
+A message is made of three frames: the topic, a clear header and the payload encoded by one of the
+codecs below (then encrypted when security is enabled). The header tells the receiver which codec
+to decode the payload with, so that nodes configured with different codecs still understand each
+other:
+
+    version (u8) | codec id (u8) | origin id (8 bytes) | message id (8 bytes)
+
+Headers of 16 bytes, without version nor codec id, come from nodes predating the codecs and carry
+JSON payloads.
+Several alerts can travel in one envelope message, encrypted at once: its header is the envelope
+codec id and the item count followed by the header of each item, so that echoes and already seen
+alerts are still dropped before decrypting, and its payload the length-prefixed item payloads:
+
+    version (u8) | 0xFF (u8) | count (u16) | item header (18 bytes) * count
+    (length (u32) | item payload) * count
+
+Call the codecs as :
+codec = get_codec(settings.ZMQ_WIRE_CODEC)
+payload = codec.encode(alert)
+alert = get_codec_by_id(codec.codec_id).decode(payload)
+"""
+
+WIRE_VERSION = 1
+_HEADER_PREFIX = struct.Struct("!BB")
+HEADER_SIZE = _HEADER_PREFIX.size + IDS_SIZE
+ENVELOPE_CODEC_ID = 0xFF
+_ENVELOPE_PREFIX = struct.Struct("!BBH")
+_ITEM_LENGTH = struct.Struct("!I")
+
+
+def encode_header(codec_id: int, origin: str, message_id: str) -> bytes:
+    """
+    Build the clear header frame of a message.
+    Args:
+        codec_id (int): The id of the codec the payload is encoded with.
+        origin (str): The origin node id.
+        message_id (str): The message id.
+    Returns:
+        bytes: The header frame.
+    """
+    return _HEADER_PREFIX.pack(WIRE_VERSION, codec_id) + encode_ids(origin=origin, message_id=message_id)
+
+
+def decode_header(header: bytes) -> tuple[int, str, str]:
+    """
+    Parse the clear header frame of a message.
+    Args:
+        header (bytes): The header frame.
+    Returns:
+        tuple[int, str, str]: The codec id, the origin node id and the message id.
+    Raises:
+        ValueError: If the header is malformed or of an unsupported version.
+    """
+    if len(header) == IDS_SIZE:
+        return JsonCodec.codec_id, *decode_ids(header)
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Invalid message header size: {len(header)}")
+    version, codec_id = _HEADER_PREFIX.unpack_from(header)
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported wire version: {version}")
+    return codec_id, *decode_ids(header[_HEADER_PREFIX.size:])
+
+
+def is_envelope_header(header: bytes) -> bool:
+    """Return whether a header frame is the header of an envelope of several alerts."""
+    return (len(header) >= _ENVELOPE_PREFIX.size and len(header) != IDS_SIZE
+            and header[0] == WIRE_VERSION and header[1] == ENVELOPE_CODEC_ID)
+
+
+def encode_envelope_header(headers: list[bytes]) -> bytes:
+    """
+    Build the clear header frame of an envelope.
+    Args:
+        headers (list[bytes]): The header of each item, as built by encode_header.
+    Returns:
+        bytes: The envelope header frame.
+    Raises:
+        ValueError: If there are too many items for one envelope.
+    """
+    if len(headers) > 0xFFFF:
+        raise ValueError(f"Too many alerts for one envelope: {len(headers)}")
+    return _ENVELOPE_PREFIX.pack(WIRE_VERSION, ENVELOPE_CODEC_ID, len(headers)) + b"".join(headers)
+
+
+def decode_envelope_header(header: bytes) -> list[bytes]:
+    """
+    Split the clear header frame of an envelope in the headers of its items.
+    Args:
+        header (bytes): The envelope header frame.
+    Returns:
+        list[bytes]: The header of each item, to be parsed with decode_header.
+    Raises:
+        ValueError: If the header is malformed.
+    """
+    _, _, count = _ENVELOPE_PREFIX.unpack_from(header)
+    if len(header) != _ENVELOPE_PREFIX.size + count * HEADER_SIZE:
+        raise ValueError(f"Invalid envelope header size: {len(header)} for {count} alerts")
+    offset = _ENVELOPE_PREFIX.size
+    return [header[offset + index * HEADER_SIZE:offset + (index + 1) * HEADER_SIZE] for index in range(count)]
+
+
+def pack_envelope(payloads: list[bytes]) -> bytes:
+    """
+    Concatenate the item payloads of an envelope, each prefixed with its length.
+    Args:
+        payloads (list[bytes]): The encoded alerts.
+    Returns:
+        bytes: The envelope payload, to be encrypted as a whole.
+    """
+    return b"".join(_ITEM_LENGTH.pack(len(payload)) + payload for payload in payloads)
+
+
+def unpack_envelope(data: bytes | memoryview, count: int) -> list[memoryview]:
+    """
+    Split an envelope payload in its item payloads, without copying them.
+    Args:
+        data (bytes | memoryview): The decrypted envelope payload.
+        count (int): The number of items announced by the envelope header.
+    Returns:
+        list[memoryview]: The item payloads.
+    Raises:
+        ValueError: If the payload does not hold exactly count items.
+    """
+    view = memoryview(data)
+    payloads, offset = [], 0
+    try:
+        for _ in range(count):
+            (length,) = _ITEM_LENGTH.unpack_from(view, offset)
+            offset += _ITEM_LENGTH.size
+            if offset + length > len(view):
+                raise ValueError("Truncated envelope item")
+            payloads.append(view[offset:offset + length])
+            offset += length
+    except struct.error as e:
+        raise ValueError(f"Malformed envelope: {e}")
+    if offset != len(view):
+        raise ValueError(f"Malformed envelope: {len(view) - offset} trailing bytes")
+    return payloads
+
+
+def header_ids(header: bytes) -> bytes:
+    """Return the origin and message ids of a header, the key identifying the alert whatever its codec."""
+    return header[-IDS_SIZE:]
+
+
+class JsonCodec:
+    """
+    Pydantic JSON payloads, the format of the nodes predating the binary codec.
+    Methods:
+        encode(alert): Encode an alert.
+        decode(data): Decode and validate an alert.
+    """
+    codec_id = 0
+    name = "json"
+
+    @staticmethod
+    def encode(alert: AlertModel) -> bytes:
+        return alert.model_dump_json(exclude_none=True).encode('utf-8')
+
+    @staticmethod
+    def decode(data: bytes | memoryview) -> AlertModel:
+        return AlertModel.model_validate_json(bytes(data))
+
+
+class BinaryCodec:
+    """
+    Compact binary payloads: fixed-width packed IP addresses, enum ids for the jail, action and
+    severity, nanoseconds since the epoch for the timestamps and length-prefixed UTF-8 strings for
+    the free-text fields. The optional fixed-width fields present, and the version of each IP
+    address, are flagged in a bitmask so that all of them are packed and unpacked with a single
+    struct call, precompiled once per combination of flags.
+
+        flags (u16) | action (u8) | severity (u8) | jail (u8) | timestamp (i64)
+        [processing_timestamp (i64)] [port (u16)] [source_ip] [target_ip] [ip]
+        [message_id (8 bytes)] [origin (8 bytes)] [jail (str)] [severity (str)]
+        [hostname (str)] [protocol (str)] [alert_type (str)] [reason (str)]
+        [trace count (u8) | (stage id (u8) | time (i64)) * count]
+
+    An IP address is a u32 for IPv4 or 16 bytes for IPv6, a string its length (u16) followed by its
+    UTF-8 bytes. Jails and severities missing from the enum tables are sent as strings with id 0.
+    The stages of the trace are ids into the append-only alert_trace.STAGES plus one; unknown stages
+    are not sent.
+    Decoding only reads from the buffer, so a memoryview over a received frame is never copied, and
+    builds the model from the already typed fields without going through pydantic's parsing again.
+    Methods:
+        encode(alert): Encode an alert.
+        decode(data): Decode and validate an alert.
+    """
+    codec_id = 1
+    name = "binary"
+
+    # Append-only tables: an id must keep its meaning for the nodes already deployed
+    ACTIONS = (None, Fail2banAction.BAN, Fail2banAction.UNBAN, Fail2banAction.STATUS)
+    SEVERITIES = (None, "low", "medium", "high", "critical")
+    JAILS = (None, "sshd", "recidive", "nginx-http-auth", "nginx-botsearch", "nginx-limit-req", "apache-auth",
+             "apache-badbots", "postfix", "postfix-sasl", "dovecot", "vsftpd", "proftpd", "pure-ftpd", "named-refused",
+             "mysqld-auth", "portscan")
+
+    _PREFIX = struct.Struct("!H")
+    _FLAG_PROCESSING_TIMESTAMP = 1 << 0
+    _FLAG_PORT = 1 << 1
+    _FLAG_MESSAGE_ID = 1 << 2
+    _FLAG_ORIGIN = 1 << 3
+    # One bit for the presence of each IP address and one for its version
+    _IP_FIELDS = (("source_ip", 1 << 4, 1 << 5), ("target_ip", 1 << 6, 1 << 7), ("ip", 1 << 8, 1 << 9))
+    # One bit for the absence of each string, hostname and protocol being optional
+    _STRING_FIELDS = (("hostname", 1 << 10), ("protocol", 1 << 11), ("alert_type", 1 << 12), ("reason", 1 << 13))
+    _FLAG_TRACE = 1 << 14
+    _TRACE_COUNT = struct.Struct("!B")
+    _TRACE_STAMP = struct.Struct("!Bq")
+    _TRACE_IDS = {stage: index + 1 for index, stage in enumerate(TRACE_STAGES)}
+    _FIELD_NAMES = tuple(AlertModel.model_fields)
+
+    _ACTION_IDS = {action: index for index, action in enumerate(ACTIONS) if action is not None}
+    _SEVERITY_IDS = {severity: index for index, severity in enumerate(SEVERITIES) if severity is not None}
+    _JAIL_IDS = {jail: index for index, jail in enumerate(JAILS) if jail is not None}
+    _layouts: dict[int, struct.Struct] = {}
+
+    @classmethod
+    def _layout(cls, flags: int) -> struct.Struct:
+        """Return the struct of the fixed-width part of the payloads with the given flags."""
+        layout = cls._layouts.get(flags)
+        if layout is None:
+            fmt = "!HBBBq"
+            if flags & cls._FLAG_PROCESSING_TIMESTAMP:
+                fmt += "q"
+            if flags & cls._FLAG_PORT:
+                fmt += "H"
+            for _, present, ipv6 in cls._IP_FIELDS:
+                if flags & present:
+                    fmt += "16s" if flags & ipv6 else "I"
+            if flags & cls._FLAG_MESSAGE_ID:
+                fmt += "8s"
+            if flags & cls._FLAG_ORIGIN:
+                fmt += "8s"
+            layout = cls._layouts[flags] = struct.Struct(fmt)
+        return layout
+
+    @classmethod
+    def encode(cls, alert: AlertModel) -> bytes:
+        flags = 0
+        values = []
+        if alert.processing_timestamp is not None:
+            flags |= cls._FLAG_PROCESSING_TIMESTAMP
+            values.append(_to_epoch_ns(alert.processing_timestamp))
+        if alert.port is not None:
+            flags |= cls._FLAG_PORT
+            values.append(alert.port)
+        for field, present, ipv6 in cls._IP_FIELDS:
+            ip = getattr(alert, field)
+            if ip is not None:
+                flags |= present
+                if ip.version == 6:
+                    flags |= ipv6
+                    values.append(ip.packed)
+                else:
+                    values.append(int(ip))
+        if alert.message_id is not None:
+            flags |= cls._FLAG_MESSAGE_ID
+            values.append(bytes.fromhex(alert.message_id))
+        if alert.origin is not None:
+            flags |= cls._FLAG_ORIGIN
+            values.append(bytes.fromhex(alert.origin))
+        strings = []
+        for field, absent in cls._STRING_FIELDS:
+            value = getattr(alert, field)
+            if value is None:
+                flags |= absent
+            else:
+                strings.append(_pack_str(value))
+        if alert.trace:
+            flags |= cls._FLAG_TRACE
+            stamps = [(cls._TRACE_IDS[stage], at) for stage, at in alert.trace.items() if stage in cls._TRACE_IDS]
+            strings.append(cls._TRACE_COUNT.pack(len(stamps))
+                           + b"".join(cls._TRACE_STAMP.pack(stage_id, at) for stage_id, at in stamps))
+        severity_id = cls._SEVERITY_IDS.get(alert.severity, 0)
+        jail_id = cls._JAIL_IDS.get(alert.jail, 0)
+        parts = [cls._layout(flags).pack(flags, cls._ACTION_IDS[Fail2banAction(alert.action)], severity_id, jail_id,
+                                         _to_epoch_ns(alert.timestamp), *values)]
+        if jail_id == 0:
+            parts.append(_pack_str(alert.jail))
+        if severity_id == 0:
+            parts.append(_pack_str(alert.severity))
+        parts.extend(strings)
+        return b"".join(parts)
+
+    @classmethod
+    def decode(cls, data: bytes | memoryview) -> AlertModel:
+        try:
+            (flags,) = cls._PREFIX.unpack_from(data)
+            layout = cls._layout(flags)
+            flags, action_id, severity_id, jail_id, timestamp, *values = layout.unpack_from(data)
+            # Id 0 stands for a jail or a severity sent as a string, never for an action
+            if not 0 < action_id < len(cls.ACTIONS):
+                raise ValueError(f"Malformed binary alert: unknown action id {action_id}")
+            if severity_id >= len(cls.SEVERITIES) or jail_id >= len(cls.JAILS):
+                raise ValueError(f"Malformed binary alert: unknown severity id {severity_id} or jail id {jail_id}")
+            offset = layout.size
+            values = iter(values)
+            fields = {
+                "action": cls.ACTIONS[action_id],
+                "timestamp": _from_epoch_ns(timestamp),
+                "processing_timestamp": _from_epoch_ns(next(values)) if flags & cls._FLAG_PROCESSING_TIMESTAMP else None,
+                "port": next(values) if flags & cls._FLAG_PORT else None,
+            }
+            for field, present, ipv6 in cls._IP_FIELDS:
+                if not flags & present:
+                    fields[field] = None
+                elif flags & ipv6:
+                    fields[field] = ipaddress.IPv6Address(next(values))
+                else:
+                    fields[field] = ipaddress.IPv4Address(next(values))
+            fields["message_id"] = next(values).hex() if flags & cls._FLAG_MESSAGE_ID else None
+            fields["origin"] = next(values).hex() if flags & cls._FLAG_ORIGIN else None
+            if jail_id == 0:
+                fields["jail"], offset = _unpack_str(data, offset)
+            else:
+                fields["jail"] = cls.JAILS[jail_id]
+            if severity_id == 0:
+                fields["severity"], offset = _unpack_str(data, offset)
+            else:
+                fields["severity"] = cls.SEVERITIES[severity_id]
+            for field, absent in cls._STRING_FIELDS:
+                if flags & absent:
+                    fields[field] = None
+                else:
+                    fields[field], offset = _unpack_str(data, offset)
+            fields["trace"] = None
+            if flags & cls._FLAG_TRACE:
+                fields["trace"], offset = cls._unpack_trace(data, offset)
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError(f"Malformed binary alert: {e}")
+        if offset != len(data):
+            raise ValueError(f"Malformed binary alert: {len(data) - offset} trailing bytes")
+        # The fields are typed by construction, only the jail needs the model's validation
+        AlertModel.validate_jail(fields["jail"])
+        return cls._construct(fields)
+
+    @classmethod
+    def _unpack_trace(cls, data: bytes | memoryview, offset: int) -> tuple[dict[str, int], int]:
+        (count,) = cls._TRACE_COUNT.unpack_from(data, offset)
+        offset += cls._TRACE_COUNT.size
+        trace = {}
+        for _ in range(count):
+            stage_id, at = cls._TRACE_STAMP.unpack_from(data, offset)
+            offset += cls._TRACE_STAMP.size
+            # Stages added by newer nodes are skipped
+            if 0 < stage_id <= len(TRACE_STAGES):
+                trace[TRACE_STAGES[stage_id - 1]] = at
+        return trace, offset
+
+    @classmethod
+    def _construct(cls, fields: dict) -> AlertModel:
+        """
+        Build a model from a complete set of typed fields, as model_construct does minus its lookup
+        of the defaults, which alone costs as much as the whole decoding.
+        """
+        alert = AlertModel.__new__(AlertModel)
+        # In the order of the declaration of the fields, as serialization follows the dict order
+        object.__setattr__(alert, "__dict__", {name: fields[name] for name in cls._FIELD_NAMES})
+        object.__setattr__(alert, "__pydantic_fields_set__", set(cls._FIELD_NAMES))
+        object.__setattr__(alert, "__pydantic_extra__", None)
+        object.__setattr__(alert, "__pydantic_private__", None)
+        return alert
+
+
+_CODECS = {codec.codec_id: codec for codec in (JsonCodec, BinaryCodec)}
+_CODECS_BY_NAME = {codec.name: codec for codec in _CODECS.values()}
+
+
+def get_codec(name: str = None):
+    """
+    Return the codec of the given name.
+    Args:
+        name (str): "json" or "binary", defaults to ZMQ_WIRE_CODEC.
+    Returns:
+        The codec class.
+    Raises:
+        ValueError: If the codec is unknown.
+    """
+    name = settings.ZMQ_WIRE_CODEC if name is None else name
+    try:
+        return _CODECS_BY_NAME[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown wire codec: {name}")
+
+
+def get_codec_by_id(codec_id: int):
+    """
+    Return the codec of the given id, as found in a message header.
+    Args:
+        codec_id (int): The codec id.
+    Returns:
+        The codec class.
+    Raises:
+        ValueError: If the codec is unknown.
+    """
+    try:
+        return _CODECS[codec_id]
+    except KeyError:
+        raise ValueError(f"Unknown wire codec id: {codec_id}")
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+_STR_LENGTH = struct.Struct("!H")
+
+
+def _to_epoch_ns(value: datetime) -> int:
+    delta = (value if value.tzinfo is not None else value.replace(tzinfo=UTC)) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+
+
+def _from_epoch_ns(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value // 1000)
+
+
+def _pack_str(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+    if len(encoded) > 0xFFFF:
+        raise ValueError("String field too long for the binary codec")
+    return _STR_LENGTH.pack(len(encoded)) + encoded
+
+
+def _unpack_str(data: bytes | memoryview, offset: int) -> tuple[str, int]:
+    (length,) = _STR_LENGTH.unpack_from(data, offset)
+    offset += _STR_LENGTH.size
+    if offset + length > len(data):
+        raise ValueError("Truncated string field")
+    return str(data[offset:offset + length], 'utf-8'), offset + length
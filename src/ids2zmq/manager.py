@@ -1,9 +1,11 @@
 import zmq
+import zmq.asyncio
 import logging
 import json
 import os
 
 from fernet import Fernet
+import zmq.auth
 from zmq.auth.thread import ThreadAuthenticator
 
 from src.config.settings import settings
@@ -17,26 +19,36 @@ class ZMQManager:
     Manage the ZeroMQ context for the application.
     Attributes:
         _context (zmq.Context): The ZeroMQ context instance.
+        _async_context (zmq.asyncio.Context): asyncio shadow of the ZeroMQ context, sharing the same sockets' backend.
         _keys_manager (KeysManager): Instance of KeysManager for key management.
-        _authenticator (ThreadAuthenticator): The authenticator for PLAIN authentication.
+        _authenticator (ThreadAuthenticator): The authenticator for PLAIN or CURVE authentication.
         zmq_security_enabled (bool): Flag to enable or disable ZMQ security.
+        security_mechanism (str): "plain" (PLAIN authentication and encrypted payloads) or "curve"
+            (CURVE authentication and encryption by libzmq, payloads sent as is).
+        payload_cipher (str): Cipher of the payloads with PLAIN, "fernet" or one of the AEAD ciphers of payload_crypto.
         zmq_security (ZMQSecurity): Instance of ZMQSecurity for handling security operations.
     Methods:
         get_context(): Get the ZeroMQ context, initializing it if it does not exist.
+        get_async_context(): Get an asyncio shadow of the ZeroMQ context for zmq.asyncio sockets.
         terminate_context(): Terminate the ZeroMQ context if it exists.
         reset_context(): Reset the ZeroMQ context, useful for testing or reinitialization.
         get_trusted_hosts(): Get the list of trusted hosts from settings or a configuration file.
         enable_plain_auth(context): Enable PLAIN authentication for ZeroMQ if security is enabled.
-        stop_authenticator(): Stop the PLAIN authenticator if it exists.
+        enable_curve_auth(context): Enable CURVE authentication of the peers whose certificate is in the trusted peers directory.
+        stop_authenticator(): Stop the PLAIN or CURVE authenticator if it exists.
         generate_key(filename): Generate and store a key in the keys' manager.
         load_certificate(filename): Load a ZMQ certificate from a file.
+        load_peer_public_key(ip): Load the CURVE public key of a trusted peer.
         generate_symmetrical_key(filename): Generate and store a symmetric key for low encryption.
         load_symmetrical_key(filename): Load the symmetric key from a file.
     """
     _context: zmq.Context = None
+    _async_context: zmq.asyncio.Context = None
     _keys_manager: KeysManager = KeysManager()
     _authenticator: ThreadAuthenticator = None
     zmq_security_enabled: bool = settings.ENABLE_ZMQ_SECURITY
+    security_mechanism: str = settings.ZMQ_SECURITY_MECHANISM.lower()
+    payload_cipher: str = settings.ZMQ_PAYLOAD_CIPHER.lower()
     zmq_security: ZMQSecurity = ZMQSecurity()
 
     @classmethod
@@ -51,9 +63,24 @@ class ZMQManager:
             cls._context = zmq.Context().instance()
         return cls._context
 
+    @classmethod
+    def get_async_context(cls) -> zmq.asyncio.Context:
+        """
+        Get an asyncio shadow of the ZeroMQ context.
+        The shadow shares the underlying libzmq context, so the PLAIN authenticator started on the
+        regular context also applies to the asyncio sockets.
+        Returns:
+            zmq.asyncio.Context: The asyncio ZeroMQ context instance.
+        """
+        if cls._async_context is None:
+            logger.info("Initializing asyncio ZeroMQ context.")
+            cls._async_context = zmq.asyncio.Context.shadow(cls.get_context())
+        return cls._async_context
+
     @classmethod
     def terminate_context(cls):
         """Terminate the ZeroMQ context if it exists."""
+        cls._async_context = None
         if cls._context:
             logger.info("Terminating ZeroMQ context.")
             cls._context.term()
@@ -125,12 +152,41 @@ class ZMQManager:
             logger.error(f"Error enabling PLAIN authentication server: {e}")
             raise
 
+    @classmethod
+    def enable_curve_auth(cls, context: zmq.Context) -> ThreadAuthenticator:
+        """
+        Enable CURVE authentication for ZeroMQ: only the clients whose public certificate is in
+        ZMQ_TRUSTED_PEERS_CERTS_PATH are allowed to connect.
+        Args:
+            context (zmq.Context): The ZeroMQ context to configure.
+        Returns:
+            ThreadAuthenticator: The authenticator instance if successful, None otherwise.
+        Raises:
+            RuntimeError: If libzmq was built without CURVE support.
+            Exception: If there is an error enabling the CURVE authentication server.
+        """
+        if not cls.zmq_security_enabled:
+            logger.warning("ZMQ security is not enabled, skipping CURVE authentication setup.")
+            return None
+        if not zmq.has("curve"):
+            raise RuntimeError("libzmq was built without CURVE support.")
+        try:
+            if cls._authenticator is None:
+                cls._authenticator = ThreadAuthenticator(context)
+                cls._authenticator.start()
+            cls._authenticator.configure_curve(domain='*', location=settings.ZMQ_TRUSTED_PEERS_CERTS_PATH)
+            logger.info(f"CURVE authentication server enabled, trusting the certificates of {settings.ZMQ_TRUSTED_PEERS_CERTS_PATH}.")
+            return cls._authenticator
+        except Exception as e:
+            logger.error(f"Error enabling CURVE authentication server: {e}")
+            raise
+
     @classmethod
     def stop_authenticator(cls):
-        """Stop the PLAIN authenticator if it exists."""
+        """Stop the PLAIN or CURVE authenticator if it exists."""
         if cls._authenticator:
             cls._authenticator.stop()
-            logger.info("ZMQ PLAIN authenticator stopped.")
+            logger.info("ZMQ authenticator stopped.")
             cls._authenticator = None
 
     @classmethod
@@ -144,7 +200,7 @@ class ZMQManager:
         """
         if os.path.exists(settings.ZMQ_CERTS_PATH + filename + ".key_secret"):
             logger.info("ZMQ key pair already exists, loading from file.")
-            pub, private = cls.zmq_security.load_certificate(filename=settings.ZMQ_CERTS_PATH + filename + ".key_secret")
+            pub, private = cls.zmq_security.load_certificate(filename=settings.ZMQ_CERTS_PATH + filename)
         else :
             pub, private = cls.zmq_security.generate_key(filename=filename)
             logger.info("Generated new ZMQ key pair.")
@@ -166,6 +222,24 @@ class ZMQManager:
             raise FileNotFoundError(f"Certificate file {filename} does not exist.")
         return cls.zmq_security.load_certificate(filename=settings.ZMQ_CERTS_PATH + filename)
 
+    @classmethod
+    def load_peer_public_key(cls, ip: str) -> bytes:
+        """
+        Load the CURVE public key of a trusted peer, from its certificate <ip>.key in the trusted peers directory.
+        Args:
+            ip (str): The IP address of the peer.
+        Returns:
+            bytes: The Z85 encoded public key of the peer.
+        Raises:
+            FileNotFoundError: If the peer has no certificate.
+        """
+        path = os.path.join(settings.ZMQ_TRUSTED_PEERS_CERTS_PATH, f"{ip}.key")
+        if not os.path.exists(path):
+            logger.error(f"No CURVE certificate for peer {ip} in {settings.ZMQ_TRUSTED_PEERS_CERTS_PATH}.")
+            raise FileNotFoundError(f"Certificate file {path} does not exist.")
+        public_key, _ = zmq.auth.load_certificate(path)
+        return public_key
+
     @classmethod
     def generate_symmetrical_key(cls, filename: str = "default_symmetric_key.key") -> bytes:
         """
@@ -0,0 +1,290 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+import logging
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+from src.config.settings import settings
+from src.utils.keysManager import KeysManager
+
+logger = logging.getLogger(__name__)
+
+"""
+AEAD encryption of the alert payloads, replacing Fernet when ZMQ_PAYLOAD_CIPHER is "aes-gcm" or
+"chacha20-poly1305". The payload is encrypted as raw bytes, without base64, and the clear header
+frame of the message is authenticated with it. An encrypted payload starts with the id of the key
+it was encrypted with, so that the receiver finds the key with a dictionary lookup whatever the
+number of loaded keys:
+
+    marker 0xAE (u8) | cipher id (u8) | key id (4 bytes) | nonce (12 bytes) | ciphertext | tag (16 bytes)
+
+The key id is derived from the key itself, so every node computes the same ids without sharing
+anything but the key files. Every key of ZMQ_PAYLOAD_KEYS_PATH decrypts; the newest key older than
+ZMQ_PAYLOAD_KEY_ACTIVATION_DELAY encrypts. Rotating a key is dropping a new key file on every node,
+then removing the old one once no node encrypts with it anymore, without any restart.
+Call this class as :
+payload_crypto.reload()
+payload_crypto.start()
+token = payload_crypto.encrypt(payload, associated_data=header)
+payload = payload_crypto.decrypt(token, associated_data=header)
+"""
+
+MARKER = 0xAE
+CIPHER_IDS = {"aes-gcm": 1, "chacha20-poly1305": 2}
+KEY_SIZE = 32
+KEY_ID_SIZE = 4
+NONCE_SIZE = 12
+TAG_SIZE = 16
+PREFIX_SIZE = 2 + KEY_ID_SIZE
+OVERHEAD = PREFIX_SIZE + NONCE_SIZE + TAG_SIZE
+
+
+def key_id_of(key: bytes) -> bytes:
+    """
+    Derive the id of a key.
+    Args:
+        key (bytes): The raw key.
+    Returns:
+        bytes: The 4 bytes key id.
+    """
+    return hashlib.blake2b(key, digest_size=KEY_ID_SIZE, person=b"ids2zmq-payload").digest()
+
+
+def is_aead_token(token: bytes | memoryview) -> bool:
+    """Return whether a payload frame was encrypted by PayloadCrypto rather than Fernet."""
+    return len(token) >= OVERHEAD and token[0] == MARKER
+
+
+class PayloadCrypto:
+    """
+    Keyring and AEAD cipher of the payloads.
+    The keys are loaded in a KeysManager indexed by key id, holding for each key one cipher
+    instance per AEAD algorithm. A reload builds a new KeysManager and swaps it at once, so
+    encrypting and decrypting never take a lock.
+    Args:
+        keys_path (str): Directory of the key files, ZMQ_PAYLOAD_KEYS_PATH by default.
+        cipher (str): "aes-gcm" or "chacha20-poly1305", ZMQ_PAYLOAD_CIPHER by default.
+        activation_delay (float): Seconds before a new key encrypts, ZMQ_PAYLOAD_KEY_ACTIVATION_DELAY by default.
+        refresh_interval (float): Seconds between two checks of the key files, ZMQ_PAYLOAD_KEYS_REFRESH_INTERVAL by default.
+    Attributes:
+        _keys (KeysManager): The loaded keys, key id to {cipher id: AEAD instance}.
+        _active (tuple[bytes, AESGCM | ChaCha20Poly1305]): The prefix and the cipher of the encrypting key.
+        _files (dict[str, tuple[int, int, bytes]]): The mtime, size and key id of each loaded key file.
+    Methods:
+        reload(): Load the added or modified key files, forget the removed ones, and select the encrypting key.
+        encrypt(data, associated_data): Encrypt a payload with the encrypting key.
+        decrypt(token, associated_data): Decrypt a payload with the key it designates.
+        generate_key(name): Write a new random key file.
+        key_ids(): Return the ids of the loaded keys.
+        active_key_id(): Return the id of the encrypting key.
+        start(): Start the background reload thread.
+        stop(): Stop the background reload thread.
+    """
+
+    def __init__(self, keys_path: str = None, cipher: str = None, activation_delay: float = None, refresh_interval: float = None):
+        self._keys_path = keys_path
+        self._cipher = cipher
+        self._activation_delay = activation_delay
+        self._refresh_interval = refresh_interval
+        self._keys = KeysManager()
+        self._active: tuple = None
+        self._files: dict[str, tuple[int, int, bytes]] = {}
+        self._reload_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    @property
+    def keys_path(self) -> str:
+        return self._keys_path if self._keys_path is not None else settings.ZMQ_PAYLOAD_KEYS_PATH
+
+    @property
+    def cipher_id(self) -> int:
+        """The id of the configured cipher."""
+        cipher = (self._cipher if self._cipher is not None else settings.ZMQ_PAYLOAD_CIPHER).lower()
+        if cipher not in CIPHER_IDS:
+            raise ValueError(f"Unsupported payload cipher: {cipher}")
+        return CIPHER_IDS[cipher]
+
+    def reload(self) -> bool:
+        """
+        Load the added or modified key files, forget the removed ones, and select the encrypting key.
+        The unchanged files are not read again.
+        Returns:
+            bool: True if the loaded keys or the encrypting key changed, False otherwise.
+        Raises:
+            ValueError: If the configured cipher is not supported.
+        """
+        cipher_id = self.cipher_id
+        with self._reload_lock:
+            entries = self._scan()
+            files_changed = {name: (mtime, size) for name, (mtime, size, _) in self._files.items()} != entries
+            if files_changed:
+                keys, files = self._load(entries)
+            else:
+                keys, files = self._keys, self._files
+            active = self._select_active(keys=keys, files=files, cipher_id=cipher_id)
+            active_changed = (active and active[0]) != (self._active and self._active[0])
+            if files_changed:
+                self._keys, self._files = keys, files
+                logger.info(f"Payload keys reloaded: {', '.join(self.key_ids()) or 'none'}")
+            self._active = active
+            if active_changed:
+                logger.info(f"Payload encryption key is now {self.active_key_id()}")
+            return files_changed or active_changed
+
+    def encrypt(self, data: bytes, associated_data: bytes = b"") -> bytes:
+        """
+        Encrypt a payload with the encrypting key.
+        Args:
+            data (bytes): The clear payload.
+            associated_data (bytes): The clear data authenticated with the payload, the header frame of the message.
+        Returns:
+            bytes: The encrypted payload, prefixed with the cipher and key ids and the nonce.
+        Raises:
+            RuntimeError: If no key is loaded.
+        """
+        active = self._active
+        if active is None:
+            raise RuntimeError(f"No payload key loaded from {self.keys_path}")
+        prefix, aead = active
+        nonce = os.urandom(NONCE_SIZE)
+        return prefix + nonce + aead.encrypt(nonce, data, prefix + associated_data)
+
+    def decrypt(self, token: bytes | memoryview, associated_data: bytes = b"") -> bytes:
+        """
+        Decrypt a payload with the key its prefix designates.
+        Args:
+            token (bytes | memoryview): The encrypted payload.
+            associated_data (bytes): The clear data authenticated with the payload, the header frame of the message.
+        Returns:
+            bytes: The clear payload.
+        Raises:
+            ValueError: If the payload is malformed, or its key or cipher unknown.
+            cryptography.exceptions.InvalidTag: If the payload or the associated data were tampered with.
+        """
+        if not is_aead_token(token):
+            raise ValueError("Not an AEAD payload")
+        prefix = bytes(token[:PREFIX_SIZE])
+        ciphers = self._keys.get_key(prefix[2:])
+        if ciphers is None:
+            raise ValueError(f"Unknown payload key id {prefix[2:].hex()}")
+        aead = ciphers.get(prefix[1])
+        if aead is None:
+            raise ValueError(f"Unsupported payload cipher id {prefix[1]}")
+        nonce = bytes(token[PREFIX_SIZE:PREFIX_SIZE + NONCE_SIZE])
+        return aead.decrypt(nonce, bytes(token[PREFIX_SIZE + NONCE_SIZE:]), prefix + associated_data)
+
+    def generate_key(self, name: str = None) -> str:
+        """
+        Write a new random key file, readable by its owner only.
+        Args:
+            name (str): The file name without extension, the current timestamp by default.
+        Returns:
+            str: The hexadecimal id of the new key.
+        """
+        key = os.urandom(KEY_SIZE)
+        os.makedirs(self.keys_path, exist_ok=True)
+        path = os.path.join(self.keys_path, f"{name or time.strftime('%Y%m%d%H%M%S')}.key")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as key_file:
+            key_file.write(base64.urlsafe_b64encode(key))
+        logger.info(f"Payload key {key_id_of(key).hex()} written to {path}")
+        return key_id_of(key).hex()
+
+    def key_ids(self) -> list[str]:
+        """Return the hexadecimal ids of the loaded keys."""
+        return [key_id.hex() for key_id in self._keys.list_keys()]
+
+    def active_key_id(self) -> str | None:
+        """Return the hexadecimal id of the encrypting key, None when no key is loaded."""
+        active = self._active
+        return active[0][2:].hex() if active else None
+
+    def start(self):
+        """Start the background reload thread."""
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Payload keys reload already running.")
+            return
+        self._stop_event.clear()
+        interval = self._refresh_interval if self._refresh_interval is not None else settings.ZMQ_PAYLOAD_KEYS_REFRESH_INTERVAL
+        self._thread = threading.Thread(target=self._reload_loop, args=(interval,), name="payload-keys", daemon=True)
+        self._thread.start()
+        logger.info(f"Payload keys reloading every {interval}s.")
+
+    def stop(self):
+        """Stop the background reload thread."""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        logger.info("Payload keys reload stopped.")
+
+    def _reload_loop(self, interval: float):
+        while not self._stop_event.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error reloading the payload keys: {e}")
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        """The mtime and size of each key file."""
+        entries = {}
+        try:
+            with os.scandir(self.keys_path) as directory:
+                for entry in directory:
+                    if entry.name.endswith(".key") and entry.is_file():
+                        stat = entry.stat()
+                        entries[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            logger.warning(f"Payload keys directory {self.keys_path} does not exist.")
+        return entries
+
+    def _load(self, entries: dict[str, tuple[int, int]]) -> tuple[KeysManager, dict]:
+        """Build the keyring of the key files, reusing the unchanged ones."""
+        keys = KeysManager()
+        files = {}
+        for name, (mtime, size) in sorted(entries.items()):
+            previous = self._files.get(name)
+            if previous is not None and previous[:2] == (mtime, size) and self._keys.key_exists(previous[2]):
+                key_id, ciphers = previous[2], self._keys.get_key(previous[2])
+            else:
+                try:
+                    key_id, ciphers = self._read_key(os.path.join(self.keys_path, name))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ignoring the payload key file {name}: {e}")
+                    continue
+            if keys.key_exists(key_id):
+                logger.warning(f"Payload key file {name} holds the already loaded key {key_id.hex()}.")
+            keys.add_key(key_id, ciphers)
+            files[name] = (mtime, size, key_id)
+        return keys, files
+
+    @staticmethod
+    def _read_key(path: str) -> tuple[bytes, dict]:
+        """Read a key file, returning the key id and one cipher instance per AEAD algorithm."""
+        with open(path, "rb") as key_file:
+            key = base64.urlsafe_b64decode(key_file.read().strip())
+        if len(key) != KEY_SIZE:
+            raise ValueError(f"expected a {KEY_SIZE} bytes key, got {len(key)} bytes")
+        return key_id_of(key), {CIPHER_IDS["aes-gcm"]: AESGCM(key), CIPHER_IDS["chacha20-poly1305"]: ChaCha20Poly1305(key)}
+
+    def _select_active(self, keys: KeysManager, files: dict, cipher_id: int) -> tuple | None:
+        """
+        The newest key whose file is older than the activation delay, or the oldest one while every
+        key is still waiting for its activation, so that a single fresh key is used right away.
+        """
+        if not files:
+            return None
+        delay = self._activation_delay if self._activation_delay is not None else settings.ZMQ_PAYLOAD_KEY_ACTIVATION_DELAY
+        activated_before = time.time_ns() - int(delay * 1e9)
+        by_age = sorted((mtime, name) for name, (mtime, _, _) in files.items())
+        activated = [item for item in by_age if item[0] <= activated_before]
+        _, name = activated[-1] if activated else by_age[0]
+        key_id = files[name][2]
+        return bytes((MARKER, cipher_id)) + key_id, keys.get_key(key_id)[cipher_id]
+
+
+payload_crypto = PayloadCrypto()
@@ -1,3 +1,5 @@
+import threading
+import time
 import zmq
 import logging
 
@@ -5,44 +7,105 @@ from cryptography.fernet import Fernet
 
 from src.ids2zmq.manager import ZMQManager
 from src.config.settings import settings
+from src.ids2zmq.codec import JsonCodec, encode_envelope_header, encode_header, get_codec, pack_envelope
+from src.ids2zmq.payload_crypto import CIPHER_IDS, PayloadCrypto, payload_crypto
+from src.models.alert_model import AlertModel
+from src.shared.message_id import get_node_id, new_message_id
+from src.shared.metrics import SIZE_BUCKETS, metrics
 
 logger = logging.getLogger(__name__)
 
+_sent_messages = metrics.counter("ids2zmq_publisher_messages_total", "Messages sent by the publisher, single alerts and envelopes.")
+_sent_alerts = metrics.counter("ids2zmq_publisher_alerts_total", "Alerts sent by the publisher.")
+_sent_bytes = metrics.counter("ids2zmq_publisher_bytes_total", "Bytes of the header and payload frames sent by the publisher.")
+_send_failures = metrics.counter("ids2zmq_publisher_send_failures_total", "Messages the publisher socket failed to send.")
+_frame_seconds = metrics.histogram("ids2zmq_publisher_frame_seconds", "Time to pack and encrypt the payload of a message.")
+_message_alerts = metrics.histogram("ids2zmq_publisher_message_alerts", "Alerts per sent message.", buckets=SIZE_BUCKETS)
+
 class ZMQPublisher:
     """
     Manage the ZMQ message publishing for Fail2Ban alerts.
+    When ZMQ_PUBLISH_BATCH_ENABLED is set, the alerts are gathered for up to
+    ZMQ_PUBLISH_BATCH_WINDOW seconds or ZMQ_PUBLISH_BATCH_MAX_SIZE alerts, then encrypted and sent
+    at once in a single envelope message. Alerts of an urgent severity flush the pending ones
+    immediately, so that batching never delays them.
+    Args:
+        context (zmq.Context): Optional ZeroMQ context to create the socket from, defaults to the shared context.
     Attributes:
         publisher_socket (zmq.Socket): ZMQ socket for publishing messages.
         _bind_address (str): Address to bind the publisher socket.
         _topic (str): Topic for Fail2Ban alerts.
         _is_bound (bool): Flag indicating if the publisher is bound.
-        _fernet (Fernet): Fernet instance for encrypting messages if security is enabled.
+        _fernet (Fernet): Fernet instance for encrypting messages if PLAIN security is enabled with the Fernet cipher.
+        _aead (PayloadCrypto): AEAD keyring encrypting messages if PLAIN security is enabled with an AEAD cipher.
+        _codec: Wire codec of the published payloads, selected by ZMQ_WIRE_CODEC.
+        _pending (list[tuple[bytes, bytes]]): The header and clear payload of the alerts waiting for the next envelope.
+        _condition (threading.Condition): Condition protecting the pending alerts and waking up the flusher.
+        _send_lock (threading.Lock): Lock serializing the flushes, so that envelopes leave in order.
+        _flusher (threading.Thread): The thread flushing the envelopes whose window elapsed.
+        batch_stats (dict[str, int]): Counters of batched alerts, sent envelopes and urgent flushes.
     Methods:
         configure_security(): Configure security settings for the publisher socket.
         bind(): Bind the ZMQ Publisher to the configured address.
-        publish_alert(alert: str): Publish a Fail2Ban alert to the ZMQ topic.
-        close(): Close the ZMQ Publisher socket.
+        publish_alert(alert: AlertModel | str, message_id: str, origin: str): Publish a Fail2Ban alert to the ZMQ topic.
+        publish_alerts(alerts: list[AlertModel | str]): Publish several Fail2Ban alerts at once, in envelopes.
+        flush(): Send the pending alerts right away.
+        close(): Flush the pending alerts and close the ZMQ Publisher socket.
     """
-    def __init__(self):
-        self.context = ZMQManager.get_context()
+    def __init__(self, context: zmq.Context = None):
+        self.context = context if context is not None else ZMQManager.get_context()
         self.publisher_socket: zmq.Socket = self.context.socket(zmq.PUB)
         self._bind_address = settings.ZMQ_PUBLISHER_BIND_ADDRESS
         self._topic = settings.ZMQ_TOPIC_FAIL2BAN_ALERT
         self._is_bound = False
         self._fernet: Fernet = None
+        self._aead: PayloadCrypto = None
+        self._codec = get_codec()
+        self._batching = settings.ZMQ_PUBLISH_BATCH_ENABLED
+        self._batch_window = settings.ZMQ_PUBLISH_BATCH_WINDOW
+        self._batch_max_size = max(1, settings.ZMQ_PUBLISH_BATCH_MAX_SIZE)
+        self._urgent_severities = frozenset(severity.lower() for severity in settings.ZMQ_PUBLISH_BATCH_URGENT_SEVERITIES)
+        self._pending: list[tuple[bytes, bytes]] = []
+        self._pending_since = 0.0
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._flusher: threading.Thread = None
+        self._flusher_running = False
+        self.batch_stats = {"alerts": 0, "envelopes": 0, "urgent_flushes": 0}
 
     def configure_security(self):
         """
         Configure security settings for the publisher socket if enabled.
+        With CURVE, the socket is a CURVE server using this node's certificate and only accepts the
+        peers of the trusted peers directory. With PLAIN, the payloads are encrypted with Fernet or,
+        when ZMQ_PAYLOAD_CIPHER names an AEAD cipher, with the keys of ZMQ_PAYLOAD_KEYS_PATH.
         Raises:
             RuntimeError: If there is an error configuring ZMQ security.
         """
-        if ZMQManager.zmq_security_enabled:
+        if ZMQManager.zmq_security_enabled and ZMQManager.security_mechanism == "curve":
+            try:
+                public_key, secret_key = ZMQManager.generate_key(filename=settings.ZMQ_CERTS_NAME)
+                self.publisher_socket.setsockopt(zmq.CURVE_SECRETKEY, secret_key)
+                self.publisher_socket.setsockopt(zmq.CURVE_PUBLICKEY, public_key)
+                self.publisher_socket.setsockopt(zmq.CURVE_SERVER, 1)
+                ZMQManager.enable_curve_auth(context=ZMQManager.get_context())
+                logger.info("ZMQ CURVE security enabled for publisher socket, payloads are not encrypted again.")
+            except zmq.ZMQError as e:
+                logger.error(f"Failed to enable ZMQ CURVE security for publisher: {e}")
+                raise
+            except Exception as e:
+                logger.error(f"Error configuring ZMQ security for publisher: {e}")
+                raise RuntimeError(f"Failed to configure ZMQ security for publisher: {e}")
+        elif ZMQManager.zmq_security_enabled:
             try:
                 self.publisher_socket.setsockopt(zmq.PLAIN_SERVER, 1)
                 logger.info("ZMQ plain security enabled for publisher socket.")
                 ZMQManager.enable_plain_auth(context=ZMQManager.get_context())
-                self._fernet = Fernet(ZMQManager.load_symmetrical_key(filename=settings.ZMQ_SYMMETRICAL_KEY_FILE))
+                if ZMQManager.payload_cipher in CIPHER_IDS:
+                    payload_crypto.reload()
+                    self._aead = payload_crypto
+                else:
+                    self._fernet = Fernet(ZMQManager.load_symmetrical_key(filename=settings.ZMQ_SYMMETRICAL_KEY_FILE))
             except zmq.ZMQError as e:
                 logger.error(f"Failed to enable ZMQ plain security for publisher: {e}")
                 raise
@@ -54,7 +117,7 @@ class ZMQPublisher:
 
     def bind(self):
         """
-        Bind the ZMQ Publisher to the configured address.
+        Bind the ZMQ Publisher to the configured address, and start the flusher when batching is enabled.
         Raises:
             RuntimeError: If the publisher is already bound or if binding fails.
         """
@@ -66,14 +129,21 @@ class ZMQPublisher:
             except zmq.ZMQError as e:
                 logger.error(f"Failed to bind ZMQ Publisher to {self._bind_address}: {e}")
                 raise
+            if self._batching:
+                self._start_flusher()
         else:
             logger.warning("ZMQ Publisher already bound.")
 
-    def publish_alert(self, alert: str):
+    def publish_alert(self, alert: AlertModel | str, message_id: str = None, origin: str = None):
         """
         Publish a Fail2Ban alert to the ZMQ topic.
+        The message is made of three frames: the topic, a clear header holding the codec, origin and
+        message ids, and the alert payload, encrypted when security is enabled. With batching, the
+        alert is queued for the next envelope instead, unless its severity is urgent.
         Args:
-            alert (str): The alert message to publish.
+            alert (AlertModel | str): The alert to publish, encoded with the configured codec, or an already serialized JSON alert.
+            message_id (str): The message id of the alert, the alert's own or a new one if None.
+            origin (str): The origin node id of the alert, the alert's own or this node if None.
         Raises:
             RuntimeError: If the publisher is not bound or if there is an error during publishing.
         """
@@ -81,22 +151,190 @@ class ZMQPublisher:
             logger.error("Attempted to publish without binding the ZMQ Publisher.")
             raise RuntimeError("ZMQ Publisher not bound.")
 
+        item = self._encode_item(alert=alert, message_id=message_id, origin=origin)
+        if self._batching:
+            if self._enqueue(item=item, urgent=self._is_urgent(alert)):
+                self.flush()
+            return
         try:
-            if ZMQManager.zmq_security_enabled :
-                encrypted_alert = self._fernet.encrypt(alert.encode('utf-8'))
-                logger.info("Alert encrypted before publishing.")
-                self.publisher_socket.send_multipart([self._topic.encode('utf-8'), encrypted_alert])
-            else:
-                self.publisher_socket.send_string(f"{self._topic} {alert}")
-                logger.info("Alert sent without encryption.")
-            logger.info(f"Published alert on topic '{self._topic}'")
+            self.publisher_socket.send_multipart(self._build_frames(items=[item]))
+            logger.debug("Published alert on topic '%s'", self._topic)
         except zmq.ZMQError as e:
-            logger.error(f"Error publishing ZMQ message: {e}")
+            _send_failures.inc()
+            logger.error("Error publishing ZMQ message: %s", e)
             raise
 
+    def publish_alerts(self, alerts: list[AlertModel | str]):
+        """
+        Publish several Fail2Ban alerts at once, in envelopes of up to ZMQ_PUBLISH_BATCH_MAX_SIZE alerts,
+        whether batching is enabled or not. The pending alerts are sent first, so that the alerts leave in order.
+        Args:
+            alerts (list[AlertModel | str]): The alerts to publish, with their own message ids and origins.
+        Raises:
+            RuntimeError: If the publisher is not bound.
+            zmq.ZMQError: If sending an envelope fails.
+        """
+        if not self._is_bound:
+            logger.error("Attempted to publish without binding the ZMQ Publisher.")
+            raise RuntimeError("ZMQ Publisher not bound.")
+        if not alerts:
+            return
+
+        items = [self._encode_item(alert=alert) for alert in alerts]
+        with self._send_lock:
+            for envelope in self._split(self._take_pending() + items):
+                self._send_envelope(items=envelope)
+
+    def flush(self):
+        """
+        Send the pending alerts right away, in one envelope.
+        Raises:
+            zmq.ZMQError: If sending the envelope fails.
+        """
+        with self._send_lock:
+            items = self._take_pending()
+            if items:
+                self._send_envelope(items=items)
+
+    def _send_envelope(self, items: list[tuple[bytes, bytes]]):
+        """Send the given alerts as one message, logging instead of raising on the flusher thread."""
+        try:
+            self.publisher_socket.send_multipart(self._build_frames(items=items))
+            self.batch_stats["envelopes"] += 1
+            logger.debug("Published %d alerts on topic '%s'", len(items), self._topic)
+        except zmq.ZMQError as e:
+            _send_failures.inc()
+            logger.error(f"Error publishing ZMQ envelope of {len(items)} alerts: {e}")
+            if threading.current_thread() is not self._flusher:
+                raise
+
+    def _split(self, items: list[tuple[bytes, bytes]]) -> list[list[tuple[bytes, bytes]]]:
+        """Split encoded alerts into envelopes of up to ZMQ_PUBLISH_BATCH_MAX_SIZE alerts."""
+        return [items[start:start + self._batch_max_size] for start in range(0, len(items), self._batch_max_size)]
+
+    def _is_urgent(self, alert: AlertModel | str) -> bool:
+        """Whether an alert must leave without waiting for its envelope; raw JSON alerts, of unknown severity, are."""
+        return isinstance(alert, str) or str(alert.severity).lower() in self._urgent_severities
+
+    def _enqueue(self, item: tuple[bytes, bytes], urgent: bool) -> bool:
+        """
+        Queue an encoded alert for the next envelope.
+        Args:
+            item (tuple[bytes, bytes]): The header and clear payload of the alert.
+            urgent (bool): Whether the alert must be sent immediately.
+        Returns:
+            bool: True if the caller must flush now, because the alert is urgent or the envelope is full.
+        """
+        with self._condition:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+                self._condition.notify()
+            self._pending.append(item)
+            self.batch_stats["alerts"] += 1
+            if urgent:
+                self.batch_stats["urgent_flushes"] += 1
+            return urgent or len(self._pending) >= self._batch_max_size
+
+    def _take_pending(self) -> list[tuple[bytes, bytes]]:
+        """Remove and return the pending alerts."""
+        with self._condition:
+            items, self._pending = self._pending, []
+        return items
+
+    def _start_flusher(self):
+        """Start the thread flushing the envelopes whose window elapsed."""
+        with self._condition:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher_running = True
+        self._flusher = threading.Thread(target=self._flush_loop, name="zmq-publisher-flusher", daemon=True)
+        self._flusher.start()
+        logger.info(f"ZMQ Publisher batching enabled (window {self._batch_window}s, max {self._batch_max_size} alerts).")
+
+    def _stop_flusher(self):
+        """Stop the flusher thread, then send the alerts still pending."""
+        with self._condition:
+            self._flusher_running = False
+            self._condition.notify()
+        if self._flusher is not None and self._flusher.is_alive() and threading.current_thread() is not self._flusher:
+            self._flusher.join(timeout=2.0)
+        self._flusher = None
+        if self._pending and self._is_bound:
+            self.flush()
+
+    def _flush_loop(self):
+        """Wait for the pending alerts to be due and flush them until stopped."""
+        while True:
+            with self._condition:
+                while self._flusher_running and not self._is_due():
+                    self._condition.wait(timeout=self._time_to_deadline())
+                if not self._flusher_running:
+                    return
+            self.flush()
+
+    def _is_due(self) -> bool:
+        return bool(self._pending) and (time.monotonic() - self._pending_since >= self._batch_window
+                                        or len(self._pending) >= self._batch_max_size)
+
+    def _time_to_deadline(self) -> float | None:
+        """Seconds until the pending alerts are due, None when there is none."""
+        if not self._pending:
+            return None
+        return max(0.0, self._pending_since + self._batch_window - time.monotonic())
+
+    def _encode_item(self, alert: AlertModel | str, message_id: str = None, origin: str = None) -> tuple[bytes, bytes]:
+        """
+        Encode an alert and its header.
+        Args:
+            alert (AlertModel | str): The alert to publish, or an already serialized JSON alert.
+            message_id (str): The message id of the alert, the alert's own or a new one if None.
+            origin (str): The origin node id of the alert, the alert's own or this node if None.
+        Returns:
+            tuple[bytes, bytes]: The header and the clear payload of the alert.
+        """
+        if isinstance(alert, str):
+            codec, payload = JsonCodec, alert.encode('utf-8')
+        else:
+            codec, payload = self._codec, self._codec.encode(alert)
+            message_id = message_id or alert.message_id
+            origin = origin or alert.origin
+        header = encode_header(codec_id=codec.codec_id, origin=origin or get_node_id(), message_id=message_id or new_message_id())
+        return header, payload
+
+    def _build_frames(self, items: list[tuple[bytes, bytes]]) -> list[bytes]:
+        """
+        Build the frames of a message: [topic, header, payload] for a single alert, or the envelope
+        of several alerts, whose payloads are encrypted at once.
+        Args:
+            items (list[tuple[bytes, bytes]]): The header and clear payload of each alert.
+        Returns:
+            list[bytes]: The frames to send.
+        """
+        started = time.perf_counter()
+        if len(items) == 1:
+            header, payload = items[0]
+        else:
+            header = encode_envelope_header([item_header for item_header, _ in items])
+            payload = pack_envelope([item_payload for _, item_payload in items])
+        if ZMQManager.zmq_security_enabled and self._aead is not None:
+            payload = self._aead.encrypt(payload, associated_data=header)
+            logger.debug("Alert encrypted before publishing.")
+        elif ZMQManager.zmq_security_enabled and self._fernet is not None:
+            payload = self._fernet.encrypt(payload)
+            logger.debug("Alert encrypted before publishing.")
+        else:
+            logger.debug("Alert sent without encryption.")
+        _frame_seconds.observe(time.perf_counter() - started)
+        _sent_messages.inc()
+        _sent_alerts.inc(len(items))
+        _sent_bytes.inc(len(header) + len(payload))
+        _message_alerts.observe(len(items))
+        return [self._topic.encode('utf-8'), header, payload]
+
     def close(self):
-        """Close the ZMQ Publisher socket."""
+        """Flush the pending alerts and close the ZMQ Publisher socket."""
+        self._stop_flusher()
         if self.publisher_socket:
             logger.info("Closing ZMQ Publisher socket.")
             self.publisher_socket.close()
-            self._is_bound = False
\ No newline at end of file
+            self._is_bound = False
@@ -8,6 +8,8 @@ logger = logging.getLogger(__name__)
 class ZMQRouter:
     """
     ZMQRouter is a class that implements a ZeroMQ ROUTER socket.
+    Args:
+        context (zmq.Context): Optional ZeroMQ context to create the socket from, defaults to the shared context.
     Attributes:
         context (zmq.Context): The ZeroMQ context for creating sockets.
         socket (zmq.Socket): The ROUTER socket for receiving and sending messages.
@@ -19,8 +21,8 @@ class ZMQRouter:
         run_in_thread(): Runs the ROUTER in a separate thread to allow asynchronous operation.
     """
 
-    def __init__(self):
-        self.context = ZMQManager.get_context()
+    def __init__(self, context: zmq.Context = None):
+        self.context = context if context is not None else ZMQManager.get_context()
         self.socket = self.context.socket(zmq.ROUTER)
         self.bind_address = settings.ZMQ_ROUTER_BIND_ADDRESS
         self.running = False
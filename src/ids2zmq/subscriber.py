@@ -1,3 +1,4 @@
+import struct
 import time
 from datetime import datetime, UTC
 
@@ -10,52 +11,104 @@ import cryptography.exceptions as cry_ex
 from src.ids2zmq.manager import ZMQManager
 from src.config.settings import settings
 from src.models.alert_model import AlertModel
-from src.utils.ip_address import get_local_ip
+from src.shared import alert_trace
+from src.shared.bloom_filter import RotatingBloomFilter
+from src.ids2zmq.codec import (JsonCodec, decode_envelope_header, decode_header, get_codec_by_id, header_ids,
+                               is_envelope_header, unpack_envelope)
+from src.ids2zmq.payload_crypto import CIPHER_IDS, PayloadCrypto, payload_crypto
+from src.shared.message_id import get_node_id
+from src.shared.metrics import SIZE_BUCKETS, metrics
 from src.utils.ip_address import extract_ip_address_from_socket_address
+from src.utils.node_identity import node_identity
 
 logger = logging.getLogger(__name__)
 
+_received_messages = metrics.counter("ids2zmq_subscriber_messages_total", "Messages received by the subscriber.")
+_received_alerts = metrics.counter("ids2zmq_subscriber_alerts_total", "Alerts decoded and handed over by the subscriber.")
+_dropped = metrics.counter("ids2zmq_subscriber_dropped_total", "Messages or alerts dropped by the subscriber, by reason.",
+                           labels=("reason",))
+_dropped_topic, _dropped_header, _dropped_echo, _dropped_seen, _dropped_decrypt, _dropped_invalid = (
+    _dropped.labels(reason) for reason in ("topic", "header", "echo", "seen", "decrypt", "invalid"))
+_callback_failures = metrics.counter("ids2zmq_subscriber_callback_failures_total", "Errors raised by the subscriber callback.")
+_drained_messages = metrics.histogram("ids2zmq_subscriber_drained_messages",
+                                      "Messages queued on the subscriber socket at each wake-up of the receive loop.",
+                                      buckets=SIZE_BUCKETS)
+_message_seconds = metrics.histogram("ids2zmq_subscriber_message_seconds",
+                                     "Time to decrypt, decode and hand over the alerts of a received message.")
+
 """
 Call this class as : 
-def handle_alert(data: str):
-    print("Received alert data:", data)
+def handle_alert(alert: AlertModel):
+    print("Received alert:", alert.ip)
 
-subscriber = ZMQSubscriber(on_message_callback=handle_alert)
+subscriber = ZMQSubscriber(on_alert_callback=handle_alert)
 subscriber.connect_to_publishers()
 subscriber.start()
 
-# Define the on_message_callback function to handle incoming messages and implement your logic.
+# Define the on_alert_callback function to handle the validated alerts and implement your logic.
+# Callbacks expecting the JSON string of the alert can still be given as on_message_callback.
 """
 
 class ZMQSubscriber(threading.Thread):
     """
     Subscriber in a separate thread to listen for ZMQ messages.
+    The received alerts are decoded and validated once, then handed over as AlertModel instances
+    so that the next stages never parse them again.
     Args:
-        on_message_callback (callable): Function to call when a message is received.
+        on_message_callback (callable): Function called with the JSON string of each received alert, kept for compatibility.
+        context (zmq.Context): Optional ZeroMQ context to create the sockets from, defaults to the shared context.
+        on_alert_callback (callable): Function called with each received AlertModel, preferred over on_message_callback.
     Attributes:
-        on_message_callback (callable): Function to call when a message is received.
+        _on_message_callback (callable): Function to call when an alert is received.
+        _typed_callback (bool): Whether the callback takes the AlertModel rather than its JSON string.
         subscriber_socket (zmq.Socket): ZMQ socket for subscribing to messages.
         _topic (str): Topic to subscribe to.
         _running (threading.Event): Event to control the running state of the thread.
-        _fernet (Fernet): Fernet instance for decrypting messages if security is enabled.
+        _fernet (Fernet): Fernet instance for decrypting messages if PLAIN security is enabled with the Fernet cipher.
+        _aead (PayloadCrypto): AEAD keyring decrypting messages if PLAIN security is enabled with an AEAD cipher.
+        _seen (RotatingBloomFilter): Time-windowed filter of the message headers already handled.
+        _wakeup_receiver (zmq.Socket): Inproc PAIR socket polled alongside the subscriber socket to interrupt the wait.
+        _wakeup_sender (zmq.Socket): Inproc PAIR socket used by stop() to wake up the receive loop.
+        _close_lock (threading.Lock): Lock deciding whether stop() or the exiting receive loop closes the sockets.
+        _exited (bool): Whether the receive loop is done with the sockets.
+        _close_on_exit (bool): Whether the receive loop must close the sockets, stop() having given up waiting for it.
     Methods:
         connect_to_publisher(host: str): Connect to a specific publisher.
         connect_to_publisher_with_retries(host: str, retries: int = 5, delay: float = 2.0): Connect to a publisher with retry logic.
         connect_to_publishers(): Connect to all trusted publishers defined in the ZMQManager.
         configure_security(): Configure security settings for the subscriber socket if enabled.
-        run(): Run the subscriber thread to listen for messages.
-        stop(): Stop the subscriber thread and close the socket.
+        run(): Run the subscriber thread, blocking on a poller until a socket is readable.
+        wakeup(): Interrupt the poller wait of the receive loop.
+        stop(): Wake up and stop the subscriber thread, then close the sockets.
     """
 
-    def __init__(self, on_message_callback: callable):
+    def __init__(self, on_message_callback: callable = None, context: zmq.Context = None, on_alert_callback: callable = None):
+        if (on_message_callback is None) == (on_alert_callback is None):
+            raise ValueError("Exactly one of on_message_callback and on_alert_callback is required.")
         super().__init__(daemon=True)  # Daemon thread so it closes with main app
-        self.context = ZMQManager.get_context()
+        self.context = context if context is not None else ZMQManager.get_context()
         self.subscriber_socket: zmq.Socket = self.context.socket(zmq.SUB)
         self._topic = settings.ZMQ_TOPIC_FAIL2BAN_ALERT
         self._running = threading.Event()
         self._running.set()
-        self._on_message_callback = on_message_callback
+        self._typed_callback = on_alert_callback is not None
+        self._on_message_callback = on_alert_callback if self._typed_callback else on_message_callback
         self._fernet: Fernet = None
+        self._aead: PayloadCrypto = None
+        self._seen = RotatingBloomFilter(
+            capacity=settings.ZMQ_SEEN_FILTER_CAPACITY,
+            error_rate=settings.ZMQ_SEEN_FILTER_ERROR_RATE,
+            window=settings.ZMQ_SEEN_FILTER_WINDOW,
+        )
+        # Inproc PAIR channel used by stop() to wake the poller immediately
+        self._wakeup_address = f"inproc://zmq-subscriber-wakeup-{id(self)}"
+        self._wakeup_receiver: zmq.Socket = self.context.socket(zmq.PAIR)
+        self._wakeup_receiver.bind(self._wakeup_address)
+        self._wakeup_sender: zmq.Socket = self.context.socket(zmq.PAIR)
+        self._wakeup_sender.connect(self._wakeup_address)
+        self._close_lock = threading.Lock()
+        self._exited = False
+        self._close_on_exit = False
 
     def connect_to_publisher(self, host:str):
         """
@@ -66,6 +119,7 @@ class ZMQSubscriber(threading.Thread):
             zmq.ZMQError: If the connection fails.
         """
         try:
+            self._set_server_key(host=host)
             self.subscriber_socket.connect(host)
             logger.info(f"Subscriber bound to {settings.ZMQ_PUBLISHER_BIND_ADDRESS}")
         except zmq.ZMQError as e:
@@ -85,6 +139,7 @@ class ZMQSubscriber(threading.Thread):
         attempt = 0
         while attempt < retries:
             try:
+                self._set_server_key(host=host)
                 self.subscriber_socket.connect(host)
                 logger.info(f"Subscriber connected to {host}")
                 return
@@ -107,29 +162,62 @@ class ZMQSubscriber(threading.Thread):
         count = 0
         for host in trusted_hosts:
             try:
-                if extract_ip_address_from_socket_address(socket_address=host) == get_local_ip():
+                if node_identity.is_local(extract_ip_address_from_socket_address(socket_address=host)):
                     logger.info(f"Skipping connection to self: {host}")
                     continue
                 else:
                     self.connect_to_publisher_with_retries(host=host)
                     count += 1
-            except zmq.ZMQError as e:
+            except (zmq.ZMQError, FileNotFoundError) as e:
                 logger.error(f"Failed to connect to {host}: {e}")
         logger.info(f"Connected to {count} trusted hosts for ZMQ subscriber.")
         self.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, self._topic)
 
+    def _set_server_key(self, host: str):
+        """
+        With CURVE, set the public key of the publisher about to be connected, the socket option
+        being read by libzmq at connect time.
+        Args:
+            host (str): Publisher address.
+        Raises:
+            FileNotFoundError: If the publisher has no certificate in the trusted peers directory.
+        """
+        if ZMQManager.zmq_security_enabled and ZMQManager.security_mechanism == "curve":
+            server_key = ZMQManager.load_peer_public_key(ip=extract_ip_address_from_socket_address(socket_address=host))
+            self.subscriber_socket.setsockopt(zmq.CURVE_SERVERKEY, server_key)
+
     def configure_security(self):
         """
         Configure security settings for the subscriber socket if enabled.
+        With CURVE, the socket authenticates with this node's certificate and each publisher is
+        authenticated with its certificate from the trusted peers directory. With PLAIN, the
+        payloads are decrypted with Fernet or, when ZMQ_PAYLOAD_CIPHER names an AEAD cipher, with the
+        keys of ZMQ_PAYLOAD_KEYS_PATH.
         Raises:
             RuntimeError: If there is an error configuring ZMQ security.
             zmq.ZMQError: If setting socket options fails.
         """
-        if ZMQManager.zmq_security_enabled:
+        if ZMQManager.zmq_security_enabled and ZMQManager.security_mechanism == "curve":
+            try:
+                public_key, secret_key = ZMQManager.generate_key(filename=settings.ZMQ_CERTS_NAME)
+                self.subscriber_socket.setsockopt(zmq.CURVE_SECRETKEY, secret_key)
+                self.subscriber_socket.setsockopt(zmq.CURVE_PUBLICKEY, public_key)
+                logger.info("ZMQ CURVE security enabled for subscriber socket.")
+            except zmq.ZMQError as e:
+                logger.error(f"Failed to enable ZMQ CURVE security for subscriber: {e}")
+                raise
+            except Exception as e:
+                logger.error(f"Error configuring ZMQ security for subscriber: {e}")
+                raise RuntimeError(f"Failed to configure ZMQ security for subscriber: {e}")
+        elif ZMQManager.zmq_security_enabled:
             try :
                 self.subscriber_socket.setsockopt(zmq.PLAIN_USERNAME, settings.ZMQ_SECURITY_USERNAME.encode('utf-8'))
                 self.subscriber_socket.setsockopt(zmq.PLAIN_PASSWORD, settings.ZMQ_SECURITY_PASSWORD.encode('utf-8'))
-                self._fernet = Fernet(key=ZMQManager.load_symmetrical_key(filename=settings.ZMQ_SYMMETRICAL_KEY_FILE))
+                if ZMQManager.payload_cipher in CIPHER_IDS:
+                    payload_crypto.reload()
+                    self._aead = payload_crypto
+                else:
+                    self._fernet = Fernet(key=ZMQManager.load_symmetrical_key(filename=settings.ZMQ_SYMMETRICAL_KEY_FILE))
                 logger.info("ZMQ plain security enabled for subscriber socket.")
             except zmq.ZMQError as e:
                 logger.error(f"Failed to enable ZMQ plain security for subscriber: {e}")
@@ -143,50 +231,321 @@ class ZMQSubscriber(threading.Thread):
     def run(self):
         """
         Run the subscriber thread to listen for messages.
-        Raises:
-            zmq.Again: If no message is available (non-blocking mode).
-            Exception: For any other errors during message processing.
+        The thread blocks on a zmq.Poller until either the subscriber socket or the wake-up channel
+        is readable, so it does not consume CPU while no alerts are flowing. Every wake-up drains
+        all the messages already queued on the subscriber socket.
         """
         logger.info("ZMQSubscriber started.")
-        received_msg:str = ""
+        poller = zmq.Poller()
+        poller.register(self.subscriber_socket, zmq.POLLIN)
+        poller.register(self._wakeup_receiver, zmq.POLLIN)
+        try:
+            while self._running.is_set():
+                try:
+                    events = dict(poller.poll())
+                except zmq.ZMQError as e:
+                    if e.errno == zmq.ETERM:
+                        break
+                    logger.error(f"Error polling ZMQSubscriber sockets: {e}")
+                    continue
+                if self._wakeup_receiver in events:
+                    self._drain_wakeup_channel()
+                if self.subscriber_socket in events:
+                    self._drain_messages()
+        finally:
+            with self._close_lock:
+                self._exited = True
+                close = self._close_on_exit
+            if close:
+                self._close_sockets()
+            logger.info("ZMQSubscriber receive loop exited.")
+
+    def _drain_wakeup_channel(self):
+        """Consume all the pending wake-up signals."""
+        while True:
+            try:
+                self._wakeup_receiver.recv(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+    def _drain_messages(self):
+        """Receive and handle every message currently queued on the subscriber socket."""
+        drained = 0
         while self._running.is_set():
             try:
-                topic, message = self.subscriber_socket.recv_multipart(flags=zmq.NOBLOCK)
-                if ZMQManager.zmq_security_enabled:
-                    try:
-                        received_msg = self._fernet.decrypt(message).decode('utf-8')
-                        logger.info("Received encrypted message, decrypted successfully.")
-                    except cry_ex.InvalidKey as e:
-                        logger.error(f"Failed to decrypt message, invalid key: {e}")
-                        continue
-                    except cry_ex.InvalidSignature as e:
-                        logger.error(f"Failed to decrypt message, invalid signature: {e}")
-                        continue
-                    except cry_ex.UnsupportedAlgorithm as e:
-                        logger.error(f"Failed to decrypt message, unsupported algorithm: {e}")
-                        continue
-                    except Exception as e:
-                        logger.error(f"Error decrypting message: {e}")
-                        continue
-                else:
-                    received_msg = message.decode('utf-8')
-                    logger.info("Received message without encryption.")
-                if topic.decode() == self._topic:
-                    alert_received: AlertModel = AlertModel.from_json(json_str=received_msg)
-                    alert_received.target_ip = get_local_ip()
-                    alert_received.processing_timestamp = datetime.now(UTC)
-                    payload = alert_received.to_json()
-                    logger.info(f"Received alert: {payload}")
-                    self._on_message_callback(payload)
+                frames = self.subscriber_socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
             except zmq.Again:
-                continue  # No message available yet, just retry
+                break  # Queue drained, go back to the poller
+            except Exception as e:
+                logger.error("Error in ZMQSubscriber: %s", e)
+                continue
+            drained += 1
+            self._handle_message(frames=frames)
+        if drained:
+            _drained_messages.observe(drained)
+
+    def _handle_message(self, frames: list[bytes]):
+        """
+        Decode a received message and forward each of its alerts to the callback.
+        Args:
+            frames (list[zmq.Frame]): The frames of the message.
+        """
+        started = time.perf_counter()
+        for alert in self._decode_frames(frames=frames):
+            try:
+                self._on_message_callback(self._callback_argument(alert))
             except Exception as e:
-                logger.error(f"Error in ZMQSubscriber: {e}")
+                _callback_failures.inc()
+                logger.error("Error in ZMQSubscriber: %s", e)
+        _message_seconds.observe(time.perf_counter() - started)
+
+    def _callback_argument(self, alert: AlertModel) -> AlertModel | str:
+        """The alert itself for a typed callback, its JSON string for a legacy one."""
+        alert_trace.stamp(alert, alert_trace.ENQUEUE)
+        return alert if self._typed_callback else alert.to_json()
+
+    def _decode_frames(self, frames: list[zmq.Frame | bytes]) -> list[AlertModel]:
+        """
+        Filter a received message on its clear frames, then decode its payload.
+        Messages of another topic, echoes of this node's own alerts and message ids already seen are
+        dropped before anything is decrypted or validated. Messages without header frame, sent by
+        peers predating it, skip the id checks and carry JSON. The frames are read through
+        memoryviews, the payload is only copied when it has to be decrypted.
+        Args:
+            frames (list[zmq.Frame | bytes]): The [topic, header, payload] or [topic, payload] frames of the message.
+        Returns:
+            list[AlertModel]: The alerts to forward, several for an envelope, none if the message must be dropped.
+        """
+        _received_messages.inc()
+        # The stages of this node, added to the trace of each alert once decoded
+        stamps = {alert_trace.RECEIVE: time.time_ns()} if alert_trace.enabled() else None
+        buffers = [getattr(frame, "buffer", frame) for frame in frames]
+        if len(buffers) == 3:
+            topic, header, message = buffers
+        elif len(buffers) == 2:
+            (topic, message), header = buffers, None
+        else:
+            logger.warning("Dropping a message of %d frames.", len(buffers))
+            _dropped_header.inc()
+            return []
+        if topic != self._topic.encode('utf-8'):
+            _dropped_topic.inc()
+            return []
+        if header is None:
+            alert = self._decode_message(message=message, stamps=stamps)
+            alerts = [alert] if alert is not None else []
+        else:
+            header = bytes(header)
+            if is_envelope_header(header):
+                alerts = self._decode_envelope(header=header, message=message, stamps=stamps)
+            else:
+                alerts = self._decode_single(header=header, message=message, stamps=stamps)
+        _received_alerts.inc(len(alerts))
+        return alerts
+
+    def _decode_single(self, header: bytes, message: bytes | memoryview, stamps: dict = None) -> list[AlertModel]:
+        """
+        Decode the alert of a single alert message, unless it is dropped on its header.
+        Args:
+            header (bytes): The header frame.
+            message (bytes | memoryview): The payload frame.
+            stamps (dict): The trace stamps of this node, None when tracing is disabled.
+        Returns:
+            list[AlertModel]: The alert to forward, or none.
+        """
+        accepted = self._accept_header(header=header)
+        if accepted is None:
+            return []
+        codec, message_id, seen_key = accepted
+        alert = self._decode_message(message=message, message_id=message_id, codec=codec, header=header, stamps=stamps)
+        if alert is None:
+            return []
+        self._seen.add(seen_key)
+        return [alert]
+
+    def _decode_envelope(self, header: bytes, message: bytes | memoryview, stamps: dict = None) -> list[AlertModel]:
+        """
+        Decode the alerts of an envelope message, decrypted once unless all of them are dropped on their header.
+        Args:
+            header (bytes): The envelope header frame.
+            message (bytes | memoryview): The envelope payload frame.
+            stamps (dict): The trace stamps of this node, None when tracing is disabled.
+        Returns:
+            list[AlertModel]: The alerts to forward.
+        """
+        try:
+            item_headers = decode_envelope_header(header)
+        except (ValueError, struct.error) as e:
+            logger.warning("Dropping an envelope with an invalid header: %s", e)
+            _dropped_header.inc()
+            return []
+        accepted = [(index, self._accept_header(header=item_header)) for index, item_header in enumerate(item_headers)]
+        accepted = [(index, item) for index, item in accepted if item is not None]
+        if not accepted:
+            return []
+        received_msg = self._decrypt(message=message, header=header)
+        if received_msg is None:
+            return []
+        if stamps is not None:
+            stamps[alert_trace.DECRYPT] = time.time_ns()
+        try:
+            items = unpack_envelope(received_msg, count=len(item_headers))
+        except ValueError as e:
+            logger.warning("Dropping an envelope of %d alerts: %s", len(item_headers), e)
+            _dropped_invalid.inc(len(accepted))
+            return []
+        alerts = []
+        for index, (codec, message_id, seen_key) in accepted:
+            alert = self._decode_payload(data=items[index], message_id=message_id, codec=codec, stamps=stamps)
+            if alert is not None:
+                self._seen.add(seen_key)
+                alerts.append(alert)
+        return alerts
+
+    def _accept_header(self, header: bytes) -> tuple | None:
+        """
+        Check the header of a single alert against this node's id and the seen filter.
+        Args:
+            header (bytes): The header of the alert.
+        Returns:
+            tuple | None: The codec, the message id and the seen filter key of the alert, None if it must be dropped.
+        """
+        try:
+            codec_id, origin, message_id = decode_header(header)
+            codec = get_codec_by_id(codec_id)
+        except ValueError as e:
+            logger.warning("Dropping a message with an invalid header: %s", e)
+            _dropped_header.inc()
+            return None
+        if origin == get_node_id():
+            logger.debug("Dropping the echo of our own alert %s.", message_id)
+            _dropped_echo.inc()
+            return None
+        seen_key = header_ids(header)
+        if seen_key in self._seen:
+            logger.debug("Dropping the already seen alert %s from %s.", message_id, origin)
+            _dropped_seen.inc()
+            return None
+        return codec, message_id, seen_key
+
+    def _decode_message(self, message: bytes | memoryview, message_id: str = None, codec=JsonCodec,
+                        header: bytes = b"", stamps: dict = None) -> AlertModel | None:
+        """
+        Decrypt and validate a single received message.
+        Args:
+            message (bytes | memoryview): The payload frame of the message.
+            message_id (str): The message id of the header frame, checked against the payload when set.
+            codec: The wire codec of the payload, given by the header frame.
+            header (bytes): The header frame, authenticated with the payload by the AEAD ciphers.
+            stamps (dict): The trace stamps of this node, None when tracing is disabled.
+        Returns:
+            AlertModel | None: The alert to forward, None if the message must be dropped.
+        """
+        received_msg = self._decrypt(message=message, header=header)
+        if received_msg is None:
+            return None
+        if stamps is not None:
+            stamps[alert_trace.DECRYPT] = time.time_ns()
+        return self._decode_payload(data=received_msg, message_id=message_id, codec=codec, stamps=stamps)
+
+    def _decrypt(self, message: bytes | memoryview, header: bytes = b"") -> bytes | memoryview | None:
+        """
+        Decrypt a payload frame when PLAIN security is enabled, CURVE being decrypted by libzmq.
+        Args:
+            message (bytes | memoryview): The payload frame.
+            header (bytes): The header frame, authenticated with the payload by the AEAD ciphers.
+        Returns:
+            bytes | memoryview | None: The clear payload, None if it could not be decrypted.
+        """
+        if ZMQManager.zmq_security_enabled and self._aead is not None:
+            try:
+                return self._aead.decrypt(message, associated_data=header)
+            except cry_ex.InvalidTag:
+                logger.error("Failed to decrypt message, invalid authentication tag.")
+            except ValueError as e:
+                logger.error("Failed to decrypt message: %s", e)
+            _dropped_decrypt.inc()
+            return None
+        if not ZMQManager.zmq_security_enabled or self._fernet is None:
+            logger.debug("Received message without encryption.")
+            return message
+        try:
+            received_msg = self._fernet.decrypt(bytes(message))
+            logger.debug("Received encrypted message, decrypted successfully.")
+            return received_msg
+        except cry_ex.InvalidKey as e:
+            logger.error("Failed to decrypt message, invalid key: %s", e)
+        except cry_ex.InvalidSignature as e:
+            logger.error("Failed to decrypt message, invalid signature: %s", e)
+        except cry_ex.UnsupportedAlgorithm as e:
+            logger.error("Failed to decrypt message, unsupported algorithm: %s", e)
+        except Exception as e:
+            logger.error("Error decrypting message: %s", e)
+        _dropped_decrypt.inc()
+        return None
+
+    def _decode_payload(self, data: bytes | memoryview, message_id: str = None, codec=JsonCodec,
+                        stamps: dict = None) -> AlertModel | None:
+        """
+        Decode and validate a clear alert payload.
+        Args:
+            data (bytes | memoryview): The clear payload of the alert.
+            message_id (str): The message id of the header, checked against the payload when set.
+            codec: The wire codec of the payload.
+            stamps (dict): The trace stamps of this node, added to the trace of the alert, None when tracing is disabled.
+        Returns:
+            AlertModel | None: The validated alert, stamped with its receipt time, None if it must be dropped.
+        """
+        try:
+            alert_received: AlertModel = codec.decode(data)
+            payload_id = getattr(alert_received, "message_id", None)
+            if message_id is not None and payload_id is not None and payload_id != message_id:
+                logger.warning("Dropping alert %s received with the header id %s.", payload_id, message_id)
+                _dropped_invalid.inc()
+                return None
+            alert_received.target_ip = node_identity.get_primary_ip()
+            alert_received.processing_timestamp = datetime.now(UTC)
+            if stamps is not None:
+                alert_received.trace = {**(alert_received.trace or {}), **stamps}
+                alert_trace.stamp(alert_received, alert_trace.VALIDATE)
+            logger.debug("Received alert %s", payload_id)
+            return alert_received
+        except Exception as e:
+            logger.error("Error in ZMQSubscriber: %s", e)
+            _dropped_invalid.inc()
+            return None
 
-    def stop(self):
+    def wakeup(self):
+        """Interrupt the poller wait of the receive loop."""
+        try:
+            self._wakeup_sender.send(b"", flags=zmq.NOBLOCK)
+        except zmq.ZMQError as e:
+            logger.debug(f"Failed to wake up ZMQSubscriber: {e}")
+
+    def stop(self, timeout: float = 2.0):
         """
-        Stop the subscriber thread and close the socket.
+        Stop the subscriber thread and close the sockets.
+        The receive loop is woken up through the wake-up channel so that it exits immediately,
+        and the sockets are only closed once the thread is done with them: when the loop is still
+        running after the timeout, or stop() is called from the loop itself, the loop closes them on exit.
+        Args:
+            timeout (float): Maximum number of seconds to wait for the receive loop to exit.
         """
         self._running.clear()
+        self.wakeup()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=timeout)
+        with self._close_lock:
+            deferred = self._close_on_exit = self.is_alive() and not self._exited
+        if deferred:
+            if threading.current_thread() is not self:
+                logger.warning("ZMQSubscriber receive loop still running after %ss, it will close the sockets on exit.", timeout)
+            return
+        self._close_sockets()
+        logger.info("ZMQSubscriber stopped.")
+
+    def _close_sockets(self):
+        """Close the subscriber and wake-up sockets."""
         self.subscriber_socket.close()
-        logger.info("ZMQSubscriber stopped.")
\ No newline at end of file
+        self._wakeup_sender.close()
+        self._wakeup_receiver.close()
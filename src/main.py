@@ -1,4 +1,5 @@
 import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 import uvicorn
@@ -7,13 +8,28 @@ from src.config.settings import settings
 from src.ids2zmq.manager import ZMQManager
 from src.ids2zmq.publisher import ZMQPublisher
 from src.ids2zmq.subscriber import ZMQSubscriber
+from src.ids2zmq.router import ZMQRouter
+from src.ids2zmq.async_publisher import AsyncZMQPublisher
+from src.ids2zmq.async_subscriber import AsyncZMQSubscriber
+from src.ids2zmq.async_router import AsyncZMQRouter
+from src.ids2zmq.payload_crypto import CIPHER_IDS, payload_crypto
 from src.utils.graceful_shutdown_manager import GracefulShutdownManager
 from src.services.publish_msg_service import PublishMsgService
 from src.services.subscribe_msg_service import SubscribeMsgService
+from src.services.ban_executor import BanExecutor
 from src.api.routes import get_routes
 from src.api.middleware import ExceptionHandlingMiddleware
 from src.api.handler import register_exception_handlers
 from src.utils.logger import setup_logging
+from src.shared.metrics import metrics
+from src.fail2ban.jail_registry import jail_registry
+from src.utils.node_identity import node_identity
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.batcher import Fail2banBatcher
+from src.fail2ban.ban_state import ban_state
+from src.fail2ban.ban_expiry import ban_expiry
+from src.shared.ban_journal import ban_journal
+from src.shared.allowlist import allowlist
 
 logger = logging.getLogger(__name__)
 
@@ -22,33 +38,108 @@ class Main:
     Main class to initialize the FastAPI application and ZMQ components.
     This class is responsible for setting up the ZMQ publisher and subscriber,
     handling graceful shutdown, and registering API routes.
+    When ENABLE_ASYNC_RUNTIME is set, the publisher, subscriber and router are zmq.asyncio sockets
+    running as tasks on uvicorn's event loop, started and stopped by the FastAPI lifespan.
     """
 
     def __init__(self):
-        self.app = FastAPI()
+        self.async_runtime = settings.ENABLE_ASYNC_RUNTIME
+        self.app = FastAPI(lifespan=self._lifespan) if self.async_runtime else FastAPI()
         self.shutdown_manager = GracefulShutdownManager()
 
-        setup_logging(log_level="INFO", log_file=settings.LOG_FILE)
+        # The queued records are written out at exit, after the shutdown handlers
+        setup_logging(log_level=settings.LOG_LEVEL, log_file=settings.LOG_FILE)
+
+        # Restore the applied actions before receiving any alert, so that the ones already applied are not applied again
+        if settings.BAN_JOURNAL_ENABLED:
+            ban_journal.open()
+            # Skip the actions already applied from the first alert, before the jails are loaded from fail2ban
+            if settings.FAIL2BAN_BAN_STATE_ENABLED:
+                for jail in ban_journal.jails():
+                    ban_state.seed(jail, ban_journal.banned(jail))
 
         # Initialize ZMQ Publisher and Subscriber
-        self.publisher = ZMQPublisher()
-        self.subscriber_service = SubscribeMsgService()
-        self.subscriber = ZMQSubscriber(on_message_callback=self.subscriber_service.process_received_message)
+        self.batcher = Fail2banBatcher() if settings.FAIL2BAN_BATCH_ENABLED else None
+        self.subscriber_service = SubscribeMsgService(batcher=self.batcher)
+        # Keep the subscriber receiving at line rate while the bans are paced by the executor
+        self.ban_executor = BanExecutor(
+            handler=self.subscriber_service.process_alert,
+            key_func=SubscribeMsgService.extract_jail,
+        ) if settings.BAN_EXECUTOR_ENABLED else None
+        if self.ban_executor:
+            metrics.callback("ids2zmq_ban_executor_queue_depth", "Alerts waiting in the ban executor queue.",
+                             function=lambda: self.ban_executor.stats()["depth"])
+        # The subscriber hands the validated alerts over as they are, without serializing them again
+        on_alert_callback = self.ban_executor.submit if self.ban_executor else self.subscriber_service.process_alert
+        if self.async_runtime:
+            self.publisher = AsyncZMQPublisher()
+            self.subscriber = AsyncZMQSubscriber(on_alert_callback=on_alert_callback)
+            self.router = AsyncZMQRouter() if settings.ENABLE_ZMQ_ROUTER else None
+        else:
+            self.publisher = ZMQPublisher()
+            self.subscriber = ZMQSubscriber(on_alert_callback=on_alert_callback)
+            self.router = ZMQRouter() if settings.ENABLE_ZMQ_ROUTER else None
 
         # Initialize ZMQ context and security if enabled
+        self.payload_keys = None
         if ZMQManager.zmq_security_enabled:
-            ZMQManager.generate_symmetrical_key(filename=settings.ZMQ_SYMMETRICAL_KEY_FILE)
+            # CURVE encrypts the transport itself, the payload keys are only used with PLAIN
+            plain = ZMQManager.security_mechanism != "curve"
+            if plain and ZMQManager.payload_cipher in CIPHER_IDS:
+                # Keys are shared by the nodes, only bootstrap one when the directory is empty
+                self.payload_keys = payload_crypto
+                self.payload_keys.reload()
+                if not self.payload_keys.key_ids():
+                    self.payload_keys.generate_key()
+            elif plain:
+                ZMQManager.generate_symmetrical_key(filename=settings.ZMQ_SYMMETRICAL_KEY_FILE)
             self.publisher.configure_security()
             self.subscriber.configure_security()
 
+        # Enumerate the local addresses before skipping our own publisher among the trusted hosts
+        node_identity.refresh()
         self.publisher.bind()
         self.subscriber.connect_to_publishers()
 
-        # Register shutdown handlers
-        self.shutdown_manager.register(self.publisher.close)
-        self.shutdown_manager.register(self.subscriber.stop)
-        self.shutdown_manager.register(ZMQManager.stop_authenticator)
-        self.shutdown_manager.register(ZMQManager.terminate_context)
+        # Keep the active jails cached for the AlertModel validation, and the local addresses for the received alerts
+        jail_registry.start()
+        node_identity.start()
+        allowlist.start()
+        if settings.FAIL2BAN_BAN_STATE_ENABLED:
+            ban_state.start()
+        # Restore the ban expiries, lifting at once the bans expired while stopped
+        ban_expiry.start()
+        if self.payload_keys:
+            self.payload_keys.start()
+        if self.batcher:
+            self.batcher.start()
+        if self.ban_executor:
+            self.ban_executor.start()
+
+        # Register shutdown handlers, the lifespan takes care of them in asyncio mode
+        if not self.async_runtime:
+            self.shutdown_manager.register(jail_registry.stop)
+            self.shutdown_manager.register(node_identity.stop)
+            self.shutdown_manager.register(allowlist.stop)
+            if settings.FAIL2BAN_BAN_STATE_ENABLED:
+                self.shutdown_manager.register(ban_state.stop)
+            if self.payload_keys:
+                self.shutdown_manager.register(self.payload_keys.stop)
+            self.shutdown_manager.register(self.publisher.close)
+            self.shutdown_manager.register(self.subscriber.stop)
+            if self.ban_executor:
+                self.shutdown_manager.register(self.ban_executor.stop)
+            if self.batcher:
+                self.shutdown_manager.register(self.batcher.stop)
+            # Saved once the executor and the batcher finished the alerts scheduling expiries
+            self.shutdown_manager.register(ban_expiry.stop)
+            if settings.BAN_JOURNAL_ENABLED:
+                self.shutdown_manager.register(ban_journal.close)
+            self.shutdown_manager.register(Fail2banClient.close)
+            if self.router:
+                self.shutdown_manager.register(self.router.stop)
+            self.shutdown_manager.register(ZMQManager.stop_authenticator)
+            self.shutdown_manager.register(ZMQManager.terminate_context)
         logger.info("ZMQ components initialized and shutdown handlers registered.")
 
         # Add routes to the FastAPI app
@@ -60,19 +151,81 @@ class Main:
         register_exception_handlers(app=self.app)
         logger.info("Exception handlers registered.")
 
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """
+        Start the asyncio ZMQ tasks on uvicorn's event loop and stop them on shutdown.
+        Args:
+            app (FastAPI): The FastAPI application.
+        """
+        self.subscriber.start()
+        if self.router:
+            self.router.run_as_task()
+        logger.info("Asyncio ZMQ tasks started.")
+        try:
+            yield
+        finally:
+            await self.subscriber.aclose()
+            if self.router:
+                await self.router.aclose()
+            await self.publisher.aclose()
+            jail_registry.stop()
+            node_identity.stop()
+            allowlist.stop()
+            if settings.FAIL2BAN_BAN_STATE_ENABLED:
+                ban_state.stop()
+            if self.payload_keys:
+                self.payload_keys.stop()
+            if self.ban_executor:
+                self.ban_executor.stop()
+            if self.batcher:
+                self.batcher.stop()
+            # Saved once the executor and the batcher finished the alerts scheduling expiries
+            ban_expiry.stop()
+            if settings.BAN_JOURNAL_ENABLED:
+                ban_journal.close()
+            Fail2banClient.close()
+            ZMQManager.stop_authenticator()
+            ZMQManager.terminate_context()
+            logger.info("Asyncio ZMQ tasks stopped.")
+
+    @staticmethod
+    def _uvicorn_options() -> dict:
+        """
+        Return the uvicorn options, with the event loop and HTTP parser selected by API_LOOP and API_HTTP.
+        Returns:
+            dict: Keyword arguments for uvicorn.run.
+        """
+        return {
+            "host": settings.API_HOST,
+            "port": settings.API_PORT,
+            "log_level": settings.LOG_LEVEL.lower(),
+            "loop": settings.API_LOOP,
+            "http": settings.API_HTTP,
+        }
+
     def run(self):
         """
         Run the FastAPI application with the configured ZMQ components.
         This method is typically called when starting the application.
         """
+        if self.async_runtime:
+            # uvicorn handles the signals and runs the lifespan shutdown itself
+            try:
+                uvicorn.run(self.app, **self._uvicorn_options())
+            except Exception as e:
+                logger.error(f"Error running FastAPI app: {e}")
+            return
         try:
             self.shutdown_manager.hook_signals()
             self.subscriber.start()
+            if self.router:
+                self.router.run_in_thread()
         except Exception as e:
             logger.error(f"Error starting subscriber: {e}")
             self.shutdown_manager.shutdown()
         try:
-            uvicorn.run(self.app, host=settings.API_HOST, port=settings.API_PORT, log_level=settings.LOG_LEVEL.lower())
+            uvicorn.run(self.app, **self._uvicorn_options())
             logger.info(f"FastAPI app running at {settings.API_HOST}:{settings.API_PORT}")
         except Exception as e:
             logger.error(f"Error running FastAPI app: {e}")
@@ -1,7 +1,7 @@
-from pydantic import BaseModel, IPvAnyAddress, field_validator
+from pydantic import BaseModel, Field, IPvAnyAddress, field_validator
 from typing import Optional
 from datetime import datetime, UTC
-from src.fail2ban.jail import get_active_jails
+from src.fail2ban.jail_registry import jail_registry
 from src.fail2ban.action import Fail2banAction
 
 class AlertModel(BaseModel):
@@ -21,6 +21,9 @@ class AlertModel(BaseModel):
         reason (str): The reason for the ban.
         timestamp (datetime): The timestamp of the alert, defaults to current time in UTC.
         processing_timestamp (Optional[datetime]): The timestamp when the alert was processed, defaults to current time in UTC.
+        message_id (Optional[str]): Unique id of the alert, stamped when it is first published.
+        origin (Optional[str]): Id of the node the alert was first published by.
+        trace (Optional[dict[str, int]]): Time of each stage the alert went through, in nanoseconds since the epoch, when ALERT_TRACE_ENABLED.
     """
     hostname: Optional[str] = "N/A"
     source_ip: Optional[IPvAnyAddress] = None
@@ -33,12 +36,15 @@ class AlertModel(BaseModel):
     action: Fail2banAction = "banip"
     ip: Optional[IPvAnyAddress] = None
     reason: str = "N/A"
-    timestamp: datetime = datetime.now(UTC)
-    processing_timestamp: Optional[datetime] = datetime.now(UTC)
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    processing_timestamp: Optional[datetime] = Field(default_factory=lambda: datetime.now(UTC))
+    message_id: Optional[str] = Field(default=None, pattern=r"^[0-9a-f]{16}$")
+    origin: Optional[str] = Field(default=None, pattern=r"^[0-9a-f]{16}$")
+    trace: Optional[dict[str, int]] = None
 
     @field_validator("jail")
     def validate_jail(cls, v):
-        if v not in get_active_jails():
+        if not jail_registry.is_active(v):
             raise ValueError(f"Jail is not authorized : {v}")
         return v
 
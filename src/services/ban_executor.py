@@ -0,0 +1,254 @@
+import threading
+import time
+import logging
+from collections import deque
+from enum import Enum
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+executor = BanExecutor(handler=subscribe_msg_service.process_alert,
+                       key_func=SubscribeMsgService.extract_jail)
+executor.start()
+subscriber = ZMQSubscriber(on_alert_callback=executor.submit)
+...
+executor.stop()
+"""
+
+class OverflowPolicy(str, Enum):
+    BLOCK = "block"
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+
+
+class BanExecutor:
+    """
+    Bounded executor running the ban handler outside the receiving thread.
+    Items are queued by submit() in a queue per jail and handled by a pool of worker threads, with at
+    most `per_jail_limit` items of the same jail handled at the same time. The workers take the next
+    item of the jails below their limit in turn, so a flood in one jail never holds a worker while
+    the items of the other jails wait: a worker never waits on a jail. When the queue is full the
+    overflow policy applies: BLOCK makes submit() wait up to `block_timeout` seconds (backpressure
+    towards the ZMQ socket), DROP_NEWEST rejects the submitted item and DROP_OLDEST evicts the
+    oldest queued one.
+    Args:
+        handler (callable): Function handling one item, e.g. SubscribeMsgService.process_alert.
+        key_func (callable): Function returning the jail of an item, used for the per jail limit.
+        workers (int): Number of worker threads.
+        queue_size (int): Maximum number of queued items.
+        per_jail_limit (int): Maximum number of items of the same jail handled concurrently.
+        overflow_policy (OverflowPolicy): What to do when the queue is full.
+        block_timeout (float): Maximum seconds submit() waits for room with the BLOCK policy.
+    Attributes:
+        _queues (dict[str, deque]): The queued items of each jail, with their sequence number.
+        _ready (deque): The jails with queued items and below their limit, in the order they are served.
+        _jail_in_flight (dict[str, int]): The number of items of each jail being handled.
+        _not_empty (threading.Condition): Condition signalled when an item can be handled.
+        _not_full (threading.Condition): Condition signalled when an item is dequeued.
+        _counters (dict[str, int]): Counters of submitted, processed, failed and dropped items.
+    Methods:
+        submit(item): Queue an item, applying the overflow policy when the queue is full.
+        start(): Start the worker threads.
+        stop(drain): Stop the worker threads, after handling the queued items if drain is set.
+        stats(): Return the queue depth and the counters.
+    """
+
+    def __init__(self, handler: callable, key_func: callable = None, workers: int = None, queue_size: int = None,
+                 per_jail_limit: int = None, overflow_policy: OverflowPolicy | str = None, block_timeout: float = None):
+        self._handler = handler
+        self._key_func = key_func
+        self._workers_count = settings.BAN_EXECUTOR_WORKERS if workers is None else workers
+        self._queue_size = settings.BAN_EXECUTOR_QUEUE_SIZE if queue_size is None else queue_size
+        self._per_jail_limit = settings.BAN_EXECUTOR_PER_JAIL_LIMIT if per_jail_limit is None else per_jail_limit
+        self._overflow_policy = OverflowPolicy(settings.BAN_EXECUTOR_OVERFLOW_POLICY if overflow_policy is None else overflow_policy)
+        self._block_timeout = settings.BAN_EXECUTOR_BLOCK_TIMEOUT if block_timeout is None else block_timeout
+        self._queues: dict[str, deque] = {}
+        self._ready: deque = deque()
+        self._ready_jails: set[str] = set()
+        self._jail_in_flight: dict[str, int] = {}
+        self._depth = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._workers: list[threading.Thread] = []
+        self._running = False
+        self._in_flight = 0
+        self._max_depth = 0
+        self._counters = {"submitted": 0, "processed": 0, "failed": 0, "dropped": 0}
+
+    def submit(self, item) -> bool:
+        """
+        Queue an item, applying the overflow policy when the queue is full.
+        Args:
+            item: The item to hand over to the handler.
+        Returns:
+            bool: True if the item was queued, False if it was dropped.
+        """
+        jail = self._jail_of(item)
+        with self._lock:
+            if not self._running:
+                logger.warning("Ban executor not running, dropping item.")
+                self._counters["dropped"] += 1
+                return False
+            if self._depth >= self._queue_size:
+                if self._overflow_policy is OverflowPolicy.BLOCK:
+                    deadline = time.monotonic() + self._block_timeout
+                    while self._depth >= self._queue_size and self._running:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._not_full.wait(timeout=remaining):
+                            break
+                if self._depth >= self._queue_size:
+                    if self._overflow_policy is OverflowPolicy.DROP_OLDEST:
+                        self._drop_oldest()
+                    else:
+                        self._counters["dropped"] += 1
+                        logger.warning("Ban executor queue full (%d), dropping item (%s).", self._queue_size, self._overflow_policy.value)
+                        return False
+                    self._counters["dropped"] += 1
+                    logger.warning("Ban executor queue full (%d), dropped the oldest item.", self._queue_size)
+            queue = self._queues.get(jail)
+            if queue is None:
+                queue = self._queues[jail] = deque()
+            queue.append((self._sequence, item))
+            self._sequence += 1
+            self._depth += 1
+            self._counters["submitted"] += 1
+            self._max_depth = max(self._max_depth, self._depth)
+            self._mark_ready(jail)
+            return True
+
+    def start(self):
+        """Start the worker threads."""
+        with self._lock:
+            if self._running:
+                logger.warning("Ban executor already running.")
+                return
+            self._running = True
+        self._workers = [
+            threading.Thread(target=self._work, name=f"ban-executor-{i}", daemon=True)
+            for i in range(self._workers_count)
+        ]
+        for worker in self._workers:
+            worker.start()
+        logger.info(f"Ban executor started with {self._workers_count} workers, queue size {self._queue_size}, "
+                    f"{self._per_jail_limit} concurrent items per jail, overflow policy {self._overflow_policy.value}.")
+
+    def stop(self, drain: bool = True, timeout: float = 10.0):
+        """
+        Stop the worker threads.
+        Args:
+            drain (bool): Handle the queued items before stopping, drop them otherwise.
+            timeout (float): Maximum seconds to wait for the workers.
+        """
+        with self._lock:
+            self._running = False
+            if not drain:
+                self._counters["dropped"] += self._depth
+                self._queues.clear()
+                self._ready.clear()
+                self._ready_jails.clear()
+                self._depth = 0
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._workers = []
+        logger.info(f"Ban executor stopped: {self.stats()}")
+
+    def stats(self) -> dict:
+        """
+        Return the queue depth and the counters.
+        Returns:
+            dict: depth, max_depth, capacity, in_flight, submitted, processed, failed and dropped.
+        """
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "max_depth": self._max_depth,
+                "capacity": self._queue_size,
+                "in_flight": self._in_flight,
+                **self._counters,
+            }
+
+    def _jail_of(self, item) -> str | None:
+        """Return the jail of an item, None without key function, the items of no jail having no limit."""
+        if self._key_func is None:
+            return None
+        try:
+            return self._key_func(item)
+        except Exception as e:
+            logger.debug(f"Unable to extract the jail of a ban executor item: {e}")
+            return None
+
+    def _below_limit(self, jail: str | None) -> bool:
+        return jail is None or self._jail_in_flight.get(jail, 0) < self._per_jail_limit
+
+    def _mark_ready(self, jail: str | None):
+        """Queue a jail to be served if it has items and is below its limit. Called with the lock held."""
+        if jail not in self._ready_jails and self._queues.get(jail) and self._below_limit(jail):
+            self._ready.append(jail)
+            self._ready_jails.add(jail)
+            self._not_empty.notify()
+
+    def _drop_oldest(self):
+        """Evict the oldest queued item, whatever its jail. Called with the lock held."""
+        jail = min(self._queues, key=lambda key: self._queues[key][0][0])
+        queue = self._queues[jail]
+        queue.popleft()
+        self._depth -= 1
+        if not queue:
+            del self._queues[jail]
+            if jail in self._ready_jails:
+                self._ready.remove(jail)
+                self._ready_jails.discard(jail)
+
+    def _next_item(self) -> tuple[str | None, object] | None:
+        """Wait for an item of a jail below its limit, returns None once stopped and drained."""
+        with self._lock:
+            while not self._ready:
+                if not self._running and not self._depth:
+                    return None
+                self._not_empty.wait()
+            jail = self._ready.popleft()
+            self._ready_jails.discard(jail)
+            queue = self._queues[jail]
+            _, item = queue.popleft()
+            if not queue:
+                del self._queues[jail]
+            self._depth -= 1
+            self._in_flight += 1
+            if jail is not None:
+                self._jail_in_flight[jail] = self._jail_in_flight.get(jail, 0) + 1
+            # Served in turn with the other jails, behind them
+            self._mark_ready(jail)
+            self._not_full.notify()
+            return jail, item
+
+    def _work(self):
+        while (next_item := self._next_item()) is not None:
+            jail, item = next_item
+            try:
+                success = self._handler(item)
+            except Exception as e:
+                logger.error("Error in ban executor handler: %s", e)
+                success = False
+            with self._lock:
+                self._in_flight -= 1
+                self._counters["processed"] += 1
+                if success is False:
+                    self._counters["failed"] += 1
+                if jail is not None:
+                    count = self._jail_in_flight[jail] - 1
+                    if count:
+                        self._jail_in_flight[jail] = count
+                    else:
+                        del self._jail_in_flight[jail]
+                    self._mark_ready(jail)
+                if not self._running and not self._depth:
+                    # Wake up the workers waiting on the items of a jail at its limit, none is left
+                    self._not_empty.notify_all()
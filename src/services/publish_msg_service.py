@@ -1,9 +1,18 @@
+import inspect
+import time
 from datetime import datetime, UTC
 
 from pydantic import IPvAnyAddress
 
 from src.models.alert_model import AlertModel
 from src.ids2zmq.publisher import ZMQPublisher
+from src.shared import alert_trace
+from src.shared.message_id import get_node_id, new_message_id
+from src.shared.metrics import metrics
+
+_published = metrics.counter("ids2zmq_service_published_alerts_total", "Alerts handed to the publisher by the publish service.")
+_publish_failures = metrics.counter("ids2zmq_service_publish_failures_total", "Alerts the publisher failed to publish.")
+_publish_seconds = metrics.histogram("ids2zmq_service_publish_seconds", "Time to prepare and hand an alert to the publisher.")
 
 class PublishMsgService:
     """
@@ -14,12 +23,78 @@ class PublishMsgService:
         publisher (ZMQPublisher): The ZMQPublisher instance used to publish messages.
     Methods:
         publish_alert(alert: AlertModel): Publishes an alert message with a timestamp.
+        publish_alert_async(alert: AlertModel): Publishes an alert message, awaiting asyncio publishers.
+        publish_alerts(alerts: list[AlertModel]): Publishes several alerts in one call.
+        publish_alerts_async(alerts: list[AlertModel]): Publishes several alerts in one call, awaiting asyncio publishers.
     """
     def __init__(self, publisher: ZMQPublisher):
         self.publisher = publisher
 
     def publish_alert(self, alert: AlertModel):
+        started = time.perf_counter()
+        try:
+            self.publisher.publish_alert(alert=self._prepare_alert(alert))
+        except Exception:
+            _publish_failures.inc()
+            raise
+        _published.inc()
+        _publish_seconds.observe(time.perf_counter() - started)
+
+    async def publish_alert_async(self, alert: AlertModel):
+        """
+        Publish an alert from the event loop, awaiting the publisher when it is an AsyncZMQPublisher.
+        Args:
+            alert (AlertModel): The alert to publish.
+        """
+        started = time.perf_counter()
+        try:
+            result = self.publisher.publish_alert(alert=self._prepare_alert(alert))
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            _publish_failures.inc()
+            raise
+        _published.inc()
+        _publish_seconds.observe(time.perf_counter() - started)
+
+    def publish_alerts(self, alerts: list[AlertModel]):
+        """
+        Publish several alerts in one call, handed to the publisher at once so that they leave in envelopes.
+        Args:
+            alerts (list[AlertModel]): The alerts to publish.
+        """
+        started = time.perf_counter()
+        try:
+            self.publisher.publish_alerts(alerts=[self._prepare_alert(alert) for alert in alerts])
+        except Exception:
+            _publish_failures.inc(len(alerts))
+            raise
+        _published.inc(len(alerts))
+        _publish_seconds.observe(time.perf_counter() - started)
+
+    async def publish_alerts_async(self, alerts: list[AlertModel]):
+        """
+        Publish several alerts in one call from the event loop, awaiting the publisher when it is an AsyncZMQPublisher.
+        Args:
+            alerts (list[AlertModel]): The alerts to publish.
+        """
+        started = time.perf_counter()
+        try:
+            result = self.publisher.publish_alerts(alerts=[self._prepare_alert(alert) for alert in alerts])
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            _publish_failures.inc(len(alerts))
+            raise
+        _published.inc(len(alerts))
+        _publish_seconds.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _prepare_alert(alert: AlertModel) -> AlertModel:
+        # A relayed alert keeps its ids so that the peers recognize it
+        alert.message_id = alert.message_id or new_message_id()
+        alert.origin = alert.origin or get_node_id()
         alert.processing_timestamp = datetime.now(UTC)
         alert.target_ip = IPvAnyAddress("0.0.0.0") if alert.target_ip is None else alert.target_ip
-        payload = alert.to_json()
-        self.publisher.publish_alert(alert=payload)
+        alert_trace.stamp(alert, alert_trace.PUBLISH)
+        return alert
@@ -1,58 +1,237 @@
 import json
 import logging
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime, UTC
 from src.models.alert_model import AlertModel
+from src.fail2ban.action import Fail2banAction
 from src.fail2ban.fail2ban_client import Fail2banClient
-from src.shared.custom_cache import register_alert
+from src.fail2ban.batcher import Fail2banBatcher
+from src.fail2ban.ban_expiry import ban_expiry, record_unban
+from src.fail2ban.ban_state import ban_state
+from src.fail2ban.prefix_aggregator import Aggregation, prefix_aggregator
+from src.shared import alert_trace
+from src.shared.alert_trace import latency_tracker
+from src.shared.allowlist import allowlist
+from src.shared.ban_journal import ban_journal
+from src.shared.custom_cache import check_and_register, discard_alert
+from src.shared.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+_processed = metrics.counter("ids2zmq_received_alerts_processed_total", "Received alerts processed, by result.", labels=("result",))
+_applied, _duplicate, _unchanged, _allowlisted, _failed = (
+    _processed.labels(result) for result in ("applied", "duplicate", "unchanged", "allowlisted", "failed"))
+_process_seconds = metrics.histogram("ids2zmq_received_alert_seconds", "Time to dedup and apply a received alert, fail2ban included.")
+
 class SubscribeMsgService:
     """
     SubscribeMsgService listens for messages from the ZMQ subscriber and processes them.
+    Args:
+        batcher (Fail2banBatcher): Optional batching stage, actions are executed directly by the client when None.
     Attributes:
         _fail2ban_client (Fail2banClient): An instance of Fail2banClient to handle ban actions.
+        _batcher (Fail2banBatcher): The batching stage the actions are submitted to, if any.
     Methods:
         process_received_message(message: str) -> bool | None:
-            Processes the received message and performs the ban action if applicable.
+            Parses the received JSON message and performs the ban action if applicable.
+        process_alert(alert: AlertModel) -> bool:
+            Performs the ban action of an already validated alert.
+        extract_jail(message: AlertModel | str) -> str | None:
+            Returns the jail of a received message, used to limit the concurrency per jail.
     """
 
-    def __init__(self):
+    def __init__(self, batcher: Fail2banBatcher = None):
         self._fail2ban_client: Fail2banClient = Fail2banClient()
+        self._batcher = batcher
 
     def process_received_message(self, message: str) -> bool | None:
         """
         Processes the received message from the ZMQ subscriber.
+        Adapter of process_alert() for the callers handing over the JSON string of the alert.
         Args:
             message (str): The message received from the ZMQ subscriber.
         Returns:
             bool | None: True if the ban action was successful, False if it failed, None if the message was invalid.
         """
         try:
-            alert_data = json.loads(message)
-            alert = AlertModel(**alert_data)
+            alert = AlertModel(**json.loads(message))
+        except Exception as e:
+            logger.error("Failed to parse or process alert message: %s", e)
+            return False
+        return self.process_alert(alert)
+
+    def process_alert(self, alert: AlertModel) -> bool:
+        """
+        Apply an alert already decoded and validated by the subscriber, without parsing it again.
+        With the batching stage, the action is queued without waiting for its batch, so that the batch
+        gathers every alert received within its window; the bookkeeping is finished once it is executed.
+        Args:
+            alert (AlertModel): The received alert.
+        Returns:
+            bool: True if the ban action was successful or queued, or the alert a duplicate or refused as allowlisted,
+                False if it failed.
+        """
+        started = time.perf_counter()
+        deferred = False
+        try:
             alert.processing_timestamp = datetime.now(UTC)
 
-            logger.info(f"Received alert: {alert}")
+            logger.debug("Received alert: %s", alert)
 
-            # Register the alert in the custom cache
-            register_alert(ip=alert.ip, action=alert.action, jail=alert.jail)
-            logger.info(f"Alert registered in cache: {alert.ip}, {alert.action}, {alert.jail}")
+            # Peers, this node and the protected networks are never banned, whoever asks for it
+            if alert.action == Fail2banAction.BAN and allowlist.is_allowed(alert.ip, path="receive"):
+                logger.warning("Refusing to ban allowlisted address %s in jail %s, sent by %s", alert.ip, alert.jail, alert.origin)
+                _allowlisted.inc()
+                return True
 
-            # Perform the ban action using Fail2banClient
-            success = self._fail2ban_client.execute_action(
-                action=alert.action,
-                jail=alert.jail,
-                ip=str(alert.ip)
-            )
+            # Register the alert in the dedup engine, the same alert relayed by several peers is applied once
+            if check_and_register(ip=alert.ip, action=alert.action, jail=alert.jail):
+                logger.debug("Duplicate alert skipped: %s, %s, %s", alert.ip, alert.action, alert.jail)
+                _duplicate.inc()
+                return True
+            logger.debug("Alert registered in cache: %s, %s, %s", alert.ip, alert.action, alert.jail)
 
-            if success:
-                logger.info(f"{alert.action} successful for IP: {alert.ip}")
-                return success
-            else:
-                logger.warning(f"Failed to {alert.action} IP: {alert.ip}")
-                return success
+            # Many hosts of one prefix are banned as the prefix, and the hosts within a banned prefix skipped
+            aggregation = prefix_aggregator.aggregate(action=alert.action, jail=alert.jail, ip=alert.ip)
+            if aggregation.covered:
+                logger.debug("Alert covered by the ban of %s: %s, %s, %s", aggregation.target, alert.ip, alert.action, alert.jail)
+                _unchanged.inc()
+                return True
+
+            # Reported by several peers, the attacker is often banned already: no command to send,
+            # unless the opposite action is still queued, the index only knowing of the executed ones
+            if (not aggregation.escalated and not self._undoes_pending(alert, aggregation)
+                    and ban_state.matches(action=alert.action, jail=alert.jail, ip=alert.ip)):
+                logger.debug("Ban state already matches alert: %s, %s, %s", alert.ip, alert.action, alert.jail)
+                _unchanged.inc()
+                return True
+
+            # Through the batching stage if enabled, finished by a callback once the batch is executed
+            if self._batcher is not None:
+                future = self._batcher.submit(action=alert.action, jail=alert.jail, ip=aggregation.target)
+                deferred = True
+                future.add_done_callback(lambda done: self._complete_deferred(alert, aggregation, done, started))
+                return True
+
+            try:
+                success = self._fail2ban_client.execute_action(action=alert.action, jail=alert.jail, ip=aggregation.target)
+            except Exception as e:
+                logger.error("Error executing %s for IP %s: %s", alert.action, aggregation.target, e)
+                success = False
+            return self._complete(alert, aggregation, success)
 
         except Exception as e:
-            logger.error(f"Failed to parse or process alert message: {e}")
+            logger.error("Failed to process alert: %s", e)
+            _failed.inc()
+            return False
+        finally:
+            if not deferred:
+                _process_seconds.observe(time.perf_counter() - started)
+
+    def _undoes_pending(self, alert: AlertModel, aggregation: Aggregation) -> bool:
+        """Whether the opposite action of an alert is queued in the batching stage, not executed yet."""
+        if self._batcher is None or aggregation.target is None:
+            return False
+        pending = self._batcher.pending(jail=alert.jail, ip=aggregation.target)
+        return pending is not None and pending != Fail2banAction(alert.action).value
+
+    def _complete(self, alert: AlertModel, aggregation: Aggregation, success: bool) -> bool:
+        """
+        Record the outcome of an action sent to fail2ban, or undo the aggregation and the dedup entry if it failed.
+        Args:
+            alert (AlertModel): The received alert.
+            aggregation (Aggregation): The aggregation of the alert.
+            success (bool): Whether fail2ban applied the action.
+        Returns:
+            bool: success.
+        """
+        if not success:
+            logger.warning("Failed to %s IP: %s", alert.action, aggregation.target)
+            # Let the next copy of the alert retry the action
+            prefix_aggregator.rollback(aggregation)
+            discard_alert(ip=alert.ip, action=alert.action, jail=alert.jail)
+            _failed.inc()
             return False
+
+        logger.info("%s successful for IP: %s", alert.action, aggregation.target)
+        if aggregation.retired:
+            self._retire(jail=alert.jail, targets=aggregation.retired)
+        if alert.action == Fail2banAction.UNBAN and aggregation.target and "/" in aggregation.target:
+            # An IPv6 host is banned as its network, whose unban lifts every host recorded within it
+            record_unban(jail=alert.jail, target=aggregation.target)
+        elif not aggregation.escalated:
+            # Recorded by host address, the network of an IPv6 host being cleared by record_unban once lifted
+            ban_state.apply(action=alert.action, jail=alert.jail, ip=alert.ip)
+            # Remember the applied action across restarts
+            ban_journal.record(action=alert.action, jail=alert.jail, ip=alert.ip)
+        # The ban lasts as long as the policy says, whatever the bantime of the local jail
+        if alert.action == Fail2banAction.BAN:
+            ban_expiry.schedule(jail=alert.jail, target=aggregation.target, severity=alert.severity)
+        elif alert.action == Fail2banAction.UNBAN:
+            ban_expiry.cancel(jail=alert.jail, target=aggregation.target)
+        alert_trace.stamp(alert, alert_trace.BAN)
+        latency_tracker.record(alert)
+        _applied.inc()
+        return True
+
+    def _complete_deferred(self, alert: AlertModel, aggregation: Aggregation, future: Future, started: float):
+        """Finish an alert queued to the batching stage, called once its batch is executed."""
+        try:
+            self._complete(alert, aggregation, future.result())
+        except Exception as e:
+            logger.error("Failed to process alert: %s", e)
+            _failed.inc()
+        finally:
+            _process_seconds.observe(time.perf_counter() - started)
+
+    def _retire(self, jail: str, targets: list[str]):
+        """
+        Unban the bans covered by a prefix ban just applied, with a single command.
+        With the batching stage, the unbans are queued and recorded once all of them are executed.
+        Args:
+            jail (str): The jail.
+            targets (list[str]): The IP addresses and networks within the prefix.
+        """
+        if self._batcher is None:
+            success = self._fail2ban_client.execute_batch(action=Fail2banAction.UNBAN, jail=jail, ips=targets)
+            self._retired(jail=jail, targets=targets, success=success)
+            return
+        futures = [self._batcher.submit(action=Fail2banAction.UNBAN, jail=jail, ip=target) for target in targets]
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_: Future):
+            with lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            self._retired(jail=jail, targets=targets, success=all(future.result() for future in futures))
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    @staticmethod
+    def _retired(jail: str, targets: list[str], success: bool):
+        """Record the bans retired by a prefix ban, once unbanned."""
+        if not success:
+            # Still covered by the prefix ban, the rules are left until they expire
+            logger.warning("Failed to retire %d bans of jail %s covered by a prefix ban", len(targets), jail)
+            return
+        for target in targets:
+            ban_expiry.cancel(jail=jail, target=target)
+            record_unban(jail=jail, target=target)
+
+    @staticmethod
+    def extract_jail(message: AlertModel | str) -> str | None:
+        """
+        Return the jail of a received alert, or of a received message without validating it.
+        Args:
+            message (AlertModel | str): The alert, or the message received from the ZMQ subscriber.
+        Returns:
+            str | None: The jail of the alert, None if the message has none.
+        """
+        if isinstance(message, AlertModel):
+            return message.jail
+        return json.loads(message).get("jail")
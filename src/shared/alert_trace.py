@@ -0,0 +1,163 @@
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, UTC
+
+from src.config.settings import settings
+from src.shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Time of each stage an alert goes through, from its receipt by the API of the detecting node to the
+ban on the remote nodes. The stamps travel with the alert in its trace field, the remote nodes add
+theirs, and the node applying the ban aggregates the detection to ban latency of each origin node.
+The stamps are wall clock times: the durations between stages of different nodes are only as
+accurate as the synchronization of their clocks.
+Call this class as :
+stamp(alert, API)
+...
+stamp(alert, BAN)
+latency_tracker.record(alert)
+print(latency_tracker.summary())
+"""
+
+API = "api"
+DEDUP = "dedup"
+PUBLISH = "publish"
+RECEIVE = "receive"
+DECRYPT = "decrypt"
+VALIDATE = "validate"
+ENQUEUE = "enqueue"
+BAN = "ban"
+# In pipeline order; append-only, the binary codec sends the index of each stage
+STAGES = (API, DEDUP, PUBLISH, RECEIVE, DECRYPT, VALIDATE, ENQUEUE, BAN)
+
+TIME_TO_BAN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PERCENTILES = (50, 90, 99)
+
+_time_to_ban = metrics.histogram("ids2zmq_detection_to_ban_seconds",
+                                 "Time from the detection of an alert to its ban on this node, by origin node.",
+                                 labels=("peer",), buckets=TIME_TO_BAN_BUCKETS)
+_stage_seconds = metrics.histogram("ids2zmq_alert_stage_seconds",
+                                   "Time from the previous traced stage of an alert to this one, by stage.",
+                                   labels=("stage",))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def enabled() -> bool:
+    """Return whether the alerts are traced, ALERT_TRACE_ENABLED."""
+    return settings.ALERT_TRACE_ENABLED is True
+
+
+def stamp(alert, stage: str, at: int = None):
+    """
+    Record the time an alert reached a stage, when ALERT_TRACE_ENABLED.
+    Args:
+        alert (AlertModel): The alert.
+        stage (str): One of STAGES.
+        at (int): The time in nanoseconds since the epoch, now by default.
+    """
+    if not enabled():
+        return
+    trace = alert.trace
+    if trace is None:
+        alert.trace = trace = {}
+    trace[stage] = time.time_ns() if at is None else at
+
+
+def _epoch_ns(value: datetime) -> int:
+    delta = (value if value.tzinfo is not None else value.replace(tzinfo=UTC)) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+
+
+def _summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    summary = {"count": len(ordered)}
+    for percentile in PERCENTILES:
+        # Nearest rank
+        rank = max(1, -(-percentile * len(ordered) // 100))
+        summary[f"p{percentile}"] = ordered[rank - 1]
+    summary["max"] = ordered[-1]
+    return summary
+
+
+class LatencyTracker:
+    """
+    Detection to ban latency of the banned alerts, per origin node, and time spent in each stage.
+    The percentiles are computed on the most recent bans only, a sliding window per origin node,
+    so that they follow the current state of the cluster.
+    Args:
+        window (int): Number of samples kept per origin node and per stage, ALERT_LATENCY_WINDOW by default.
+    Methods:
+        record(alert): Record the latencies of a banned alert.
+        summary(): Return the percentiles per origin node and per stage.
+        reset(): Forget all the samples.
+    """
+
+    def __init__(self, window: int = None):
+        self.window = settings.ALERT_LATENCY_WINDOW if window is None else window
+        self._peers: dict[str, deque] = {}
+        self._stages: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, alert) -> float | None:
+        """
+        Record the latencies of an alert stamped with its ban.
+        Args:
+            alert (AlertModel): The banned alert.
+        Returns:
+            float | None: The detection to ban latency in seconds, None if the alert carries no ban stamp.
+        """
+        trace = alert.trace
+        if not trace or BAN not in trace:
+            return None
+        previous = detected = _epoch_ns(alert.timestamp)
+        durations = []
+        for stage in STAGES:
+            at = trace.get(stage)
+            if at is not None:
+                durations.append((stage, (at - previous) / 1e9))
+                previous = at
+        latency = (trace[BAN] - detected) / 1e9
+        peer = alert.origin or "unknown"
+        with self._lock:
+            self._samples(self._peers, peer).append(latency)
+            for stage, duration in durations:
+                self._samples(self._stages, stage).append(duration)
+        _time_to_ban.labels(peer).observe(latency)
+        for stage, duration in durations:
+            _stage_seconds.labels(stage).observe(duration)
+        return latency
+
+    def _samples(self, samples: dict[str, deque], key: str) -> deque:
+        window = samples.get(key)
+        if window is None:
+            window = samples[key] = deque(maxlen=self.window)
+        return window
+
+    def summary(self) -> dict:
+        """
+        Return the latency percentiles of the recorded bans.
+        Returns:
+            dict: "peers" maps each origin node to the count, p50, p90, p99 and max of its detection to
+                ban latency, "stages" each stage to the same of its duration, all in seconds.
+        """
+        with self._lock:
+            peers = {peer: list(samples) for peer, samples in self._peers.items()}
+            stages = {stage: list(samples) for stage, samples in self._stages.items()}
+        return {
+            "peers": {peer: _summarize(samples) for peer, samples in sorted(peers.items())},
+            "stages": {stage: _summarize(stages[stage]) for stage in STAGES if stage in stages},
+        }
+
+    def reset(self):
+        """Forget all the samples."""
+        with self._lock:
+            self._peers.clear()
+            self._stages.clear()
+
+
+latency_tracker = LatencyTracker()
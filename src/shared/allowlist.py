@@ -0,0 +1,229 @@
+import ipaddress
+import os
+import socket
+import threading
+import logging
+
+from src.config.settings import settings
+from src.ids2zmq.manager import ZMQManager
+from src.shared.metrics import metrics
+from src.shared.prefix_trie import PrefixTrie, mask
+from src.utils.node_identity import node_identity
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+allowlist.start()
+if allowlist.is_allowed("10.0.0.2"):
+    print("Never banned")
+allowlist.stop()
+"""
+
+_hits = metrics.counter("ids2zmq_allowlist_hits_total", "Bans refused as their address is allowlisted, by path.", labels=("path",))
+_reloads = metrics.counter("ids2zmq_allowlist_reloads_total", "Reloads of the allowlist, by result.", labels=("result",))
+
+_WIDTHS = {4: 32, 6: 128}
+
+
+def parse_entry(entry: str) -> list[ipaddress.IPv4Network | ipaddress.IPv6Network]:
+    """
+    Parse an allowlist entry: an IP address, a network, a host name or a ZMQ endpoint such as tcp://host:port.
+    Host names are resolved once, here, never on lookup.
+    Args:
+        entry (str): The entry.
+    Returns:
+        list[IPv4Network | IPv6Network]: The networks of the entry, every address of a host name.
+    Raises:
+        ValueError: If the entry is neither an address, a network nor a resolvable host name.
+    """
+    entry = entry.strip()
+    if "://" in entry:
+        entry = entry.split("://", 1)[1]
+        # Drop the port, keeping the IPv6 addresses whole: [::1]:5556
+        if entry.startswith("["):
+            entry = entry[1:entry.index("]")]
+        elif entry.count(":") == 1:
+            entry = entry.rsplit(":", 1)[0]
+    try:
+        return [ipaddress.ip_network(entry, strict=False)]
+    except ValueError:
+        pass
+    try:
+        infos = socket.getaddrinfo(entry, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Invalid allowlist entry {entry!r}: {e}") from e
+    return sorted({ipaddress.ip_network(info[4][0].split("%", 1)[0]) for info in infos}, key=str)
+
+
+class Allowlist:
+    """
+    Addresses and networks that are never banned: the trusted hosts of the cluster, this node's own
+    addresses and the networks configured as protected, such as the management networks.
+    The prefixes are kept in a longest-prefix-match trie per IP version, so that a lookup is a walk
+    down at most one node per branching bit, whatever the number of prefixes. Reloading builds new
+    tries and swaps them, the lookups never waiting for it. The file is checked for changes by a
+    background thread and reloaded when modified.
+    Args:
+        enabled (bool): Check the addresses, ALLOWLIST_ENABLED by default; nothing is allowlisted otherwise.
+        entries (str): Comma-separated addresses and networks, ALLOWLIST by default.
+        file (str): File of addresses and networks, one per line with # comments, ALLOWLIST_FILE by default.
+        trusted_hosts (bool): Allow the trusted hosts of ZMQManager.get_trusted_hosts().
+        local_addresses (bool): Allow the addresses of this node.
+        refresh_interval (float): Seconds between two checks of the file for changes.
+    Attributes:
+        _tries (dict[int, PrefixTrie]): The prefixes per IP version, each holding where it comes from.
+        _file_mtime (float): Modification time of the file when last loaded.
+        _stop_event (threading.Event): Event used to stop the background refresh thread.
+        _thread (threading.Thread): The background refresh thread once started.
+    Methods:
+        reload(): Load the prefixes again.
+        match(ip): Return the longest allowlisted prefix containing an address.
+        is_allowed(ip, path): Check whether an address is allowlisted.
+        stats(): Return the number of prefixes.
+        start(): Load the prefixes and start the background refresh thread.
+        stop(): Stop the background refresh thread.
+    """
+
+    def __init__(self, enabled: bool = None, entries: str = None, file: str = None, trusted_hosts: bool = None,
+                 local_addresses: bool = None, refresh_interval: float = None):
+        self.enabled = settings.ALLOWLIST_ENABLED if enabled is None else enabled
+        self._entries = settings.ALLOWLIST if entries is None else entries
+        self._file = settings.ALLOWLIST_FILE if file is None else file
+        self._trusted_hosts = settings.ALLOWLIST_TRUSTED_HOSTS if trusted_hosts is None else trusted_hosts
+        self._local_addresses = settings.ALLOWLIST_LOCAL_ADDRESSES if local_addresses is None else local_addresses
+        self._refresh_interval = settings.ALLOWLIST_REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        self._tries: dict[int, PrefixTrie] = {version: PrefixTrie(width) for version, width in _WIDTHS.items()}
+        self._loaded = False
+        self._file_mtime: float = None
+        self._reload_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def _sources(self) -> list[tuple[str, list[str]]]:
+        """Return the entries of each source."""
+        sources = [("settings", [entry for entry in self._entries.split(",") if entry.strip()])]
+        if self._file:
+            with open(self._file) as allowlist_file:
+                lines = [line.split("#", 1)[0].strip() for line in allowlist_file]
+            sources.append(("file", [line for line in lines if line]))
+        if self._trusted_hosts:
+            try:
+                sources.append(("trusted_hosts", ZMQManager.get_trusted_hosts()))
+            except Exception as e:
+                logger.warning("Trusted hosts left out of the allowlist: %s", e)
+        return sources
+
+    def reload(self) -> int:
+        """
+        Load the prefixes again from every source. An invalid entry is skipped, an unreadable file
+        keeps the prefixes previously loaded.
+        Returns:
+            int: The number of prefixes.
+        Raises:
+            OSError: If the file cannot be read.
+        """
+        with self._reload_lock:
+            try:
+                mtime = os.stat(self._file).st_mtime if self._file else None
+                sources = self._sources()
+            except OSError:
+                _reloads.labels("error").inc()
+                raise
+            tries = {version: PrefixTrie(width) for version, width in _WIDTHS.items()}
+            for source, entries in sources:
+                for entry in entries:
+                    try:
+                        networks = parse_entry(entry)
+                    except ValueError as e:
+                        logger.warning("Skipping allowlist entry from %s: %s", source, e)
+                        continue
+                    for network in networks:
+                        tries[network.version].insert(int(network.network_address), network.prefixlen, source)
+            self._tries = tries
+            self._file_mtime = mtime
+            self._loaded = True
+            _reloads.labels("ok").inc()
+            count = sum(len(trie) for trie in tries.values())
+            logger.info("Allowlist loaded: %d prefixes.", count)
+            return count
+
+    def match(self, ip) -> tuple[str, str] | None:
+        """
+        Return the longest allowlisted prefix containing an address.
+        Args:
+            ip (str | IPvAnyAddress): The address.
+        Returns:
+            tuple[str, str] | None: The prefix and where it comes from, "local" for this node's addresses;
+                None if the address is not allowlisted.
+        """
+        if not self._loaded:
+            self.reload()
+        if not isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            ip = ipaddress.ip_address(str(ip))
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        width = _WIDTHS[ip.version]
+        found = self._tries[ip.version].longest_match(int(ip), width)
+        if found is not None:
+            value, length, source = found
+            network = ipaddress.ip_network((mask(value, length, width), length))
+            return str(network), source
+        if self._local_addresses and node_identity.is_local(ip):
+            return str(ip), "local"
+        return None
+
+    def is_allowed(self, ip, path: str = None) -> bool:
+        """
+        Check whether an address is allowlisted, and so must never be banned.
+        Args:
+            ip (str | IPvAnyAddress): The address.
+            path (str): Where the check is made, counted in the metrics when given.
+        Returns:
+            bool: True if the address is allowlisted, always False when disabled.
+        """
+        if not self.enabled or ip is None or self.match(ip) is None:
+            return False
+        if path is not None:
+            _hits.labels(path).inc()
+        return True
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of prefixes.
+        Returns:
+            dict[str, int]: The number of IPv4 and IPv6 prefixes.
+        """
+        tries = self._tries
+        return {"ipv4": len(tries[4]), "ipv6": len(tries[6])}
+
+    def start(self):
+        """Load the prefixes and start the background refresh thread."""
+        if not self.enabled:
+            return
+        self.reload()
+        if not self._file or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="allowlist", daemon=True)
+        self._thread.start()
+        logger.info("Allowlist file %s checked for changes every %ss.", self._file, self._refresh_interval)
+
+    def stop(self):
+        """Stop the background refresh thread."""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _refresh_loop(self):
+        """Reload the prefixes whenever the file is modified, until stopped."""
+        while not self._stop_event.wait(self._refresh_interval):
+            try:
+                if os.stat(self._file).st_mtime != self._file_mtime:
+                    self.reload()
+            except Exception as e:
+                logger.error("Error reloading the allowlist, keeping the previous one: %s", e)
+
+
+allowlist = Allowlist()
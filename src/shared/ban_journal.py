@@ -0,0 +1,552 @@
+import bisect
+import ipaddress
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+import zlib
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.shared.dedup_engine import DedupEngine, dedup_engine
+from src.shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Crash-safe record of the ban and unban actions applied by this node, so that a restart neither
+executes again nor forgets the alerts it already applied.
+Each applied action is appended to a journal with a single write, surviving a crash of the process,
+and the journal is fsynced in batches by a background thread, bounding what a power loss can lose
+to BAN_JOURNAL_FSYNC_INTERVAL seconds. Once the journal grows past BAN_JOURNAL_COMPACT_SIZE it is
+folded into a snapshot: the banned IPs of each jail, packed and sorted, looked up in place through
+mmap with a binary search. Opening the journal maps the snapshot and replays the few records
+appended since, instead of loading every banned IP.
+Call this class as :
+ban_journal.open()
+ban_journal.record(action="banip", jail="sshd", ip="1.2.3.4")
+if ban_journal.is_banned(jail="sshd", ip="1.2.3.4"):
+    print("Already banned")
+ban_journal.close()
+"""
+
+JOURNAL_FILE = "ban.journal"
+SNAPSHOT_FILE = "ban.snapshot"
+
+_ACTION_IDS = {Fail2banAction.BAN.value: 1, Fail2banAction.UNBAN.value: 2}
+_ACTIONS = {action_id: action for action, action_id in _ACTION_IDS.items()}
+
+# Journal record: crc32 of the body, body length | action id, wall time, jail length, jail, packed IP
+_RECORD_HEADER = struct.Struct("<IH")
+_RECORD_BODY = struct.Struct("<BdH")
+
+# Snapshot: magic, version, jail count | per jail: name length, name, offset and count of the IPv4
+# then the IPv6 addresses | the packed addresses, big-endian so that their bytes sort as their values
+_SNAPSHOT_MAGIC = b"IBJS"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<4sHH")
+_SNAPSHOT_JAIL = struct.Struct("<QIQI")
+
+_records = metrics.counter("ids2zmq_ban_journal_records_total", "Actions appended to the ban journal, by action.", labels=("action",))
+_fsync_seconds = metrics.histogram("ids2zmq_ban_journal_fsync_seconds", "Time to fsync a batch of ban journal records.")
+_compactions = metrics.counter("ids2zmq_ban_journal_compactions_total", "Compactions of the ban journal into a snapshot.")
+
+
+class _PackedIps:
+    """Sorted fixed-size IP addresses of a snapshot, indexable in place for bisect."""
+    __slots__ = ("_view", "_offset", "_count", "_size")
+
+    def __init__(self, view: memoryview, offset: int, count: int, size: int):
+        self._view = view
+        self._offset = offset
+        self._count = count
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        start = self._offset + index * self._size
+        return self._view[start:start + self._size].tobytes()
+
+    def __contains__(self, packed: bytes) -> bool:
+        index = bisect.bisect_left(self, packed)
+        return index < self._count and self[index] == packed
+
+
+class BanSnapshot:
+    """
+    Read-only view of a snapshot file, mapped in memory rather than loaded.
+    Args:
+        path (str): The snapshot file, an empty snapshot if it does not exist.
+    Raises:
+        ValueError: If the file is not a valid snapshot.
+    Methods:
+        contains(jail, packed): Check whether a packed IP address is banned in a jail.
+        jails(): Return the jails of the snapshot.
+        packed_ips(jail): Return the packed IP addresses banned in a jail, IPv4 first.
+        close(): Unmap the file.
+    """
+
+    def __init__(self, path: str = None):
+        self._mmap: mmap.mmap = None
+        self._view: memoryview = None
+        self._jails: dict[str, tuple[_PackedIps, _PackedIps]] = {}
+        if path is None or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            self._parse()
+        except (ValueError, struct.error) as e:
+            self.close()
+            raise ValueError(f"Invalid ban snapshot {path}: {e}") from e
+
+    def _parse(self):
+        magic, version, jail_count = _SNAPSHOT_HEADER.unpack_from(self._view, 0)
+        if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+            raise ValueError(f"unknown format {magic!r} version {version}")
+        position = _SNAPSHOT_HEADER.size
+        for _ in range(jail_count):
+            (name_length,) = struct.unpack_from("<H", self._view, position)
+            position += 2
+            name = self._view[position:position + name_length].tobytes().decode()
+            position += name_length
+            v4_offset, v4_count, v6_offset, v6_count = _SNAPSHOT_JAIL.unpack_from(self._view, position)
+            position += _SNAPSHOT_JAIL.size
+            if v4_offset + v4_count * 4 > len(self._view) or v6_offset + v6_count * 16 > len(self._view):
+                raise ValueError(f"jail {name} out of bounds")
+            self._jails[name] = (_PackedIps(self._view, v4_offset, v4_count, 4),
+                                 _PackedIps(self._view, v6_offset, v6_count, 16))
+
+    def contains(self, jail: str, packed: bytes) -> bool:
+        """
+        Check whether an IP address is banned in a jail.
+        Args:
+            jail (str): The jail.
+            packed (bytes): The packed IP address, 4 or 16 bytes.
+        Returns:
+            bool: True if the address is in the snapshot of the jail.
+        """
+        ips = self._jails.get(jail)
+        if ips is None:
+            return False
+        return packed in ips[0 if len(packed) == 4 else 1]
+
+    def jails(self) -> list[str]:
+        """Return the jails of the snapshot."""
+        return list(self._jails)
+
+    def packed_ips(self, jail: str) -> list[bytes]:
+        """
+        Return the IP addresses banned in a jail.
+        Args:
+            jail (str): The jail.
+        Returns:
+            list[bytes]: The packed addresses, the IPv4 ones then the IPv6 ones, each sorted.
+        """
+        ips = self._jails.get(jail)
+        if ips is None:
+            return []
+        return [ips[0][index] for index in range(len(ips[0]))] + [ips[1][index] for index in range(len(ips[1]))]
+
+    def close(self):
+        """Unmap the file."""
+        self._jails = {}
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    @staticmethod
+    def write(path: str, jails: dict[str, set[bytes]]):
+        """
+        Atomically write a snapshot: written to a temporary file, fsynced and renamed over the previous one.
+        Args:
+            path (str): The snapshot file.
+            jails (dict[str, set[bytes]]): The packed IP addresses banned in each jail.
+        """
+        names = sorted(jail for jail, ips in jails.items() if ips)
+        arrays = []
+        directory_size = _SNAPSHOT_HEADER.size + sum(2 + len(name.encode()) + _SNAPSHOT_JAIL.size for name in names)
+        offset = directory_size
+        entries = []
+        for name in names:
+            v4 = sorted(ip for ip in jails[name] if len(ip) == 4)
+            v6 = sorted(ip for ip in jails[name] if len(ip) == 16)
+            entries.append((name, offset, len(v4), offset + len(v4) * 4, len(v6)))
+            offset += len(v4) * 4 + len(v6) * 16
+            arrays.append(b"".join(v4) + b"".join(v6))
+
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as snapshot_file:
+            snapshot_file.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(names)))
+            for name, v4_offset, v4_count, v6_offset, v6_count in entries:
+                encoded = name.encode()
+                snapshot_file.write(struct.pack("<H", len(encoded)) + encoded)
+                snapshot_file.write(_SNAPSHOT_JAIL.pack(v4_offset, v4_count, v6_offset, v6_count))
+            for array in arrays:
+                snapshot_file.write(array)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary, path)
+        fsync_directory(os.path.dirname(path))
+
+
+def fsync_directory(path: str):
+    """Make a rename in a directory durable."""
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _pack(ip) -> bytes:
+    if not isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        ip = ipaddress.ip_address(str(ip))
+    return ip.packed
+
+
+def encode_record(action: str, jail: str, packed: bytes, at: float) -> bytes:
+    """
+    Encode a journal record.
+    Args:
+        action (str): "banip" or "unbanip".
+        jail (str): The jail.
+        packed (bytes): The packed IP address.
+        at (float): The wall time the action was applied at.
+    Returns:
+        bytes: The record, checksummed so that a torn write is detected on replay.
+    """
+    encoded = jail.encode()
+    body = _RECORD_BODY.pack(_ACTION_IDS[action], at, len(encoded)) + encoded + packed
+    return _RECORD_HEADER.pack(zlib.crc32(body), len(body)) + body
+
+
+def decode_records(data: bytes) -> tuple[list[tuple[str, str, bytes, float]], int]:
+    """
+    Decode the records of a journal, up to the first truncated or corrupted one.
+    Args:
+        data (bytes): The content of the journal.
+    Returns:
+        tuple[list[tuple[str, str, bytes, float]], int]: The action, jail, packed IP address and wall time
+            of each valid record, and the length of the valid prefix of the journal.
+    """
+    records = []
+    position = 0
+    while position + _RECORD_HEADER.size <= len(data):
+        crc, length = _RECORD_HEADER.unpack_from(data, position)
+        body = data[position + _RECORD_HEADER.size:position + _RECORD_HEADER.size + length]
+        if len(body) != length or zlib.crc32(body) != crc or length < _RECORD_BODY.size:
+            break
+        action_id, at, jail_length = _RECORD_BODY.unpack_from(body, 0)
+        packed = body[_RECORD_BODY.size + jail_length:]
+        if action_id not in _ACTIONS or len(packed) not in (4, 16):
+            break
+        jail = body[_RECORD_BODY.size:_RECORD_BODY.size + jail_length].decode()
+        records.append((_ACTIONS[action_id], jail, packed, at))
+        position += _RECORD_HEADER.size + length
+    return records, position
+
+
+class BanJournal:
+    """
+    Journal of the ban and unban actions applied by this node, compacted into a snapshot.
+    The current state is the mapped snapshot overlaid with the changes journaled since, kept in
+    memory per jail. The journal is written with one os.write per record, and fsynced by a background
+    thread every fsync_interval seconds, or sooner once fsync_batch records are pending. A compaction
+    rotates the journal, writes the overlaid state to a new snapshot and deletes the rotated journal;
+    a crash at any point leaves a snapshot and journals whose replay gives the same state.
+    Args:
+        path (str): Directory of the journal and snapshot files, BAN_JOURNAL_PATH by default.
+        fsync_interval (float): Maximum seconds between the write of a record and its fsync.
+        fsync_batch (int): Number of pending records fsynced without waiting for fsync_interval.
+        compact_size (int): Size in bytes of the journal triggering a compaction.
+        dedup (DedupEngine): Dedup engine the recent actions are restored into on open.
+    Attributes:
+        _snapshot (BanSnapshot): The mapped snapshot.
+        _changes (dict[str, dict[bytes, bool]]): Per jail, the packed IP addresses banned (True) or unbanned
+            (False) since the snapshot.
+        _fd (int): The journal file descriptor once opened.
+        _pending (int): Records written and not fsynced yet.
+    Methods:
+        open(): Restore the state from the snapshot and the journal, and start the fsync thread.
+        record(action, jail, ip): Journal an applied action.
+        is_banned(jail, ip): Check whether an IP address is banned in a jail.
+        jails(): Return the jails with journaled actions.
+        banned(jail): Return the IP addresses banned in a jail.
+        compact(): Fold the journal into a new snapshot.
+        stats(): Return the sizes of the journal and of the state.
+        close(): Fsync the journal and stop the fsync thread.
+    """
+
+    def __init__(self, path: str = None, fsync_interval: float = None, fsync_batch: int = None,
+                 compact_size: int = None, dedup: DedupEngine = None):
+        self._path = settings.BAN_JOURNAL_PATH if path is None else path
+        self._fsync_interval = settings.BAN_JOURNAL_FSYNC_INTERVAL if fsync_interval is None else fsync_interval
+        self._fsync_batch = settings.BAN_JOURNAL_FSYNC_BATCH if fsync_batch is None else fsync_batch
+        self._compact_size = settings.BAN_JOURNAL_COMPACT_SIZE if compact_size is None else compact_size
+        self._dedup = dedup_engine if dedup is None else dedup
+        self._snapshot = BanSnapshot()
+        self._changes: dict[str, dict[bytes, bool]] = {}
+        self._fd: int = None
+        self._journal_size = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._fd is not None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._path, name)
+
+    def open(self):
+        """
+        Restore the state from the snapshot and the journal, and start the fsync thread.
+        The recent actions, within their dedup TTL, are registered again in the dedup engine so that
+        the copies of an alert still relayed by the peers are not applied twice across a restart.
+        """
+        if self.is_open:
+            return
+        started = time.perf_counter()
+        os.makedirs(self._path, exist_ok=True)
+        snapshot_path = self._file(SNAPSHOT_FILE)
+        try:
+            self._snapshot = BanSnapshot(snapshot_path)
+        except ValueError as e:
+            # Keep the file for inspection, the journal still holds the actions applied since
+            logger.error("%s, starting from an empty ban state", e)
+            os.replace(snapshot_path, f"{snapshot_path}.corrupt")
+            self._snapshot = BanSnapshot()
+
+        now = time.time()
+        replayed = 0
+        # A rotated journal is only left by a compaction interrupted by a crash
+        for name in (f"{JOURNAL_FILE}.old", JOURNAL_FILE):
+            journal_path = self._file(name)
+            if not os.path.exists(journal_path):
+                continue
+            with open(journal_path, "rb") as journal_file:
+                data = journal_file.read()
+            records, valid_length = decode_records(data)
+            if valid_length < len(data):
+                logger.warning("Ban journal %s truncated after %d valid records, %d bytes dropped",
+                               journal_path, len(records), len(data) - valid_length)
+                os.truncate(journal_path, valid_length)
+            for action, jail, packed, at in records:
+                self._apply(action, jail, packed)
+                self._dedup.register(ip=ipaddress.ip_address(packed), jail=jail, action=action, age=now - at)
+            replayed += len(records)
+
+        self._fd = os.open(self._file(JOURNAL_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._journal_size = os.fstat(self._fd).st_size
+        logger.info("Ban state restored in %.1f ms: %d jails in the snapshot, %d journal records replayed.",
+                    (time.perf_counter() - started) * 1000, len(self._snapshot.jails()), replayed)
+        if os.path.exists(self._file(f"{JOURNAL_FILE}.old")):
+            self.compact()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._fsync_loop, name="ban-journal", daemon=True)
+        self._thread.start()
+
+    def _apply(self, action: str, jail: str, packed: bytes):
+        changes = self._changes.get(jail)
+        if changes is None:
+            changes = self._changes[jail] = {}
+        changes[packed] = action == Fail2banAction.BAN.value
+
+    def record(self, action: str | Fail2banAction, jail: str, ip):
+        """
+        Journal an action applied to fail2ban. Does nothing until open() or for other actions than ban and unban.
+        Args:
+            action (str | Fail2banAction): "banip" or "unbanip".
+            jail (str): The jail.
+            ip (str | IPvAnyAddress): The IP address.
+        """
+        action = action.value if isinstance(action, Fail2banAction) else str(action)
+        if action not in _ACTION_IDS or not self.is_open:
+            return
+        packed = _pack(ip)
+        data = encode_record(action, jail, packed, time.time())
+        with self._lock:
+            if self._fd is None:
+                return
+            os.write(self._fd, data)
+            self._journal_size += len(data)
+            self._pending += 1
+            self._apply(action, jail, packed)
+            wakeup = self._pending >= self._fsync_batch
+        _records.labels(action).inc()
+        if wakeup:
+            self._wakeup.set()
+
+    def is_banned(self, jail: str, ip) -> bool:
+        """
+        Check whether an IP address is banned in a jail, according to the journaled actions.
+        Args:
+            jail (str): The jail.
+            ip (str | IPvAnyAddress): The IP address.
+        Returns:
+            bool: True if the last journaled action of the address in the jail is a ban.
+        """
+        packed = _pack(ip)
+        with self._lock:
+            banned = self._changes.get(jail, {}).get(packed)
+            if banned is not None:
+                return banned
+            return self._snapshot.contains(jail, packed)
+
+    def jails(self) -> list[str]:
+        """
+        Return the jails with journaled actions.
+        Returns:
+            list[str]: The jails of the snapshot and of the changes since, sorted.
+        """
+        with self._lock:
+            return sorted(set(self._snapshot.jails()) | set(self._changes))
+
+    def banned(self, jail: str) -> list[str]:
+        """
+        Return the IP addresses banned in a jail, according to the journaled actions.
+        Args:
+            jail (str): The jail.
+        Returns:
+            list[str]: The addresses.
+        """
+        with self._lock:
+            ips = self._merged(jail, self._snapshot, self._changes.get(jail, {}))
+        return [str(ipaddress.ip_address(packed)) for packed in sorted(ips, key=lambda packed: (len(packed), packed))]
+
+    @staticmethod
+    def _merged(jail: str, snapshot: BanSnapshot, changes: dict[bytes, bool]) -> set[bytes]:
+        ips = set(snapshot.packed_ips(jail))
+        for packed, banned in changes.items():
+            if banned:
+                ips.add(packed)
+            else:
+                ips.discard(packed)
+        return ips
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot.
+        The journal is rotated under the lock, the records appended meanwhile going to a new journal,
+        and the snapshot is written outside of it, so that record() waits for the rotation only.
+        """
+        with self._compact_lock:
+            started = time.perf_counter()
+            old_journal = self._file(f"{JOURNAL_FILE}.old")
+            with self._lock:
+                if self._fd is None:
+                    return
+                os.fsync(self._fd)
+                self._pending = 0
+                os.close(self._fd)
+                if not os.path.exists(old_journal):
+                    os.replace(self._file(JOURNAL_FILE), old_journal)
+                else:
+                    # The rotated journal was not folded yet, the current one is appended to it
+                    with open(self._file(JOURNAL_FILE), "rb") as journal_file, open(old_journal, "ab") as old_file:
+                        old_file.write(journal_file.read())
+                        old_file.flush()
+                        os.fsync(old_file.fileno())
+                    os.remove(self._file(JOURNAL_FILE))
+                self._fd = os.open(self._file(JOURNAL_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                fsync_directory(self._path)
+                self._journal_size = 0
+                frozen = {jail: dict(changes) for jail, changes in self._changes.items()}
+                snapshot = self._snapshot
+
+            jails = {jail: self._merged(jail, snapshot, frozen.get(jail, {}))
+                     for jail in set(snapshot.jails()) | set(frozen)}
+            snapshot_path = self._file(SNAPSHOT_FILE)
+            BanSnapshot.write(snapshot_path, jails)
+            new_snapshot = BanSnapshot(snapshot_path)
+
+            with self._lock:
+                self._snapshot = new_snapshot
+                # Only the changes journaled since the rotation are left on top of the new snapshot
+                for jail, changes in frozen.items():
+                    current = self._changes.get(jail, {})
+                    for packed, banned in changes.items():
+                        if current.get(packed) is banned:
+                            del current[packed]
+                    if not current:
+                        self._changes.pop(jail, None)
+            snapshot.close()
+            os.remove(old_journal)
+            _compactions.inc()
+            logger.info("Ban journal compacted in %.1f ms: %d IPs in %d jails.",
+                        (time.perf_counter() - started) * 1000, sum(len(ips) for ips in jails.values()), len(jails))
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the sizes of the journal and of the state.
+        Returns:
+            dict[str, int]: journal_bytes, pending_fsync, changes since the snapshot and snapshot_jails.
+        """
+        with self._lock:
+            return {
+                "journal_bytes": self._journal_size,
+                "pending_fsync": self._pending,
+                "changes": sum(len(changes) for changes in self._changes.values()),
+                "snapshot_jails": len(self._snapshot.jails()),
+            }
+
+    def _fsync(self):
+        with self._lock:
+            if self._fd is None or not self._pending:
+                return
+            fd, self._pending = self._fd, 0
+            compact = self._journal_size >= self._compact_size
+        started = time.perf_counter()
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            # The descriptor was rotated by a compaction, which fsynced it first
+            logger.debug("Ban journal fsync skipped: %s", e)
+        _fsync_seconds.observe(time.perf_counter() - started)
+        if compact:
+            self.compact()
+
+    def _fsync_loop(self):
+        """Fsync the pending records every fsync_interval seconds, or as soon as fsync_batch are pending."""
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self._fsync_interval)
+            self._wakeup.clear()
+            try:
+                self._fsync()
+            except Exception as e:
+                logger.error("Error syncing the ban journal: %s", e)
+
+    def close(self):
+        """Fsync the journal, stop the fsync thread and unmap the snapshot."""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+        self._thread = None
+        with self._compact_lock, self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+                self._pending = 0
+            self._snapshot.close()
+            self._snapshot = BanSnapshot()
+            self._changes = {}
+        logger.info("Ban journal closed.")
+
+
+ban_journal = BanJournal()
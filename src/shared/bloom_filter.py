@@ -0,0 +1,126 @@
+import hashlib
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+seen = RotatingBloomFilter(capacity=1_000_000, error_rate=1e-4, window=300)
+if seen.check_and_add(b"message id"):
+    print("Already seen")
+"""
+
+
+class _BloomGeneration:
+    """A plain Bloom filter of m bits, holding the keys added during one rotation period."""
+    __slots__ = ("bits", "count", "created_at")
+
+    def __init__(self, size_bytes: int):
+        self.bits = bytearray(size_bytes)
+        self.count = 0
+        self.created_at = time.monotonic()
+
+
+class RotatingBloomFilter:
+    """
+    Time-windowed Bloom filter with a fixed memory footprint.
+    Keys are added to the current generation and looked up in the current and the previous ones.
+    The generations rotate every `window` seconds, or earlier once the current one holds `capacity`
+    keys so that the false positive rate stays bounded during a flood. A key is thus remembered for
+    at least one rotation period and the memory never exceeds `generations` bit arrays.
+    Args:
+        capacity (int): Number of keys per generation the filter is sized for.
+        error_rate (float): Target false positive rate at capacity.
+        window (float): Seconds between two rotations.
+        generations (int): Number of generations kept, at least 2.
+    Attributes:
+        size_bits (int): Number of bits of each generation.
+        hash_count (int): Number of bit positions per key.
+        rotations (int): Number of rotations so far.
+        _generations (list[_BloomGeneration]): The generations, newest first.
+    Methods:
+        add(key): Add a key.
+        check_and_add(key): Check whether a key was probably seen and add it.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, window: float, generations: int = 2):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("Bloom filter capacity must be positive and error_rate within ]0, 1[")
+        self.size_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.size_bits += -self.size_bits % 8
+        self.hash_count = max(1, round(self.size_bits / capacity * math.log(2)))
+        self._capacity = capacity
+        self._window = window
+        self._generations_count = max(2, generations)
+        self._generations = [_BloomGeneration(self.size_bits // 8)]
+        self._lock = threading.Lock()
+        self.rotations = 0
+
+    def __contains__(self, key: bytes) -> bool:
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate_if_due()
+            return any(self._test(generation, positions) for generation in self._generations)
+
+    def add(self, key: bytes):
+        """
+        Add a key to the current generation.
+        Args:
+            key (bytes): The key to add.
+        """
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate_if_due()
+            self._set(self._generations[0], positions)
+
+    def check_and_add(self, key: bytes) -> bool:
+        """
+        Check whether a key was probably seen within the window and add it.
+        Args:
+            key (bytes): The key to look up.
+        Returns:
+            bool: True if the key was probably seen already, False if it is new.
+        """
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate_if_due()
+            if any(self._test(generation, positions) for generation in self._generations):
+                return True
+            self._set(self._generations[0], positions)
+            return False
+
+    def _positions(self, key: bytes) -> list[int]:
+        """Bit positions of a key, derived from one 128 bits digest by double hashing."""
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        size = self.size_bits
+        return [(first + i * second) % size for i in range(self.hash_count)]
+
+    @staticmethod
+    def _test(generation: _BloomGeneration, positions: list[int]) -> bool:
+        bits = generation.bits
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @staticmethod
+    def _set(generation: _BloomGeneration, positions: list[int]):
+        bits = generation.bits
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        generation.count += 1
+
+    def _rotate_if_due(self):
+        current = self._generations[0]
+        if current.count < self._capacity and time.monotonic() - current.created_at < self._window:
+            return
+        if current.count >= self._capacity:
+            logger.warning(f"Bloom filter generation full after {time.monotonic() - current.created_at:.1f}s, rotating early.")
+        self._generations.insert(0, _BloomGeneration(self.size_bits // 8))
+        del self._generations[self._generations_count:]
+        self.rotations += 1
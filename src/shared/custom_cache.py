@@ -1,19 +1,18 @@
 # src/shared/alert_dedup.py
-from cachetools import TTLCache
-from threading import Lock
 from pydantic import IPvAnyAddress
 from src.fail2ban.action import Fail2banAction
+from src.shared.dedup_engine import dedup_engine
 
-# TTL de 60 secondes
-alert_cache = TTLCache(maxsize=1000, ttl=60)
-alert_cache_lock = Lock()
+# Thin helpers over the shared DedupEngine, see src/shared/dedup_engine.py for the TTLs and capacities
 
 def is_duplicate(ip: str|IPvAnyAddress, jail: str, action: str|Fail2banAction) -> bool:
-    key = f"{action}:{jail}:{ip}"
-    with alert_cache_lock:
-        return key in alert_cache
+    return dedup_engine.is_duplicate(ip=ip, jail=jail, action=action)
 
 def register_alert(ip: str|IPvAnyAddress, jail: str, action: str|Fail2banAction):
-    key = f"{action}:{jail}:{ip}"
-    with alert_cache_lock:
-        alert_cache[key] = True
\ No newline at end of file
+    dedup_engine.register(ip=ip, jail=jail, action=action)
+
+def check_and_register(ip: str|IPvAnyAddress, jail: str, action: str|Fail2banAction) -> bool:
+    return dedup_engine.check_and_register(ip=ip, jail=jail, action=action)
+
+def discard_alert(ip: str|IPvAnyAddress, jail: str, action: str|Fail2banAction):
+    dedup_engine.discard(ip=ip, jail=jail, action=action)
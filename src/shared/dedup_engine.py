@@ -0,0 +1,243 @@
+import ipaddress
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+engine = DedupEngine()
+if engine.check_and_register(ip="1.2.3.4", jail="sshd", action="banip"):
+    print("Duplicate alert")
+"""
+
+
+class _Shard:
+    """One slice of an action table: the keys with their expiry time, oldest first, and the counters."""
+    __slots__ = ("lock", "entries", "capacity", "hits", "misses", "evictions", "expirations")
+
+    def __init__(self, capacity: int):
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[int, float] = OrderedDict()
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def purge(self, now: float):
+        """Drop the expired entries, all at the front since every entry of the shard has the same TTL."""
+        entries = self.entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now:
+                return
+            del entries[key]
+            self.expirations += 1
+
+    def store(self, key: int, expires_at: float):
+        """Insert or refresh a key, evicting the oldest entry when the shard is full."""
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+        elif len(entries) >= self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+        entries[key] = expires_at
+
+
+class DedupEngine:
+    """
+    Deduplication of the alerts seen by this node, shared by the API and the receive path.
+    An alert is identified by a single int packing its IP address and an interned jail id, stored
+    in a table per action with its own TTL and capacity. Each table is split in shards with their
+    own lock, so concurrent lookups rarely contend. When a shard is full the oldest entry is evicted
+    and counted, instead of silently turning the deduplication off.
+    Args:
+        ttls (dict[str, float]): Seconds an alert is remembered, per action.
+        capacities (dict[str, int]): Maximum number of alerts remembered, per action.
+        default_ttl (float): TTL of the actions missing from ttls.
+        default_capacity (int): Capacity of the actions missing from capacities.
+        shards (int): Number of shards of each action table.
+    Attributes:
+        _tables (dict[str, list[_Shard]]): The shards of each action.
+        _jail_ids (dict[str, int]): Interned jail ids.
+    Methods:
+        check_and_register(ip, jail, action): Atomically check whether an alert is a duplicate and register it if not.
+        is_duplicate(ip, jail, action): Check whether an alert was seen within its TTL.
+        register(ip, jail, action): Register an alert, refreshing its TTL.
+        discard(ip, jail, action): Forget an alert, e.g. when its publication or ban failed.
+        clear(): Forget every alert.
+        stats(): Return the size and the counters of each action table.
+    """
+
+    def __init__(self, ttls: dict[str, float] = None, capacities: dict[str, int] = None, default_ttl: float = None,
+                 default_capacity: int = None, shards: int = None):
+        self._ttls = dict(settings.DEDUP_ACTION_TTLS if ttls is None else ttls)
+        self._capacities = dict(settings.DEDUP_ACTION_CAPACITIES if capacities is None else capacities)
+        self._default_ttl = settings.DEDUP_DEFAULT_TTL if default_ttl is None else default_ttl
+        self._default_capacity = settings.DEDUP_DEFAULT_CAPACITY if default_capacity is None else default_capacity
+        self._shards_count = max(1, settings.DEDUP_SHARDS if shards is None else shards)
+        self._tables: dict[str, list[_Shard]] = {}
+        self._jail_ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def check_and_register(self, ip, jail: str, action: str | Fail2banAction) -> bool:
+        """
+        Atomically check whether an alert is a duplicate and register it if it is not.
+        Args:
+            ip (str | IPvAnyAddress): The IP address of the alert.
+            jail (str): The jail of the alert.
+            action (str | Fail2banAction): The action of the alert.
+        Returns:
+            bool: True if the alert was already registered within its TTL, False if it has just been registered.
+        """
+        action, key = self._resolve(ip, jail, action)
+        shard = self._get_shard(action, key)
+        now = time.monotonic()
+        with shard.lock:
+            shard.purge(now)
+            if key in shard.entries:
+                shard.hits += 1
+                return True
+            shard.misses += 1
+            shard.store(key, now + self._ttl(action))
+            return False
+
+    def is_duplicate(self, ip, jail: str, action: str | Fail2banAction) -> bool:
+        """
+        Check whether an alert was registered within its TTL.
+        Args:
+            ip (str | IPvAnyAddress): The IP address of the alert.
+            jail (str): The jail of the alert.
+            action (str | Fail2banAction): The action of the alert.
+        Returns:
+            bool: True if the alert is a duplicate, False otherwise.
+        """
+        action, key = self._resolve(ip, jail, action)
+        shard = self._get_shard(action, key)
+        with shard.lock:
+            shard.purge(time.monotonic())
+            if key in shard.entries:
+                shard.hits += 1
+                return True
+            shard.misses += 1
+            return False
+
+    def register(self, ip, jail: str, action: str | Fail2banAction, age: float = 0.0):
+        """
+        Register an alert, refreshing its TTL if it was already registered.
+        Args:
+            ip (str | IPvAnyAddress): The IP address of the alert.
+            jail (str): The jail of the alert.
+            action (str | Fail2banAction): The action of the alert.
+            age (float): Seconds since the alert was seen, deducted from its TTL; not registered once past it.
+                The alerts registered with an age must be older than the ones already registered.
+        """
+        action, key = self._resolve(ip, jail, action)
+        ttl = self._ttl(action) - max(0.0, age)
+        if ttl <= 0:
+            return
+        shard = self._get_shard(action, key)
+        now = time.monotonic()
+        with shard.lock:
+            shard.purge(now)
+            shard.store(key, now + ttl)
+
+    def discard(self, ip, jail: str, action: str | Fail2banAction):
+        """
+        Forget an alert, so that it is accepted again, e.g. when its publication or ban failed.
+        Args:
+            ip (str | IPvAnyAddress): The IP address of the alert.
+            jail (str): The jail of the alert.
+            action (str | Fail2banAction): The action of the alert.
+        """
+        action, key = self._resolve(ip, jail, action)
+        shard = self._get_shard(action, key)
+        with shard.lock:
+            shard.entries.pop(key, None)
+
+    def clear(self):
+        """Forget every alert and reset the counters."""
+        with self._lock:
+            self._tables = {}
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Return the size and the counters of each action table.
+        Returns:
+            dict[str, dict[str, int]]: size, capacity, hits, misses, evictions and expirations per action.
+        """
+        with self._lock:
+            tables = dict(self._tables)
+        stats = {}
+        for action, shards in tables.items():
+            totals = {"size": 0, "capacity": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+            for shard in shards:
+                with shard.lock:
+                    totals["size"] += len(shard.entries)
+                    totals["capacity"] += shard.capacity
+                    totals["hits"] += shard.hits
+                    totals["misses"] += shard.misses
+                    totals["evictions"] += shard.evictions
+                    totals["expirations"] += shard.expirations
+            stats[action] = totals
+        return stats
+
+    def _ttl(self, action: str) -> float:
+        return self._ttls.get(action, self._default_ttl)
+
+    def _resolve(self, ip, jail: str, action: str | Fail2banAction) -> tuple[str, int]:
+        """Return the action name and the compact key of an alert."""
+        action = action.value if isinstance(action, Fail2banAction) else str(action)
+        return action, self._pack_ip(ip) << 16 | self._jail_id(jail)
+
+    @staticmethod
+    def _pack_ip(ip) -> int:
+        """Pack an IP address in an int, with the IP version in the two lowest bits so that IPv4 and IPv6 never collide."""
+        if ip is None:
+            return 0
+        if not isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            ip = ipaddress.ip_address(str(ip))
+        return int(ip) << 2 | (1 if ip.version == 4 else 2)
+
+    def _jail_id(self, jail: str) -> int:
+        """Return the interned id of a jail."""
+        jail_id = self._jail_ids.get(jail)
+        if jail_id is None:
+            with self._lock:
+                if jail not in self._jail_ids and len(self._jail_ids) >= 1 << 16:
+                    raise ValueError(f"Too many distinct jails for the dedup engine: {jail}")
+                jail_id = self._jail_ids.setdefault(jail, len(self._jail_ids))
+        return jail_id
+
+    def _get_shard(self, action: str, key: int) -> _Shard:
+        shards = self._tables.get(action)
+        if shards is None:
+            with self._lock:
+                shards = self._tables.get(action)
+                if shards is None:
+                    capacity = self._capacities.get(action, self._default_capacity)
+                    per_shard = max(1, -(-capacity // self._shards_count))
+                    shards = self._tables[action] = [_Shard(per_shard) for _ in range(self._shards_count)]
+        return shards[hash(key) % self._shards_count]
+
+
+dedup_engine = DedupEngine()
+
+def _dedup_totals(counter: str) -> dict[tuple, int]:
+    return {(action,): totals[counter] for action, totals in dedup_engine.stats().items()}
+
+
+# The dedup hit ratio is hits / (hits + misses), the counters are read from the shards at scrape time
+for _counter in ("hits", "misses", "evictions"):
+    metrics.callback(f"ids2zmq_dedup_{_counter}_total", f"Dedup engine {_counter}, by action.", kind="counter",
+                     labels=("action",), function=lambda counter=_counter: _dedup_totals(counter))
+metrics.callback("ids2zmq_dedup_entries", "Entries held by the dedup engine, by action.", labels=("action",),
+                 function=lambda: _dedup_totals("size"))
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import random
+
+from src.config.settings import settings
+
+"""
+Identification of the published alerts: every alert carries the id of the node it originates from
+and a random message id, both 8 bytes written as 16 hexadecimal characters. They travel in clear in
+the header frame of the ZMQ message so that a receiver can drop an echo or an already seen alert
+before decrypting it.
+"""
+
+ID_SIZE = 8
+HEADER_SIZE = 2 * ID_SIZE
+
+_random = random.Random(os.urandom(16))
+
+
+def _resolve_node_id() -> str:
+    """Derive the node id from NODE_ID, or draw a random one for this process when it is not set."""
+    if settings.NODE_ID:
+        return hashlib.blake2b(settings.NODE_ID.encode("utf-8"), digest_size=ID_SIZE).hexdigest()
+    return os.urandom(ID_SIZE).hex()
+
+
+_node_id = _resolve_node_id()
+
+
+def get_node_id() -> str:
+    """
+    Return the id of this node.
+    Returns:
+        str: 16 hexadecimal characters.
+    """
+    return _node_id
+
+
+def new_message_id() -> str:
+    """
+    Draw a new message id.
+    Returns:
+        str: 16 hexadecimal characters.
+    """
+    return f"{_random.getrandbits(ID_SIZE * 8):016x}"
+
+
+def encode_header(origin: str, message_id: str) -> bytes:
+    """
+    Pack the origin and message ids in the header frame.
+    Args:
+        origin (str): The origin node id.
+        message_id (str): The message id.
+    Returns:
+        bytes: The 16 bytes header.
+    Raises:
+        ValueError: If an id is not 16 hexadecimal characters.
+    """
+    header = bytes.fromhex(origin) + bytes.fromhex(message_id)
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Invalid message header ids: {origin}, {message_id}")
+    return header
+
+
+def decode_header(header: bytes) -> tuple[str, str]:
+    """
+    Unpack the origin and message ids of a header frame.
+    Args:
+        header (bytes): The header frame.
+    Returns:
+        tuple[str, str]: The origin node id and the message id.
+    Raises:
+        ValueError: If the header does not have the expected size.
+    """
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Invalid message header size: {len(header)}")
+    return header[:ID_SIZE].hex(), header[ID_SIZE:].hex()
@@ -0,0 +1,329 @@
+from bisect import bisect_left
+import math
+import threading
+import logging
+import weakref
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+"""
+Counters and latency histograms of the pipeline, rendered in the Prometheus text format by GET /metrics.
+Recording an event takes no lock: every thread updates its own cells of the metric, and a scrape
+sums the cells of all the threads. The metrics are declared once at import time, with their labels
+bound ahead of the hot path.
+Call this class as :
+published = metrics.counter("ids2zmq_published_alerts_total", "Alerts published.")
+latency = metrics.histogram("ids2zmq_publish_seconds", "Time to publish an alert.")
+published.inc()
+latency.observe(0.00012)
+failures = metrics.counter("ids2zmq_failures_total", "Failures by stage.", labels=("stage",)).labels("decrypt")
+print(metrics.render())
+"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CellOwner:
+    """Object held in the thread-local storage of a thread, collected when the thread exits."""
+    __slots__ = ("__weakref__",)
+
+
+class _Cells:
+    """
+    The cells of one metric, one list of values per recording thread. When a thread exits, the
+    values of its cell are folded into the retired totals and the cell is dropped, so that the
+    threads coming and going do not grow the cells.
+    """
+    __slots__ = ("size", "local", "cells", "retired", "lock")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.local = threading.local()
+        self.cells: dict[int, list] = {}
+        self.retired = [0] * size
+        self.lock = threading.Lock()
+
+    def new_cell(self) -> list:
+        """Create the cell of the calling thread, the only time a lock is taken."""
+        cell = [0] * self.size
+        with self.lock:
+            self.cells[id(cell)] = cell
+        owner = self.local.owner = _CellOwner()
+        weakref.finalize(owner, self._retire, cell).atexit = False
+        self.local.cell = cell
+        return cell
+
+    def _retire(self, cell: list):
+        """Fold the cell of an exited thread into the retired totals."""
+        with self.lock:
+            del self.cells[id(cell)]
+            for index, value in enumerate(cell):
+                self.retired[index] += value
+
+    def totals(self) -> list:
+        with self.lock:
+            cells = list(self.cells.values())
+            totals = list(self.retired)
+        for cell in cells:
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+
+class _Metric:
+    """A metric family, holding one child per label values."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: dict[tuple, "_Metric"] = {}
+        self._children_lock = threading.Lock()
+
+    def labels(self, *values) -> "_Metric":
+        """
+        Return the child of some label values, to be kept by the caller for the hot path.
+        Args:
+            *values: One value per label name.
+        Returns:
+            The child metric.
+        Raises:
+            ValueError: If the number of values does not match the label names.
+        """
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {self.label_names}, got {values}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self) -> list[tuple[tuple, "_Metric"]]:
+        if self.label_names:
+            with self._children_lock:
+                return sorted(self._children.items())
+        return [((), self)]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._samples():
+            lines.extend(child._render_sample(self.name, self.label_names, values))
+        return lines
+
+    def _render_sample(self, name: str, label_names: tuple, values: tuple) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter.
+    Methods:
+        inc(amount): Add to the counter.
+        value(): Return the current total.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self._cells = _Cells(1)
+        self._local = self._cells.local
+
+    def inc(self, amount: int | float = 1):
+        """Add to the counter."""
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._cells.new_cell()[0] += amount
+
+    def value(self) -> int | float:
+        """Return the current total over all the threads."""
+        return self._cells.totals()[0]
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def _render_sample(self, name: str, label_names: tuple, values: tuple) -> list[str]:
+        return [f"{name}{_format_labels(label_names, values)} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    """
+    Histogram with fixed buckets.
+    Args:
+        buckets (tuple[float]): The upper bounds of the buckets, in increasing order.
+    Methods:
+        observe(value): Record a value.
+        snapshot(): Return the per bucket counts, the sum and the count.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # One cell per bucket, one for the values above the last bound, then the sum
+        self._cells = _Cells(len(self.buckets) + 2)
+        self._local = self._cells.local
+
+    def observe(self, value: float):
+        """Record a value in its bucket."""
+        index = bisect_left(self.buckets, value)
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.new_cell()
+        cell[index] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        """
+        Return the state of the histogram.
+        Returns:
+            tuple[list[int], float, int]: The non cumulative count of each bucket and of the +Inf one, the sum and the count.
+        """
+        totals = self._cells.totals()
+        counts = totals[:-1]
+        return counts, totals[-1], sum(counts)
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _render_sample(self, name: str, label_names: tuple, values: tuple) -> list[str]:
+        counts, total, count = self.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound if math.isinf(bound) else float(bound))}"'
+            lines.append(f"{name}_bucket{_format_labels(label_names, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(label_names, values)} {_format_value(float(total))}")
+        lines.append(f"{name}_count{_format_labels(label_names, values)} {count}")
+        return lines
+
+
+class Callback(_Metric):
+    """
+    Gauge or counter read from a function at scrape time, for the values already maintained elsewhere.
+    Args:
+        function (callable): Returns the value, or with labels a dict of label values tuple to value.
+        kind (str): "gauge" or "counter".
+    """
+
+    def __init__(self, name: str, documentation: str, function: callable, kind: str = "gauge", labels: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self._function = function
+
+    def render(self) -> list[str]:
+        try:
+            value = self._function()
+        except Exception as e:
+            logger.error(f"Error reading the metric {self.name}: {e}")
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        samples = sorted(value.items()) if self.label_names else [((), value)]
+        for values, sample in samples:
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(sample)}")
+        return lines
+
+
+class _NoopMetric:
+    """Stand-in of every metric while the metrics are disabled."""
+
+    def labels(self, *values) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: int | float = 1):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+_NOOP = _NoopMetric()
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of the process.
+    Declaring a metric under an existing name returns the existing one, so that every module can
+    declare the metrics it records.
+    Args:
+        enabled (bool): Record the metrics, METRICS_ENABLED by default; disabled metrics do nothing.
+    Methods:
+        counter(name, documentation, labels): Declare a counter.
+        histogram(name, documentation, labels, buckets): Declare a histogram.
+        callback(name, documentation, function, kind, labels): Declare a metric read from a function at scrape time.
+        render(): Render all the metrics in the Prometheus text format.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = settings.METRICS_ENABLED if enabled is None else enabled
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name: str, documentation: str, function: callable, kind: str = "gauge", labels: tuple = ()) -> Callback:
+        return self._register(name, lambda: Callback(name, documentation, function, kind, labels), replace=True)
+
+    def _register(self, name: str, factory: callable, replace: bool = False):
+        if not self.enabled:
+            return _NOOP
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None or replace:
+                metric = factory()
+                self._metrics[name] = metric
+            return metric
+
+    def render(self) -> str:
+        """
+        Render all the metrics in the Prometheus text format.
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            registered = sorted(self._metrics.items())
+        lines = []
+        for _, metric in registered:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+metrics = MetricsRegistry()
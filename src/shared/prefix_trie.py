@@ -0,0 +1,247 @@
+"""
+Call this class as :
+trie = PrefixTrie(32)
+trie.insert(int(ipaddress.IPv4Address("10.0.0.0")), 8, "management")
+print(trie.longest_match(int(ipaddress.IPv4Address("10.1.2.3")), 32))
+"""
+
+
+def mask(value: int, length: int, width: int) -> int:
+    """Keep the first length bits of an address."""
+    return value >> (width - length) << (width - length) if length else 0
+
+
+def bit(value: int, index: int, width: int) -> int:
+    """Return the bit of an address at an index, 0 being the most significant."""
+    return (value >> (width - 1 - index)) & 1
+
+
+class _Node:
+    """A node of the trie: an entry when it holds data, a branching point otherwise, and the entries below it."""
+    __slots__ = ("value", "length", "children", "count", "data")
+
+    def __init__(self, value: int, length: int, data=None):
+        self.value = value
+        self.length = length
+        self.children: list[_Node | None] = [None, None]
+        self.data = data
+        self.count = 0 if data is None else 1
+
+
+class PrefixTrie:
+    """
+    Binary radix trie with path compression, patricia style, of the prefixes of one IP version.
+    Each entry is a prefix holding some data. Every node holds the number of entries below it, so
+    that counting the entries within a prefix is a walk down to that prefix rather than a scan, and
+    finding the entries containing an address is a walk down to the address, at most one node per
+    bit where the prefixes branch.
+    Args:
+        width (int): Bits of an address, 32 for IPv4 and 128 for IPv6.
+    Methods:
+        insert(value, length, data): Add an entry, or replace its data.
+        remove(value, length): Remove an entry.
+        find(value, length): Return the data of an entry.
+        covering(value, length): Return the shortest entry containing a prefix, shorter than it.
+        longest_match(value, length): Return the longest entry containing a prefix.
+        count_under(value, length): Return the number of entries within a prefix.
+        pop_under(value, length): Remove and return the entries within a prefix.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self.root: _Node = None
+
+    def __len__(self) -> int:
+        return self.root.count if self.root is not None else 0
+
+    def _common(self, node: _Node, value: int, length: int) -> int:
+        """Return the length of the prefix shared by a node and a prefix."""
+        return min(self.width - (node.value ^ value).bit_length(), node.length, length)
+
+    def insert(self, value: int, length: int, data) -> bool:
+        """
+        Add an entry, or replace its data.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+            data: The data of the entry, not None.
+        Returns:
+            bool: True if the entry was added, False if it was replaced.
+        """
+        self.root, added = self._insert(self.root, value, length, data)
+        return added
+
+    def _insert(self, node: _Node, value: int, length: int, data) -> tuple[_Node, bool]:
+        if node is None:
+            return _Node(value, length, data), True
+        common = self._common(node, value, length)
+        if common < node.length:
+            # The prefix diverges from the node, or contains it: a new node above it
+            if common == length:
+                parent = _Node(value, length, data)
+            else:
+                parent = _Node(mask(value, common, self.width), common)
+                parent.children[bit(value, common, self.width)] = _Node(value, length, data)
+            parent.children[bit(node.value, common, self.width)] = node
+            parent.count += node.count + (1 if common != length else 0)
+            return parent, True
+        if length == node.length:
+            added = node.data is None
+            node.data = data
+            node.count += added
+            return node, added
+        branch = bit(value, node.length, self.width)
+        node.children[branch], added = self._insert(node.children[branch], value, length, data)
+        node.count += added
+        return node, added
+
+    def remove(self, value: int, length: int) -> bool:
+        """
+        Remove an entry.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+        Returns:
+            bool: True if the entry was removed, False if there was none.
+        """
+        self.root, removed = self._remove(self.root, value, length)
+        return removed
+
+    def _remove(self, node: _Node, value: int, length: int) -> tuple[_Node, bool]:
+        if node is None or self._common(node, value, length) < node.length:
+            return node, False
+        if length == node.length:
+            if node.data is None:
+                return node, False
+            node.data = None
+            node.count -= 1
+            return self._compress(node), True
+        branch = bit(value, node.length, self.width)
+        node.children[branch], removed = self._remove(node.children[branch], value, length)
+        if not removed:
+            return node, False
+        node.count -= 1
+        return self._compress(node), True
+
+    @staticmethod
+    def _compress(node: _Node) -> _Node | None:
+        """Drop a node that is no longer an entry and has less than two children."""
+        if node.data is not None:
+            return node
+        children = [child for child in node.children if child is not None]
+        if len(children) == 2:
+            return node
+        return children[0] if children else None
+
+    def find(self, value: int, length: int):
+        """
+        Return the data of an entry.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+        Returns:
+            object: The data of the entry, None if there is no such entry.
+        """
+        node = self.root
+        while node is not None and self._common(node, value, length) == node.length:
+            if node.length == length:
+                return node.data
+            node = node.children[bit(value, node.length, self.width)]
+        return None
+
+    def covering(self, value: int, length: int) -> tuple[int, int] | None:
+        """
+        Return the shortest entry containing a prefix, and shorter than it.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+        Returns:
+            tuple[int, int] | None: The value and length of the entry, None if the prefix is not covered.
+        """
+        node = self.root
+        while node is not None and node.length < length and self._common(node, value, length) == node.length:
+            if node.data is not None:
+                return node.value, node.length
+            node = node.children[bit(value, node.length, self.width)]
+        return None
+
+    def longest_match(self, value: int, length: int) -> tuple[int, int, object] | None:
+        """
+        Return the longest entry containing a prefix, the prefix itself included.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+        Returns:
+            tuple[int, int, object] | None: The value, length and data of the entry, None if no entry contains the prefix.
+        """
+        width = self.width
+        match = None
+        node = self.root
+        # The prefix checks are inlined, this walk being on the per-message path of the allowlist
+        while node is not None:
+            node_length = node.length
+            if node_length > length or (node.value ^ value) >> (width - node_length):
+                break
+            if node.data is not None:
+                match = node
+            if node_length == length:
+                break
+            node = node.children[(value >> (width - 1 - node_length)) & 1]
+        return None if match is None else (match.value, match.length, match.data)
+
+    def count_under(self, value: int, length: int) -> int:
+        """
+        Return the number of entries within a prefix, the prefix itself included.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+        Returns:
+            int: The number of entries.
+        """
+        node = self.root
+        while node is not None:
+            common = self._common(node, value, length)
+            if node.length >= length:
+                return node.count if common >= length else 0
+            if common < node.length:
+                return 0
+            node = node.children[bit(value, node.length, self.width)]
+        return 0
+
+    def pop_under(self, value: int, length: int) -> list[tuple[int, int]]:
+        """
+        Remove the entries within a prefix, the prefix itself included.
+        Args:
+            value (int): The prefix, masked to its length.
+            length (int): The prefix length.
+        Returns:
+            list[tuple[int, int]]: The value and length of each removed entry.
+        """
+        removed = []
+        self.root = self._pop_under(self.root, value, length, removed)
+        return removed
+
+    def _pop_under(self, node: _Node, value: int, length: int, removed: list) -> _Node | None:
+        if node is None:
+            return None
+        common = self._common(node, value, length)
+        if node.length >= length:
+            if common < length:
+                return node
+            self._collect(node, removed)
+            return None
+        if common < node.length:
+            return node
+        before = len(removed)
+        branch = bit(value, node.length, self.width)
+        node.children[branch] = self._pop_under(node.children[branch], value, length, removed)
+        node.count -= len(removed) - before
+        return self._compress(node)
+
+    def _collect(self, node: _Node, entries: list):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.data is not None:
+                entries.append((node.value, node.length))
+            stack.extend(child for child in node.children if child is not None)
@@ -0,0 +1,154 @@
+import math
+
+"""
+Call this class as :
+wheel = TimerWheel(resolution=1.0, now=time.time())
+wheel.schedule(("sshd", "1.2.3.4"), deadline=time.time() + 600, data=0)
+wheel.cancel(("sshd", "1.2.3.4"))
+for key, deadline, data in wheel.advance(time.time()):
+    print("Expired", key)
+"""
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel, the timers of the Linux kernel style, holding a deadline per key.
+    Time is cut into ticks of resolution seconds. The first level has a slot per tick for the next
+    2**bits ticks, each next level a slot per 2**bits slots of the level below, so that levels of
+    2**bits slots cover 2**(bits * levels) ticks. A timer goes to the slot of the coarsest level its
+    delay needs, and is moved down a level each time the wheel below it wraps, until it fires from the
+    first level. Scheduling and cancelling a timer are a dict insertion and deletion in its slot,
+    whatever the number of timers; advancing the wheel costs a slot per elapsed tick plus the moves.
+    The timers further than the wheel covers wait in the last slot of the last level, moved again
+    until in reach. A timer never fires before its deadline, and at most a tick after it.
+    Args:
+        resolution (float): Seconds per tick.
+        bits (int): Bits of the slot index in each level, 2**bits slots per level.
+        levels (int): Number of levels.
+        now (float): The current time, in the unit of the deadlines.
+    Attributes:
+        _wheels (list[list[dict]]): The slots of each level, each mapping the keys to their timer.
+        _timers (dict): The timer of each key: tick, deadline, data, level and slot index.
+        _tick (int): The last tick processed.
+    Methods:
+        schedule(key, deadline, data): Add a timer, or move it if the key is already scheduled.
+        cancel(key): Remove a timer.
+        get(key): Return the deadline and the data of a timer.
+        advance(now): Process the elapsed ticks and return the timers expired.
+        items(): Return every timer.
+    """
+
+    def __init__(self, resolution: float = 1.0, bits: int = 6, levels: int = 4, now: float = 0.0):
+        if resolution <= 0 or bits < 1 or levels < 1:
+            raise ValueError(f"Invalid timer wheel: resolution {resolution}, {bits} bits, {levels} levels")
+        self._resolution = resolution
+        self._bits = bits
+        self._mask = (1 << bits) - 1
+        self._levels = levels
+        self._span = 1 << (bits * levels)
+        self._wheels: list[list[dict]] = [[{} for _ in range(1 << bits)] for _ in range(levels)]
+        self._timers: dict = {}
+        self._tick = math.floor(now / resolution)
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key) -> bool:
+        return key in self._timers
+
+    def schedule(self, key, deadline: float, data=None):
+        """
+        Add a timer, or move it if the key is already scheduled.
+        Args:
+            key (Hashable): The key of the timer.
+            deadline (float): The time the timer expires at; a past deadline fires on the next tick.
+            data (Any): Data returned with the timer when it expires.
+        """
+        self.cancel(key)
+        # Never into the slot of the current tick, already processed
+        tick = max(math.ceil(deadline / self._resolution), self._tick + 1)
+        timer = [tick, deadline, data, 0, 0]
+        self._timers[key] = timer
+        self._place(key, timer)
+
+    def cancel(self, key):
+        """
+        Remove a timer.
+        Args:
+            key (Hashable): The key of the timer.
+        Returns:
+            Any: The data of the timer, None if the key was not scheduled.
+        """
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return None
+        del self._wheels[timer[3]][timer[4]][key]
+        return timer[2]
+
+    def get(self, key) -> tuple[float, object] | None:
+        """
+        Return the deadline and the data of a timer.
+        Args:
+            key (Hashable): The key of the timer.
+        Returns:
+            tuple[float, Any] | None: The deadline and the data, None if the key is not scheduled.
+        """
+        timer = self._timers.get(key)
+        return None if timer is None else (timer[1], timer[2])
+
+    def items(self) -> list[tuple[object, float, object]]:
+        """
+        Return every timer.
+        Returns:
+            list[tuple[Hashable, float, Any]]: The key, deadline and data of each timer.
+        """
+        return [(key, timer[1], timer[2]) for key, timer in self._timers.items()]
+
+    def advance(self, now: float) -> list[tuple[object, float, object]]:
+        """
+        Process the ticks elapsed up to a time and return the timers expired, removed from the wheel.
+        Args:
+            now (float): The current time, in the unit of the deadlines.
+        Returns:
+            list[tuple[Hashable, float, Any]]: The key, deadline and data of each timer expired, in deadline order per tick.
+        """
+        end = math.floor(now / self._resolution)
+        expired = []
+        wheels, mask, bits = self._wheels, self._mask, self._bits
+        while self._tick < end:
+            if not self._timers:
+                self._tick = end
+                break
+            tick = self._tick = self._tick + 1
+            # Each time a level wraps, the next slot of the level above is moved down
+            level, index = 1, tick & mask
+            while index == 0 and level < self._levels:
+                index = (tick >> (bits * level)) & mask
+                slot = wheels[level][index]
+                if slot:
+                    wheels[level][index] = {}
+                    for key, timer in slot.items():
+                        self._place(key, timer)
+                level += 1
+            slot = wheels[0][tick & mask]
+            if slot:
+                wheels[0][tick & mask] = {}
+                for key, timer in slot.items():
+                    del self._timers[key]
+                    expired.append((key, timer[1], timer[2]))
+        return expired
+
+    def _place(self, key, timer: list):
+        """Put a timer in the slot of the coarsest level its delay needs, relative to the current tick."""
+        tick = timer[0]
+        delay = tick - self._tick
+        if delay >= self._span:
+            # Out of reach, parked in the last slot in reach and moved again when it comes
+            tick = self._tick + self._span - 1
+            delay = self._span - 1
+        level = 0
+        while delay >= 1 << (self._bits * (level + 1)):
+            level += 1
+        index = (tick >> (self._bits * level)) & self._mask
+        timer[3], timer[4] = level, index
+        self._wheels[level][index][key] = timer
@@ -1,28 +1,18 @@
-import socket
 import logging
 
+from src.utils.node_identity import node_identity
+
 logger = logging.getLogger(__name__)
 
 def get_local_ip():
     """
     Get the local IP address of the machine.
+    Kept for compatibility, the address is the cached primary address of the node identity.
 
     Returns:
-        str|IPvAnyAddress: The local IP address of the machine.
-    Raises:
-        Exception: If there is an error retrieving the local IP address.
+        str: The local IP address of the machine.
     """
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        # Doesn't need to be reachable
-        s.connect(('10.255.255.255', 1))
-        ip = s.getsockname()[0]
-    except Exception as e:
-        logger.error("Failed to get local IP address: %s", e)
-        ip = '127.0.0.1'
-    finally:
-        s.close()
-    return ip
+    return str(node_identity.get_primary_ip())
 
 def extract_ip_address_from_socket_address(socket_address: str) -> str:
     """
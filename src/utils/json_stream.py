@@ -0,0 +1,221 @@
+import codecs
+import json
+import re
+from typing import Any, AsyncIterable, AsyncIterator
+
+"""
+Incremental JSON parsing of a request body received in chunks, so that a batch of alerts is
+validated item by item without holding the whole body in memory. Both generators yield
+(index, item) pairs where item is either the decoded JSON value or the ValueError explaining why
+that item could not be decoded.
+"""
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+# A literal or a number ends at the first of these
+_DELIMITERS = _WHITESPACE + ",]}"
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+MAX_ITEM_SIZE = 1 << 20
+
+
+async def _iter_text(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Decode the UTF-8 chunks, keeping multibyte characters split across chunks intact."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        if chunk:
+            yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def iter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[tuple[int, Any]]:
+    """
+    Parse a newline delimited JSON body, one value per line. Blank lines are ignored and a
+    malformed line only invalidates its own item. A line longer than MAX_ITEM_SIZE characters is
+    an invalid item too, skipped up to its newline without being buffered.
+    Args:
+        chunks (AsyncIterable[bytes]): The body chunks, e.g. Request.stream().
+    Yields:
+        tuple[int, Any]: The index of the item and the decoded value or a ValueError.
+    """
+    index = 0
+    # The start of the current line, only the new text being searched for its end
+    pieces: list[str] = []
+    size = 0
+    skipping = False
+    async for text in _iter_text(chunks):
+        *ends, text = text.split("\n")
+        for end in ends:
+            if not skipping:
+                if size + len(end) > MAX_ITEM_SIZE:
+                    yield index, ValueError("JSON line too large")
+                    index += 1
+                else:
+                    line = "".join(pieces) + end
+                    if line.strip():
+                        yield index, _loads(line)
+                        index += 1
+            pieces, size, skipping = [], 0, False
+        if skipping or not text:
+            continue
+        pieces.append(text)
+        size += len(text)
+        if size > MAX_ITEM_SIZE:
+            yield index, ValueError("JSON line too large")
+            index += 1
+            pieces, size, skipping = [], 0, True
+    line = "".join(pieces)
+    if line.strip():
+        yield index, _loads(line)
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes]) -> AsyncIterator[tuple[int, Any]]:
+    """
+    Parse a JSON array body item by item. A malformed array cannot be resynchronized, so the
+    parsing stops after yielding the ValueError.
+    Args:
+        chunks (AsyncIterable[bytes]): The body chunks, e.g. Request.stream().
+    Yields:
+        tuple[int, Any]: The index of the item and the decoded value or a ValueError.
+    """
+    parser = _JsonArrayParser()
+    async for text in _iter_text(chunks):
+        for item in parser.feed(text):
+            yield item
+    for item in parser.feed("", final=True):
+        yield item
+
+
+class _JsonArrayParser:
+    """
+    Push parser of a JSON array, holding at most one incomplete item in its buffer.
+    The end of the incomplete item is searched for in the new text only, resuming the scan where
+    the previous piece stopped, and the item is decoded once complete, so that an item received in
+    many pieces is read a bounded number of times.
+    Attributes:
+        buffer (str): Text received but not consumed yet.
+        state (str): "start", "first", "item", "separator" or "end".
+        index (int): Index of the next item.
+        done (bool): True once the array is complete or malformed.
+        _scanned (int): Length of the incomplete item already scanned.
+        _depth (int): Objects and arrays open at the end of the scanned text.
+        _in_string (bool): Whether the scanned text ends within a string.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.state = "start"
+        self.index = 0
+        self.done = False
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, text: str, final: bool = False) -> list[tuple[int, Any]]:
+        """
+        Consume a piece of the body.
+        Args:
+            text (str): The next piece of the body.
+            final (bool): True once the whole body was received.
+        Returns:
+            list[tuple[int, Any]]: The items completed by this piece.
+        """
+        items = []
+        buffer = self.buffer + text
+        position = 0
+        while not self.done:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+            if self.state == "start":
+                if char != "[":
+                    items.append(self._fail("Expected a JSON array"))
+                    break
+                position += 1
+                self.state = "first"
+            elif self.state in ("first", "item"):
+                if self.state == "first" and char == "]":
+                    position += 1
+                    self.state = "end"
+                    continue
+                if not final and not self._item_complete(buffer, position):
+                    if len(buffer) - position > MAX_ITEM_SIZE:
+                        items.append(self._fail("JSON item too large"))
+                    break
+                self._scanned, self._depth, self._in_string = 0, 0, False
+                try:
+                    value, end = _decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    items.append(self._fail(f"Invalid JSON item: {e.msg}"))
+                    break
+                items.append((self.index, value))
+                self.index += 1
+                position = end
+                self.state = "separator"
+            elif self.state == "separator":
+                if char not in ",]":
+                    items.append(self._fail(f"Expected ',' or ']' but found {char!r}"))
+                    break
+                position += 1
+                self.state = "end" if char == "]" else "item"
+            else:
+                items.append(self._fail("Unexpected data after the JSON array"))
+                break
+        self.buffer = buffer[position:]
+        if final and not self.done and self.state != "end":
+            items.append(self._fail("Truncated JSON array"))
+        return items
+
+    def _item_complete(self, buffer: str, start: int) -> bool:
+        """
+        Scan the item starting at start for its end, from where the previous scan stopped.
+        Only the strings and the brackets are followed, the item being validated once decoded.
+        Args:
+            buffer (str): The text received.
+            start (int): The position of the first character of the item.
+        Returns:
+            bool: True once the buffer holds the whole item, and for a literal or a number the delimiter after it.
+        """
+        position = start + self._scanned
+        if buffer[start] not in '{["':
+            while position < len(buffer) and buffer[position] not in _DELIMITERS:
+                position += 1
+            self._scanned = position - start
+            return position < len(buffer)
+        while True:
+            match = (_STRING_SPECIAL if self._in_string else _STRUCTURAL).search(buffer, position)
+            if match is None:
+                self._scanned = len(buffer) - start
+                return False
+            char, position = match.group(), match.end()
+            if char == "\\":
+                if position >= len(buffer):
+                    # Rescan the backslash, its escaped character is in the next piece
+                    self._scanned = position - 1 - start
+                    return False
+                position += 1
+            elif char == '"':
+                self._in_string = not self._in_string
+                if not self._in_string and self._depth == 0:
+                    return True
+            elif char in "{[":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth <= 0:
+                    return True
+
+    def _fail(self, message: str) -> tuple[int, ValueError]:
+        self.done = True
+        return self.index, ValueError(message)
+
+
+def _loads(line: str) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return ValueError(f"Invalid JSON line: {e.msg}")
@@ -1,28 +1,215 @@
+import atexit
+import copy
+import json
 import logging
+import queue
 import sys
+import threading
+import time
+from datetime import datetime, UTC
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_logging(log_level: str = "INFO", log_file: str = None):
+from src.config.settings import settings
+from src.shared.metrics import metrics
+
+"""
+Logging of the application: the records are handed over to a bounded queue by the logging threads
+and written to stdout and the log file by a listener thread, so that the hot path never waits on
+I/O. A record only has its message resolved in the logging thread, its formatting, as text or JSON,
+is left to the listener. Sampling and rate limiting per logger keep the per-message events from
+flooding the output, the suppressed count being reported on the next record that goes through.
+Call this class as :
+setup_logging(log_level="INFO", log_file="app.log", log_format="json")
+logger = logging.getLogger(__name__)
+logger.info("Banned %s on %s", ip, jail)
+...
+stop_logging()
+"""
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_dropped = metrics.counter("ids2zmq_log_records_dropped_total", "Log records not written, by reason.", labels=("reason",))
+_dropped_full, _dropped_rate_limited, _dropped_sampled = (
+    _dropped.labels(reason) for reason in ("queue_full", "rate_limited", "sampled"))
+
+# The attributes of every LogRecord, the others come from the extra argument of the logging call
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "suppressed"}
+
+_listener: QueueListener = None
+_listener_lock = threading.Lock()
+
+
+class TextFormatter(logging.Formatter):
+    """The usual text lines, followed by the number of records suppressed before this one, if any."""
+
+    def __init__(self, fmt: str = TEXT_FORMAT, **kwargs):
+        super().__init__(fmt, **kwargs)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{line} [{suppressed} similar records suppressed]" if suppressed else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, the extra fields of the call and the exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sampling and rate limiting of the records, per logger and level.
+    Args:
+        sample_rate (float): Fraction of the INFO and DEBUG records kept, 1 in round(1 / sample_rate).
+        rate_limit (float): Records per second let through per logger and level, in bursts of as many; 0 for no limit.
+    The CRITICAL records are always kept. A kept record carries in its suppressed attribute the
+    number of records of its logger and level dropped since the previous kept one.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, rate_limit: float = 0.0):
+        super().__init__()
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.rate_limit = rate_limit
+        self.burst = max(1.0, rate_limit)
+        # Per (logger, level): [tokens, last refill, records suppressed, records seen]
+        self._states: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.name, record.levelno)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = [self.burst, time.monotonic(), 0, 0]
+            state[3] += 1
+            if record.levelno <= logging.INFO and self.sample_every != 1:
+                if not self.sample_every or (state[3] - 1) % self.sample_every:
+                    state[2] += 1
+                    _dropped_sampled.inc()
+                    return False
+            if self.rate_limit:
+                now = time.monotonic()
+                state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate_limit)
+                state[1] = now
+                if state[0] < 1:
+                    state[2] += 1
+                    _dropped_rate_limited.inc()
+                    return False
+                state[0] -= 1
+            record.suppressed, state[2] = state[2], 0
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler dropping the records when the queue is full rather than blocking or raising.
+    Only the message is resolved in the logging thread, as its arguments may change afterwards.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped_full.inc()
+
+
+def setup_logging(log_level: str = None, log_file: str = None, log_format: str = None, async_logging: bool = None,
+                  queue_size: int = None, sample_rate: float = None, rate_limit: float = None):
     """
     Configure the logging settings for the application.
+    Args:
+        log_level (str): Logging level, LOG_LEVEL by default.
+        log_file (str): File the records are also written to, none if empty.
+        log_format (str): "text" or "json", LOG_FORMAT by default.
+        async_logging (bool): Write the records from a listener thread, LOG_ASYNC by default.
+        queue_size (int): Maximum records waiting for the listener thread, LOG_QUEUE_SIZE by default.
+        sample_rate (float): Fraction of the INFO and DEBUG records kept per logger, LOG_SAMPLE_RATE by default.
+        rate_limit (float): Records per second kept per logger and level, LOG_RATE_LIMIT by default.
+    Raises:
+        ValueError: If the level or the format is invalid.
     """
+    log_level = settings.LOG_LEVEL if log_level is None else log_level
+    log_format = settings.LOG_FORMAT if log_format is None else log_format
+    async_logging = settings.LOG_ASYNC if async_logging is None else async_logging
     numeric_level = getattr(logging, log_level.upper(), None)
     if not isinstance(numeric_level, int):
         raise ValueError(f"Invalid log level: {log_level}")
+    if log_format.lower() not in ("text", "json"):
+        raise ValueError(f"Invalid log format: {log_format}")
 
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
-
-    logging.basicConfig(
-        level=numeric_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
 
+    formatter = JsonFormatter() if log_format.lower() == "json" else TextFormatter()
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
     if log_file:
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-        logging.getLogger().addHandler(file_handler)
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    sampling = SamplingFilter(sample_rate=settings.LOG_SAMPLE_RATE if sample_rate is None else sample_rate,
+                              rate_limit=settings.LOG_RATE_LIMIT if rate_limit is None else rate_limit)
+
+    if async_logging:
+        global _listener
+        queue_handler = DroppingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE if queue_size is None else queue_size))
+        queue_handler.addFilter(sampling)
+        with _listener_lock:
+            _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            _listener.start()
+        root.addHandler(queue_handler)
+    else:
+        for handler in handlers:
+            handler.addFilter(sampling)
+            root.addHandler(handler)
+    root.setLevel(numeric_level)
+
+    logging.getLogger(__name__).info("Logging configured with level %s, %s format%s", log_level, log_format,
+                                     ", asynchronous" if async_logging else "")
+
+
+def stop_logging():
+    """Write the records still queued and stop the listener thread, if any."""
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
 
-    logging.getLogger(__name__).info(f"Logging configured with level {log_level}")
\ No newline at end of file
+atexit.register(stop_logging)
@@ -0,0 +1,209 @@
+import fcntl
+import ipaddress
+import socket
+import struct
+import threading
+import logging
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+"""
+Call this class as :
+node_identity.start()
+if node_identity.is_local("10.0.0.2"):
+    print("This is me")
+alert.target_ip = node_identity.get_primary_ip()
+"""
+
+_SIOCGIFADDR = 0x8915
+_IF_INET6_PATH = "/proc/net/if_inet6"
+
+
+class NodeIdentity:
+    """
+    Network identity of this node: every local IPv4 and IPv6 address of every interface, and the
+    primary address used to stamp the received alerts.
+    The addresses are enumerated once, then refreshed in a background thread or on demand, so that
+    checking whether an address is local is a set lookup and the primary address a cached value,
+    with no socket opened on the per-message path.
+    Args:
+        refresh_interval (float): Seconds between two background refreshes.
+    Attributes:
+        _addresses (frozenset[IPv4Address | IPv6Address]): The local addresses.
+        _primary_ip (IPv4Address | IPv6Address): The address of the interface holding the default route.
+        _refresh_lock (threading.Lock): Lock preventing concurrent refreshes.
+        _stop_event (threading.Event): Event used to stop the background refresh thread.
+        _thread (threading.Thread): The background refresh thread once started.
+    Methods:
+        refresh(): Enumerate the local addresses again.
+        is_local(address): Check whether an address designates this node.
+        get_primary_ip(): Return the primary address of this node.
+        get_addresses(): Return the local addresses.
+        start(): Start the background refresh thread.
+        stop(): Stop the background refresh thread.
+    """
+
+    def __init__(self, refresh_interval: float = None):
+        self._refresh_interval = settings.NODE_IDENTITY_REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        self._addresses: frozenset = frozenset()
+        self._primary_ip = ipaddress.IPv4Address("127.0.0.1")
+        self._loaded = False
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def refresh(self) -> frozenset:
+        """
+        Enumerate the local addresses and resolve the primary address again.
+        Returns:
+            frozenset[IPv4Address | IPv6Address]: The local addresses.
+        """
+        with self._refresh_lock:
+            addresses = {ipaddress.IPv4Address("127.0.0.1"), ipaddress.IPv6Address("::1")}
+            addresses.update(self._interface_ipv4_addresses())
+            addresses.update(self._interface_ipv6_addresses())
+            addresses.update(self._resolved_addresses())
+            primary_ip = self._route_primary_ip()
+            if primary_ip is not None:
+                addresses.add(primary_ip)
+            self._addresses = frozenset(addresses)
+            self._primary_ip = primary_ip or self._fallback_primary_ip()
+            self._loaded = True
+            logger.debug(f"Local addresses refreshed: primary {self._primary_ip}, {sorted(map(str, self._addresses))}")
+            return self._addresses
+
+    def is_local(self, address) -> bool:
+        """
+        Check whether an address designates this node.
+        Host names are not resolved, to keep the check free of any lookup, and are never local.
+        Args:
+            address (str | IPv4Address | IPv6Address): The address to check.
+        Returns:
+            bool: True if it is one of the local addresses or the unspecified address, False otherwise.
+        """
+        if not self._loaded:
+            self.refresh()
+        if not isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            try:
+                address = ipaddress.ip_address(str(address).strip("[]").split("%", 1)[0])
+            except ValueError:
+                return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return address in self._addresses or address.is_unspecified
+
+    def get_primary_ip(self) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+        """
+        Return the primary address of this node, the one of the interface holding the default route.
+        Returns:
+            IPv4Address | IPv6Address: The primary address, 127.0.0.1 when the node has no route.
+        """
+        if not self._loaded:
+            self.refresh()
+        return self._primary_ip
+
+    def get_addresses(self) -> frozenset:
+        """
+        Return the local addresses, loading them on first use.
+        Returns:
+            frozenset[IPv4Address | IPv6Address]: The local addresses.
+        """
+        if not self._loaded:
+            self.refresh()
+        return self._addresses
+
+    def start(self):
+        """Start the background refresh thread."""
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Node identity refresh already running.")
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="node-identity", daemon=True)
+        self._thread.start()
+        logger.info(f"Node identity refreshing every {self._refresh_interval}s.")
+
+    def stop(self):
+        """Stop the background refresh thread."""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        logger.info("Node identity refresh stopped.")
+
+    def _refresh_loop(self):
+        """Refresh the addresses every refresh_interval seconds until stopped."""
+        self._safe_refresh()
+        while not self._stop_event.wait(self._refresh_interval):
+            self._safe_refresh()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing local addresses: {e}")
+
+    @staticmethod
+    def _interface_ipv4_addresses() -> set:
+        """The IPv4 address of every interface, read with the SIOCGIFADDR ioctl."""
+        addresses = set()
+        try:
+            interfaces = socket.if_nameindex()
+        except OSError as e:
+            logger.debug(f"Unable to list the network interfaces: {e}")
+            return addresses
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for _, name in interfaces:
+                try:
+                    request = struct.pack("256s", name.encode("utf-8")[:15])
+                    addresses.add(ipaddress.IPv4Address(fcntl.ioctl(sock.fileno(), _SIOCGIFADDR, request)[20:24]))
+                except OSError:
+                    continue  # Interface without IPv4 address
+        return addresses
+
+    @staticmethod
+    def _interface_ipv6_addresses() -> set:
+        """The IPv6 addresses of every interface, read from /proc/net/if_inet6."""
+        addresses = set()
+        try:
+            with open(_IF_INET6_PATH) as file:
+                for line in file:
+                    fields = line.split()
+                    if fields:
+                        addresses.add(ipaddress.IPv6Address(bytes.fromhex(fields[0])))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Unable to read the IPv6 addresses: {e}")
+        return addresses
+
+    @staticmethod
+    def _resolved_addresses() -> set:
+        """The addresses the host name resolves to, covering the systems without ioctl nor procfs."""
+        addresses = set()
+        try:
+            for info in socket.getaddrinfo(socket.gethostname(), None):
+                addresses.add(ipaddress.ip_address(info[4][0].split("%", 1)[0]))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Unable to resolve the host name: {e}")
+        return addresses
+
+    @staticmethod
+    def _route_primary_ip() -> ipaddress.IPv4Address | ipaddress.IPv6Address | None:
+        """The source address of the default route, found by connecting a UDP socket without sending anything."""
+        for family, target in ((socket.AF_INET, ("10.255.255.255", 1)), (socket.AF_INET6, ("fd00::ffff", 1))):
+            try:
+                with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                    sock.connect(target)
+                    return ipaddress.ip_address(sock.getsockname()[0].split("%", 1)[0])
+            except OSError:
+                continue
+        return None
+
+    def _fallback_primary_ip(self) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+        """The first global address when there is no route, loopback otherwise."""
+        candidates = sorted((address for address in self._addresses if not address.is_loopback and not address.is_link_local),
+                            key=lambda address: (address.version, int(address)))
+        return candidates[0] if candidates else ipaddress.IPv4Address("127.0.0.1")
+
+
+node_identity = NodeIdentity()
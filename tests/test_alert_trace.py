@@ -0,0 +1,99 @@
+import asyncio
+import ipaddress
+import unittest
+from datetime import datetime, UTC
+from unittest.mock import MagicMock, patch
+
+import zmq
+
+from src.api.routes import get_routes
+from src.fail2ban.action import Fail2banAction
+from src.ids2zmq.codec import BinaryCodec, JsonCodec
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+from src.services.publish_msg_service import PublishMsgService
+from src.shared import alert_trace
+from src.shared.alert_trace import LatencyTracker
+
+DETECTED = datetime(2025, 1, 2, 3, 4, 5, tzinfo=UTC)
+DETECTED_NS = int(DETECTED.timestamp()) * 1_000_000_000
+
+
+def make_alert(origin: str = "00000000000000aa", trace: dict = None) -> AlertModel:
+    return AlertModel.model_construct(ip=ipaddress.ip_address("198.51.100.7"), action=Fail2banAction.BAN,
+                                      jail="sshd", timestamp=DETECTED, origin=origin, trace=trace)
+
+
+class TestAlertTrace(unittest.TestCase):
+    def test_stamp_only_when_enabled(self):
+        alert = make_alert()
+        with patch("src.shared.alert_trace.settings.ALERT_TRACE_ENABLED", False):
+            alert_trace.stamp(alert, alert_trace.API)
+        self.assertIsNone(alert.trace)
+        with patch("src.shared.alert_trace.settings.ALERT_TRACE_ENABLED", True):
+            alert_trace.stamp(alert, alert_trace.API, at=42)
+        self.assertEqual(alert.trace, {alert_trace.API: 42})
+
+    def test_codecs_carry_the_trace(self):
+        trace = {alert_trace.API: DETECTED_NS + 1000, alert_trace.PUBLISH: DETECTED_NS + 250_000}
+        with patch("src.fail2ban.jail_registry.jail_registry.is_active", return_value=True):
+            for codec in (BinaryCodec, JsonCodec):
+                self.assertEqual(codec.decode(codec.encode(make_alert(trace=trace))).trace, trace)
+                self.assertIsNone(codec.decode(codec.encode(make_alert())).trace)
+
+    def test_binary_codec_skips_unknown_stages(self):
+        with patch("src.fail2ban.jail_registry.jail_registry.is_active", return_value=True):
+            decoded = BinaryCodec.decode(BinaryCodec.encode(make_alert(trace={"future": 1, alert_trace.API: 2})))
+        self.assertEqual(decoded.trace, {alert_trace.API: 2})
+
+    def test_tracker_percentiles_per_peer(self):
+        tracker = LatencyTracker(window=100)
+        for index in range(1, 201):
+            trace = {alert_trace.PUBLISH: DETECTED_NS + 1_000_000, alert_trace.BAN: DETECTED_NS + index * 1_000_000}
+            tracker.record(make_alert(trace=trace))
+        tracker.record(make_alert(origin="00000000000000bb", trace={alert_trace.BAN: DETECTED_NS + 5_000_000}))
+        self.assertIsNone(tracker.record(make_alert(trace={alert_trace.API: DETECTED_NS})))
+
+        summary = tracker.summary()
+        # Only the 100 most recent bans of the peer are kept: 101 ms to 200 ms
+        peer = summary["peers"]["00000000000000aa"]
+        self.assertEqual(peer["count"], 100)
+        self.assertAlmostEqual(peer["p50"], 0.150)
+        self.assertAlmostEqual(peer["p99"], 0.199)
+        self.assertAlmostEqual(peer["max"], 0.200)
+        self.assertAlmostEqual(summary["peers"]["00000000000000bb"]["p50"], 0.005)
+        self.assertEqual(list(summary["stages"]), [alert_trace.PUBLISH, alert_trace.BAN])
+        self.assertAlmostEqual(summary["stages"][alert_trace.PUBLISH]["max"], 0.001)
+
+    def test_publisher_to_subscriber_adds_remote_stages(self):
+        context = zmq.Context()
+        publisher = ZMQPublisher(context=context)
+        subscriber = ZMQSubscriber(on_alert_callback=lambda alert: None, context=context)
+        try:
+            with patch("src.shared.alert_trace.settings.ALERT_TRACE_ENABLED", True), \
+                    patch("src.fail2ban.jail_registry.jail_registry.is_active", return_value=True):
+                alert = PublishMsgService._prepare_alert(make_alert(trace={alert_trace.API: DETECTED_NS}))
+                frames = publisher._build_frames(items=[publisher._encode_item(alert=alert)])
+                (received,) = subscriber._decode_frames(frames=frames)
+                received = subscriber._callback_argument(received)
+            self.assertEqual(list(received.trace), [alert_trace.API, alert_trace.PUBLISH, alert_trace.RECEIVE,
+                                                    alert_trace.DECRYPT, alert_trace.VALIDATE, alert_trace.ENQUEUE])
+            self.assertLessEqual(received.trace[alert_trace.PUBLISH], received.trace[alert_trace.RECEIVE])
+        finally:
+            subscriber.stop()
+            publisher.close()
+            context.term()
+
+    def test_latency_endpoint(self):
+        router = get_routes(MagicMock(spec=PublishMsgService))
+        endpoint = next(route.endpoint for route in router.routes if route.path == "/latency")
+        tracker = LatencyTracker(window=10)
+        tracker.record(make_alert(trace={alert_trace.BAN: DETECTED_NS + 2_000_000}))
+        with patch("src.api.routes.latency_tracker", tracker):
+            summary = asyncio.run(endpoint())
+        self.assertAlmostEqual(summary["peers"]["00000000000000aa"]["p90"], 0.002)
+
+
+if __name__ == "__main__":
+    unittest.main()
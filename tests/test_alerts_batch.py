@@ -0,0 +1,141 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.api.routes import get_routes
+from src.services.publish_msg_service import PublishMsgService
+from src.shared.dedup_engine import dedup_engine
+from src.utils import json_stream
+from src.utils.json_stream import iter_json_array, iter_ndjson
+
+
+async def _chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def _collect(iterator):
+    return [item async for item in iterator]
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, content_type: str = "application/json", chunk_size: int = 7):
+        self.headers = {"content-type": content_type}
+        self._body = body
+        self._chunk_size = chunk_size
+
+    def stream(self):
+        return _chunks(self._body, self._chunk_size)
+
+
+class TestJsonStream(unittest.TestCase):
+    def test_json_array_split_in_small_chunks(self):
+        values = [{"ip": "1.2.3.4", "reason": "é ü"}, {"ip": "5.6.7.8"}, 12345, "text", None]
+        body = json.dumps(values).encode()
+        for size in (1, 3, 64):
+            items = asyncio.run(_collect(iter_json_array(_chunks(body, size))))
+            self.assertEqual([value for _, value in items], values)
+            self.assertEqual([index for index, _ in items], list(range(len(values))))
+
+    def test_empty_json_array(self):
+        self.assertEqual(asyncio.run(_collect(iter_json_array(_chunks(b" [ ] ", 2)))), [])
+
+    def test_malformed_json_array_stops(self):
+        items = asyncio.run(_collect(iter_json_array(_chunks(b'[{"ip": "1.2.3.4"} {"ip": "5.6.7.8"}]', 4))))
+        self.assertEqual(items[0], (0, {"ip": "1.2.3.4"}))
+        self.assertIsInstance(items[1][1], ValueError)
+        self.assertEqual(len(items), 2)
+
+    def test_truncated_json_array(self):
+        items = asyncio.run(_collect(iter_json_array(_chunks(b'[{"ip": "1.2.3.4"}, {"ip": ', 5))))
+        self.assertEqual(len(items), 2)
+        self.assertIsInstance(items[1][1], ValueError)
+
+    def test_ndjson_invalid_line_is_isolated(self):
+        body = b'{"a": 1}\n\nnot json\n{"b": 2}'
+        items = asyncio.run(_collect(iter_ndjson(_chunks(body, 3))))
+        self.assertEqual(items[0], (0, {"a": 1}))
+        self.assertIsInstance(items[1][1], ValueError)
+        self.assertEqual(items[2], (2, {"b": 2}))
+
+    def test_item_decoded_once_whatever_the_chunks(self):
+        values = [{"reason": 'a "quoted" \\ [text] {x}', "nested": [[1, 2], {"k": "]"}]}, "\\", [], 1.5e3, True]
+        body = json.dumps(values).encode()
+        with patch.object(json_stream, "_decoder", wraps=json_stream._decoder) as decoder:
+            items = asyncio.run(_collect(iter_json_array(_chunks(body, 1))))
+        self.assertEqual([value for _, value in items], values)
+        self.assertEqual(decoder.raw_decode.call_count, len(values))
+
+    @patch.object(json_stream, "MAX_ITEM_SIZE", 32)
+    def test_json_array_item_too_large(self):
+        body = b'[{"ip": "1.2.3.4"}, {"reason": "' + b"x" * 64 + b'"}]'
+        items = asyncio.run(_collect(iter_json_array(_chunks(body, 8))))
+        self.assertEqual(items[0], (0, {"ip": "1.2.3.4"}))
+        self.assertEqual(str(items[1][1]), "JSON item too large")
+
+    @patch.object(json_stream, "MAX_ITEM_SIZE", 32)
+    def test_ndjson_line_too_large_is_skipped(self):
+        body = b'{"a": 1}\n{"reason": "' + b"x" * 64 + b'"}\n{"b": 2}'
+        for size in (5, 200):
+            items = asyncio.run(_collect(iter_ndjson(_chunks(body, size))))
+            self.assertEqual(items[0], (0, {"a": 1}))
+            self.assertEqual(str(items[1][1]), "JSON line too large")
+            self.assertEqual(items[2], (2, {"b": 2}))
+
+
+@patch("src.models.alert_model.jail_registry.is_active", side_effect=lambda jail: jail == "sshd")
+class TestAlertsBatchRoute(unittest.TestCase):
+    def setUp(self):
+        dedup_engine.clear()
+        self.service = MagicMock(spec=PublishMsgService)
+
+    def _call(self, request):
+        router = get_routes(self.service)
+        endpoint = next(route.endpoint for route in router.routes if route.path == "/alerts/batch")
+        return asyncio.run(endpoint(request))
+
+    def test_json_array_batch(self, mock_active):
+        alerts = [
+            {"ip": "1.2.3.4", "jail": "sshd"},
+            {"ip": "1.2.3.4", "jail": "sshd"},
+            {"ip": "not an ip", "jail": "sshd"},
+            {"ip": "5.6.7.8", "jail": "unknown"},
+            {"ip": "5.6.7.8", "jail": "sshd", "action": "unbanip"},
+        ]
+        response = self._call(FakeRequest(json.dumps(alerts).encode()))
+        self.assertEqual((response["accepted"], response["duplicate"], response["invalid"]), (2, 1, 2))
+        self.assertEqual([r["status"] for r in response["results"]],
+                         ["accepted", "duplicate", "invalid", "invalid", "accepted"])
+        published = self.service.publish_alerts_async.call_args.args[0]
+        self.assertEqual([str(alert.ip) for alert in published], ["1.2.3.4", "5.6.7.8"])
+
+    def test_ndjson_batch(self, mock_active):
+        body = b'{"ip": "1.2.3.4"}\n{broken\n{"ip": "9.9.9.9"}\n'
+        response = self._call(FakeRequest(body, content_type="application/x-ndjson"))
+        self.assertEqual((response["accepted"], response["invalid"]), (2, 1))
+        self.service.publish_alerts_async.assert_awaited_once()
+
+    def test_already_processed_alert_is_duplicate(self, mock_active):
+        dedup_engine.register(ip="1.2.3.4", jail="sshd", action="banip")
+        response = self._call(FakeRequest(b'[{"ip": "1.2.3.4"}]'))
+        self.assertEqual(response["duplicate"], 1)
+        self.service.publish_alerts_async.assert_awaited_once_with([])
+
+    @patch("src.api.routes.settings")
+    def test_batch_size_limit(self, mock_settings, mock_active):
+        mock_settings.API_BATCH_MAX_ITEMS = 2
+        alerts = [{"ip": f"10.0.0.{i}"} for i in range(5)]
+        response = self._call(FakeRequest(json.dumps(alerts).encode()))
+        self.assertEqual((response["accepted"], response["rejected"]), (2, 1))
+
+    def test_publish_failure_marks_items_as_error(self, mock_active):
+        self.service.publish_alerts_async.side_effect = RuntimeError("socket closed")
+        response = self._call(FakeRequest(b'[{"ip": "1.2.3.4"}]'))
+        self.assertEqual(response["accepted"], 0)
+        self.assertEqual(response["results"][0]["status"], "error")
+        self.assertFalse(dedup_engine.is_duplicate(ip="1.2.3.4", jail="sshd", action="banip"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.api.routes import get_routes
+from src.fail2ban.action import Fail2banAction
+from src.models.alert_model import AlertModel
+from src.services.publish_msg_service import PublishMsgService
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.allowlist import Allowlist, parse_entry
+from src.shared.dedup_engine import dedup_engine
+from src.shared.prefix_trie import PrefixTrie
+
+
+class TestAllowlist(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.file = os.path.join(self.tmp_dir.name, "allowlist.txt")
+        with open(self.file, "w") as allowlist_file:
+            allowlist_file.write("# management\n10.20.0.0/16\n\n2001:db8:ffff::/48  # ops\n")
+
+    def make_allowlist(self, **kwargs) -> Allowlist:
+        options = {"enabled": True, "entries": "192.0.2.0/24,192.0.2.128/25", "file": self.file,
+                   "trusted_hosts": False, "local_addresses": False, "refresh_interval": 0.01}
+        options.update(kwargs)
+        allowlist = Allowlist(**options)
+        self.addCleanup(allowlist.stop)
+        return allowlist
+
+    def test_parse_entries(self):
+        self.assertEqual(parse_entry("tcp://10.0.0.5:5556"), [ipaddress.ip_network("10.0.0.5/32")])
+        self.assertEqual(parse_entry("tcp://[2001:db8::1]:5556"), [ipaddress.ip_network("2001:db8::1/128")])
+        self.assertEqual(parse_entry(" 10.1.2.3/8 "), [ipaddress.ip_network("10.0.0.0/8")])
+        self.assertIn(ipaddress.ip_network("127.0.0.1/32"), parse_entry("tcp://localhost:5556"))
+        with self.assertRaises(ValueError):
+            parse_entry("not a host!")
+
+    def test_longest_prefix_match(self):
+        allowlist = self.make_allowlist()
+        self.assertEqual(allowlist.match("192.0.2.200"), ("192.0.2.128/25", "settings"))
+        self.assertEqual(allowlist.match("192.0.2.1"), ("192.0.2.0/24", "settings"))
+        self.assertEqual(allowlist.match(ipaddress.ip_address("::ffff:10.20.3.4")), ("10.20.0.0/16", "file"))
+        self.assertEqual(allowlist.match("2001:db8:ffff:1::1"), ("2001:db8:ffff::/48", "file"))
+        self.assertIsNone(allowlist.match("198.51.100.1"))
+        self.assertEqual(allowlist.stats(), {"ipv4": 3, "ipv6": 1})
+
+    def test_trusted_hosts_and_local_addresses(self):
+        with patch("src.shared.allowlist.ZMQManager.get_trusted_hosts", return_value=["tcp://203.0.113.9:5556"]), \
+                patch("src.shared.allowlist.node_identity.is_local", side_effect=lambda ip: str(ip) == "198.51.100.2"):
+            allowlist = self.make_allowlist(trusted_hosts=True, local_addresses=True)
+            self.assertEqual(allowlist.match("203.0.113.9"), ("203.0.113.9/32", "trusted_hosts"))
+            self.assertEqual(allowlist.match("198.51.100.2"), ("198.51.100.2", "local"))
+            self.assertIsNone(allowlist.match("198.51.100.3"))
+
+    def test_file_hot_reload(self):
+        allowlist = self.make_allowlist()
+        allowlist.start()
+        self.assertFalse(allowlist.is_allowed("172.16.0.1"))
+        with open(self.file, "a") as allowlist_file:
+            allowlist_file.write("172.16.0.0/12\n")
+        os.utime(self.file, (time.time() + 5, time.time() + 5))
+        deadline = time.monotonic() + 5
+        while not allowlist.is_allowed("172.16.0.1") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(allowlist.is_allowed("172.16.0.1"))
+
+    def test_disabled_allows_nothing(self):
+        self.assertFalse(self.make_allowlist(enabled=False).is_allowed("192.0.2.1"))
+
+    def test_longest_match_agrees_with_a_scan(self):
+        generator = random.Random(3)
+        trie = PrefixTrie(32)
+        networks = set()
+        for _ in range(2000):
+            network = ipaddress.IPv4Network((generator.getrandbits(8) << 24 | generator.getrandbits(24), 32)).supernet(
+                new_prefix=generator.choice((8, 12, 16, 20, 24, 28, 32)))
+            networks.add(network)
+            trie.insert(int(network.network_address), network.prefixlen, str(network))
+        for _ in range(300):
+            address = ipaddress.IPv4Address(generator.getrandbits(32))
+            containing = [network for network in networks if address in network]
+            found = trie.longest_match(int(address), 32)
+            expected = max(containing, key=lambda network: network.prefixlen) if containing else None
+            self.assertEqual(found[2] if found else None, str(expected) if expected else None)
+
+
+class TestAllowlistChecks(unittest.TestCase):
+    def setUp(self):
+        dedup_engine.clear()
+        self.allowlist = Allowlist(enabled=True, entries="10.20.0.0/16", file="", trusted_hosts=False, local_addresses=False)
+
+    @staticmethod
+    def make_alert(ip: str, action: str = "banip") -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address(ip), action=Fail2banAction(action), jail="sshd",
+                                          origin="00000000000000aa", trace=None)
+
+    def test_api_refuses_allowlisted_ban(self):
+        publisher_service = MagicMock(spec=PublishMsgService)
+        router = get_routes(publisher_service)
+        endpoint = next(route.endpoint for route in router.routes if route.path == "/alert")
+        with patch("src.api.routes.allowlist", self.allowlist):
+            response = asyncio.run(endpoint(self.make_alert("10.20.1.1")))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.body)["status"], "allowlisted")
+        publisher_service.publish_alert_async.assert_not_called()
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    def test_receive_path_refuses_allowlisted_ban(self, mock_exec):
+        with patch("src.services.subscribe_msg_service.allowlist", self.allowlist):
+            service = SubscribeMsgService()
+            self.assertTrue(service.process_alert(self.make_alert("10.20.1.1")))
+            mock_exec.assert_not_called()
+            self.assertTrue(service.process_alert(self.make_alert("10.20.1.1", action="unbanip")))
+        mock_exec.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+
+from src.services.ban_executor import BanExecutor, OverflowPolicy
+
+
+class TestBanExecutor(unittest.TestCase):
+    def test_items_handled_by_workers(self):
+        handled = []
+        executor = BanExecutor(handler=handled.append, workers=2, queue_size=100, per_jail_limit=2,
+                               overflow_policy=OverflowPolicy.BLOCK, block_timeout=1.0)
+        executor.start()
+        for i in range(50):
+            self.assertTrue(executor.submit(i))
+        executor.stop(drain=True)
+        self.assertEqual(sorted(handled), list(range(50)))
+        stats = executor.stats()
+        self.assertEqual(stats["submitted"], 50)
+        self.assertEqual(stats["processed"], 50)
+        self.assertEqual(stats["depth"], 0)
+
+    def test_submit_does_not_wait_for_handler(self):
+        release = threading.Event()
+        executor = BanExecutor(handler=lambda item: release.wait(), workers=1, queue_size=100, per_jail_limit=1,
+                               overflow_policy=OverflowPolicy.BLOCK, block_timeout=1.0)
+        executor.start()
+        started = time.monotonic()
+        for i in range(20):
+            executor.submit(i)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertGreaterEqual(executor.stats()["depth"], 19)
+        release.set()
+        executor.stop()
+
+    def _saturated_executor(self, policy, handled, release):
+        def handler(item):
+            release.wait()
+            handled.append(item)
+
+        executor = BanExecutor(handler=handler, workers=1, queue_size=2, per_jail_limit=1,
+                               overflow_policy=policy, block_timeout=0.05)
+        executor.start()
+        executor.submit("in-flight")
+        while executor.stats()["in_flight"] == 0:
+            time.sleep(0.001)
+        executor.submit("a")
+        executor.submit("b")
+        return executor
+
+    def test_drop_newest_policy(self):
+        handled, release = [], threading.Event()
+        executor = self._saturated_executor(OverflowPolicy.DROP_NEWEST, handled, release)
+        self.assertFalse(executor.submit("c"))
+        release.set()
+        executor.stop()
+        self.assertEqual(handled, ["in-flight", "a", "b"])
+        self.assertEqual(executor.stats()["dropped"], 1)
+
+    def test_drop_oldest_policy(self):
+        handled, release = [], threading.Event()
+        executor = self._saturated_executor(OverflowPolicy.DROP_OLDEST, handled, release)
+        self.assertTrue(executor.submit("c"))
+        release.set()
+        executor.stop()
+        self.assertEqual(handled, ["in-flight", "b", "c"])
+        self.assertEqual(executor.stats()["dropped"], 1)
+
+    def test_block_policy_applies_backpressure_then_drops(self):
+        handled, release = [], threading.Event()
+        executor = self._saturated_executor(OverflowPolicy.BLOCK, handled, release)
+        started = time.monotonic()
+        self.assertFalse(executor.submit("c"))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        release.set()
+        executor.stop()
+        self.assertEqual(handled, ["in-flight", "a", "b"])
+
+    def test_per_jail_limit(self):
+        lock = threading.Lock()
+        running = {"sshd": 0, "nginx": 0}
+        peak = {"sshd": 0, "nginx": 0}
+
+        def handler(item):
+            with lock:
+                running[item] += 1
+                peak[item] = max(peak[item], running[item])
+            time.sleep(0.01)
+            with lock:
+                running[item] -= 1
+
+        executor = BanExecutor(handler=handler, key_func=lambda item: item, workers=6, queue_size=100,
+                               per_jail_limit=2, overflow_policy=OverflowPolicy.BLOCK, block_timeout=1.0)
+        executor.start()
+        for _ in range(10):
+            executor.submit("sshd")
+            executor.submit("nginx")
+        executor.stop()
+        self.assertEqual(peak["sshd"], 2)
+        self.assertEqual(peak["nginx"], 2)
+
+    def test_flooded_jail_does_not_hold_the_workers(self):
+        release = threading.Event()
+        handled = []
+
+        def handler(item):
+            if item.startswith("sshd"):
+                release.wait()
+            handled.append(item)
+
+        executor = BanExecutor(handler=handler, key_func=lambda item: item.split("-")[0], workers=3, queue_size=100,
+                               per_jail_limit=1, overflow_policy=OverflowPolicy.BLOCK, block_timeout=1.0)
+        executor.start()
+        for i in range(10):
+            executor.submit(f"sshd-{i}")
+        executor.submit("nginx-0")
+        deadline = time.monotonic() + 2.0
+        while "nginx-0" not in handled and time.monotonic() < deadline:
+            time.sleep(0.005)
+        # Handled while the flooded jail holds its only slot
+        self.assertEqual(handled, ["nginx-0"])
+        self.assertEqual(executor.stats()["in_flight"], 1)
+        release.set()
+        executor.stop()
+        self.assertEqual(len(handled), 11)
+
+    def test_handler_failures_are_counted(self):
+        def handler(item):
+            if item == "boom":
+                raise RuntimeError("boom")
+            return item == "ok"
+
+        executor = BanExecutor(handler=handler, workers=1, queue_size=10, per_jail_limit=1,
+                               overflow_policy=OverflowPolicy.BLOCK, block_timeout=1.0)
+        executor.start()
+        for item in ("ok", "ko", "boom"):
+            executor.submit(item)
+        executor.stop()
+        self.assertEqual(executor.stats()["processed"], 3)
+        self.assertEqual(executor.stats()["failed"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import ipaddress
+import math
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.ban_expiry import STATE_FILE, BanExpiryScheduler, decode_state, encode_state
+from src.fail2ban.ban_state import BanStateIndex
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.prefix_aggregator import PrefixAggregator
+from src.models.alert_model import AlertModel
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.ban_journal import BanJournal
+from src.shared.dedup_engine import dedup_engine
+from src.shared.timer_wheel import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+    def test_fires_like_a_scan(self):
+        # Small levels, so that the cascades and the timers out of reach are exercised
+        generator = random.Random(3)
+        wheel = TimerWheel(resolution=0.5, bits=3, levels=3, now=100.0)
+        due: dict[int, int] = {}
+        now = 100.0
+        for _ in range(5000):
+            choice = generator.random()
+            if choice < 0.5:
+                key = generator.randrange(300)
+                deadline = now + generator.choice((generator.uniform(-2, 2), generator.uniform(0, 50), generator.uniform(0, 5000)))
+                wheel.schedule(key, deadline, key)
+                due[key] = max(math.ceil(deadline / 0.5), math.floor(now / 0.5) + 1)
+            elif choice < 0.6:
+                key = generator.randrange(300)
+                self.assertEqual(wheel.cancel(key), key if key in due else None)
+                due.pop(key, None)
+            else:
+                now += generator.choice((0.2, 1.0, 7.0, 90.0, 2000.0))
+                tick = math.floor(now / 0.5)
+                for key, deadline, data in wheel.advance(now):
+                    self.assertEqual(data, key)
+                    self.assertLessEqual(due.pop(key), tick)
+                self.assertFalse([key for key, key_tick in due.items() if key_tick <= tick])
+        self.assertEqual(len(wheel), len(due))
+
+    def test_reschedule_moves_the_timer(self):
+        wheel = TimerWheel(now=0.0)
+        wheel.schedule("a", 10.0, 1)
+        wheel.schedule("a", 100000.0, 2)
+        self.assertEqual(wheel.advance(50.0), [])
+        self.assertEqual(wheel.get("a"), (100000.0, 2))
+        self.assertEqual(wheel.advance(100000.0), [("a", 100000.0, 2)])
+        self.assertNotIn("a", wheel)
+
+
+class TestBanExpiryScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.executor = MagicMock(return_value=True)
+        # The effects of a lifted ban on the other singletons are covered by the service test
+        patcher = patch("src.fail2ban.ban_expiry.BanExpiryScheduler._lifted")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_scheduler(self, **kwargs) -> BanExpiryScheduler:
+        options = dict(enabled=True, path=self.tmp_dir.name, durations={"sshd": 100, "nginx": 0}, default_duration=10,
+                       severity_factors={"low": 0.5, "High": 2}, repeat_factor=2, repeat_window=1000,
+                       max_duration=1000, resolution=1.0, batch_size=2, save_interval=5, executor=self.executor)
+        options.update(kwargs)
+        # The wheel starts at the time of creation, the tests then drive the clock
+        with patch("src.fail2ban.ban_expiry.time.time", return_value=0.0):
+            return BanExpiryScheduler(**options)
+
+    def test_duration_policy(self):
+        scheduler = self.make_scheduler()
+        self.assertEqual(scheduler.duration("sshd", "medium"), 100)
+        self.assertEqual(scheduler.duration("sshd", "high"), 200)
+        self.assertEqual(scheduler.duration("sshd", "low", repeats=2), 200)
+        self.assertEqual(scheduler.duration("sshd", "high", repeats=5000), 1000)
+        self.assertEqual(scheduler.duration("postfix", None), 10)
+        self.assertEqual(scheduler.duration("nginx", "critical"), 0)
+
+    def test_repeat_offences_within_window(self):
+        scheduler = self.make_scheduler()
+        self.assertEqual(scheduler.schedule("sshd", "1.2.3.4", now=0.0), 100.0)
+        # Banned again while banned, then after the expiry within the window, then long after it
+        self.assertEqual(scheduler.schedule("sshd", "1.2.3.4", now=50.0), 250.0)
+        scheduler.expire(now=251.0)
+        self.assertEqual(scheduler.schedule("sshd", "1.2.3.4", now=260.0), 660.0)
+        scheduler.expire(now=661.0)
+        self.assertEqual(scheduler.schedule("sshd", "1.2.3.4", now=5000.0), 5100.0)
+        self.assertIsNone(scheduler.schedule("nginx", "1.2.3.4", now=0.0))
+
+    def test_expired_bans_unbanned_in_batches(self):
+        scheduler = self.make_scheduler()
+        for target in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+            scheduler.schedule("sshd", target, now=0.0)
+        scheduler.schedule("postfix", "10.0.0.4", now=0.0)
+        scheduler.schedule("sshd", "10.0.0.5", now=50.0)
+        self.assertTrue(scheduler.cancel("sshd", "10.0.0.3"))
+        self.assertEqual(scheduler.expire(now=5.0), 0)
+        self.assertEqual(scheduler.expire(now=101.0), 3)
+        self.assertEqual(sorted(tuple(call.args[1:]) for call in self.executor.call_args_list),
+                         [("postfix", ["10.0.0.4"]), ("sshd", ["10.0.0.1", "10.0.0.2"])])
+        self.assertEqual(scheduler.expires_at("sshd", "10.0.0.5"), 150.0)
+        self.assertEqual(scheduler.stats(), {"scheduled": 1, "offenders": 5})
+
+    def test_failed_unban_retried_then_dropped(self):
+        self.executor.return_value = False
+        scheduler = self.make_scheduler()
+        scheduler.schedule("postfix", "10.0.0.1", now=0.0)
+        self.assertEqual(scheduler.expire(now=11.0), 0)
+        self.assertEqual(scheduler.expires_at("postfix", "10.0.0.1"), 71.0)
+        scheduler.expire(now=72.0)
+        scheduler.expire(now=133.0)
+        self.assertEqual(self.executor.call_count, 3)
+        self.assertIsNone(scheduler.expires_at("postfix", "10.0.0.1"))
+
+    def test_state_survives_restart(self):
+        scheduler = self.make_scheduler()
+        with patch("src.fail2ban.ban_expiry.time.time", return_value=1000.0):
+            scheduler.schedule("sshd", "10.0.0.1")
+            scheduler.schedule("sshd", "2001:db8::/64", severity="high")
+            scheduler.schedule("postfix", "10.0.0.2")
+            scheduler.save()
+
+        restored = self.make_scheduler()
+        with patch("src.fail2ban.ban_expiry.time.time", return_value=1050.0):
+            self.assertEqual(restored.load(), 3)
+        self.assertEqual(restored.expires_at("sshd", "2001:db8::/64"), 1200.0)
+        # Expired while stopped: lifted on the first tick
+        self.assertEqual(restored.expire(now=1051.0), 1)
+        self.executor.assert_called_once_with("unbanip", "postfix", ["10.0.0.2"])
+        self.assertEqual(restored.schedule("sshd", "10.0.0.1", now=1060.0), 1260.0)
+
+    def test_background_thread_lifts_and_saves(self):
+        scheduler = BanExpiryScheduler(enabled=True, path=self.tmp_dir.name, durations={}, default_duration=0.1,
+                                       resolution=0.05, save_interval=0, executor=self.executor)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        scheduler.schedule("sshd", "10.0.0.1")
+        deadline = time.monotonic() + 2.0
+        while not self.executor.called and time.monotonic() < deadline:
+            time.sleep(0.02)
+        scheduler.stop()
+        self.executor.assert_called_once_with("unbanip", "sshd", ["10.0.0.1"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, STATE_FILE)))
+
+    def test_corrupted_state_set_aside(self):
+        state = encode_state([("sshd", "10.0.0.1", 10.0, 0)], [("sshd", "10.0.0.1", 10.0, 1)])
+        self.assertEqual(decode_state(state), ([("sshd", "10.0.0.1", 10.0, 0)], [("sshd", "10.0.0.1", 10.0, 1)]))
+        with open(os.path.join(self.tmp_dir.name, STATE_FILE), "wb") as state_file:
+            state_file.write(state[:-1] + bytes([state[-1] ^ 1]))
+        scheduler = self.make_scheduler()
+        self.assertEqual(scheduler.load(), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, STATE_FILE + ".corrupt")))
+
+
+class TestBanExpiryService(unittest.TestCase):
+    def setUp(self):
+        dedup_engine.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.executor = MagicMock(return_value=True)
+        with patch("src.fail2ban.ban_expiry.time.time", return_value=0.0):
+            self.scheduler = BanExpiryScheduler(enabled=True, path=self.tmp_dir.name, durations={}, default_duration=60,
+                                                severity_factors={"critical": 4}, executor=self.executor)
+        self.ban_state = BanStateIndex(source="status")
+        for target, replacement in (("src.services.subscribe_msg_service.ban_expiry", self.scheduler),
+                                    ("src.services.subscribe_msg_service.ban_state", self.ban_state),
+                                    ("src.fail2ban.ban_expiry.ban_state", self.ban_state)):
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def make_alert(action: Fail2banAction, severity: str = "medium") -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address("198.51.100.7"), action=action, jail="sshd",
+                                          severity=severity, origin="00000000000000aa", trace=None)
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    def test_received_ban_expires_and_can_be_banned_again(self, mock_action):
+        service = SubscribeMsgService()
+        with patch("src.fail2ban.ban_expiry.time.time", return_value=1000.0):
+            self.assertTrue(service.process_alert(self.make_alert(Fail2banAction.BAN, "critical")))
+        self.assertEqual(self.scheduler.expires_at("sshd", "198.51.100.7"), 1240.0)
+
+        self.scheduler.expire(now=1241.0)
+        self.executor.assert_called_once_with("unbanip", "sshd", ["198.51.100.7"])
+        # Neither a copy in the dedup engine nor a stale ban state holds the next ban back
+        self.assertTrue(service.process_alert(self.make_alert(Fail2banAction.BAN)))
+        self.assertEqual(mock_action.call_count, 2)
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    def test_received_unban_cancels_expiry(self, mock_action):
+        service = SubscribeMsgService()
+        self.assertTrue(service.process_alert(self.make_alert(Fail2banAction.BAN)))
+        self.assertTrue(service.process_alert(self.make_alert(Fail2banAction.UNBAN)))
+        self.assertEqual(self.scheduler.stats()["scheduled"], 0)
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    def test_lifted_network_clears_the_host_banned_as_it(self, mock_action):
+        journal = BanJournal(path=self.tmp_dir.name)
+        journal.open()
+        self.addCleanup(journal.close)
+        aggregator = PrefixAggregator(enabled=True, ipv6_host_prefix=64, default_threshold=0)
+        for target, replacement in (("src.services.subscribe_msg_service.ban_journal", journal),
+                                    ("src.fail2ban.ban_expiry.ban_journal", journal),
+                                    ("src.services.subscribe_msg_service.prefix_aggregator", aggregator),
+                                    ("src.fail2ban.ban_expiry.prefix_aggregator", aggregator)):
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with patch.object(Fail2banClient, "get_banned_ips", return_value=[]):
+            self.ban_state.reload("sshd")
+        service = SubscribeMsgService()
+        alert = self.make_alert(Fail2banAction.BAN)
+        alert.ip = ipaddress.ip_address("2001:db8::7")
+        with patch("src.fail2ban.ban_expiry.time.time", return_value=1000.0):
+            self.assertTrue(service.process_alert(alert))
+        mock_action.assert_called_once_with(action=Fail2banAction.BAN, jail="sshd", ip="2001:db8::/64")
+        self.assertTrue(self.ban_state.is_banned("sshd", "2001:db8::7"))
+        self.assertTrue(journal.is_banned("sshd", "2001:db8::7"))
+
+        self.scheduler.expire(now=1061.0)
+        self.executor.assert_called_once_with("unbanip", "sshd", ["2001:db8::/64"])
+        self.assertFalse(self.ban_state.is_banned("sshd", "2001:db8::7"))
+        self.assertFalse(journal.is_banned("sshd", "2001:db8::7"))
+        self.assertTrue(service.process_alert(alert))
+        self.assertEqual(mock_action.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.fail2ban.ban_state import BanStateIndex
+from src.shared.ban_journal import JOURNAL_FILE, SNAPSHOT_FILE, BanJournal, BanSnapshot
+from src.shared.dedup_engine import DedupEngine
+
+
+class TestBanJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = self.tmp_dir.name
+
+    def make_journal(self, compact_size: int = 1 << 20, dedup: DedupEngine = None) -> BanJournal:
+        journal = BanJournal(path=self.path, fsync_interval=0.01, fsync_batch=8, compact_size=compact_size,
+                             dedup=dedup or DedupEngine(ttls={"banip": 60}, default_ttl=60, shards=1))
+        journal.open()
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_state_restored_after_restart(self):
+        journal = self.make_journal()
+        journal.record(action="banip", jail="sshd", ip="1.2.3.4")
+        journal.record(action="banip", jail="sshd", ip="2001:db8::1")
+        journal.record(action="banip", jail="nginx", ip="5.6.7.8")
+        journal.record(action="unbanip", jail="nginx", ip="5.6.7.8")
+        journal.record(action="status", jail="sshd", ip="9.9.9.9")
+        journal.close()
+
+        dedup = DedupEngine(ttls={"banip": 60, "unbanip": 60}, default_ttl=60, shards=1)
+        restored = self.make_journal(dedup=dedup)
+        self.assertTrue(restored.is_banned(jail="sshd", ip="1.2.3.4"))
+        self.assertTrue(restored.is_banned(jail="sshd", ip="2001:db8::1"))
+        self.assertFalse(restored.is_banned(jail="nginx", ip="5.6.7.8"))
+        self.assertEqual(restored.banned("sshd"), ["1.2.3.4", "2001:db8::1"])
+        self.assertTrue(dedup.is_duplicate(ip="1.2.3.4", jail="sshd", action="banip"))
+        self.assertTrue(dedup.is_duplicate(ip="5.6.7.8", jail="nginx", action="unbanip"))
+        self.assertEqual(restored.jails(), ["nginx", "sshd"])
+
+        # The restored bans are skipped before the jails are loaded from fail2ban
+        index = BanStateIndex(source="status")
+        for jail in restored.jails():
+            index.seed(jail, restored.banned(jail))
+        self.assertTrue(index.matches(action="banip", jail="sshd", ip="2001:db8::1"))
+        self.assertFalse(index.matches(action="unbanip", jail="nginx", ip="5.6.7.8"))
+
+    def test_torn_record_is_truncated(self):
+        journal = self.make_journal()
+        journal.record(action="banip", jail="sshd", ip="1.2.3.4")
+        journal.record(action="banip", jail="sshd", ip="1.2.3.5")
+        journal.close()
+        journal_path = os.path.join(self.path, JOURNAL_FILE)
+        os.truncate(journal_path, os.path.getsize(journal_path) - 3)
+
+        restored = self.make_journal()
+        self.assertTrue(restored.is_banned(jail="sshd", ip="1.2.3.4"))
+        self.assertFalse(restored.is_banned(jail="sshd", ip="1.2.3.5"))
+        restored.record(action="banip", jail="sshd", ip="1.2.3.6")
+        restored.close()
+        self.assertTrue(self.make_journal().is_banned(jail="sshd", ip="1.2.3.6"))
+
+    def test_compaction_into_snapshot(self):
+        journal = self.make_journal(compact_size=1)
+        for index in range(50):
+            journal.record(action="banip", jail="sshd", ip=f"10.0.0.{index}")
+        journal.record(action="unbanip", jail="sshd", ip="10.0.0.7")
+        deadline = time.monotonic() + 5
+        while journal.stats()["changes"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(journal.stats()["changes"], 0)
+        self.assertTrue(journal.is_banned(jail="sshd", ip="10.0.0.49"))
+        self.assertFalse(journal.is_banned(jail="sshd", ip="10.0.0.7"))
+        journal.close()
+
+        self.assertEqual(os.path.getsize(os.path.join(self.path, JOURNAL_FILE)), 0)
+        snapshot = BanSnapshot(os.path.join(self.path, SNAPSHOT_FILE))
+        self.addCleanup(snapshot.close)
+        self.assertEqual(len(snapshot.packed_ips("sshd")), 49)
+        self.assertEqual(len(self.make_journal().banned("sshd")), 49)
+
+    def test_interrupted_compaction_is_replayed(self):
+        journal = self.make_journal()
+        journal.record(action="banip", jail="sshd", ip="1.2.3.4")
+        journal.close()
+        os.replace(os.path.join(self.path, JOURNAL_FILE), os.path.join(self.path, f"{JOURNAL_FILE}.old"))
+
+        restored = self.make_journal()
+        self.assertTrue(restored.is_banned(jail="sshd", ip="1.2.3.4"))
+        self.assertFalse(os.path.exists(os.path.join(self.path, f"{JOURNAL_FILE}.old")))
+
+    def test_corrupted_snapshot_starts_empty(self):
+        with open(os.path.join(self.path, SNAPSHOT_FILE), "wb") as snapshot_file:
+            snapshot_file.write(b"garbage")
+        journal = self.make_journal()
+        self.assertFalse(journal.is_banned(jail="sshd", ip="1.2.3.4"))
+        self.assertTrue(os.path.exists(os.path.join(self.path, f"{SNAPSHOT_FILE}.corrupt")))
+
+    def test_record_ignored_until_open(self):
+        journal = BanJournal(path=self.path)
+        journal.record(action="banip", jail="sshd", ip="1.2.3.4")
+        self.assertFalse(os.path.exists(os.path.join(self.path, JOURNAL_FILE)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import asyncio
+import ipaddress
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fastapi import HTTPException
+
+from src.api.routes import get_routes
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.ban_state import BanStateIndex, read_database_bans
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.socket_client import Fail2banSocketClient
+from src.fail2ban.stub_server import Fail2banStubServer
+from src.models.alert_model import AlertModel
+from src.services.publish_msg_service import PublishMsgService
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.dedup_engine import dedup_engine
+
+
+class TestBanStateIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = BanStateIndex(source="status", reconcile_interval=60)
+
+    def load(self, jail: str, ips: list[str]):
+        with patch.object(Fail2banClient, "get_banned_ips", return_value=ips):
+            self.assertTrue(self.index.reload(jail))
+
+    def test_matches_once_loaded(self):
+        self.assertFalse(self.index.matches(action="banip", jail="sshd", ip="1.2.3.4"))
+        self.load("sshd", ["1.2.3.4", "2001:db8::1", "not-an-ip"])
+        self.assertTrue(self.index.matches(action=Fail2banAction.BAN, jail="sshd", ip="1.2.3.4"))
+        self.assertTrue(self.index.matches(action="banip", jail="sshd", ip=ipaddress.ip_address("2001:db8::1")))
+        self.assertFalse(self.index.matches(action="unbanip", jail="sshd", ip="1.2.3.4"))
+        self.assertTrue(self.index.matches(action="unbanip", jail="sshd", ip="5.6.7.8"))
+        self.assertFalse(self.index.matches(action="banip", jail="nginx", ip="1.2.3.4"))
+
+    def test_apply_updates_loaded_jails(self):
+        self.load("sshd", [])
+        self.index.apply(action="banip", jail="sshd", ip="1.2.3.4")
+        self.index.apply(action="banip", jail="sshd", ip="::1")
+        self.index.apply(action="banip", jail="nginx", ip="1.2.3.4")
+        self.assertEqual(self.index.banned("sshd"), ["1.2.3.4", "::1"])
+        self.index.apply(action="unbanip", jail="sshd", ip="1.2.3.4")
+        self.assertFalse(self.index.is_banned("sshd", "1.2.3.4"))
+        self.assertIsNone(self.index.is_banned("nginx", "1.2.3.4"))
+
+    def test_actions_applied_during_reload_are_kept(self):
+        self.load("sshd", ["1.2.3.4"])
+
+        def load_while_banning(jail):
+            self.index.apply(action="banip", jail=jail, ip="5.6.7.8")
+            self.index.apply(action="unbanip", jail=jail, ip="9.9.9.9")
+            return ["9.9.9.9"]
+
+        with patch.object(Fail2banClient, "get_banned_ips", side_effect=load_while_banning):
+            self.assertTrue(self.index.reload("sshd"))
+        self.assertEqual(self.index.banned("sshd"), ["5.6.7.8"])
+
+    def test_failed_reload_keeps_previous_state(self):
+        self.load("sshd", ["1.2.3.4"])
+        with patch.object(Fail2banClient, "get_banned_ips", return_value=None):
+            self.assertFalse(self.index.reload("sshd"))
+        self.assertTrue(self.index.is_banned("sshd", "1.2.3.4"))
+
+    def test_seed_until_loaded_from_fail2ban(self):
+        self.assertTrue(self.index.seed("sshd", ["1.2.3.4"]))
+        self.assertTrue(self.index.matches(action="banip", jail="sshd", ip="1.2.3.4"))
+        # Banned by fail2ban on its own maybe: the unban is sent
+        self.assertFalse(self.index.matches(action="unbanip", jail="sshd", ip="9.9.9.9"))
+        self.load("sshd", ["5.6.7.8"])
+        self.assertTrue(self.index.matches(action="unbanip", jail="sshd", ip="9.9.9.9"))
+        self.assertFalse(self.index.seed("sshd", ["1.2.3.4"]))
+        self.assertEqual(self.index.banned("sshd"), ["5.6.7.8"])
+
+    def test_reconcile_forgets_inactive_jails(self):
+        self.load("old", ["1.2.3.4"])
+        with patch("src.fail2ban.ban_state.jail_registry.get_jails", return_value=frozenset({"sshd"})), \
+                patch.object(Fail2banClient, "get_banned_ips", return_value=["5.6.7.8"]):
+            self.index.reconcile()
+        self.assertEqual(self.index.stats(), {"sshd": 1})
+
+
+class TestBanStateSources(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_database_source(self):
+        path = os.path.join(self.tmp_dir.name, "fail2ban.sqlite3")
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE bips (jail TEXT, ip TEXT, timeofban INTEGER, bantime INTEGER, bancount INTEGER, data JSON)")
+            connection.executemany("INSERT INTO bips VALUES (?, ?, ?, ?, 1, '{}')", [
+                ("sshd", "1.2.3.4", 1000, 600), ("sshd", "5.6.7.8", 100, 600),
+                ("sshd", "9.9.9.9", 100, -1), ("nginx", "1.1.1.1", 1000, 600)])
+        self.assertEqual(sorted(read_database_bans(path, "sshd", now=1200)), ["1.2.3.4", "9.9.9.9"])
+
+        index = BanStateIndex(source="database", database_path=path)
+        with patch("src.fail2ban.ban_state.time.time", return_value=1200):
+            self.assertTrue(index.reload("sshd"))
+        self.assertEqual(index.banned("sshd"), ["1.2.3.4", "9.9.9.9"])
+
+    def test_missing_database_falls_back_to_status(self):
+        index = BanStateIndex(source="database", database_path=os.path.join(self.tmp_dir.name, "missing.sqlite3"))
+        with patch.object(Fail2banClient, "get_banned_ips", return_value=["1.2.3.4"]):
+            self.assertTrue(index.reload("sshd"))
+        self.assertTrue(index.is_banned("sshd", "1.2.3.4"))
+
+    @patch("src.fail2ban.fail2ban_client.settings")
+    def test_status_over_socket(self, mock_settings):
+        mock_settings.FAIL2BAN_USE_SOCKET = True
+        socket_path = os.path.join(self.tmp_dir.name, "fail2ban.sock")
+        server = Fail2banStubServer(socket_path=socket_path)
+        server.start()
+        self.addCleanup(server.stop)
+        server.banned["sshd"].update({"1.2.3.4", "5.6.7.8"})
+        Fail2banClient.close()
+        Fail2banClient._socket_retry_at = 0.0
+        Fail2banClient._socket_client = Fail2banSocketClient(socket_path=socket_path, timeout=2.0)
+        self.addCleanup(Fail2banClient.close)
+        self.assertEqual(Fail2banClient.get_banned_ips("sshd"), ["1.2.3.4", "5.6.7.8"])
+        self.assertIsNone(Fail2banClient.get_banned_ips("unknown"))
+
+    @patch("src.fail2ban.fail2ban_client.subprocess.run")
+    @patch("src.fail2ban.fail2ban_client.settings")
+    def test_status_from_fail2ban_client(self, mock_settings, mock_run):
+        mock_settings.FAIL2BAN_USE_SOCKET = False
+        mock_run.return_value.returncode = 0
+        mock_run.return_value.stdout = ("Status for the jail: sshd\n"
+                                        "`- Actions\n"
+                                        "   |- Currently banned: 2\n"
+                                        "   `- Banned IP list:   1.2.3.4 2001:db8::1\n")
+        self.assertEqual(Fail2banClient.get_banned_ips("sshd"), ["1.2.3.4", "2001:db8::1"])
+
+
+class TestBanStateIntegration(unittest.TestCase):
+    def setUp(self):
+        dedup_engine.clear()
+        self.index = BanStateIndex(source="status")
+        with patch.object(Fail2banClient, "get_banned_ips", return_value=["1.2.3.4"]):
+            self.index.reload("sshd")
+
+    def make_alert(self, ip: str, action: str = "banip") -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address(ip), action=Fail2banAction(action), jail="sshd",
+                                          origin="00000000000000aa", trace=None)
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    def test_service_skips_matching_actions(self, mock_exec):
+        with patch("src.services.subscribe_msg_service.ban_state", self.index):
+            service = SubscribeMsgService()
+            self.assertTrue(service.process_alert(self.make_alert("1.2.3.4")))
+            mock_exec.assert_not_called()
+            self.assertTrue(service.process_alert(self.make_alert("5.6.7.8")))
+            self.assertTrue(service.process_alert(self.make_alert("5.6.7.8", action="unbanip")))
+        self.assertEqual(mock_exec.call_count, 2)
+        self.assertFalse(self.index.is_banned("sshd", "5.6.7.8"))
+
+    def test_bans_endpoints(self):
+        router = get_routes(MagicMock(spec=PublishMsgService))
+        endpoints = {route.path: route.endpoint for route in router.routes}
+        with patch("src.api.routes.ban_state", self.index):
+            self.assertEqual(asyncio.run(endpoints["/bans"]()), {"jails": {"sshd": 1}})
+            self.assertEqual(asyncio.run(endpoints["/bans/{jail}"]("sshd"))["ips"], ["1.2.3.4"])
+            self.assertTrue(asyncio.run(endpoints["/bans/{jail}"]("sshd", ip="1.2.3.4"))["banned"])
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(endpoints["/bans/{jail}"]("nginx"))
+            self.assertEqual(raised.exception.status_code, 404)
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(endpoints["/bans/{jail}"]("sshd", ip="nope"))
+            self.assertEqual(raised.exception.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import time
+import unittest
+
+from src.shared.bloom_filter import RotatingBloomFilter
+from src.shared.message_id import decode_header, encode_header, new_message_id
+
+
+class TestRotatingBloomFilter(unittest.TestCase):
+    def test_check_and_add(self):
+        seen = RotatingBloomFilter(capacity=1000, error_rate=0.001, window=60)
+        self.assertFalse(seen.check_and_add(b"a"))
+        self.assertTrue(seen.check_and_add(b"a"))
+        self.assertIn(b"a", seen)
+        self.assertNotIn(b"b", seen)
+
+    def test_false_positive_rate(self):
+        seen = RotatingBloomFilter(capacity=5000, error_rate=0.01, window=60)
+        for i in range(5000):
+            seen.add(i.to_bytes(8, "little"))
+        false_positives = sum(i.to_bytes(8, "little") in seen for i in range(5000, 15000))
+        self.assertLess(false_positives / 10000, 0.03)
+
+    def test_keys_expire_after_two_windows(self):
+        seen = RotatingBloomFilter(capacity=100, error_rate=0.001, window=0.05)
+        seen.add(b"a")
+        time.sleep(0.06)
+        self.assertIn(b"a", seen)
+        time.sleep(0.06)
+        self.assertNotIn(b"a", seen)
+
+    def test_rotates_early_when_full(self):
+        seen = RotatingBloomFilter(capacity=10, error_rate=0.01, window=60)
+        for i in range(25):
+            seen.add(bytes([i]))
+        self.assertEqual(seen.rotations, 2)
+        # Memory stays bounded to the current and the previous generation
+        self.assertEqual(len(seen._generations), 2)
+
+
+class TestMessageId(unittest.TestCase):
+    def test_header_round_trip(self):
+        message_id = new_message_id()
+        header = encode_header(origin="00000000000000aa", message_id=message_id)
+        self.assertEqual(len(header), 16)
+        self.assertEqual(decode_header(header), ("00000000000000aa", message_id))
+
+    def test_invalid_header(self):
+        with self.assertRaises(ValueError):
+            decode_header(b"short")
+        with self.assertRaises(ValueError):
+            encode_header(origin="aa", message_id="0000000000000001")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import json
+import threading
+import unittest
+from datetime import datetime, UTC
+from unittest.mock import patch
+
+import zmq
+
+from src.ids2zmq.codec import BinaryCodec, JsonCodec, decode_header, encode_header, get_codec, get_codec_by_id
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+from src.shared.message_id import encode_header as encode_ids
+
+
+@patch("src.models.alert_model.jail_registry.is_active", return_value=True)
+class TestBinaryCodec(unittest.TestCase):
+    def _alert(self, **overrides):
+        fields = dict(hostname="node-1", source_ip="203.0.113.7", target_ip="10.0.0.2", port=22, jail="sshd",
+                      action="banip", severity="high", ip="203.0.113.7", reason="5 failures é",
+                      timestamp=datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=UTC),
+                      processing_timestamp=datetime(2025, 1, 2, 3, 4, 6, tzinfo=UTC),
+                      message_id="0123456789abcdef", origin="00000000000000aa")
+        fields.update(overrides)
+        return AlertModel(**fields)
+
+    def test_round_trip(self, mock_active):
+        alert = self._alert()
+        data = BinaryCodec.encode(alert)
+        self.assertEqual(BinaryCodec.decode(memoryview(data)), alert)
+        self.assertLess(len(data) * 3, len(JsonCodec.encode(alert)))
+
+    def test_round_trip_unknown_enums_ipv6_and_missing_fields(self, mock_active):
+        alert = self._alert(jail="my-custom-jail", severity="urgent", action="unbanip", ip="2001:db8::1",
+                            source_ip=None, target_ip=None, port=None, processing_timestamp=None,
+                            message_id=None, origin=None, hostname=None, protocol=None)
+        decoded = BinaryCodec.decode(BinaryCodec.encode(alert))
+        self.assertEqual(decoded, alert)
+        self.assertEqual(decoded.to_json(), alert.to_json())
+
+    def test_malformed_payload(self, mock_active):
+        data = BinaryCodec.encode(self._alert())
+        for broken in (data[:10], data[:-1], data + b"x"):
+            with self.assertRaises(ValueError):
+                BinaryCodec.decode(broken)
+
+    def test_unknown_enum_ids_rejected(self, mock_active):
+        data = BinaryCodec.encode(self._alert())
+        # flags (u16) | action (u8) | severity (u8) | jail (u8)
+        for offset, value in ((2, 0), (2, len(BinaryCodec.ACTIONS)), (3, len(BinaryCodec.SEVERITIES)), (4, 255)):
+            broken = data[:offset] + bytes([value]) + data[offset + 1:]
+            with self.assertRaisesRegex(ValueError, "Malformed binary alert"):
+                BinaryCodec.decode(broken)
+
+    def test_inactive_jail_rejected(self, mock_active):
+        data = BinaryCodec.encode(self._alert())
+        mock_active.return_value = False
+        with self.assertRaises(ValueError):
+            BinaryCodec.decode(data)
+
+
+class TestWireHeader(unittest.TestCase):
+    def test_header_round_trip(self):
+        header = encode_header(codec_id=BinaryCodec.codec_id, origin="00000000000000aa", message_id="0000000000000001")
+        self.assertEqual(decode_header(header), (1, "00000000000000aa", "0000000000000001"))
+
+    def test_legacy_header_is_json(self):
+        header = encode_ids(origin="00000000000000aa", message_id="0000000000000001")
+        self.assertEqual(decode_header(header)[0], JsonCodec.codec_id)
+
+    def test_unknown_version_and_codec(self):
+        with self.assertRaises(ValueError):
+            decode_header(b"\x09\x01" + bytes(16))
+        with self.assertRaises(ValueError):
+            get_codec_by_id(42)
+        with self.assertRaises(ValueError):
+            get_codec("xml")
+
+
+@patch("src.models.alert_model.jail_registry.is_active", return_value=True)
+class TestCodecEndToEnd(unittest.TestCase):
+    """Publish with one codec and receive on real inproc sockets."""
+    def _exchange(self, codec_name: str) -> dict:
+        context = zmq.Context()
+        received = threading.Event()
+        messages = []
+
+        def callback(message):
+            messages.append(message)
+            received.set()
+
+        with patch("src.ids2zmq.publisher.ZMQManager.zmq_security_enabled", False), \
+                patch("src.ids2zmq.subscriber.ZMQManager.zmq_security_enabled", False), \
+                patch("src.ids2zmq.publisher.get_codec", return_value=get_codec(codec_name)):
+            publisher = ZMQPublisher(context=context)
+            publisher._bind_address = f"inproc://test-codec-{codec_name}"
+            publisher.bind()
+            subscriber = ZMQSubscriber(on_message_callback=callback, context=context)
+            subscriber.subscriber_socket.connect(publisher._bind_address)
+            subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, publisher._topic)
+            subscriber.start()
+            try:
+                alert = AlertModel(ip="198.51.100.9", port=22, reason="end to end",
+                                   message_id="00000000000000ff", origin="00000000000000bb")
+                for _ in range(40):
+                    publisher.publish_alert(alert)
+                    if received.wait(0.05):
+                        break
+            finally:
+                subscriber.stop()
+                publisher.close()
+                context.term()
+        return json.loads(messages[0])
+
+    def test_binary(self, mock_active):
+        message = self._exchange("binary")
+        self.assertEqual((message["ip"], message["port"], message["message_id"]), ("198.51.100.9", 22, "00000000000000ff"))
+
+    def test_json(self, mock_active):
+        message = self._exchange("json")
+        self.assertEqual((message["ip"], message["reason"]), ("198.51.100.9", "end to end"))
+
+
+@patch("src.models.alert_model.jail_registry.is_active", return_value=True)
+class TestEnvelope(unittest.TestCase):
+    """Envelopes built by a batching publisher, decoded by the subscriber."""
+    def setUp(self):
+        self.context = zmq.Context()
+        self.addCleanup(self.context.term)
+        for target in ("src.ids2zmq.publisher.ZMQManager.zmq_security_enabled",
+                       "src.ids2zmq.subscriber.ZMQManager.zmq_security_enabled"):
+            patcher = patch(target, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.publisher = ZMQPublisher(context=self.context)
+        self.addCleanup(self.publisher.publisher_socket.close)
+        self.subscriber = ZMQSubscriber(on_message_callback=lambda message: None, context=self.context)
+        self.addCleanup(self.subscriber.stop)
+
+    def _envelope(self, count: int) -> list[bytes]:
+        items = [self.publisher._encode_item(AlertModel(ip=f"192.0.2.{index}", message_id=f"{index:016x}",
+                                                        origin="00000000000000bb"))
+                 for index in range(count)]
+        return self.publisher._build_frames(items=items)
+
+    def test_envelope_round_trip(self, mock_active):
+        alerts = self.subscriber._decode_frames(self._envelope(3))
+        self.assertEqual([str(alert.ip) for alert in alerts], ["192.0.2.0", "192.0.2.1", "192.0.2.2"])
+
+    def test_seen_items_dropped_from_envelope(self, mock_active):
+        self.subscriber._decode_frames(self._envelope(2))
+        alerts = self.subscriber._decode_frames(self._envelope(3))
+        self.assertEqual([str(alert.ip) for alert in alerts], ["192.0.2.2"])
+
+    def test_truncated_envelope_dropped(self, mock_active):
+        topic, header, payload = self._envelope(2)
+        self.assertEqual(self.subscriber._decode_frames([topic, header, payload[:-1]]), [])
+        self.assertEqual(self.subscriber._decode_frames([topic, header[:-1], payload]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+from ipaddress import ip_address
+
+from src.fail2ban.action import Fail2banAction
+from src.shared.dedup_engine import DedupEngine
+
+
+class TestDedupEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = DedupEngine(ttls={"banip": 60, "unbanip": 0.05}, capacities={"banip": 1000, "unbanip": 4},
+                                  default_ttl=60, default_capacity=10, shards=4)
+
+    def test_check_and_register(self):
+        self.assertFalse(self.engine.check_and_register(ip="1.2.3.4", jail="sshd", action="banip"))
+        self.assertTrue(self.engine.check_and_register(ip=ip_address("1.2.3.4"), jail="sshd", action=Fail2banAction.BAN))
+        self.assertFalse(self.engine.check_and_register(ip="1.2.3.4", jail="nginx", action="banip"))
+        self.assertFalse(self.engine.check_and_register(ip="1.2.3.4", jail="sshd", action="unbanip"))
+        self.assertEqual(self.engine.stats()["banip"]["hits"], 1)
+        self.assertEqual(self.engine.stats()["banip"]["misses"], 2)
+
+    def test_ipv4_and_ipv6_do_not_collide(self):
+        self.engine.register(ip="0.0.0.1", jail="sshd", action="banip")
+        self.assertFalse(self.engine.is_duplicate(ip="::1", jail="sshd", action="banip"))
+        self.assertFalse(self.engine.is_duplicate(ip=None, jail="sshd", action="banip"))
+
+    def test_ttl_per_action(self):
+        self.engine.register(ip="1.2.3.4", jail="sshd", action="banip")
+        self.engine.register(ip="1.2.3.4", jail="sshd", action="unbanip")
+        time.sleep(0.1)
+        self.assertTrue(self.engine.is_duplicate(ip="1.2.3.4", jail="sshd", action="banip"))
+        self.assertFalse(self.engine.is_duplicate(ip="1.2.3.4", jail="sshd", action="unbanip"))
+        self.assertEqual(self.engine.stats()["unbanip"]["expirations"], 1)
+
+    def test_capacity_evicts_oldest_and_counts(self):
+        engine = DedupEngine(ttls={}, capacities={"banip": 3}, default_ttl=60, default_capacity=10, shards=1)
+        for i in range(5):
+            engine.register(ip=f"10.0.0.{i}", jail="sshd", action="banip")
+        stats = engine.stats()["banip"]
+        self.assertEqual((stats["size"], stats["evictions"]), (3, 2))
+        self.assertFalse(engine.is_duplicate(ip="10.0.0.0", jail="sshd", action="banip"))
+        self.assertTrue(engine.is_duplicate(ip="10.0.0.4", jail="sshd", action="banip"))
+
+    def test_discard(self):
+        self.engine.register(ip="1.2.3.4", jail="sshd", action="banip")
+        self.engine.discard(ip="1.2.3.4", jail="sshd", action="banip")
+        self.assertFalse(self.engine.is_duplicate(ip="1.2.3.4", jail="sshd", action="banip"))
+
+    def test_check_and_register_is_atomic(self):
+        registered = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            for i in range(200):
+                if not self.engine.check_and_register(ip=f"10.0.{i >> 8}.{i & 255}", jail="sshd", action="banip"):
+                    registered.append(i)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(registered), list(range(200)))
+
+
+if __name__ == "__main__":
+    unittest.main()
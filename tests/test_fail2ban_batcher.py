@@ -0,0 +1,164 @@
+import ipaddress
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.fail2ban.fail2ban_client import Fail2banClient
+
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.ban_state import BanStateIndex
+from src.fail2ban.batcher import Fail2banBatcher
+from src.models.alert_model import AlertModel
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.dedup_engine import dedup_engine
+
+
+class FakeClient:
+    """Records the commands instead of calling fail2ban."""
+    def __init__(self, batch_result=True, failing_ips=()):
+        self.batches = []
+        self.actions = []
+        self.batch_result = batch_result
+        self.failing_ips = set(failing_ips)
+
+    def execute_batch(self, action, jail, ips):
+        self.batches.append((action, jail, list(ips)))
+        return self.batch_result
+
+    def execute_actions(self, actions):
+        self.actions.extend(actions)
+        return [ip not in self.failing_ips for _, _, ip in actions]
+
+    def execute_action(self, action, jail=None, ip=None):
+        self.actions.append((action, jail, ip))
+        return True
+
+
+class TestFail2banBatcher(unittest.TestCase):
+    def test_actions_grouped_per_jail_and_action(self):
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        futures = [batcher.submit("banip", "sshd", f"10.0.0.{i}") for i in range(3)]
+        futures.append(batcher.submit("banip", "nginx", "10.0.1.1"))
+        futures.append(batcher.submit("banip", "sshd", "10.0.0.1"))
+        batcher.flush()
+        self.assertEqual(sorted(client.batches), [
+            ("banip", "nginx", ["10.0.1.1"]),
+            ("banip", "sshd", ["10.0.0.0", "10.0.0.1", "10.0.0.2"]),
+        ])
+        self.assertTrue(all(future.result(timeout=1) for future in futures))
+
+    def test_ban_then_unban_is_coalesced(self):
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        ban = batcher.submit("banip", "sshd", "1.2.3.4")
+        unban = batcher.submit("unbanip", "sshd", "1.2.3.4")
+        other = batcher.submit("banip", "sshd", "5.6.7.8")
+        batcher.flush()
+        self.assertEqual(client.batches, [("banip", "sshd", ["5.6.7.8"])])
+        self.assertTrue(ban.result(timeout=1) and unban.result(timeout=1) and other.result(timeout=1))
+        self.assertEqual(batcher.stats["coalesced"], 2)
+
+    def test_unban_then_ban_sends_the_ban(self):
+        client = FakeClient(batch_result=False)
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        unban = batcher.submit("unbanip", "sshd", "1.2.3.4")
+        self.assertEqual(batcher.pending("sshd", "1.2.3.4"), "unbanip")
+        ban = batcher.submit("banip", "sshd", "1.2.3.4")
+        self.assertEqual(batcher.pending("sshd", "1.2.3.4"), "banip")
+        batcher.flush()
+        # The IP may have been banned before the unban: the ban is sent and its failure reported on both
+        self.assertEqual(client.batches, [("banip", "sshd", ["1.2.3.4"])])
+        self.assertFalse(unban.result(timeout=1) or ban.result(timeout=1))
+        self.assertEqual(batcher.stats["coalesced"], 0)
+        self.assertIsNone(batcher.pending("sshd", "1.2.3.4"))
+
+    def test_failed_batch_reports_result_per_ip(self):
+        client = FakeClient(batch_result=False, failing_ips={"5.6.7.8"})
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        good = batcher.submit("banip", "sshd", "1.2.3.4")
+        bad = batcher.submit("banip", "sshd", "5.6.7.8")
+        batcher.flush()
+        self.assertTrue(good.result(timeout=1))
+        self.assertFalse(bad.result(timeout=1))
+
+    def test_window_and_size_cap_trigger_flush(self):
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=0.05, max_size=3)
+        batcher.start()
+        self.addCleanup(batcher.stop)
+        capped = [batcher.submit("banip", "sshd", f"10.0.0.{i}") for i in range(3)]
+        self.assertTrue(all(future.result(timeout=1) for future in capped))
+        timed = batcher.submit("unbanip", "sshd", "10.0.0.9")
+        self.assertTrue(timed.result(timeout=1))
+        self.assertEqual(len(client.batches), 2)
+
+    def test_concurrent_submissions_share_commands(self):
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=0.1, max_size=1000)
+        batcher.start()
+        self.addCleanup(batcher.stop)
+        results = []
+
+        def worker(i):
+            results.append(batcher.submit("banip", "sshd", f"10.1.{i // 256}.{i % 256}").result(timeout=2))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 200)
+        self.assertTrue(all(results))
+        self.assertLess(len(client.batches), 10)
+
+    def test_status_is_not_batched(self):
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        self.assertTrue(batcher.submit("status", "sshd", None).result(timeout=1))
+        self.assertEqual(client.batches, [])
+
+
+class TestBatchedService(unittest.TestCase):
+    def setUp(self):
+        dedup_engine.clear()
+        self.ban_state = BanStateIndex(source="status")
+        patcher = patch("src.services.subscribe_msg_service.ban_state", self.ban_state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def make_alert(ip: str, action: Fail2banAction = Fail2banAction.BAN) -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address(ip), action=action, jail="sshd",
+                                          origin="00000000000000aa", trace=None)
+
+    def test_alerts_of_one_thread_share_a_command(self):
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        service = SubscribeMsgService(batcher=batcher)
+        # Submitted without waiting for the batch, one after the other from the same thread
+        for address in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+            self.assertTrue(service.process_alert(self.make_alert(address)))
+        self.assertTrue(service.process_alert(self.make_alert("10.0.0.3", Fail2banAction.UNBAN)))
+        self.assertEqual(client.batches, [])
+        batcher.flush()
+        self.assertEqual(client.batches, [("banip", "sshd", ["10.0.0.1", "10.0.0.2"])])
+
+    @patch("src.services.subscribe_msg_service.ban_expiry")
+    @patch("src.services.subscribe_msg_service.ban_journal")
+    def test_unban_of_a_queued_ban_is_not_skipped(self, mock_journal, mock_expiry):
+        with patch.object(Fail2banClient, "get_banned_ips", return_value=[]):
+            self.assertTrue(self.ban_state.reload("sshd"))
+        client = FakeClient()
+        batcher = Fail2banBatcher(client=client, window=60, max_size=100)
+        service = SubscribeMsgService(batcher=batcher)
+        self.assertTrue(service.process_alert(self.make_alert("198.51.100.9")))
+        # Not banned yet according to the index, the ban being still queued
+        self.assertTrue(service.process_alert(self.make_alert("198.51.100.9", Fail2banAction.UNBAN)))
+        batcher.flush()
+        self.assertEqual(client.batches, [])
+        self.assertFalse(self.ban_state.is_banned("sshd", "198.51.100.9"))
+
+
+if __name__ == "__main__":
+    unittest.main()
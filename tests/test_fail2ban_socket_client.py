@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.fail2ban_client import Fail2banClient
+from src.fail2ban.socket_client import Fail2banSocketClient, RemoteError
+from src.fail2ban.stub_server import Fail2banStubServer
+
+
+class TestFail2banSocketClient(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.socket_path = os.path.join(self.tmp_dir.name, "fail2ban.sock")
+        self.server = Fail2banStubServer(socket_path=self.socket_path, jails=("sshd", "nginx"))
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = Fail2banSocketClient(socket_path=self.socket_path, timeout=2.0)
+        self.addCleanup(self.client.close)
+
+    def test_ping_and_status(self):
+        self.assertEqual(self.client.send_command(["ping"]), (0, "pong"))
+        code, status = self.client.send_command(["status"])
+        self.assertEqual(code, 0)
+        self.assertEqual(dict(status)["Jail list"], "nginx, sshd")
+
+    def test_connection_is_reused(self):
+        self.client.send_command(["ping"])
+        sock = self.client._socket
+        self.client.send_command(["set", "sshd", "banip", "1.2.3.4"])
+        self.assertIs(self.client._socket, sock)
+
+    def test_pipelined_commands_answered_in_order(self):
+        answers = self.client.send_commands([
+            ["set", "sshd", "banip", "1.2.3.4"],
+            ["set", "sshd", "banip", "1.2.3.4"],
+            ["set", "nginx", "banip", "5.6.7.8", "9.9.9.9"],
+            ["get", "sshd", "banned"],
+        ])
+        self.assertEqual(answers, [(0, 1), (0, 0), (0, 2), (0, ["1.2.3.4"])])
+
+    def test_remote_error_is_returned(self):
+        code, error = self.client.send_command(["set", "unknown", "banip", "1.2.3.4"])
+        self.assertEqual(code, 1)
+        self.assertIsInstance(error, Exception)
+
+    def test_foreign_exception_classes_are_not_imported(self):
+        from decimal import Decimal
+        import pickle
+        from src.fail2ban.socket_client import decode_response
+        code, error = decode_response(pickle.dumps((1, Decimal("1"))))
+        self.assertEqual(code, 1)
+        self.assertIsInstance(error, RemoteError)
+
+    def test_builtin_functions_are_refused(self):
+        import pickle
+        from src.fail2ban.socket_client import decode_response
+
+        class Eval:
+            def __reduce__(self):
+                return eval, ("__import__('os').getpid()",)
+
+        data = pickle.dumps((0, Eval()))
+        self.assertIn(b"builtins", data)
+        code, result = decode_response(data)
+        self.assertIsInstance(result, RemoteError)
+        self.assertEqual(result.args, ("__import__('os').getpid()",))
+        self.assertIsInstance(decode_response(pickle.dumps((1, KeyError("sshd"))))[1], KeyError)
+
+    def test_reconnects_after_server_restart(self):
+        self.client.send_command(["ping"])
+        sock = self.client._socket
+        self.server.stop()
+        self.server.start()
+        self.assertEqual(self.client.send_command(["ping"]), (0, "pong"))
+        self.assertIsNot(self.client._socket, sock)
+
+    def test_missing_socket_raises(self):
+        client = Fail2banSocketClient(socket_path=os.path.join(self.tmp_dir.name, "missing.sock"))
+        with self.assertRaises(OSError):
+            client.send_command(["ping"])
+
+
+class TestFail2banClientSocketPath(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.socket_path = os.path.join(self.tmp_dir.name, "fail2ban.sock")
+        patcher = patch("src.fail2ban.fail2ban_client.settings")
+        self.mock_settings = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_settings.FAIL2BAN_USE_SOCKET = True
+        self.mock_settings.FAIL2BAN_SOCKET_RETRY_INTERVAL = 30.0
+        Fail2banClient.close()
+        Fail2banClient._socket_retry_at = 0.0
+        Fail2banClient._socket_client = Fail2banSocketClient(socket_path=self.socket_path, timeout=2.0)
+        self.addCleanup(Fail2banClient.close)
+
+    @patch("src.fail2ban.fail2ban_client.subprocess.run")
+    def test_execute_action_over_socket(self, mock_run):
+        server = Fail2banStubServer(socket_path=self.socket_path)
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertTrue(Fail2banClient.execute_action("banip", jail="sshd", ip="1.2.3.4"))
+        self.assertFalse(Fail2banClient.execute_action("banip", jail="unknown", ip="1.2.3.4"))
+        self.assertEqual(server.banned["sshd"], {"1.2.3.4"})
+        mock_run.assert_not_called()
+
+    def test_enum_action_sent_as_command_word(self):
+        server = Fail2banStubServer(socket_path=self.socket_path)
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertTrue(Fail2banClient.execute_action(Fail2banAction.BAN, jail="sshd", ip="1.2.3.4"))
+        self.assertEqual(server.commands[-1], ["set", "sshd", "banip", "1.2.3.4"])
+
+    @patch("src.fail2ban.fail2ban_client.subprocess.run")
+    def test_falls_back_to_subprocess_without_socket(self, mock_run):
+        mock_run.return_value.returncode = 0
+        self.assertEqual(Fail2banClient.execute_actions([("banip", "sshd", "1.2.3.4"), ("banip", "sshd", "5.6.7.8")]), [True, True])
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertGreater(Fail2banClient._socket_retry_at, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
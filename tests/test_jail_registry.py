@@ -0,0 +1,64 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from src.fail2ban.jail_registry import JailRegistry
+
+
+class TestJailRegistry(unittest.TestCase):
+    @patch("src.fail2ban.jail.get_active_jails", return_value={"sshd", "nginx"})
+    def test_lookup_loads_once(self, mock_jails):
+        registry = JailRegistry(refresh_interval=60, miss_refresh_cooldown=60)
+        self.assertTrue(registry.is_active("sshd"))
+        self.assertTrue(registry.is_active("nginx"))
+        self.assertTrue(registry.is_active("sshd"))
+        mock_jails.assert_called_once()
+
+    @patch("src.fail2ban.jail.get_active_jails")
+    def test_unknown_jail_forces_refresh(self, mock_jails):
+        mock_jails.side_effect = [{"sshd"}, {"sshd", "postfix"}]
+        registry = JailRegistry(refresh_interval=60, miss_refresh_cooldown=0)
+        self.assertTrue(registry.is_active("sshd"))
+        self.assertTrue(registry.is_active("postfix"))
+        self.assertEqual(mock_jails.call_count, 2)
+
+    @patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"})
+    def test_miss_refresh_is_rate_limited(self, mock_jails):
+        registry = JailRegistry(refresh_interval=60, miss_refresh_cooldown=60)
+        for _ in range(10):
+            self.assertFalse(registry.is_active("unknownjail"))
+        mock_jails.assert_called_once()
+
+    @patch("src.fail2ban.jail.get_active_jails", return_value={"sshd"})
+    def test_background_refresh(self, mock_jails):
+        registry = JailRegistry(refresh_interval=0.01, miss_refresh_cooldown=60)
+        registry.start()
+        time.sleep(0.1)
+        registry.stop()
+        self.assertGreater(mock_jails.call_count, 1)
+        self.assertEqual(registry.get_jails(), frozenset({"sshd"}))
+
+    @patch("src.fail2ban.jail.get_active_jails")
+    def test_miss_on_event_loop_defers_refresh(self, mock_jails):
+        mock_jails.side_effect = [{"sshd"}, {"sshd"}, {"sshd", "postfix"}]
+        registry = JailRegistry(refresh_interval=60, miss_refresh_cooldown=0)
+        registry.start()
+        try:
+            time.sleep(0.05)
+
+            async def lookup():
+                return registry.is_active("postfix")
+
+            self.assertFalse(asyncio.run(lookup()))
+            deadline = time.monotonic() + 2
+            while mock_jails.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(mock_jails.call_count, 2)
+            self.assertTrue(registry.is_active("postfix"))
+        finally:
+            registry.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
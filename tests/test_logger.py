@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.utils.logger import DroppingQueueHandler, JsonFormatter, SamplingFilter, TextFormatter, setup_logging, stop_logging
+
+
+def make_record(name: str = "test", level: int = logging.INFO, msg: str = "event %s", args: tuple = ("a",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestSamplingFilter(unittest.TestCase):
+    def test_sampling_keeps_one_in_n_info_records(self):
+        sampling = SamplingFilter(sample_rate=0.25)
+        kept = [sampling.filter(make_record()) for _ in range(8)]
+        self.assertEqual(kept, [True, False, False, False, True, False, False, False])
+        self.assertTrue(all(sampling.filter(make_record(level=logging.WARNING)) for _ in range(8)))
+
+    def test_rate_limit_per_logger_reports_suppressed(self):
+        sampling = SamplingFilter(rate_limit=2)
+        with patch("src.utils.logger.time.monotonic", return_value=100.0):
+            kept = [sampling.filter(make_record()) for _ in range(5)]
+            self.assertTrue(sampling.filter(make_record(name="other")))
+            self.assertTrue(sampling.filter(make_record(level=logging.CRITICAL)))
+        self.assertEqual(kept, [True, True, False, False, False])
+        with patch("src.utils.logger.time.monotonic", return_value=101.0):
+            record = make_record()
+            self.assertTrue(sampling.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+
+class TestFormatters(unittest.TestCase):
+    def test_json_formatter_includes_extra_fields(self):
+        entry = json.loads(JsonFormatter().format(make_record(jail="sshd", suppressed=2)))
+        self.assertEqual(entry["message"], "event a")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["jail"], "sshd")
+        self.assertEqual(entry["suppressed"], 2)
+
+    def test_text_formatter_reports_suppressed(self):
+        self.assertTrue(TextFormatter().format(make_record(suppressed=4)).endswith("event a [4 similar records suppressed]"))
+
+
+class TestQueueLogging(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+
+        def restore():
+            stop_logging()
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+
+        self.addCleanup(restore)
+        self.log_file = os.path.join(tempfile.mkdtemp(), "app.log")
+
+    def test_records_written_by_listener_with_message_resolved_at_call_time(self):
+        setup_logging(log_level="INFO", log_file=self.log_file, log_format="json", async_logging=True, rate_limit=0)
+        alert = {"ip": "198.51.100.7"}
+        logging.getLogger("test.queue").info("Banned %s", alert)
+        alert["ip"] = "changed"
+        logging.getLogger("test.queue").debug("Not written %s", alert)
+        stop_logging()
+        with open(self.log_file) as log_file:
+            entries = [json.loads(line) for line in log_file]
+        messages = [entry["message"] for entry in entries if entry["logger"] == "test.queue"]
+        self.assertEqual(messages, ["Banned {'ip': '198.51.100.7'}"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = DroppingQueueHandler(queue.Queue(1))
+        handler.handle(make_record())
+        handler.handle(make_record())
+        self.assertEqual(handler.queue.qsize(), 1)
+
+    def test_invalid_format_raises(self):
+        with self.assertRaises(ValueError):
+            setup_logging(log_level="INFO", log_format="xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from src.api.routes import get_routes
+from src.services.publish_msg_service import PublishMsgService
+from src.shared.metrics import CONTENT_TYPE, MetricsRegistry, metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry(enabled=True)
+
+    def test_counter_sums_every_thread(self):
+        counter = self.registry.counter("test_events_total", "Events.")
+
+        def record():
+            for _ in range(10000):
+                counter.inc()
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5)
+        self.assertEqual(counter.value(), 40005)
+
+    def test_cells_of_exited_threads_are_folded(self):
+        counter = self.registry.counter("test_threads_total", "Events.")
+        histogram = self.registry.histogram("test_threads_seconds", "Latency.", buckets=(0.001,))
+
+        def record():
+            counter.inc(2)
+            histogram.observe(0.0005)
+
+        for _ in range(200):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        counter.inc()
+        self.assertEqual(counter.value(), 401)
+        self.assertEqual(len(counter._cells.cells), 1)
+        self.assertEqual(len(histogram._cells.cells), 0)
+        self.assertEqual(histogram._cells.totals()[0], 200)
+
+    def test_same_name_returns_same_metric(self):
+        self.assertIs(self.registry.counter("test_total", "Test."), self.registry.counter("test_total", "Test."))
+
+    def test_histogram_rendering(self):
+        histogram = self.registry.histogram("test_seconds", "Latency.", labels=("stage",), buckets=(0.001, 0.01))
+        child = histogram.labels("decode")
+        for value in (0.0005, 0.001, 0.005, 0.5):
+            child.observe(value)
+        counts, total, count = child.snapshot()
+        self.assertEqual(counts, [2, 1, 1])
+        self.assertEqual(count, 4)
+        self.assertAlmostEqual(total, 0.5065)
+        text = self.registry.render()
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{stage="decode",le="0.001"} 2', text)
+        self.assertIn('test_seconds_bucket{stage="decode",le="0.01"} 3', text)
+        self.assertIn('test_seconds_bucket{stage="decode",le="+Inf"} 4', text)
+        self.assertIn('test_seconds_count{stage="decode"} 4', text)
+
+    def test_labels_are_escaped_and_checked(self):
+        counter = self.registry.counter("test_labelled_total", "Labelled.", labels=("reason",))
+        counter.labels('bad "quote"\n').inc()
+        self.assertIn('test_labelled_total{reason="bad \\"quote\\"\\n"} 1', self.registry.render())
+        with self.assertRaises(ValueError):
+            counter.labels("a", "b")
+
+    def test_callback_read_at_scrape_time(self):
+        depth = {"value": 3}
+        self.registry.callback("test_depth", "Depth.", function=lambda: depth["value"])
+        self.assertIn("test_depth 3", self.registry.render())
+        depth["value"] = 7
+        self.assertIn("test_depth 7", self.registry.render())
+
+    def test_failing_callback_is_skipped(self):
+        self.registry.callback("test_broken", "Broken.", function=lambda: 1 / 0)
+        self.registry.counter("test_ok_total", "Ok.").inc()
+        text = self.registry.render()
+        self.assertNotIn("test_broken", text)
+        self.assertIn("test_ok_total 1", text)
+
+    def test_disabled_registry_records_nothing(self):
+        registry = MetricsRegistry(enabled=False)
+        registry.counter("test_total", "Test.", labels=("a",)).labels("x").inc()
+        registry.histogram("test_seconds", "Test.").observe(0.1)
+        self.assertEqual(registry.render(), "")
+
+
+class TestMetricsRoute(unittest.TestCase):
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        router = get_routes(MagicMock(spec=PublishMsgService))
+        endpoint = next(route.endpoint for route in router.routes if route.path == "/metrics")
+        metrics.counter("test_route_total", "Route test.").inc()
+        response = asyncio.run(endpoint())
+        self.assertEqual(response.media_type, CONTENT_TYPE)
+        self.assertIn(b"test_route_total 1", response.body)
+        self.assertIn(b"# TYPE ids2zmq_api_alerts_total counter", response.body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import ipaddress
+import unittest
+from unittest.mock import patch
+
+from src.utils.node_identity import NodeIdentity
+
+
+class TestNodeIdentity(unittest.TestCase):
+    def _identity(self, ipv4=(), ipv6=(), resolved=(), primary=None) -> NodeIdentity:
+        identity = NodeIdentity(refresh_interval=60)
+        for name, values in (("_interface_ipv4_addresses", ipv4), ("_interface_ipv6_addresses", ipv6),
+                             ("_resolved_addresses", resolved)):
+            patcher = patch.object(NodeIdentity, name, return_value={ipaddress.ip_address(value) for value in values})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(NodeIdentity, "_route_primary_ip",
+                               return_value=ipaddress.ip_address(primary) if primary else None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return identity
+
+    def test_every_interface_address_is_local(self):
+        identity = self._identity(ipv4=["10.0.0.2", "192.168.1.5"], ipv6=["2001:db8::2"], primary="10.0.0.2")
+        for address in ("10.0.0.2", "192.168.1.5", "2001:db8::2", "[2001:db8::2]", "::ffff:192.168.1.5",
+                        "127.0.0.1", "::1", "0.0.0.0", ipaddress.IPv4Address("192.168.1.5")):
+            self.assertTrue(identity.is_local(address), address)
+        for address in ("10.0.0.3", "2001:db8::3", "not-an-ip", "localhost"):
+            self.assertFalse(identity.is_local(address), address)
+
+    def test_primary_ip_is_cached(self):
+        identity = self._identity(ipv4=["10.0.0.2"], primary="10.0.0.2")
+        self.assertEqual(identity.get_primary_ip(), ipaddress.IPv4Address("10.0.0.2"))
+        identity.get_primary_ip()
+        self.assertEqual(NodeIdentity._route_primary_ip.call_count, 1)
+
+    def test_primary_ip_without_route(self):
+        identity = self._identity(ipv4=["192.168.1.5"], ipv6=["fe80::1"])
+        self.assertEqual(identity.get_primary_ip(), ipaddress.IPv4Address("192.168.1.5"))
+        self.assertEqual(self._identity().get_primary_ip(), ipaddress.IPv4Address("127.0.0.1"))
+
+    def test_refresh_picks_up_new_addresses(self):
+        identity = self._identity(ipv4=["10.0.0.2"], primary="10.0.0.2")
+        self.assertFalse(identity.is_local("10.0.0.9"))
+        NodeIdentity._interface_ipv4_addresses.return_value = {ipaddress.IPv4Address("10.0.0.9")}
+        identity.refresh()
+        self.assertTrue(identity.is_local("10.0.0.9"))
+        self.assertFalse(identity.is_local("10.0.0.3"))
+
+    def test_real_enumeration_includes_loopback(self):
+        identity = NodeIdentity(refresh_interval=60)
+        self.assertTrue(identity.is_local("127.0.0.1"))
+        self.assertTrue(identity.is_local(identity.get_primary_ip()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import base64
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import zmq
+from cryptography.exceptions import InvalidTag
+
+from src.ids2zmq.payload_crypto import OVERHEAD, PayloadCrypto, is_aead_token
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+
+
+class TestPayloadCrypto(unittest.TestCase):
+    def setUp(self):
+        self.keys_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.keys_dir, True)
+        self.crypto = PayloadCrypto(keys_path=self.keys_dir, cipher="aes-gcm", activation_delay=60.0)
+
+    def _age(self, name: str, seconds: float):
+        """Backdate a key file, as if it had been dropped some time ago."""
+        path = os.path.join(self.keys_dir, f"{name}.key")
+        past = time.time() - seconds
+        os.utime(path, (past, past))
+
+    def test_round_trip_both_ciphers(self):
+        self.crypto.generate_key("k1")
+        self.crypto.reload()
+        aes_token = self.crypto.encrypt(b"alert", associated_data=b"header")
+        chacha = PayloadCrypto(keys_path=self.keys_dir, cipher="chacha20-poly1305")
+        chacha.reload()
+        chacha_token = chacha.encrypt(b"alert", associated_data=b"header")
+        self.assertTrue(is_aead_token(aes_token))
+        self.assertEqual(len(aes_token), len(b"alert") + OVERHEAD)
+        self.assertNotEqual(aes_token[1], chacha_token[1])
+        # Either node decrypts both ciphers
+        self.assertEqual(chacha.decrypt(memoryview(aes_token), associated_data=b"header"), b"alert")
+        self.assertEqual(self.crypto.decrypt(chacha_token, associated_data=b"header"), b"alert")
+
+    def test_tampered_header_or_payload_rejected(self):
+        self.crypto.generate_key("k1")
+        self.crypto.reload()
+        token = self.crypto.encrypt(b"alert", associated_data=b"header")
+        with self.assertRaises(InvalidTag):
+            self.crypto.decrypt(token, associated_data=b"other header")
+        with self.assertRaises(InvalidTag):
+            self.crypto.decrypt(token[:-1] + bytes([token[-1] ^ 1]), associated_data=b"header")
+
+    def test_unknown_key_id_rejected(self):
+        self.crypto.generate_key("k1")
+        self.crypto.reload()
+        other = PayloadCrypto(keys_path=tempfile.mkdtemp(), cipher="aes-gcm")
+        self.addCleanup(shutil.rmtree, other.keys_path, True)
+        other.generate_key("k2")
+        other.reload()
+        with self.assertRaises(ValueError):
+            self.crypto.decrypt(other.encrypt(b"alert"))
+
+    def test_encrypt_without_key_raises(self):
+        self.crypto.reload()
+        with self.assertRaises(RuntimeError):
+            self.crypto.encrypt(b"alert")
+
+    def test_invalid_key_file_ignored(self):
+        with open(os.path.join(self.keys_dir, "short.key"), "wb") as key_file:
+            key_file.write(base64.urlsafe_b64encode(b"too short"))
+        self.crypto.generate_key("k1")
+        self.crypto.reload()
+        self.assertEqual(len(self.crypto.key_ids()), 1)
+
+    def test_rotation_without_restart(self):
+        old_id = self.crypto.generate_key("old")
+        self._age("old", 3600)
+        self.crypto.reload()
+        old_token = self.crypto.encrypt(b"before rotation")
+
+        # A new key decrypts right away but only encrypts once its activation delay elapsed
+        new_id = self.crypto.generate_key("new")
+        self.assertTrue(self.crypto.reload())
+        self.assertEqual(set(self.crypto.key_ids()), {old_id, new_id})
+        self.assertEqual(self.crypto.active_key_id(), old_id)
+        self._age("new", 120)
+        self.assertTrue(self.crypto.reload())
+        self.assertEqual(self.crypto.active_key_id(), new_id)
+        self.assertEqual(self.crypto.decrypt(old_token), b"before rotation")
+        self.assertFalse(self.crypto.reload())
+
+        # Removing the old key retires it
+        os.remove(os.path.join(self.keys_dir, "old.key"))
+        self.assertTrue(self.crypto.reload())
+        self.assertEqual(self.crypto.key_ids(), [new_id])
+        with self.assertRaises(ValueError):
+            self.crypto.decrypt(old_token)
+
+    def test_single_fresh_key_is_used_right_away(self):
+        key_id = self.crypto.generate_key("fresh")
+        self.crypto.reload()
+        self.assertEqual(self.crypto.active_key_id(), key_id)
+
+    def test_unsupported_cipher_raises(self):
+        with self.assertRaises(ValueError):
+            PayloadCrypto(keys_path=self.keys_dir, cipher="des").reload()
+
+    def test_publisher_to_subscriber_authenticates_header(self):
+        self.crypto.generate_key("k1")
+        self.crypto.reload()
+        context = zmq.Context()
+        publisher = ZMQPublisher(context=context)
+        subscriber = ZMQSubscriber(on_message_callback=lambda message: None, context=context)
+        publisher._aead = subscriber._aead = self.crypto
+        try:
+            with patch("src.ids2zmq.publisher.ZMQManager.zmq_security_enabled", True), \
+                    patch("src.ids2zmq.subscriber.ZMQManager.zmq_security_enabled", True), \
+                    patch("src.fail2ban.jail_registry.jail_registry.is_active", return_value=True):
+                alert = '{"ip": "198.51.100.7", "action": "banip", "jail": "sshd"}'
+                topic, header, payload = publisher._build_frames(items=[publisher._encode_item(
+                    alert=alert, message_id="0000000000000001", origin="00000000000000aa")])
+                self.assertTrue(is_aead_token(payload))
+                alerts = subscriber._decode_frames(frames=[topic, header, payload])
+                self.assertEqual([str(alert.ip) for alert in alerts], ["198.51.100.7"])
+                # A header replayed with another message id no longer authenticates the payload
+                forged = header[:-1] + bytes([header[-1] ^ 1])
+                self.assertEqual(subscriber._decode_frames(frames=[topic, forged, payload]), [])
+        finally:
+            subscriber.stop()
+            publisher.close()
+            context.term()
+
+
+if __name__ == "__main__":
+    unittest.main()
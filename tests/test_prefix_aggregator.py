@@ -0,0 +1,127 @@
+import ipaddress
+import random
+import unittest
+from unittest.mock import patch
+
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.ban_state import BanStateIndex
+from src.fail2ban.prefix_aggregator import PrefixAggregator
+from src.shared.prefix_trie import PrefixTrie
+from src.models.alert_model import AlertModel
+from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.dedup_engine import dedup_engine
+
+
+def host(address: str) -> int:
+    return int(ipaddress.IPv4Address(address))
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_counts_match_a_scan(self):
+        trie = PrefixTrie(32)
+        entries = set()
+        generator = random.Random(7)
+        for _ in range(2000):
+            value = generator.choice((0x0A000000, 0x0A000100, 0xC0A80000)) | generator.randrange(256)
+            if generator.random() < 0.3:
+                self.assertEqual(trie.remove(value, 32), value in entries)
+                entries.discard(value)
+            else:
+                self.assertEqual(trie.insert(value, 32, 1.0), value not in entries)
+                entries.add(value)
+        self.assertEqual(len(trie), len(entries))
+        for prefix in (0x0A000000, 0x0A000100, 0xC0A80000, 0x0B000000):
+            self.assertEqual(trie.count_under(prefix, 24), sum(1 for value in entries if value >> 8 == prefix >> 8))
+        self.assertEqual(trie.count_under(0x0A000000, 16), sum(1 for value in entries if value >> 16 == 0x0A00))
+
+    def test_pop_under_and_covering(self):
+        trie = PrefixTrie(32)
+        for address in ("10.0.0.1", "10.0.0.2", "10.0.1.1", "10.0.0.200"):
+            trie.insert(host(address), 32, 1.0)
+        self.assertEqual(sorted(trie.pop_under(host("10.0.0.0"), 24)),
+                         [(host("10.0.0.1"), 32), (host("10.0.0.2"), 32), (host("10.0.0.200"), 32)])
+        self.assertEqual(len(trie), 1)
+        trie.insert(host("10.0.0.0"), 24, 1.0)
+        self.assertEqual(trie.covering(host("10.0.0.9"), 32), (host("10.0.0.0"), 24))
+        self.assertIsNone(trie.covering(host("10.0.1.1"), 32))
+        self.assertIsNone(trie.covering(host("10.0.0.0"), 24))
+        self.assertEqual(trie.find(host("10.0.1.1"), 32), 1.0)
+        self.assertIsNone(trie.find(host("10.0.1.2"), 32))
+
+
+class TestPrefixAggregator(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = PrefixAggregator(enabled=True, ipv4_prefix=24, ipv6_prefix=48, ipv6_host_prefix=64,
+                                           thresholds={"sshd": 3}, default_threshold=0, ttl=60)
+
+    def test_escalates_and_retires_hosts(self):
+        self.assertEqual(self.aggregator.aggregate("banip", "sshd", "10.0.0.1").target, "10.0.0.1")
+        self.assertEqual(self.aggregator.aggregate("banip", "sshd", "10.0.0.2").target, "10.0.0.2")
+        aggregation = self.aggregator.aggregate(Fail2banAction.BAN, "sshd", ipaddress.ip_address("10.0.0.3"))
+        self.assertTrue(aggregation.escalated)
+        self.assertEqual(aggregation.target, "10.0.0.0/24")
+        self.assertEqual(sorted(aggregation.retired), ["10.0.0.1", "10.0.0.2"])
+        covered = self.aggregator.aggregate("banip", "sshd", "10.0.0.4")
+        self.assertTrue(covered.covered)
+        self.assertEqual(covered.target, "10.0.0.0/24")
+        self.assertEqual(self.aggregator.stats(), {"sshd": 1})
+
+    def test_threshold_per_jail(self):
+        for index in range(10):
+            self.assertFalse(self.aggregator.aggregate("banip", "nginx", f"10.0.0.{index}").escalated)
+
+    def test_ipv6_folded_into_64(self):
+        aggregation = self.aggregator.aggregate("banip", "nginx", "2001:db8:0:1::5")
+        self.assertEqual(aggregation.target, "2001:db8:0:1::/64")
+        self.assertEqual(self.aggregator.aggregate("unbanip", "nginx", "2001:db8:0:1::9").target, "2001:db8:0:1::/64")
+        self.assertEqual(self.aggregator.stats(), {"nginx": 0})
+
+    def test_rollback_restores_retired_hosts(self):
+        self.aggregator.aggregate("banip", "sshd", "10.0.0.1")
+        self.aggregator.aggregate("banip", "sshd", "10.0.0.2")
+        self.aggregator.rollback(self.aggregator.aggregate("banip", "sshd", "10.0.0.3"))
+        self.assertFalse(self.aggregator.aggregate("banip", "sshd", "10.0.0.4").covered)
+        self.assertEqual(self.aggregator.stats(), {"sshd": 1})
+
+    def test_entries_expire(self):
+        with patch("src.fail2ban.prefix_aggregator.time.monotonic", return_value=100.0):
+            self.aggregator.aggregate("banip", "sshd", "10.0.0.1")
+            self.aggregator.aggregate("banip", "sshd", "10.0.0.2")
+        with patch("src.fail2ban.prefix_aggregator.time.monotonic", return_value=161.0):
+            self.assertFalse(self.aggregator.aggregate("banip", "sshd", "10.0.0.3").escalated)
+
+    def test_disabled_passes_through(self):
+        aggregator = PrefixAggregator(enabled=False)
+        aggregation = aggregator.aggregate("banip", "sshd", "2001:db8::1")
+        self.assertEqual(aggregation.target, "2001:db8::1")
+        self.assertFalse(aggregation.covered or aggregation.escalated)
+
+
+class TestPrefixAggregationService(unittest.TestCase):
+    def setUp(self):
+        dedup_engine.clear()
+        aggregator = PrefixAggregator(enabled=True, thresholds={"sshd": 2}, default_threshold=0, ttl=60)
+        patcher = patch("src.services.subscribe_msg_service.prefix_aggregator", aggregator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("src.services.subscribe_msg_service.ban_state", BanStateIndex(source="status"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def make_alert(ip: str) -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address(ip), action=Fail2banAction.BAN, jail="sshd",
+                                          origin="00000000000000aa", trace=None)
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_batch", return_value=True)
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    def test_escalation_sends_prefix_ban_then_retires(self, mock_action, mock_batch):
+        service = SubscribeMsgService()
+        for address in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+            self.assertTrue(service.process_alert(self.make_alert(address)))
+        self.assertEqual([call.kwargs["ip"] for call in mock_action.call_args_list], ["10.0.0.1", "10.0.0.0/24"])
+        mock_batch.assert_called_once_with(action=Fail2banAction.UNBAN, jail="sshd", ips=["10.0.0.1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,5 +15,12 @@ class TestPublishMsgService(unittest.TestCase):
         self.service.publish_alert(mock_alert)
         self.mock_publisher.publish_alert.assert_called_once_with(alert='{"id": 1, "msg": "test"}')
 
+    def test_publish_alerts_handed_at_once(self):
+        alerts = [AlertModel.model_construct(message_id=None, origin=None, target_ip=None, trace=None) for _ in range(3)]
+        self.service.publish_alerts(alerts)
+        self.mock_publisher.publish_alerts.assert_called_once_with(alerts=alerts)
+        self.mock_publisher.publish_alert.assert_not_called()
+        self.assertTrue(all(alert.message_id and alert.origin for alert in alerts))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,11 +1,14 @@
 import unittest
 from unittest.mock import patch
 
+from src.models.alert_model import AlertModel
 from src.services.subscribe_msg_service import SubscribeMsgService
+from src.shared.dedup_engine import dedup_engine
 
 
 class TestSubscribeMsgService(unittest.TestCase):
     def setUp(self):
+        dedup_engine.clear()
         self.service = SubscribeMsgService()
         self.valid_message = {
             "source_ip": "10.0.0.1",
@@ -89,6 +92,32 @@ class TestSubscribeMsgService(unittest.TestCase):
         mock_exec.assert_called_once()
         self.assertFalse(result)
 
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    @patch("src.fail2ban.jail.get_active_jails", return_value=["sshd"])
+    def test_duplicate_alert_is_applied_once(self, mock_jails, mock_exec):
+        json_str = self._to_json(self.valid_message)
+        self.assertTrue(self.service.process_received_message(json_str))
+        self.assertTrue(self.service.process_received_message(json_str))
+        mock_exec.assert_called_once()
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", side_effect=[False, True])
+    @patch("src.fail2ban.jail.get_active_jails", return_value=["sshd"])
+    def test_failed_alert_is_retried(self, mock_jails, mock_exec):
+        json_str = self._to_json(self.valid_message)
+        self.assertFalse(self.service.process_received_message(json_str))
+        self.assertTrue(self.service.process_received_message(json_str))
+        self.assertEqual(mock_exec.call_count, 2)
+
+    @patch("src.fail2ban.fail2ban_client.Fail2banClient.execute_action", return_value=True)
+    @patch("src.fail2ban.jail.get_active_jails", return_value=["sshd"])
+    def test_process_alert_does_not_validate_again(self, mock_jails, mock_exec):
+        alert = AlertModel(**self.valid_message)
+        with patch("src.services.subscribe_msg_service.AlertModel") as mock_model:
+            self.assertTrue(self.service.process_alert(alert))
+        mock_model.assert_not_called()
+        self.assertEqual(mock_exec.call_args.kwargs["ip"], "192.168.1.123")
+        self.assertEqual(SubscribeMsgService.extract_jail(alert), "sshd")
+
     def _to_json(self, data_dict):
         """Helper to convert dict to JSON with timestamp added."""
         import json
@@ -0,0 +1,215 @@
+import asyncio
+import ipaddress
+import threading
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+import zmq
+import zmq.asyncio
+
+from src.ids2zmq.async_publisher import AsyncZMQPublisher
+from src.ids2zmq.async_subscriber import AsyncZMQSubscriber
+from src.ids2zmq.async_router import AsyncZMQRouter
+from src.ids2zmq.codec import decode_envelope_header
+from src.fail2ban.action import Fail2banAction
+from src.models.alert_model import AlertModel
+
+
+class EchoAlertModel:
+    """Stand-in for AlertModel echoing the received payload back to the callback."""
+    def __init__(self, payload):
+        self.payload = payload
+
+    @classmethod
+    def from_json(cls, json_str):
+        return cls(json_str)
+
+    @classmethod
+    def model_validate_json(cls, data):
+        return cls(bytes(data).decode())
+
+    def to_json(self):
+        return self.payload
+
+
+class TestAsyncZMQPublisher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher_mgr = patch('src.ids2zmq.async_publisher.ZMQManager')
+        patcher_pub_mgr = patch('src.ids2zmq.publisher.ZMQManager')
+        self.mock_mgr = patcher_mgr.start()
+        self.addCleanup(patcher_mgr.stop)
+        self.mock_pub_mgr = patcher_pub_mgr.start()
+        self.addCleanup(patcher_pub_mgr.stop)
+        self.publisher = AsyncZMQPublisher()
+        self.publisher.publisher_socket = MagicMock()
+        self.publisher.publisher_socket.send_multipart = AsyncMock()
+        self.publisher._topic = "mytopic"
+
+    async def test_publish_alert_not_bound_raises(self):
+        self.publisher._is_bound = False
+        with self.assertRaises(RuntimeError):
+            await self.publisher.publish_alert("alert")
+
+    async def test_publish_alert_no_encryption(self):
+        self.publisher._is_bound = True
+        self.mock_pub_mgr.zmq_security_enabled = False
+        await self.publisher.publish_alert("hello world", message_id="0000000000000001", origin="00000000000000aa")
+        self.publisher.publisher_socket.send_multipart.assert_awaited_once_with(
+            [b"mytopic", bytes.fromhex("010000000000000000aa0000000000000001"), b"hello world"])
+
+    async def test_publish_alert_encrypted(self):
+        self.publisher._is_bound = True
+        self.mock_pub_mgr.zmq_security_enabled = True
+        self.publisher._fernet = MagicMock()
+        self.publisher._fernet.encrypt.return_value = b"encrypted"
+        await self.publisher.publish_alert("hello!", message_id="0000000000000001", origin="00000000000000aa")
+        self.publisher.publisher_socket.send_multipart.assert_awaited_once_with(
+            [b"mytopic", bytes.fromhex("010000000000000000aa0000000000000001"), b"encrypted"])
+
+    @staticmethod
+    def _low_alert(message_id: str) -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address("10.0.0.1"), severity="low", action=Fail2banAction.BAN, message_id=message_id)
+
+    async def test_batched_alerts_flushed_by_timer(self):
+        self.publisher._is_bound = True
+        self.mock_pub_mgr.zmq_security_enabled = False
+        self.publisher._batching, self.publisher._batch_window = True, 0.01
+        await self.publisher.publish_alert(self._low_alert("0000000000000001"))
+        await self.publisher.publish_alert(self._low_alert("0000000000000002"))
+        for _ in range(100):
+            if self.publisher.publisher_socket.send_multipart.await_count:
+                break
+            await asyncio.sleep(0.01)
+        self.publisher.publisher_socket.send_multipart.assert_awaited_once()
+        self.assertEqual(len(decode_envelope_header(self.publisher.publisher_socket.send_multipart.call_args.args[0][1])), 2)
+
+    async def test_aclose_flushes_pending_alerts(self):
+        self.publisher._is_bound = True
+        self.mock_pub_mgr.zmq_security_enabled = False
+        self.publisher._batching, self.publisher._batch_window = True, 60
+        await self.publisher.publish_alert(self._low_alert("0000000000000001"))
+        await self.publisher.aclose()
+        self.publisher.publisher_socket.send_multipart.assert_awaited_once()
+
+    async def test_publish_alerts_flushes_pending_ones_first(self):
+        self.publisher._is_bound = True
+        self.mock_pub_mgr.zmq_security_enabled = False
+        self.publisher._batching, self.publisher._batch_window, self.publisher._batch_max_size = True, 60, 2
+        await self.publisher.publish_alert(self._low_alert("0000000000000001"))
+        await self.publisher.publish_alerts([self._low_alert("0000000000000002"), self._low_alert("0000000000000003")])
+        self.assertEqual(self.publisher.publisher_socket.send_multipart.await_count, 2)
+        self.assertIsNone(self.publisher._flush_handle)
+        self.assertEqual(len(decode_envelope_header(self.publisher.publisher_socket.send_multipart.call_args_list[0].args[0][1])), 2)
+
+
+class TestAsyncZMQSubscriber(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.context = zmq.asyncio.Context()
+        patch_ctx = patch('src.ids2zmq.async_subscriber.ZMQManager.get_async_context', return_value=self.context)
+        patch_ctx.start()
+        self.addCleanup(patch_ctx.stop)
+        patch_settings = patch("src.ids2zmq.subscriber.settings")
+        self.mock_settings = patch_settings.start()
+        self.addCleanup(patch_settings.stop)
+        self.mock_settings.ZMQ_TOPIC_FAIL2BAN_ALERT = "mytopic"
+        self.mock_settings.ZMQ_SEEN_FILTER_CAPACITY = 1000
+        self.mock_settings.ZMQ_SEEN_FILTER_ERROR_RATE = 0.001
+        self.mock_settings.ZMQ_SEEN_FILTER_WINDOW = 60
+        patch_security = patch("src.ids2zmq.subscriber.ZMQManager.zmq_security_enabled", False)
+        patch_security.start()
+        self.addCleanup(patch_security.stop)
+        patch_alert = patch("src.ids2zmq.codec.AlertModel", EchoAlertModel)
+        patch_alert.start()
+        self.addCleanup(patch_alert.stop)
+
+        self.publisher = self.context.socket(zmq.PUB)
+        self.publisher.bind("inproc://test-async-subscriber")
+
+    async def asyncTearDown(self):
+        self.publisher.close()
+        self.context.term()
+
+    async def _receive_with(self, callback, received: asyncio.Event):
+        subscriber = AsyncZMQSubscriber(on_message_callback=callback)
+        subscriber.subscriber_socket.connect("inproc://test-async-subscriber")
+        subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, "mytopic")
+        subscriber.start()
+        for _ in range(40):
+            await self.publisher.send_multipart([b"mytopic", b"payload"])
+            try:
+                await asyncio.wait_for(received.wait(), timeout=0.05)
+                break
+            except asyncio.TimeoutError:
+                continue
+        await subscriber.aclose()
+        self.assertTrue(subscriber._task.done())
+
+    async def test_coroutine_callback_awaited_on_loop(self):
+        received, messages = asyncio.Event(), []
+
+        async def callback(payload):
+            messages.append(payload)
+            received.set()
+
+        await self._receive_with(callback, received)
+        self.assertEqual(messages[0], "payload")
+
+    async def test_sync_callback_runs_in_executor(self):
+        received, messages = asyncio.Event(), []
+        loop = asyncio.get_running_loop()
+
+        def callback(payload):
+            messages.append(payload)
+            loop.call_soon_threadsafe(received.set)
+
+        await self._receive_with(callback, received)
+        self.assertEqual(messages[0], "payload")
+
+    async def test_slow_sync_callback_does_not_hold_the_receive_loop(self):
+        released, calls = threading.Event(), []
+        self.addCleanup(released.set)
+
+        def callback(payload):
+            calls.append(payload)
+            released.wait(timeout=2)
+
+        subscriber = AsyncZMQSubscriber(on_message_callback=callback)
+        subscriber._in_flight = asyncio.Semaphore(2)
+        try:
+            # The first two messages are dispatched without waiting, the third one waits for a slot
+            for _ in range(2):
+                await asyncio.wait_for(subscriber._dispatch(frames=[b"mytopic", b"payload"]), timeout=1)
+            self.assertEqual(len(subscriber._calls), 2)
+            blocked = asyncio.ensure_future(subscriber._dispatch(frames=[b"mytopic", b"payload"]))
+            await asyncio.sleep(0.05)
+            self.assertFalse(blocked.done())
+            released.set()
+            await asyncio.wait_for(blocked, timeout=2)
+        finally:
+            released.set()
+            await subscriber.aclose()
+        self.assertEqual(len(calls), 3)
+        self.assertFalse(subscriber._calls)
+
+
+class TestAsyncZMQRouter(unittest.IsolatedAsyncioTestCase):
+    async def test_router_acknowledges_and_closes(self):
+        context = zmq.asyncio.Context()
+        with patch('src.ids2zmq.async_router.ZMQManager.get_async_context', return_value=context), \
+                patch('src.ids2zmq.router.settings') as mock_settings:
+            mock_settings.ZMQ_ROUTER_BIND_ADDRESS = "inproc://test-async-router"
+            router = AsyncZMQRouter()
+        router.run_as_task()
+        await asyncio.sleep(0)
+        dealer = context.socket(zmq.DEALER)
+        dealer.connect("inproc://test-async-router")
+        await dealer.send_multipart([b"", b"hello"])
+        reply = await asyncio.wait_for(dealer.recv_multipart(), timeout=1.0)
+        self.assertEqual(reply[-1], b"ACK")
+        dealer.close()
+        await router.aclose()
+        self.assertTrue(router._task.done())
+        context.term()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import ipaddress
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import zmq
+import zmq.auth
+
+from src.config.settings import settings
+from src.fail2ban.action import Fail2banAction
+from src.fail2ban.jail_registry import jail_registry
+from src.ids2zmq.manager import ZMQManager
+from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.subscriber import ZMQSubscriber
+from src.models.alert_model import AlertModel
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipUnless(zmq.has("curve"), "libzmq built without CURVE")
+class TestZMQCurveSecurity(unittest.TestCase):
+    def setUp(self):
+        self.certs_dir = tempfile.mkdtemp()
+        self.peers_dir = os.path.join(self.certs_dir, "authorized_clients")
+        os.makedirs(self.peers_dir)
+        self.context = zmq.Context()
+        for name, value in (("ZMQ_CERTS_PATH", self.certs_dir + "/"), ("ZMQ_CERTS_NAME", "local"),
+                            ("ZMQ_TRUSTED_PEERS_CERTS_PATH", self.peers_dir + "/")):
+            patcher = patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in (("zmq_security_enabled", True), ("security_mechanism", "curve"),
+                            ("_context", self.context), ("_authenticator", None)):
+            patcher = patch.object(ZMQManager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(jail_registry, "is_active", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.address = f"tcp://127.0.0.1:{_free_port()}"
+        self.publisher = ZMQPublisher(context=self.context)
+        self.publisher._bind_address = self.address
+
+    def tearDown(self):
+        self.publisher.close()
+        ZMQManager.stop_authenticator()
+        self.context.term()
+        shutil.rmtree(self.certs_dir, ignore_errors=True)
+
+    def _trust_local_certificate(self):
+        """Both ends run on this node, so its own certificate is the trusted certificate of 127.0.0.1."""
+        shutil.copy(os.path.join(self.certs_dir, "local.key"), os.path.join(self.peers_dir, "127.0.0.1.key"))
+
+    @staticmethod
+    def _alert() -> AlertModel:
+        return AlertModel.model_construct(ip=ipaddress.ip_address("198.51.100.7"), action=Fail2banAction.BAN)
+
+    def _publish_until(self, event: threading.Event, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while not event.is_set() and time.monotonic() < deadline:
+            self.publisher.publish_alert(self._alert(), message_id=f"{int(time.monotonic() * 1e6):016x}",
+                                         origin="00000000000000aa")
+            event.wait(0.05)
+
+    def test_trusted_peer_receives_clear_payload(self):
+        ZMQManager.generate_key(filename="local")
+        self._trust_local_certificate()
+        self.publisher.configure_security()
+        self.publisher.bind()
+        self.assertIsNone(self.publisher._fernet)
+
+        received = []
+        event = threading.Event()
+        subscriber = ZMQSubscriber(on_alert_callback=lambda alert: (received.append(alert), event.set()),
+                                   context=self.context)
+        subscriber.configure_security()
+        subscriber.connect_to_publisher(self.address)
+        subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, self.publisher._topic)
+        subscriber.start()
+        try:
+            self._publish_until(event)
+        finally:
+            subscriber.stop()
+        self.assertIsNone(subscriber._fernet)
+        self.assertTrue(received)
+        self.assertEqual(str(received[0].ip), "198.51.100.7")
+
+    def test_unknown_peer_is_rejected(self):
+        ZMQManager.generate_key(filename="local")
+        self._trust_local_certificate()
+        self.publisher.configure_security()
+        self.publisher.bind()
+
+        intruder_public, intruder_secret = zmq.curve_keypair()
+        intruder = self.context.socket(zmq.SUB)
+        intruder.setsockopt(zmq.CURVE_PUBLICKEY, intruder_public)
+        intruder.setsockopt(zmq.CURVE_SECRETKEY, intruder_secret)
+        intruder.setsockopt(zmq.CURVE_SERVERKEY, ZMQManager.load_peer_public_key(ip="127.0.0.1"))
+        intruder.setsockopt(zmq.LINGER, 0)
+        intruder.setsockopt_string(zmq.SUBSCRIBE, "")
+        intruder.connect(self.address)
+        try:
+            for i in range(10):
+                self.publisher.publish_alert(self._alert(), message_id=f"{i:016x}", origin="00000000000000aa")
+                time.sleep(0.05)
+            self.assertEqual(intruder.poll(timeout=200), 0)
+        finally:
+            intruder.close()
+
+    def test_missing_peer_certificate_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            ZMQManager.load_peer_public_key(ip="192.0.2.1")
+
+    def test_generate_key_loads_existing_pair(self):
+        first = ZMQManager.generate_key(filename="local")
+        self.assertEqual(ZMQManager.generate_key(filename="local"), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
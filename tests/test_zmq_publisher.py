@@ -1,8 +1,14 @@
+import json
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
 import zmq
 
 from src.ids2zmq.publisher import ZMQPublisher
+from src.ids2zmq.codec import JsonCodec, decode_envelope_header, decode_header, is_envelope_header, unpack_envelope
+from src.fail2ban.action import Fail2banAction
+from src.models.alert_model import AlertModel
+from src.shared.message_id import get_node_id
 
 class DummyFernet:
     def __init__(self, key):
@@ -31,6 +37,10 @@ class TestZMQPublisher(unittest.TestCase):
         self.mock_settings.ZMQ_PUBLISHER_BIND_ADDRESS = "tcp://*:9999"
         self.mock_settings.ZMQ_TOPIC_FAIL2BAN_ALERT = "mytopic"
         self.mock_settings.ZMQ_SYMMETRICAL_KEY_FILE = "/dev/null"
+        self.mock_settings.ZMQ_PUBLISH_BATCH_ENABLED = False
+        self.mock_settings.ZMQ_PUBLISH_BATCH_WINDOW = 60
+        self.mock_settings.ZMQ_PUBLISH_BATCH_MAX_SIZE = 3
+        self.mock_settings.ZMQ_PUBLISH_BATCH_URGENT_SEVERITIES = ["high"]
 
         self.publisher = ZMQPublisher()
         self.publisher.publisher_socket = MagicMock(spec=zmq.Socket)
@@ -73,9 +83,18 @@ class TestZMQPublisher(unittest.TestCase):
     def test_publish_alert_no_encryption(self):
         self.publisher._is_bound = True
         self.mock_mgr.zmq_security_enabled = False
-        self.publisher.publisher_socket.send_string = MagicMock()
-        self.publisher.publish_alert("hello world")
-        self.publisher.publisher_socket.send_string.assert_called()
+        self.publisher.publisher_socket.send_multipart = MagicMock()
+        self.publisher.publish_alert("hello world", message_id="0000000000000001", origin="00000000000000aa")
+        self.publisher.publisher_socket.send_multipart.assert_called_once_with(
+            [b"mytopic", bytes.fromhex("010000000000000000aa0000000000000001"), b"hello world"])
+
+    def test_publish_alert_stamps_ids(self):
+        self.publisher._is_bound = True
+        self.publisher.publisher_socket.send_multipart = MagicMock()
+        self.publisher.publish_alert("hello!")
+        topic, header, payload = self.publisher.publisher_socket.send_multipart.call_args.args[0]
+        self.assertEqual(decode_header(header)[:2], (0, get_node_id()))
+        self.assertEqual(payload, b"encrypted_hello!")
 
     def test_publish_alert_not_bound_raises(self):
         self.publisher._is_bound = False
@@ -89,5 +108,78 @@ class TestZMQPublisher(unittest.TestCase):
         self.publisher.publisher_socket.close.assert_called()
         self.assertFalse(self.publisher._is_bound)
 
+    def _batching_publisher(self) -> ZMQPublisher:
+        self.mock_settings.ZMQ_PUBLISH_BATCH_ENABLED = True
+        self.mock_mgr.zmq_security_enabled = True
+        publisher = ZMQPublisher()
+        publisher.publisher_socket = MagicMock(spec=zmq.Socket)
+        publisher._fernet = DummyFernet(b'dummy')
+        publisher._codec = JsonCodec
+        publisher._is_bound = True
+        return publisher
+
+    def _alert(self, index: int, severity: str = "low") -> AlertModel:
+        return AlertModel.model_construct(ip=f"10.0.0.{index}", severity=severity, action=Fail2banAction.BAN, message_id=f"{index:016x}",
+                                          origin="00000000000000aa")
+
+    def test_batched_alerts_sent_in_one_envelope(self):
+        publisher = self._batching_publisher()
+        for index in range(3):
+            publisher.publish_alert(self._alert(index))
+        publisher.publisher_socket.send_multipart.assert_called_once()
+        topic, header, payload = publisher.publisher_socket.send_multipart.call_args.args[0]
+        self.assertTrue(is_envelope_header(header))
+        self.assertEqual([decode_header(item)[2] for item in decode_envelope_header(header)],
+                         [f"{index:016x}" for index in range(3)])
+        # Encrypted once for the whole envelope
+        self.assertTrue(payload.startswith(b"encrypted_"))
+        items = unpack_envelope(payload[len(b"encrypted_"):], count=3)
+        self.assertEqual([json.loads(bytes(item))["ip"] for item in items], ["10.0.0.0", "10.0.0.1", "10.0.0.2"])
+
+    def test_urgent_alert_flushes_pending_ones(self):
+        publisher = self._batching_publisher()
+        publisher.publish_alert(self._alert(1))
+        publisher.publisher_socket.send_multipart.assert_not_called()
+        publisher.publish_alert(self._alert(2, severity="high"))
+        header = publisher.publisher_socket.send_multipart.call_args.args[0][1]
+        self.assertEqual(len(decode_envelope_header(header)), 2)
+        self.assertEqual(publisher.batch_stats["urgent_flushes"], 1)
+
+    def test_single_pending_alert_sent_as_plain_message_on_close(self):
+        publisher = self._batching_publisher()
+        publisher.publish_alert(self._alert(1))
+        publisher.close()
+        topic, header, payload = publisher.publisher_socket.send_multipart.call_args.args[0]
+        self.assertFalse(is_envelope_header(header))
+        self.assertEqual(decode_header(header)[2], f"{1:016x}")
+
+    def test_window_elapsed_flushed_by_thread(self):
+        self.mock_settings.ZMQ_PUBLISH_BATCH_WINDOW = 0.01
+        publisher = self._batching_publisher()
+        publisher._start_flusher()
+        sent = threading.Event()
+        publisher.publisher_socket.send_multipart.side_effect = lambda frames: sent.set()
+        publisher.publish_alert(self._alert(1))
+        self.assertTrue(sent.wait(timeout=2))
+        publisher.close()
+        self.assertEqual(publisher.batch_stats["envelopes"], 1)
+
+    def test_publish_alerts_in_envelopes_after_pending_ones(self):
+        publisher = self._batching_publisher()
+        publisher.publish_alert(self._alert(0))
+        publisher.publish_alerts([self._alert(index) for index in range(1, 5)])
+        messages = [call.args[0] for call in publisher.publisher_socket.send_multipart.call_args_list]
+        # The pending alert first, then envelopes of at most ZMQ_PUBLISH_BATCH_MAX_SIZE alerts
+        self.assertEqual([[decode_header(item)[2] for item in decode_envelope_header(header)]
+                          if is_envelope_header(header) else [decode_header(header)[2]] for _, header, _ in messages],
+                         [[f"{index:016x}" for index in (0, 1, 2)], [f"{index:016x}" for index in (3, 4)]])
+        self.assertEqual(publisher._pending, [])
+
+    def test_publish_alerts_without_batching(self):
+        self.publisher._is_bound = True
+        self.publisher._codec = JsonCodec
+        self.publisher.publish_alerts([self._alert(index) for index in range(4)])
+        self.assertEqual(self.publisher.publisher_socket.send_multipart.call_count, 2)
+
 if __name__ == "__main__":
     unittest.main()
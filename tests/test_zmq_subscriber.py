@@ -2,8 +2,10 @@ import unittest
 from unittest.mock import MagicMock, patch
 import zmq
 import threading
+import time
 
 from src.ids2zmq.subscriber import ZMQSubscriber
+from src.shared.message_id import encode_header, get_node_id
 
 
 class DummyFernet:
@@ -14,6 +16,23 @@ class DummyFernet:
         return b"decrypted_" + message
 
 
+class FakeAlertModel:
+    """Stand-in for AlertModel echoing the received payload back to the callback."""
+    def __init__(self, payload):
+        self.payload = payload
+
+    @classmethod
+    def from_json(cls, json_str):
+        return cls(json_str)
+
+    @classmethod
+    def model_validate_json(cls, data):
+        return cls(bytes(data).decode())
+
+    def to_json(self):
+        return self.payload
+
+
 class TestZMQSubscriber(unittest.TestCase):
     def setUp(self):
         # Patch global ZMQManager and settings
@@ -38,6 +57,9 @@ class TestZMQSubscriber(unittest.TestCase):
         self.mock_settings.ZMQ_SECURITY_USERNAME = "user"
         self.mock_settings.ZMQ_SECURITY_PASSWORD = "pass"
         self.mock_settings.ZMQ_SYMMETRICAL_KEY_FILE = "/dev/null"
+        self.mock_settings.ZMQ_SEEN_FILTER_CAPACITY = 1000
+        self.mock_settings.ZMQ_SEEN_FILTER_ERROR_RATE = 0.001
+        self.mock_settings.ZMQ_SEEN_FILTER_WINDOW = 60
 
         self.messages_received = []
 
@@ -82,24 +104,29 @@ class TestZMQSubscriber(unittest.TestCase):
         self.subscriber.connect_to_publisher_with_retries.assert_called()
         self.subscriber.subscriber_socket.setsockopt_string.assert_called()
 
+    def _run_once(self, frames):
+        """Run the receive loop for a single poller wake-up delivering the given frames."""
+        sock = self.subscriber.subscriber_socket
+        sock.recv_multipart.side_effect = list(frames) + [zmq.Again()]
+        poller = MagicMock()
+
+        def poll():
+            if poller.poll.call_count > 1:
+                self.subscriber._running.clear()
+                return []
+            return [(sock, zmq.POLLIN)]
+
+        poller.poll.side_effect = poll
+        with patch("src.ids2zmq.subscriber.zmq.Poller", return_value=poller), \
+                patch("src.ids2zmq.codec.AlertModel", FakeAlertModel):
+            self.subscriber.run()
+        return poller
+
     def test_run_encrypted_message(self):
         # Prepare a mock encrypted message
         topic = b"mytopic"
         encrypted_msg = b"hello!"
-        self.subscriber.subscriber_socket.recv_multipart.side_effect = [
-            (topic, encrypted_msg),
-            zmq.Again(),  # Stop loop
-        ]
-        # Configure threading event to stop after one message
-        self.subscriber._running = threading.Event()
-        self.subscriber._running.set()
-
-        def stop_after_one():
-            self.subscriber._running.clear()
-
-        threading.Timer(0.05, stop_after_one).start()
-
-        self.subscriber.run()
+        self._run_once([(topic, encrypted_msg)])
         self.assertGreaterEqual(len(self.messages_received), 1)
         self.assertTrue(self.messages_received[0].startswith("decrypted_"))
 
@@ -108,19 +135,63 @@ class TestZMQSubscriber(unittest.TestCase):
         self.subscriber._fernet = None  # Disable encryption
         topic = b"mytopic"
         raw_msg = b"unencrypted text"
-        self.subscriber.subscriber_socket.recv_multipart.side_effect = [
-            (topic, raw_msg),
-            zmq.Again(),
-        ]
-        self.subscriber._running = threading.Event()
-        self.subscriber._running.set()
+        self._run_once([(topic, raw_msg)])
+        self.assertIn("unencrypted text", self.messages_received[0])
+
+    def test_run_drains_all_queued_messages(self):
+        self.mock_mgr.zmq_security_enabled = False
+        frames = [(b"mytopic", f"msg-{i}".encode()) for i in range(5)]
+        poller = self._run_once(frames)
+        self.assertEqual(self.messages_received, [f"msg-{i}" for i in range(5)])
+        # All five messages were handled after a single wake-up of the poller
+        self.assertEqual(poller.poll.call_count, 2)
 
-        def stop_after_one():
-            self.subscriber._running.clear()
+    def test_run_ignores_other_topics(self):
+        self.mock_mgr.zmq_security_enabled = False
+        self._run_once([(b"othertopic", b"ignored"), (b"mytopic", b"kept")])
+        self.assertEqual(self.messages_received, ["kept"])
 
-        threading.Timer(0.05, stop_after_one).start()
-        self.subscriber.run()
-        self.assertIn("unencrypted text", self.messages_received[0])
+    def test_run_drops_seen_ids_and_own_echoes(self):
+        self.mock_mgr.zmq_security_enabled = False
+        peer_header = encode_header(origin="00000000000000aa", message_id="0000000000000001")
+        own_header = encode_header(origin=get_node_id(), message_id="0000000000000002")
+        self._run_once([
+            (b"mytopic", peer_header, b"first"),
+            (b"mytopic", peer_header, b"first again"),
+            (b"mytopic", own_header, b"echo"),
+            (b"mytopic", encode_header(origin="00000000000000aa", message_id="0000000000000003"), b"second"),
+        ])
+        self.assertEqual(self.messages_received, ["first", "second"])
+
+    def test_seen_id_is_checked_before_decrypting(self):
+        header = encode_header(origin="00000000000000aa", message_id="0000000000000001")
+        self.subscriber._seen.add(header)
+        self.subscriber._fernet = MagicMock()
+        self._run_once([(b"mytopic", header, b"ciphertext")])
+        self.subscriber._fernet.decrypt.assert_not_called()
+        self.assertEqual(self.messages_received, [])
+
+    def test_invalid_message_id_is_not_marked_seen(self):
+        self.subscriber._fernet = MagicMock()
+        self.subscriber._fernet.decrypt.side_effect = [Exception("bad token"), b"valid"]
+        header = encode_header(origin="00000000000000aa", message_id="0000000000000001")
+        self._run_once([(b"mytopic", header, b"forged"), (b"mytopic", header, b"genuine")])
+        self.assertEqual(self.messages_received, ["valid"])
+
+    def test_typed_callback_receives_the_decoded_alert(self):
+        alerts = []
+        self.subscriber._on_message_callback, self.subscriber._typed_callback = alerts.append, True
+        self.mock_mgr.zmq_security_enabled = False
+        with patch("src.ids2zmq.codec.AlertModel", FakeAlertModel):
+            self.subscriber._handle_message([b"mytopic", b"payload"])
+        self.assertIsInstance(alerts[0], FakeAlertModel)
+        self.assertEqual(alerts[0].payload, "payload")
+
+    def test_exactly_one_callback_required(self):
+        with self.assertRaises(ValueError):
+            ZMQSubscriber()
+        with self.assertRaises(ValueError):
+            ZMQSubscriber(on_message_callback=print, on_alert_callback=print)
 
     def test_stop(self):
         socket = self.subscriber.subscriber_socket
@@ -129,3 +200,73 @@ class TestZMQSubscriber(unittest.TestCase):
         self.subscriber.stop()
         socket.close.assert_called()
         self.assertFalse(self.subscriber._running.is_set())
+        self.subscriber._wakeup_sender.send.assert_called()
+
+
+class TestZMQSubscriberWakeup(unittest.TestCase):
+    """Exercise the receive loop on real inproc sockets."""
+    def setUp(self):
+        patch_settings = patch("src.ids2zmq.subscriber.settings")
+        self.mock_settings = patch_settings.start()
+        self.addCleanup(patch_settings.stop)
+        self.mock_settings.ZMQ_TOPIC_FAIL2BAN_ALERT = "mytopic"
+        self.mock_settings.ZMQ_SEEN_FILTER_CAPACITY = 1000
+        self.mock_settings.ZMQ_SEEN_FILTER_ERROR_RATE = 0.001
+        self.mock_settings.ZMQ_SEEN_FILTER_WINDOW = 60
+        patch_security = patch("src.ids2zmq.subscriber.ZMQManager.zmq_security_enabled", False)
+        patch_security.start()
+        self.addCleanup(patch_security.stop)
+        patch_alert = patch("src.ids2zmq.codec.AlertModel", FakeAlertModel)
+        patch_alert.start()
+        self.addCleanup(patch_alert.stop)
+
+        self.context = zmq.Context()
+        self.addCleanup(self.context.term)
+        self.publisher = self.context.socket(zmq.PUB)
+        self.publisher.bind("inproc://test-subscriber-wakeup")
+        self.addCleanup(self.publisher.close)
+
+        self.received = []
+        self.received_event = threading.Event()
+
+        def callback(msg):
+            self.received.append(msg)
+            self.received_event.set()
+
+        with patch("src.ids2zmq.subscriber.ZMQManager.get_context", return_value=self.context):
+            self.subscriber = ZMQSubscriber(on_message_callback=callback)
+        self.subscriber.subscriber_socket.connect("inproc://test-subscriber-wakeup")
+        self.subscriber.subscriber_socket.setsockopt_string(zmq.SUBSCRIBE, "mytopic")
+
+    def test_receive_then_stop_immediately(self):
+        self.subscriber.start()
+        deadline = time.monotonic() + 2.0
+        while not self.received_event.is_set() and time.monotonic() < deadline:
+            self.publisher.send_multipart([b"mytopic", b"payload"])
+            self.received_event.wait(0.05)
+        self.assertEqual(self.received[0], "payload")
+
+        started = time.monotonic()
+        self.subscriber.stop()
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertFalse(self.subscriber.is_alive())
+
+    def test_busy_loop_closes_the_sockets_on_exit(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.subscriber._on_message_callback = lambda msg: (self.received_event.set(), release.wait(timeout=2))
+        self.subscriber.start()
+        deadline = time.monotonic() + 2.0
+        while not self.received_event.is_set() and time.monotonic() < deadline:
+            self.publisher.send_multipart([b"mytopic", b"payload"])
+            self.received_event.wait(0.05)
+
+        # Still in the callback: the sockets are left to the receive loop
+        self.subscriber.stop(timeout=0.05)
+        self.assertTrue(self.subscriber.is_alive())
+        self.assertFalse(self.subscriber.subscriber_socket.closed)
+        release.set()
+        self.subscriber.join(timeout=2)
+        self.assertFalse(self.subscriber.is_alive())
+        self.assertTrue(self.subscriber.subscriber_socket.closed)
+        self.assertTrue(self.subscriber._wakeup_receiver.closed)